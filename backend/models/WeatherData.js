@@ -1,5 +1,8 @@
 const mongoose = require("mongoose");
 
+// lower-cased, whitespace-collapsed city name: "  Pune " and "pune" share one key
+const cityKey = (city) => String(city || "").trim().split(/\s+/).join(" ").toLowerCase();
+
 const WeatherSchema = new mongoose.Schema({
   temperature: Number,
   humidity: Number,
@@ -8,9 +11,34 @@ const WeatherSchema = new mongoose.Schema({
   pressure: Number,
   soilMoisture: Number,
   city: String,
+  // normalised city (cityKey above) so lookups by a user's location are exact, indexed matches
+  cityKey: String,
+  // station coordinates from OpenWeather's coord (ml/station_index.py nearest-station lookups)
+  lat: Number,
+  lon: Number,
 }, { timestamps: true });
 
 WeatherSchema.index({ city: 1, createdAt: -1 });
+WeatherSchema.index({ cityKey: 1, createdAt: -1 });
 WeatherSchema.index({ createdAt: -1 });
 
-module.exports = mongoose.model("WeatherData", WeatherSchema);
\ No newline at end of file
+// runs for create() and insertMany() alike
+WeatherSchema.pre("validate", function (next) {
+  this.cityKey = cityKey(this.city);
+  next();
+});
+
+WeatherSchema.statics.cityKey = cityKey;
+
+// rows written before cityKey existed: one updateMany per distinct spelling
+WeatherSchema.statics.backfillCityKeys = async function () {
+  const cities = await this.distinct("city", { cityKey: { $exists: false } });
+  let updated = 0;
+  for (const city of cities) {
+    const res = await this.updateMany({ city, cityKey: { $exists: false } }, { $set: { cityKey: cityKey(city) } });
+    updated += res.modifiedCount || 0;
+  }
+  return updated;
+};
+
+module.exports = mongoose.model("WeatherData", WeatherSchema);
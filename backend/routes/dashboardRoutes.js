@@ -1,7 +1,58 @@
 const express = require('express');
 const router = express.Router();
+const mongoose = require('mongoose');
 const WeatherData = require('../models/WeatherData');
 
+// ── Rollups maintained by ml/weather_rollup.py ────────────────────────────────
+// weather_rollups holds per-city hourly/daily count + n/sum/min/max; rows newer
+// than the rollup watermark (not yet rolled up) are read raw and merged in.
+// Until the rollup job has run once, the routes use the raw-document path.
+const ROLLUP_METRICS = ['temperature', 'humidity', 'rainfall', 'soilMoisture'];
+
+async function rollupWatermark() {
+    const db = mongoose.connection.db;
+    const state = await db.collection('weather_rollup_state').findOne({ _id: 'weatherdatas' });
+    return state && state.watermark ? state.watermark : null;
+}
+
+const cityKey = city => (city ? city.trim().toLowerCase() : '*');
+const localDateKey = d => `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+
+function emptyTotals() {
+    const t = { count: 0 };
+    ROLLUP_METRICS.forEach(m => { t[m] = { n: 0, sum: 0 }; });
+    return t;
+}
+
+function addRollup(t, doc) {
+    t.count += doc.count || 0;
+    ROLLUP_METRICS.forEach(m => {
+        if (doc[m]) { t[m].n += doc[m].n || 0; t[m].sum += doc[m].sum || 0; }
+    });
+}
+
+function addRaw(t, d) {
+    t.count += 1;
+    ROLLUP_METRICS.forEach(m => {
+        if (d[m] != null) { t[m].n += 1; t[m].sum += d[m]; }
+    });
+}
+
+function rawFilter(range, city) {
+    const filter = { createdAt: range };
+    if (city) filter.city = { $regex: new RegExp(`^\\s*${city.trim()}\\s*$`, 'i') };
+    return filter;
+}
+
+// raw rows not yet covered by the rollups, inside [lower, upper] — a stale watermark must
+// not pull in rows from before the window
+function tailFilter(watermark, city, upper, lower) {
+    const range = { $gt: watermark };
+    if (upper) range.$lte = upper;
+    if (lower) range.$gte = lower;
+    return rawFilter(range, city);
+}
+
 // GET /api/dashboard/stats - Returns aggregated KPIs
 router.get('/stats', async (req, res) => {
     try {
@@ -15,10 +66,40 @@ router.get('/stats', async (req, res) => {
             filter.city = { $regex: new RegExp(`^${city.trim()}$`, 'i') };
         }
 
-        console.log(`[Dashboard] Stats filter:`, JSON.stringify(filter));
-        const recentData = await WeatherData.find(filter).sort({ createdAt: 1 }).maxTimeMS(5000);
+        const watermark = await rollupWatermark();
+        let count, totalMoisture, totalRain, totalTemp;
+        if (watermark) {
+            // whole hours from the first hour boundary at/after sevenDaysAgo come from the rollups;
+            // the rolled-up rows before that boundary and everything past the watermark are read raw
+            const hourStart = new Date(sevenDaysAgo);
+            hourStart.setUTCMinutes(0, 0, 0);
+            if (hourStart < sevenDaysAgo) hourStart.setUTCHours(hourStart.getUTCHours() + 1);
+            const db = mongoose.connection.db;
+            const [rollups, head, tail] = await Promise.all([
+                db.collection('weather_rollups')
+                    .find({ granularity: 'hour', city: cityKey(city), bucket: { $gte: hourStart } })
+                    .toArray(),
+                WeatherData.find(rawFilter({ $gte: sevenDaysAgo, $lt: hourStart, $lte: watermark }, city))
+                    .lean().maxTimeMS(5000),
+                WeatherData.find(tailFilter(watermark, city, null, sevenDaysAgo)).lean().maxTimeMS(5000),
+            ]);
+            const t = emptyTotals();
+            rollups.forEach(doc => addRollup(t, doc));
+            head.forEach(d => addRaw(t, d));
+            tail.forEach(d => addRaw(t, d));
+            count = t.count;
+            totalMoisture = t.soilMoisture.sum;
+            totalRain = t.rainfall.sum;
+            totalTemp = t.temperature.sum;
+        } else {
+            const recentData = await WeatherData.find(filter).sort({ createdAt: 1 }).maxTimeMS(5000);
+            count = recentData.length;
+            totalMoisture = recentData.reduce((sum, d) => sum + (d.soilMoisture || 0), 0);
+            totalRain = recentData.reduce((sum, d) => sum + (d.rainfall || 0), 0);
+            totalTemp = recentData.reduce((sum, d) => sum + (d.temperature || 0), 0);
+        }
 
-        if (!recentData.length) {
+        if (!count) {
             return res.json({
                 avgMoisture: 0,
                 totalRain: 0,
@@ -29,11 +110,6 @@ router.get('/stats', async (req, res) => {
         }
 
         // Calculate aggregates
-        const totalMoisture = recentData.reduce((sum, d) => sum + (d.soilMoisture || 0), 0);
-        const totalRain = recentData.reduce((sum, d) => sum + (d.rainfall || 0), 0);
-        const totalTemp = recentData.reduce((sum, d) => sum + (d.temperature || 0), 0);
-        const count = recentData.length;
-
         const avgMoisture = Math.round(totalMoisture / count);
         const avgTemp = (totalTemp / count).toFixed(1);
 
@@ -73,6 +149,45 @@ router.get('/history', async (req, res) => {
             filter.city = { $regex: new RegExp(`^${city.trim()}$`, 'i') };
         }
 
+        const avgOf = t => (t && t.n ? parseFloat((t.sum / t.n).toFixed(1)) : null);
+        const chartData = [];
+        const watermark = await rollupWatermark();
+
+        if (watermark) {
+            // 14 daily rollup docs (local calendar days) + raw rows since the watermark
+            const days = [];
+            for (let i = 13; i >= 0; i--) {
+                const d = new Date();
+                d.setDate(d.getDate() - i);
+                days.push(d);
+            }
+            const db = mongoose.connection.db;
+            const [rollups, tail] = await Promise.all([
+                db.collection('weather_rollups')
+                    .find({ granularity: 'day', city: cityKey(city), date: { $in: days.map(localDateKey) } })
+                    .toArray(),
+                WeatherData.find(tailFilter(watermark, city, today, windowStart)).lean().maxTimeMS(5000),
+            ]);
+            const totals = {};
+            days.forEach(d => { totals[localDateKey(d)] = emptyTotals(); });
+            rollups.forEach(doc => { if (totals[doc.date]) addRollup(totals[doc.date], doc); });
+            tail.forEach(d => {
+                const key = localDateKey(new Date(d.createdAt));
+                if (totals[key]) addRaw(totals[key], d);
+            });
+            days.forEach(d => {
+                const t = totals[localDateKey(d)];
+                chartData.push({
+                    date: d.toLocaleDateString('en-US', { month: 'short', day: 'numeric' }),
+                    moisture: avgOf(t.soilMoisture),
+                    rainfall: avgOf(t.rainfall),
+                    temperature: avgOf(t.temperature),
+                    humidity: avgOf(t.humidity)
+                });
+            });
+            return res.json(chartData);
+        }
+
         console.log(`[Dashboard] History filter:`, JSON.stringify(filter));
         // Fetch all records within the 14-day window
         const rawData = await WeatherData.find(filter).sort({ createdAt: 1 }).maxTimeMS(5000);
@@ -91,7 +206,6 @@ router.get('/history', async (req, res) => {
         const avg = arr => arr.length ? parseFloat((arr.reduce((s, v) => s + v, 0) / arr.length).toFixed(1)) : null;
 
         // Generate one entry per day in the window, newest day last
-        const chartData = [];
         for (let i = 13; i >= 0; i--) {
             const d = new Date();
             d.setDate(d.getDate() - i);
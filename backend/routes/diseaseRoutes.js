@@ -5,6 +5,7 @@ const path = require('path');
 const { exec } = require('child_process');
 const fs = require('fs');
 const History = require('../models/History');
+const { cachedPrediction, cacheStats } = require('../services/diseaseCache');
 
 // Configure Multer for image uploads
 const storage = multer.diskStorage({
@@ -44,50 +45,59 @@ const pythonExec = (function () {
     return fs.existsSync(venvPython) ? venvPython : (process.platform === 'win32' ? 'python' : 'python3');
 })();
 
-// POST /api/disease/predict
-router.post('/predict', upload.single('leafImage'), (req, res) => {
-    try {
-        if (!req.file) {
-            return res.status(400).json({ error: 'Please upload an image file.' });
-        }
-
-        const imagePath = req.file.path;
-        const scriptPath = path.join(__dirname, '../../ml/predict_disease.py');
-
-        // Call Python script
-        const command = `"${pythonExec}" "${scriptPath}" "${imagePath}"`;
-
+// Runs predict_disease.py on one image; resolves to the parsed JSON result
+function runDiseaseModel(imagePath) {
+    const scriptPath = path.join(__dirname, '../../ml/predict_disease.py');
+    const command = `"${pythonExec}" "${scriptPath}" "${imagePath}"`;
+    return new Promise((resolve, reject) => {
         exec(command, (error, stdout, stderr) => {
-            // Clean up: Delete image after processing (optional, keeping it for now might be useful for debug)
-            // fs.unlinkSync(imagePath); 
-
             if (error) {
                 console.error('Disease Prediction Error:', error);
-                return res.status(500).json({ error: 'Failed to analyze image.', details: stderr });
+                return reject(Object.assign(new Error('Failed to analyze image.'), { details: stderr }));
             }
-
             try {
-                const result = JSON.parse(stdout.trim());
-
-                // Save to history
-                History.create({
-                    type: 'DISEASE',
-                    input: { image: req.file.originalname },
-                    result: result.disease,
-                    userEmail: req.body.userEmail
-                }).catch(err => console.error("History save error:", err));
-
-                res.json(result);
+                resolve(JSON.parse(stdout.trim()));
             } catch (e) {
                 console.error('JSON Parse Error:', e, stdout);
-                res.status(500).json({ error: 'Invalid response from model.' });
+                reject(new Error('Invalid response from model.'));
             }
         });
+    });
+}
 
+// POST /api/disease/predict
+// Results are cached by image content hash + model version (services/diseaseCache.js),
+// so re-uploads of the same photo skip the Python process entirely.
+router.post('/predict', upload.single('leafImage'), async (req, res) => {
+    if (!req.file) {
+        return res.status(400).json({ error: 'Please upload an image file.' });
+    }
+
+    const imagePath = req.file.path;
+    try {
+        const { result, cache } = await cachedPrediction(imagePath, () => runDiseaseModel(imagePath));
+        // Clean up: Delete image after processing (optional, keeping it for now might be useful for debug)
+        // fs.unlinkSync(imagePath);
+
+        // Save to history
+        History.create({
+            type: 'DISEASE',
+            input: { image: req.file.originalname },
+            result: result.disease,
+            userEmail: req.body.userEmail
+        }).catch(err => console.error("History save error:", err));
+
+        res.set('X-Cache', cache);
+        res.json(result);
     } catch (error) {
         console.error('Server Error:', error);
-        res.status(500).json({ error: error.message });
+        res.status(500).json({ error: error.message, details: error.details });
     }
 });
 
+// GET /api/disease/cache-stats
+router.get('/cache-stats', (req, res) => {
+    res.json(cacheStats());
+});
+
 module.exports = router;
@@ -1,7 +1,15 @@
 const express = require("express");
 const router = express.Router();
+const { spawn } = require("child_process");
+const path = require("path");
+const fs = require("fs");
 const { computeIrrigationSchedule, getGrowthStage } = require("../services/waterBalance");
 
+const pythonBin = (function () {
+    const venvPython = path.join(__dirname, "..", "..", ".venv", "Scripts", "python.exe");
+    return fs.existsSync(venvPython) ? venvPython : (process.platform === "win32" ? "python" : "python3");
+})();
+
 /**
  * GET /api/irrigation/schedule
  * Query params: location, crop, plantingDate, soilType, rootDepth
@@ -31,6 +39,40 @@ router.get("/schedule", async (req, res) => {
     }
 });
 
+/**
+ * POST /api/irrigation/season-simulation
+ * Body: { farms: [{ id, city, crop, soilType, plantingDate, rootDepth, fieldSize, lat }],
+ *         traces?, source?: "auto" | "history" | "model" }
+ *
+ * Monte Carlo water budget over the whole growth cycle (ml/irrigation_sim.py):
+ * percentile irrigation need, irrigation events and stress-day risk per farm.
+ */
+router.post("/season-simulation", (req, res) => {
+    const { farms, traces = 2000, source = "auto" } = req.body || {};
+    if (!Array.isArray(farms) || farms.length === 0) {
+        return res.status(400).json({ error: "farms must be a non-empty array" });
+    }
+    if (!["auto", "history", "model"].includes(source)) {
+        return res.status(400).json({ error: "source must be auto, history or model" });
+    }
+    const nTraces = Math.min(Math.max(parseInt(traces, 10) || 2000, 100), 20000);
+
+    const script = path.join(__dirname, "..", "..", "ml", "irrigation_sim.py");
+    const child = spawn(pythonBin, [script, "-", "--traces", String(nTraces), "--source", source],
+        { cwd: path.join(__dirname, "..", "..", "ml") });
+    let stdout = "", stderr = "";
+    child.stdout.on("data", chunk => stdout += chunk);
+    child.stderr.on("data", chunk => stderr += chunk);
+    child.on("error", err => res.status(500).json({ error: err.message }));
+    child.on("close", (code) => {
+        if (res.headersSent) return;
+        if (code !== 0) return res.status(500).json({ error: `simulation exited with ${code}`, stderr });
+        try { res.json(JSON.parse(stdout)); }
+        catch (e) { res.status(500).json({ error: "Invalid JSON from simulation", stderr }); }
+    });
+    child.stdin.end(JSON.stringify(farms));
+});
+
 /**
  * GET /api/irrigation/growth-stage
  * Query params: crop, plantingDate
@@ -1,6 +1,6 @@
 const express = require("express");
 const router = express.Router();
-const { exec } = require("child_process");
+const { exec, spawn } = require("child_process");
 const path = require("path");
 const mongoose = require("mongoose");
 const fs = require('fs');
@@ -13,8 +13,22 @@ const pythonExec = (function () {
 // single-flight promise used to avoid concurrent background trainings
 let soilTrainingPromise = null;
 
+// predict_server.py answers 503 + Retry-After when its queue is full; until then
+// predict-crop answers 503 itself instead of piling more work (or predict.py spawns) on top
+let predictServerBackoffUntil = 0;
+const PREDICT_DEADLINE_MS = 4000; // below the 5s socket timeout, so the server drops stale work first
+
+function backOffPredictServer(retryAfterSec) {
+  const sec = Math.max(1, Number(retryAfterSec) || 1);
+  predictServerBackoffUntil = Math.max(predictServerBackoffUntil, Date.now() + sec * 1000);
+  return sec;
+}
+
 const PredictionHistory = require("../models/PredictionHistory");
+const { respondWithTrainingJob, submitJob, waitForJob, getJob, cancelJob } = require("../services/trainingJobs");
 const SoilPrediction = require("../models/SoilPrediction");
+const { getRecommendation } = require("../services/recommendations");
+const RECOMMENDATION_NUMERIC = ["temperature", "humidity", "rainfall", "soilMoisture", "nitrogen", "phosphorus", "potassium", "soil_ph"];
 
 // DEBUG helper - echo request body (temporary)
 router.post('/echo', (req, res) => { res.json({ body: req.body }); });
@@ -241,7 +255,7 @@ router.get("/force-reseed", async (req, res) => {
 
 // Trigger Retrain Route
 router.get("/trigger-retrain", async (req, res) => {
-  try {
+  const runInline = () => {
     const scriptPath = path.join(__dirname, '../../ml/train_model.py');
     const command = `"${pythonExec}" "${scriptPath}"`;
     console.log("Triggering retrain:", command);
@@ -254,6 +268,10 @@ router.get("/trigger-retrain", async (req, res) => {
       console.log("Retrain Output:", stdout);
       res.json({ message: "Retraining complete", stdout });
     });
+  };
+  try {
+    await respondWithTrainingJob(req, res, 'crop', 'ml_metrics', runInline,
+      (output) => ({ message: "Retraining complete", stdout: output }));
   } catch (err) {
     res.status(500).json({ error: err.message });
   }
@@ -274,6 +292,8 @@ router.post("/predict-crop", async (req, res) => {
       soilType,
       region,
       season,
+      explain,
+      explainTop,
       userEmail // capture userEmail
     } = req.body;
 
@@ -292,7 +312,9 @@ router.post("/predict-crop", async (req, res) => {
       potassium: potassium ?? null,
       soilType: soilType || '',
       region: region || '',
-      season: season || ''
+      season: season || '',
+      // per-input contributions to the prediction (prediction server only)
+      ...(explain ? { explain: true, explainTop: explainTop ?? null } : {})
     };
 
     // ── Try persistent prediction server first (fast, no cold-start) ───────────
@@ -304,19 +326,41 @@ router.post("/predict-crop", async (req, res) => {
         port: 5001,
         path: '/predict-crop',
         method: 'POST',
-        headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(body) },
+        headers: {
+          'Content-Type': 'application/json',
+          'Content-Length': Buffer.byteLength(body),
+          'X-Request-Deadline-Ms': String(PREDICT_DEADLINE_MS),
+        },
         timeout: 5000,
       };
       const req2 = http.request(options, (response) => {
         let data = '';
         response.on('data', chunk => data += chunk);
         response.on('end', () => {
-          try { resolve(JSON.parse(data)); }
-          catch (e) { reject(new Error('Invalid JSON from prediction server')); }
+          let parsed;
+          try { parsed = JSON.parse(data); }
+          catch (e) { return reject(new Error('Invalid JSON from prediction server')); }
+          if (response.statusCode === 503) {
+            const err = new Error(parsed.error || 'Prediction server overloaded');
+            err.overloaded = true;
+            err.retryAfter = response.headers['retry-after'];
+            return reject(err);
+          }
+          if (response.statusCode !== 200) {
+            const err = new Error(parsed.error || `Prediction server returned ${response.statusCode}`);
+            err.status = response.statusCode;
+            return reject(err);
+          }
+          resolve(parsed);
         });
       });
       req2.on('error', reject);
-      req2.on('timeout', () => { req2.destroy(); reject(new Error('Prediction server timeout')); });
+      // alive but not answering in time: overloaded, not down
+      req2.on('timeout', () => {
+        const err = new Error('Prediction server timeout');
+        err.overloaded = true;
+        req2.destroy(err);
+      });
       req2.write(body);
       req2.end();
     });
@@ -347,11 +391,28 @@ router.post("/predict-crop", async (req, res) => {
       });
     });
 
+    const backoffMs = predictServerBackoffUntil - Date.now();
+    if (backoffMs > 0) {
+      const retryAfter = Math.ceil(backoffMs / 1000);
+      res.set('Retry-After', String(retryAfter));
+      return res.status(503).json({ error: 'Prediction service busy, retry later', retryAfter });
+    }
+
     let predictedData = {};
     try {
       predictedData = await tryPredictServer();
       console.log('PREDICT-CROP: used persistent prediction server');
     } catch (serverErr) {
+      if (serverErr.overloaded) {
+        // a cold predict.py per request would only deepen the overload
+        const retryAfter = backOffPredictServer(serverErr.retryAfter);
+        console.log(`PREDICT-CROP: prediction server overloaded (${serverErr.message}), backing off ${retryAfter}s`);
+        res.set('Retry-After', String(retryAfter));
+        return res.status(503).json({ error: 'Prediction service busy, retry later', retryAfter });
+      }
+      if (serverErr.status) {
+        return res.status(serverErr.status).json({ error: serverErr.message });
+      }
       console.log('PREDICT-CROP: prediction server not available, falling back to child process:', serverErr.message);
       predictedData = await tryChildProcess();
     }
@@ -371,21 +432,110 @@ router.post("/predict-crop", async (req, res) => {
       ? String(predictedData.predictedCrop)
       : String(predictedData || '');
 
-    // ✅ SAVE TO DB
-    await PredictionHistory.create({
+    // ✅ SAVE TO DB — off the response path (predict_server.py also keeps its own event log)
+    PredictionHistory.create({
       type: "CROP",
       input: { temperature, humidity, rainfall, soil_ph, soilMoisture, nitrogen, phosphorus, potassium, soilType, region, season },
       result: finalCrop,
       userEmail
-    });
+    }).catch(err => console.error('PredictionHistory save error:', err.message));
 
-    res.json({ predictedCrop: finalCrop });
+    res.json(predictedData.explanation
+      ? { predictedCrop: finalCrop, explanation: predictedData.explanation }
+      : { predictedCrop: finalCrop });
   } catch (err) {
     console.error('predict-crop fatal error:', err.message);
     res.status(500).json({ error: err.message });
   }
 });
 
+// POST → what-if sweep over crop + yield models (served by predict_server.py /sweep)
+router.post("/sweep", async (req, res) => {
+  const http = require('http');
+  const body = JSON.stringify(req.body || {});
+  const req2 = http.request({
+    hostname: '127.0.0.1',
+    port: 5001,
+    path: '/sweep',
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(body) },
+    timeout: 30000,
+  }, (response) => {
+    let data = '';
+    response.on('data', chunk => data += chunk);
+    response.on('end', () => {
+      if (response.headers['retry-after']) res.set('Retry-After', response.headers['retry-after']);
+      try { res.status(response.statusCode).json(JSON.parse(data)); }
+      catch (e) { res.status(502).json({ error: 'Invalid JSON from prediction server' }); }
+    });
+  });
+  req2.on('error', err => res.status(503).json({ error: 'Prediction server not available', detail: err.message }));
+  req2.on('timeout', () => { req2.destroy(); });
+  req2.write(body);
+  req2.end();
+});
+
+// POST → multi-season crop rotation plan for one field (served by predict_server.py /rotation-plan)
+router.post("/rotation-plan", async (req, res) => {
+  const http = require('http');
+  const body = JSON.stringify(req.body || {});
+  const req2 = http.request({
+    hostname: '127.0.0.1',
+    port: 5001,
+    path: '/rotation-plan',
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(body) },
+    timeout: 30000,
+  }, (response) => {
+    let data = '';
+    response.on('data', chunk => data += chunk);
+    response.on('end', () => {
+      if (response.headers['retry-after']) res.set('Retry-After', response.headers['retry-after']);
+      try { res.status(response.statusCode).json(JSON.parse(data)); }
+      catch (e) { res.status(502).json({ error: 'Invalid JSON from prediction server' }); }
+    });
+  });
+  req2.on('error', err => res.status(503).json({ error: 'Prediction server not available', detail: err.message }));
+  req2.on('timeout', () => { req2.destroy(); });
+  req2.write(body);
+  req2.end();
+});
+
+// GET → input-drift report per served model (predict_server.py /drift, PSI per feature)
+router.get("/drift", (req, res) => {
+  const http = require('http');
+  const req2 = http.get({ hostname: '127.0.0.1', port: 5001, path: '/drift', timeout: 5000 }, (response) => {
+    let data = '';
+    response.on('data', chunk => data += chunk);
+    response.on('end', () => {
+      try { res.status(response.statusCode).json(JSON.parse(data)); }
+      catch (e) { res.status(502).json({ error: 'Invalid JSON from prediction server' }); }
+    });
+  });
+  req2.on('error', err => res.status(503).json({ error: 'Prediction server not available', detail: err.message }));
+  req2.on('timeout', () => { req2.destroy(); });
+});
+
+// GET → precomputed crop / yield / rainfall recommendation for a user
+// (?email=..., optionally with custom inputs such as &season=Rabi&nitrogen=60, which are scored live)
+router.get("/recommendations", async (req, res) => {
+  const email = req.query.email || req.query.userEmail;
+  if (!email) return res.status(400).json({ error: "email is required" });
+  const overrides = {};
+  for (const key of RECOMMENDATION_NUMERIC) {
+    if (req.query[key] !== undefined && req.query[key] !== '') overrides[key] = Number(req.query[key]);
+  }
+  for (const key of ["soilType", "region", "season"]) {
+    if (req.query[key]) overrides[key] = String(req.query[key]);
+  }
+  try {
+    res.json(await getRecommendation(String(email), overrides));
+  } catch (err) {
+    const status = err.code === 'user-not-found' ? 404 : err.code === 'no-recent-weather' ? 409 : 500;
+    res.status(status).json({ error: err.message });
+  }
+});
+
 // POST → seed synthetic crop dataset into 'crop_samples' collection
 router.post('/seed-crop', async (req, res) => {
   try {
@@ -406,7 +556,7 @@ router.post('/seed-crop', async (req, res) => {
 
 // POST → trigger training script (creates test set + metrics)
 router.post('/train', async (req, res) => {
-  try {
+  const runInline = () => {
     const scriptPath = path.join(__dirname, '../../ml/train_model.py');
     const command = `"${pythonExec}" "${scriptPath}"`;
 
@@ -421,6 +571,9 @@ router.post('/train', async (req, res) => {
 
       res.json({ output: stdout, metrics });
     });
+  };
+  try {
+    await respondWithTrainingJob(req, res, 'crop', 'ml_metrics', runInline);
   } catch (err) {
     res.status(500).json({ error: err.message });
   }
@@ -428,7 +581,7 @@ router.post('/train', async (req, res) => {
 
 // POST → train rainfall model
 router.post('/train-rainfall', async (req, res) => {
-  try {
+  const runInline = () => {
     const scriptPath = path.join(__dirname, '../../ml/train_rainfall.py');
     const command = `"${pythonExec}" "${scriptPath}"`;
 
@@ -441,15 +594,39 @@ router.post('/train-rainfall', async (req, res) => {
       const metrics = await db.collection('rainfall_metrics').findOne({}, { sort: { createdAt: -1 } });
       res.json({ output: stdout, metrics });
     });
+  };
+  try {
+    await respondWithTrainingJob(req, res, 'rainfall', 'rainfall_metrics', runInline);
   } catch (err) {
     res.status(500).json({ error: err.message });
   }
 });
 
 
+// GET → training job status (?wait=<sec> long-polls until finished)
+router.get('/jobs/:id', async (req, res) => {
+  try {
+    const { status, body } = await getJob(req.params.id, Math.min(Number(req.query.wait) || 0, 30));
+    res.status(status).json(body);
+  } catch (err) {
+    res.status(503).json({ error: 'Job runner not available', detail: err.message });
+  }
+});
+
+// POST → cancel a queued or running training job
+router.post('/jobs/:id/cancel', async (req, res) => {
+  try {
+    const { status, body } = await cancelJob(req.params.id);
+    res.status(status).json(body);
+  } catch (err) {
+    res.status(503).json({ error: 'Job runner not available', detail: err.message });
+  }
+});
+
+
 // POST → train soil-health model
 router.post('/train-soil', async (req, res) => {
-  try {
+  const runInline = () => {
     const scriptPath = path.join(__dirname, '../../ml/train_soil.py');
     const command = `"${pythonExec}" "${scriptPath}"`;
 
@@ -462,6 +639,9 @@ router.post('/train-soil', async (req, res) => {
       const metrics = await db.collection('soil_metrics').findOne({}, { sort: { createdAt: -1 } });
       res.json({ output: stdout, metrics });
     });
+  };
+  try {
+    await respondWithTrainingJob(req, res, 'soil', 'soil_metrics', runInline);
   } catch (err) {
     res.status(500).json({ error: err.message });
   }
@@ -498,7 +678,18 @@ router.post('/predict-soil', async (req, res) => {
         const trainScript = path.join(__dirname, '../../ml/train_soil.py');
         const trainCmd = `"${pythonExec}" "${trainScript}"`;
         soilTrainingPromise = (async () => {
-          const result = await runCmd(trainCmd);
+          // job runner dedupes with any /train-soil already in flight; inline exec if it is down
+          const job = await submitJob('soil').then(r => r.body).catch(() => null);
+          let result;
+          if (job && job.id) {
+            const done = await waitForJob(job.id).catch(err => ({ status: 'failed', error: err.message }));
+            const log = (done.log || []).join('\n');
+            result = done.status === 'succeeded'
+              ? { error: null, stdout: log, stderr: '' }
+              : { error: new Error(done.error || `training ${done.status}`), stdout: '', stderr: log };
+          } else {
+            result = await runCmd(trainCmd);
+          }
           // clear the promise when done so future requests can trigger retrain if needed
           soilTrainingPromise = null;
           return result;
@@ -625,7 +816,28 @@ router.get('/soil-history', async (req, res) => {
 });
 
 // GET → soil prediction history CSV export
-router.get('/soil-history/export', async (req, res) => {
+// streamed by ml/history_archive.py (archived months + live rows); Mongo-only if it cannot run
+router.get('/soil-history/export', (req, res) => {
+  const scriptPath = path.join(__dirname, '../../ml/history_archive.py');
+  const child = spawn(pythonExec, [scriptPath, 'export', 'soilpredictions']);
+  let stderr = '';
+  child.stderr.on('data', chunk => stderr += chunk);
+  child.stdout.once('data', () => {
+    res.setHeader('Content-Type', 'text/csv');
+    res.setHeader('Content-Disposition', 'attachment; filename="soil_predictions.csv"');
+  });
+  child.stdout.pipe(res, { end: false });
+  const done = (code) => {
+    if (code === 0) return res.end();
+    if (res.headersSent) return res.destroy(new Error(stderr || `export exited with ${code}`));
+    console.error('Archive export unavailable, exporting live rows only:', stderr || code);
+    exportLiveSoilHistory(res);
+  };
+  child.on('error', () => done(-1));
+  child.on('close', done);
+});
+
+async function exportLiveSoilHistory(res) {
   try {
     const rows = await SoilPrediction.find().sort({ createdAt: -1 }).lean();
 
@@ -653,6 +865,6 @@ router.get('/soil-history/export', async (req, res) => {
   } catch (err) {
     res.status(500).json({ error: err.message });
   }
-});
+}
 
 module.exports = router;
@@ -59,6 +59,8 @@ router.get("/collect", async (req, res) => {
       windSpeed: wind,
       pressure: press,
       city: city,
+      lat: data.coord?.lat,
+      lon: data.coord?.lon,
       soilMoisture: parseFloat(calculatedMoisture.toFixed(1)),
     });
 
@@ -12,10 +12,11 @@ const pythonExec = (function () {
 })();
 
 const YieldPrediction = require('../models/YieldPrediction');
+const { respondWithTrainingJob } = require('../services/trainingJobs');
 
 // POST → train yield model
 router.post('/train', async (req, res) => {
-  try {
+  const runInline = () => {
     const scriptPath = path.join(__dirname, '../../ml/train_yield.py');
     const command = `"${pythonExec}" "${scriptPath}"`;
 
@@ -28,6 +29,9 @@ router.post('/train', async (req, res) => {
       const metrics = await db.collection('yield_metrics').findOne({}, { sort: { createdAt: -1 } });
       res.json({ output: stdout, metrics });
     });
+  };
+  try {
+    await respondWithTrainingJob(req, res, 'yield', 'yield_metrics', runInline);
   } catch (err) {
     res.status(500).json({ error: err.message });
   }
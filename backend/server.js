@@ -68,6 +68,9 @@ mongoose
   .connect(mongoUri)
   .then(() => {
     console.log("✅ MongoDB connected");
+    require("./models/WeatherData").backfillCityKeys()
+      .then((n) => n && console.log(`🏙️  WeatherData cityKey backfilled on ${n} rows`))
+      .catch((err) => console.error("⚠️  WeatherData cityKey backfill failed:", err.message));
     // Start irrigation scheduler after DB is ready
     const { startScheduler } = require("./services/irrigationScheduler");
     startScheduler();
@@ -103,5 +106,21 @@ app.listen(PORT, () => {
   } else {
     console.warn('⚠️  predict_server.py not found — predictions use slower child process fallback');
   }
+
+  // ── Auto-start training job runner (queues/dedupes train_*.py runs) ─────────
+  const jobRunnerScript = path.join(__dirname, '..', 'ml', 'job_runner.py');
+  if (fs.existsSync(jobRunnerScript)) {
+    const jobRunner = spawn(pythonBin, [jobRunnerScript], {
+      detached: false,
+      stdio: ['ignore', 'pipe', 'pipe'],
+    });
+    jobRunner.stdout.on('data', d => console.log(`[JobRunner] ${d.toString().trim()}`));
+    jobRunner.stderr.on('data', d => console.error(`[JobRunner ERR] ${d.toString().trim()}`));
+    jobRunner.on('close', code => console.log(`[JobRunner] exited with code ${code}`));
+    jobRunner.on('error', err => console.error('[JobRunner] Failed to start:', err.message));
+    process.on('exit', () => { try { jobRunner.kill(); } catch (e) { } });
+  } else {
+    console.warn('⚠️  job_runner.py not found — training routes run inline');
+  }
 });
 
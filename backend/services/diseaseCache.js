@@ -0,0 +1,171 @@
+/**
+ * diseaseCache.js
+ * ===============
+ * Content-hash result cache for /api/disease/predict.
+ *
+ * Farmers often upload the same leaf photo several times. Each upload is
+ * hashed (SHA-256 of the bytes) and looked up by (model version, hash):
+ *   1. in-memory LRU (DISEASE_CACHE_MEMORY_ENTRIES, default 500)
+ *   2. on-disk JSON under cache/disease/<version>/ (DISEASE_CACHE_DISK_ENTRIES,
+ *      default 5000; least recently used files are evicted, old versions first)
+ *   3. otherwise predict_disease.py runs once — concurrent uploads of the same
+ *      image share that single run.
+ * The model version is derived from predict_disease.py and ml/disease_model.h5
+ * (size + mtime), so replacing the model starts a fresh cache namespace.
+ */
+
+const crypto = require("crypto");
+const fs = require("fs");
+const fsp = fs.promises;
+const path = require("path");
+
+const ML_DIR = path.join(__dirname, "..", "..", "ml");
+const CACHE_DIR = process.env.DISEASE_CACHE_DIR || path.join(__dirname, "..", "..", "cache", "disease");
+const MAX_MEMORY_ENTRIES = Number(process.env.DISEASE_CACHE_MEMORY_ENTRIES || 500);
+const MAX_DISK_ENTRIES = Number(process.env.DISEASE_CACHE_DISK_ENTRIES || 5000);
+const MODEL_FILES = [path.join(ML_DIR, "predict_disease.py"), path.join(ML_DIR, "disease_model.h5")];
+
+const memory = new Map();   // key -> result; Map order doubles as LRU order
+const inflight = new Map(); // key -> Promise of { result, cache }
+let diskEntries = null;     // counted lazily on first write
+let evicting = null;
+const stats = { memoryHits: 0, diskHits: 0, shared: 0, misses: 0, evictedMemory: 0, evictedDisk: 0 };
+
+function hashFile(filePath) {
+    return new Promise((resolve, reject) => {
+        const hash = crypto.createHash("sha256");
+        fs.createReadStream(filePath)
+            .on("data", chunk => hash.update(chunk))
+            .on("error", reject)
+            .on("end", () => resolve(hash.digest("hex")));
+    });
+}
+
+function modelVersion() {
+    const parts = MODEL_FILES.map((f) => {
+        try {
+            const st = fs.statSync(f);
+            return `${path.basename(f)}:${st.size}:${Math.floor(st.mtimeMs)}`;
+        } catch (e) {
+            return `${path.basename(f)}:-`;
+        }
+    });
+    return crypto.createHash("sha1").update(parts.join("|")).digest("hex").slice(0, 12);
+}
+
+function remember(key, result) {
+    memory.delete(key);
+    memory.set(key, result);
+    while (memory.size > MAX_MEMORY_ENTRIES) {
+        memory.delete(memory.keys().next().value);
+        stats.evictedMemory++;
+    }
+}
+
+const diskPath = (version, hash) => path.join(CACHE_DIR, version, `${hash}.json`);
+
+async function readDisk(version, hash) {
+    const file = diskPath(version, hash);
+    try {
+        const result = JSON.parse(await fsp.readFile(file, "utf8"));
+        const now = new Date();
+        fsp.utimes(file, now, now).catch(() => {}); // mtime = last use, for LRU eviction
+        return result;
+    } catch (e) {
+        return null;
+    }
+}
+
+async function listDisk() {
+    const entries = [];
+    let versions = [];
+    try { versions = await fsp.readdir(CACHE_DIR); } catch (e) { return entries; }
+    for (const version of versions) {
+        let files = [];
+        try { files = await fsp.readdir(path.join(CACHE_DIR, version)); } catch (e) { continue; }
+        for (const f of files) {
+            if (!f.endsWith(".json")) continue;
+            const file = path.join(CACHE_DIR, version, f);
+            try { entries.push({ file, version, mtimeMs: (await fsp.stat(file)).mtimeMs }); } catch (e) { /* raced */ }
+        }
+    }
+    return entries;
+}
+
+// drop entries of other model versions first, then the least recently used, down to 90% of the limit
+async function evictDisk(currentVersion) {
+    const entries = await listDisk();
+    const target = Math.floor(MAX_DISK_ENTRIES * 0.9);
+    entries.sort((a, b) => ((a.version === currentVersion) - (b.version === currentVersion)) || (a.mtimeMs - b.mtimeMs));
+    let count = entries.length;
+    for (const e of entries) {
+        if (count <= target) break;
+        try { await fsp.unlink(e.file); count--; stats.evictedDisk++; } catch (err) { /* already gone */ }
+    }
+    diskEntries = count;
+}
+
+async function writeDisk(version, hash, result) {
+    const file = diskPath(version, hash);
+    await fsp.mkdir(path.dirname(file), { recursive: true });
+    const tmp = `${file}.${process.pid}.tmp`;
+    await fsp.writeFile(tmp, JSON.stringify(result));
+    await fsp.rename(tmp, file);
+    if (diskEntries === null) diskEntries = (await listDisk()).length;
+    else diskEntries++;
+    if (diskEntries > MAX_DISK_ENTRIES && !evicting) {
+        evicting = evictDisk(version).finally(() => { evicting = null; });
+    }
+}
+
+/**
+ * Result for the image at `imagePath`, from cache or by calling `compute()`
+ * (which must resolve to the prediction object). Resolves to
+ * { result, cache: "memory" | "disk" | "shared" | "miss", hash }.
+ * Results carrying an `error` field are returned but not cached.
+ */
+async function cachedPrediction(imagePath, compute) {
+    const hash = await hashFile(imagePath);
+    const version = modelVersion();
+    const key = `${version}/${hash}`;
+
+    if (memory.has(key)) {
+        const result = memory.get(key);
+        remember(key, result);
+        stats.memoryHits++;
+        return { result, cache: "memory", hash };
+    }
+    if (inflight.has(key)) {
+        stats.shared++;
+        const { result } = await inflight.get(key);
+        return { result, cache: "shared", hash };
+    }
+
+    const pending = (async () => {
+        const cached = await readDisk(version, hash);
+        if (cached) {
+            stats.diskHits++;
+            remember(key, cached);
+            return { result: cached, cache: "disk" };
+        }
+        stats.misses++;
+        const result = await compute();
+        if (result && !result.error) {
+            remember(key, result);
+            writeDisk(version, hash, result).catch(err => console.error("Disease cache write failed:", err.message));
+        }
+        return { result, cache: "miss" };
+    })();
+    inflight.set(key, pending);
+    try {
+        return { ...(await pending), hash };
+    } finally {
+        inflight.delete(key);
+    }
+}
+
+function cacheStats() {
+    return { ...stats, memoryEntries: memory.size, diskEntries, inflight: inflight.size, version: modelVersion() };
+}
+
+module.exports = { cachedPrediction, cacheStats, hashFile, modelVersion };
@@ -2,6 +2,12 @@
  * irrigationScheduler.js
  * Runs every 6 hours, checks weather for each farmer's location,
  * decides if irrigation is needed, sends SMS + saves in-app notification.
+ *
+ * The run itself is ml/batch_scheduler.py (one weather fetch per distinct
+ * location, bulk inserts); this file sends the SMS it queues. If the engine
+ * cannot run, the original per-user loop below is used instead.
+ * Each run (and a nightly job) also refreshes the per-user recommendations
+ * precomputed by ml/materialize_recommendations.py.
  */
 const cron = require("node-cron");
 const axios = require("axios");
@@ -9,8 +15,20 @@ const User = require("../models/User");
 const Notification = require("../models/Notification");
 const WeatherData = require("../models/WeatherData");
 const { sendSMS } = require("./smsSender");
+const { materializeRecommendations } = require("./recommendations");
+const { execFile } = require("child_process");
+const path = require("path");
+const fs = require("fs");
+const os = require("os");
+const readline = require("readline");
+
+const pythonBin = (function () {
+    const venvPython = path.join(__dirname, "..", "..", ".venv", "Scripts", "python.exe");
+    return fs.existsSync(venvPython) ? venvPython : (process.platform === "win32" ? "python" : "python3");
+})();
 
 const OWM_KEY = process.env.OPENWEATHER_API_KEY;
+const SMS_CONCURRENCY = 5;
 
 // ── Irrigation Decision Logic ──────────────────────────────────────────────────
 function makeDecision(weather) {
@@ -80,6 +98,8 @@ async function saveWeatherData(weather, city) {
             windSpeed: wind,
             pressure: press,
             city: city,
+            lat: weather.coord?.lat,
+            lon: weather.coord?.lon,
             soilMoisture: parseFloat(soilMoisture.toFixed(1)),
         });
     } catch (err) {
@@ -127,9 +147,71 @@ async function processUser(user) {
     }
 }
 
+// ── Batch engine (ml/batch_scheduler.py) ──────────────────────────────────────
+function runBatchEngine(outbox) {
+    const script = path.join(__dirname, "..", "..", "ml", "batch_scheduler.py");
+    return new Promise((resolve, reject) => {
+        execFile(pythonBin, [script, "--sms-outbox", outbox], { maxBuffer: 1024 * 1024, timeout: 10 * 60 * 1000 },
+            (error, stdout, stderr) => {
+                if (error) return reject(new Error(stderr || error.message));
+                try { resolve(JSON.parse(stdout.trim().split("\n").pop())); }
+                catch (e) { reject(new Error(`Invalid batch engine output: ${stdout}`)); }
+            });
+    });
+}
+
+// Sends the {to, body} lines the engine queued, a few at a time
+async function drainSmsOutbox(outbox) {
+    if (!fs.existsSync(outbox)) return 0;
+    const lines = readline.createInterface({ input: fs.createReadStream(outbox), crlfDelay: Infinity });
+    let sent = 0;
+    let batch = [];
+    for await (const line of lines) {
+        if (!line.trim()) continue;
+        const { to, body } = JSON.parse(line);
+        batch.push(sendSMS(to, body));
+        if (batch.length >= SMS_CONCURRENCY) {
+            sent += (await Promise.all(batch)).filter(Boolean).length;
+            batch = [];
+        }
+    }
+    sent += (await Promise.all(batch)).filter(Boolean).length;
+    fs.unlink(outbox, () => {});
+    return sent;
+}
+
 // ── Main scheduler run ────────────────────────────────────────────────────────
 async function runScheduler() {
     console.log("⏱️  [Irrigation Scheduler] Running check...");
+    const outbox = path.join(os.tmpdir(), `sms-outbox-${process.pid}-${Date.now()}.ndjson`);
+    let summary = null;
+    try {
+        summary = await runBatchEngine(outbox);
+        console.log(`👥 ${summary.users} users in ${summary.locations} locations ` +
+            `(${summary.fetched} fetched, ${summary.cached} cached, ${summary.failed} failed) → ` +
+            `${summary.notifications} notifications`);
+    } catch (engineErr) {
+        // the engine writes its SMS outbox before its first insert: without one nothing was
+        // written and the run is redone user by user; with one, redoing it would duplicate
+        // notifications and SMS, so only the queued messages are sent
+        if (!fs.existsSync(outbox)) {
+            console.error("⚠️  Batch engine unavailable, checking users one by one:", engineErr.message);
+            await runPerUser();
+            refreshWeatherRollups();
+            return;
+        }
+        console.error("⚠️  Batch engine failed after queuing its alerts (not redone):", engineErr.message);
+    }
+    try {
+        const sent = await drainSmsOutbox(outbox);
+        console.log(`✅ [Irrigation Scheduler] Done. ${sent}/${summary ? summary.sms : "?"} SMS sent.`);
+    } catch (err) {
+        console.error("❌ [Irrigation Scheduler] SMS outbox error:", err.message);
+    }
+    refreshWeatherRollups();
+}
+
+async function runPerUser() {
     try {
         const farmers = await User.find({ location: { $ne: "" } });
         console.log(`👥 Found ${farmers.length} users with a location set`);
@@ -142,6 +224,27 @@ async function runScheduler() {
     }
 }
 
+// ── Fold the new WeatherData rows into the dashboard rollups ──────────────────
+function refreshWeatherRollups() {
+    const script = path.join(__dirname, "..", "..", "ml", "weather_rollup.py");
+    execFile(pythonBin, [script], { maxBuffer: 1024 * 1024 }, (error, stdout, stderr) => {
+        if (error) return console.error("⚠️  Weather rollup failed:", stderr || error.message);
+        console.log(`📊 Weather rollup: ${stdout.trim()}`);
+    });
+    // fresh weather → rescore every user's crop / yield / rainfall answers
+    materializeRecommendations("weather update");
+}
+
+// ── Move history older than the retention window into ml/archive ──────────────
+function compactHistory() {
+    const script = path.join(__dirname, "..", "..", "ml", "history_archive.py");
+    execFile(pythonBin, [script, "compact"], { maxBuffer: 1024 * 1024, timeout: 60 * 60 * 1000 },
+        (error, stdout, stderr) => {
+            if (error) return console.error("⚠️  History compaction failed:", stderr || error.message);
+            console.log(`🗄️  History compaction: ${stdout.trim()}`);
+        });
+}
+
 // ── Start cron ────────────────────────────────────────────────────────────────
 function startScheduler() {
     console.log("🕐 Irrigation Scheduler started — runs every 6 hours");
@@ -149,8 +252,14 @@ function startScheduler() {
     // Run every 6 hours: 0 */6 * * *
     cron.schedule("0 */6 * * *", runScheduler);
 
+    // Nightly recommendation refresh (picks up soil tests and new users): 02:30
+    cron.schedule("30 2 * * *", () => materializeRecommendations("nightly"));
+
+    // Nightly archive of old predictions / weather rows: 03:00
+    cron.schedule("0 3 * * *", compactHistory);
+
     // Also run once 30s after server start (so first alert fires quickly)
     setTimeout(runScheduler, 30_000);
 }
 
-module.exports = { startScheduler, runScheduler };
+module.exports = { startScheduler, runScheduler, refreshWeatherRollups, compactHistory };
@@ -0,0 +1,104 @@
+/**
+ * recommendations.js
+ * ==================
+ * Precomputed crop / yield / rainfall answers per registered user
+ * (ml/materialize_recommendations.py → `recommendations` collection).
+ *
+ *   - materializeRecommendations(reason) reruns the batch for every user; it is
+ *     called after weather refreshes, nightly and after successful retrains.
+ *     A request made while a run is in progress is queued as ONE follow-up run.
+ *   - getRecommendation(email, overrides) answers from the stored document
+ *     (one indexed lookup) unless it is missing, stale or custom inputs were
+ *     given; then the script scores that single user live.
+ *
+ * An entry is stale when the models it was scored with differ from those of the
+ * latest batch (`recommendation_state`), when it is older than
+ * RECOMMENDATION_MAX_AGE_H (default 24) or when the user's location changed.
+ */
+
+const { execFile } = require("child_process");
+const path = require("path");
+const fs = require("fs");
+const mongoose = require("mongoose");
+
+const pythonBin = (function () {
+    const venvPython = path.join(__dirname, "..", "..", ".venv", "Scripts", "python.exe");
+    return fs.existsSync(venvPython) ? venvPython : (process.platform === "win32" ? "python" : "python3");
+})();
+
+const SCRIPT = path.join(__dirname, "..", "..", "ml", "materialize_recommendations.py");
+const MAX_AGE_MS = Number(process.env.RECOMMENDATION_MAX_AGE_H || 24) * 3600 * 1000;
+const LIVE_TIMEOUT_MS = 60 * 1000;
+
+let running = null;   // promise of the batch in progress
+let rerun = false;    // another trigger arrived while it ran
+
+function runScript(args, timeout) {
+    return new Promise((resolve, reject) => {
+        execFile(pythonBin, [SCRIPT, ...args], { maxBuffer: 1024 * 1024 * 4, timeout },
+            (error, stdout, stderr) => {
+                let parsed = null;
+                try { parsed = JSON.parse(stdout.trim().split("\n").pop()); } catch (e) { /* handled below */ }
+                if (parsed && parsed.error) return reject(Object.assign(new Error(parsed.error), { code: parsed.error }));
+                if (error) return reject(new Error(stderr || error.message));
+                if (!parsed) return reject(new Error(`Invalid recommendation output: ${stdout}`));
+                resolve(parsed);
+            });
+    });
+}
+
+// ── Batch ─────────────────────────────────────────────────────────────────────
+function materializeRecommendations(reason = "manual") {
+    if (running) {
+        rerun = true;
+        return running;
+    }
+    running = runScript([], 30 * 60 * 1000)
+        .then((summary) => {
+            console.log(`🌱 Recommendations (${reason}): ${summary.documents} users scored, ` +
+                `${summary.skipped} skipped in ${summary.total_s}s`);
+            return summary;
+        })
+        .catch((err) => {
+            console.error(`⚠️  Recommendation batch (${reason}) failed:`, err.message);
+            return null;
+        })
+        .finally(() => {
+            running = null;
+            if (rerun) {
+                rerun = false;
+                materializeRecommendations("queued");
+            }
+        });
+    return running;
+}
+
+// ── Lookup ────────────────────────────────────────────────────────────────────
+const normalizeLocation = (loc) => String(loc || "").trim().split(/\s+/).join(" ").toLowerCase();
+
+function staleReason(doc, state, user) {
+    if (!doc) return "missing";
+    if (state && JSON.stringify(doc.modelVersion) !== JSON.stringify(state.modelVersion)) return "model-version";
+    if (Date.now() - new Date(doc.computedAt).getTime() > MAX_AGE_MS) return "age";
+    if (user && normalizeLocation(user.location) !== doc.inputs?.city) return "location";
+    return null;
+}
+
+async function getRecommendation(email, overrides = null) {
+    if (overrides && Object.keys(overrides).length) {
+        const live = await runScript(["--user", email, "--inputs", JSON.stringify(overrides)], LIVE_TIMEOUT_MS);
+        return { ...live, source: "live", reason: "custom-inputs" };
+    }
+    const db = mongoose.connection.db;
+    const [doc, state, user] = await Promise.all([
+        db.collection("recommendations").findOne({ userEmail: email }, { projection: { _id: 0 } }),
+        db.collection("recommendation_state").findOne({ _id: "current" }),
+        db.collection("users").findOne({ email }, { projection: { location: 1 } }),
+    ]);
+    const reason = staleReason(doc, state, user);
+    if (!reason) return { ...doc, source: "materialized" };
+    const live = await runScript(["--user", email], LIVE_TIMEOUT_MS);
+    return { ...live, source: "live", reason };
+}
+
+module.exports = { materializeRecommendations, getRecommendation };
@@ -0,0 +1,105 @@
+/**
+ * trainingJobs.js
+ * ===============
+ * Client for ml/job_runner.py (port 5002).
+ *
+ * Training routes submit a job instead of exec()-ing train_*.py inside the
+ * request. The runner merges duplicate requests for the same model and bounds
+ * how many fits run at once.
+ *   - `?async=1` (or body.async) → respond 202 with the job id immediately
+ *   - otherwise                  → wait for the job, respond like before ({ output, metrics })
+ * If the runner is not reachable the route falls back to the old exec() path.
+ * A successful crop / yield / rainfall job refreshes the materialized
+ * recommendations (recommendations.js), whether or not the request waited.
+ */
+
+const http = require("http");
+const mongoose = require("mongoose");
+const { materializeRecommendations } = require("./recommendations");
+
+const RUNNER_PORT = Number(process.env.JOB_RUNNER_PORT || 5002);
+// models whose answers are precomputed per user by ml/materialize_recommendations.py
+const RECOMMENDATION_MODELS = ["crop", "yield", "rainfall"];
+
+function runnerRequest(method, urlPath, payload, timeoutMs = 5000) {
+    return new Promise((resolve, reject) => {
+        const body = payload ? JSON.stringify(payload) : null;
+        const req = http.request({
+            hostname: "127.0.0.1",
+            port: RUNNER_PORT,
+            path: urlPath,
+            method,
+            headers: body
+                ? { "Content-Type": "application/json", "Content-Length": Buffer.byteLength(body) }
+                : {},
+            timeout: timeoutMs,
+        }, (response) => {
+            let data = "";
+            response.on("data", chunk => data += chunk);
+            response.on("end", () => {
+                try { resolve({ status: response.statusCode, body: JSON.parse(data) }); }
+                catch (e) { reject(new Error("Invalid JSON from job runner")); }
+            });
+        });
+        req.on("error", reject);
+        req.on("timeout", () => { req.destroy(); reject(new Error("Job runner timeout")); });
+        if (body) req.write(body);
+        req.end();
+    });
+}
+
+const submitJob = (model, args = []) => runnerRequest("POST", "/jobs", { model, args });
+const getJob = (id, waitSec = 0) => runnerRequest("GET", `/jobs/${encodeURIComponent(id)}?wait=${waitSec}`, null, (waitSec + 5) * 1000);
+const cancelJob = (id) => runnerRequest("POST", `/jobs/${encodeURIComponent(id)}/cancel`);
+
+// long-polls the runner until the job leaves queued/running
+async function waitForJob(id) {
+    for (;;) {
+        const { body } = await getJob(id, 30);
+        if (!body || !["queued", "running"].includes(body.status)) return body;
+    }
+}
+
+function refreshRecommendationsAfter(model, job) {
+    if (RECOMMENDATION_MODELS.includes(model) && job && job.status === "succeeded") {
+        materializeRecommendations(`${model} retrained`);
+    }
+}
+
+/**
+ * Run a training job for `model` through the runner and answer the request.
+ * `metricsCollection` is read after success (same response shape as the exec routes,
+ * or whatever `format(output, metrics)` returns); `fallback()` is called when the
+ * runner is unavailable.
+ */
+async function respondWithTrainingJob(req, res, model, metricsCollection, fallback, format) {
+    let submitted;
+    try {
+        submitted = await submitJob(model);
+    } catch (err) {
+        console.log(`TRAIN ${model}: job runner not available, running inline:`, err.message);
+        return fallback();
+    }
+    if (submitted.status >= 400) return res.status(submitted.status).json(submitted.body);
+
+    const job = submitted.body;
+    const wantsAsync = req.query.async === "1" || req.query.async === "true" || (req.body && req.body.async === true);
+    if (wantsAsync) {
+        if (RECOMMENDATION_MODELS.includes(model)) {
+            waitForJob(job.id).then(done => refreshRecommendationsAfter(model, done)).catch(() => {});
+        }
+        return res.status(202).json({ jobId: job.id, status: job.status, deduped: job.deduped, statusUrl: `/api/ml/jobs/${job.id}` });
+    }
+
+    const done = await waitForJob(job.id);
+    const output = (done.log || []).join("\n");
+    if (done.status !== "succeeded") {
+        return res.status(500).json({ error: done.error || `training ${done.status}`, jobId: job.id, stderr: output });
+    }
+    refreshRecommendationsAfter(model, done);
+    const metrics = await mongoose.connection.db.collection(metricsCollection).findOne({}, { sort: { createdAt: -1 } });
+    const body = format ? format(output, metrics) : { output, metrics };
+    res.json({ ...body, jobId: job.id, deduped: job.deduped });
+}
+
+module.exports = { submitJob, getJob, cancelJob, waitForJob, respondWithTrainingJob };
@@ -12,6 +12,7 @@
  */
 
 const axios = require("axios");
+const http = require("http");
 const WeatherData = require("../models/WeatherData");
 
 const OWM_KEY = process.env.OPENWEATHER_API_KEY;
@@ -109,6 +110,31 @@ async function fetchWeather(location) {
     return { current: curRes.data, forecast: foreRes.data };
 }
 
+/**
+ * Nearest stations with recent readings around (lat, lon) from predict_server.py's
+ * spatial index: { stations: [...], estimate: { soilMoisture, rainfall, temperature } }.
+ * Resolves null when the prediction server is not running.
+ */
+function nearestStations(lat, lon, k = 3) {
+    return new Promise((resolve) => {
+        const req = http.get({
+            hostname: "127.0.0.1",
+            port: 5001,
+            path: `/nearest-stations?lat=${lat}&lon=${lon}&k=${k}`,
+            timeout: 1000,
+        }, (res) => {
+            let data = "";
+            res.on("data", chunk => data += chunk);
+            res.on("end", () => {
+                try { resolve(res.statusCode === 200 ? JSON.parse(data) : null); }
+                catch (e) { resolve(null); }
+            });
+        });
+        req.on("error", () => resolve(null));
+        req.on("timeout", () => { req.destroy(); });
+    });
+}
+
 /**
  * Calculate the crop's Kc for a given day since planting.
  */
@@ -150,14 +176,26 @@ async function computeIrrigationSchedule({ location, crop, plantingDate, soilTyp
     }
 
     // ── ACCURACY UPGRADE 1: Ground in real-world moisture ────────────────────────
+    // Nearest stations by coordinate (inverse-distance weighted), so farms in towns we never
+    // fetched still get grounded; falls back to the location's normalised cityKey on the
+    // {cityKey, createdAt} index.
     let soilMoisturePercent = 65; // default fallback
-    try {
-        const latestInfo = await WeatherData.findOne({ city: new RegExp(`^${location}$`, 'i') }).sort({ createdAt: -1 });
-        if (latestInfo && latestInfo.soilMoisture !== undefined) {
-            soilMoisturePercent = latestInfo.soilMoisture;
+    let moistureSource = "default";
+    const nearby = await nearestStations(lat, lon);
+    if (nearby && nearby.estimate && nearby.estimate.soilMoisture != null) {
+        soilMoisturePercent = nearby.estimate.soilMoisture;
+        moistureSource = nearby.stations.map(s => `${s.city} (${s.distanceKm} km)`).join(", ");
+    } else {
+        try {
+            const latestInfo = await WeatherData.findOne({ cityKey: WeatherData.cityKey(location) })
+                .sort({ createdAt: -1 });
+            if (latestInfo && latestInfo.soilMoisture !== undefined) {
+                soilMoisturePercent = latestInfo.soilMoisture;
+                moistureSource = latestInfo.city;
+            }
+        } catch (e) {
+            console.warn("Could not find latest soil data, using default 65%");
         }
-    } catch (e) {
-        console.warn("Could not find latest soil data, using default 65%");
     }
 
     let soilMoisture = (soilMoisturePercent / 100) * fieldCapacity;
@@ -238,6 +276,7 @@ async function computeIrrigationSchedule({ location, crop, plantingDate, soilTyp
         soilType,
         fieldSize,
         daysSincePlanting,
+        moistureSource,
         currentGrowthStage: getGrowthStage(crop, daysSincePlanting),
         schedule: days,
         totalIrrigationNeeded: totalIrrigationMm,
@@ -0,0 +1,148 @@
+"""
+admission.py — Admission control and load shedding for predict_server.py.
+
+Requests are handed to a small pool of inference workers through a bounded
+queue instead of all running at once:
+
+  - queue full            → Overloaded straight away (HTTP 503 + Retry-After)
+  - deadline passed while
+    waiting in the queue  → dropped before inference (DeadlineExceeded, 503)
+  - otherwise             → the worker runs fn(data) and hands back the result
+
+Every request carries a deadline (the client's X-Request-Deadline-Ms budget
+or the route default), so work the caller has already given up on is never
+scored. Retry-After is estimated from the queue depth and a moving average of
+service time. snapshot() feeds /health: `ready` turns false once the queue is
+READY_FRACTION full, so callers can back off before requests are shed.
+
+  PREDICT_WORKERS       inference threads            (default 1)
+  PREDICT_QUEUE_LIMIT   queued requests before 503    (default 32)
+  PREDICT_DEADLINE_MS   default per-request deadline  (default 2000)
+"""
+import math
+import os
+import queue
+import threading
+import time
+
+READY_FRACTION = 0.75
+EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__("prediction server overloaded")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__("request deadline exceeded before inference")
+        self.retry_after = retry_after
+
+
+class _Work:
+    __slots__ = ("fn", "data", "deadline", "done", "lock", "started", "abandoned",
+                 "result", "error", "expired")
+
+    def __init__(self, fn, data, deadline):
+        self.fn, self.data, self.deadline = fn, data, deadline
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.started = self.abandoned = self.expired = False
+        self.result = self.error = None
+
+
+class AdmissionController:
+    def __init__(self, workers=None, max_queue=None, default_deadline_ms=None):
+        self.workers = int(workers or os.environ.get("PREDICT_WORKERS", "1"))
+        self.max_queue = int(max_queue or os.environ.get("PREDICT_QUEUE_LIMIT", "32"))
+        self.default_deadline_ms = float(default_deadline_ms or os.environ.get("PREDICT_DEADLINE_MS", "2000"))
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._service_s = 0.01          # EWMA of fn() wall time
+        self.counters = {"admitted": 0, "completed": 0, "failed": 0, "shed": 0, "expired": 0}
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"inference-{i}", daemon=True).start()
+
+    # ── Caller side ───────────────────────────────────────────────────────────
+    def submit(self, fn, data, deadline_ms=None):
+        """Run fn(data) on an inference worker; blocks until done or the deadline passes."""
+        budget = self.default_deadline_ms if deadline_ms is None else max(0.0, float(deadline_ms))
+        item = _Work(fn, data, time.monotonic() + budget / 1000)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._count("shed")
+            raise Overloaded(self.retry_after())
+        self._count("admitted")
+
+        if not item.done.wait(max(0.0, item.deadline - time.monotonic())):
+            with item.lock:
+                if not item.started:
+                    # still queued: the worker will discard it
+                    item.abandoned = True
+            if item.abandoned:
+                self._count("expired")
+                raise DeadlineExceeded(self.retry_after())
+            item.done.wait()            # already running — finishing is cheaper than re-queuing
+        if item.expired:
+            raise DeadlineExceeded(self.retry_after())
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def retry_after(self):
+        """Whole seconds until the current backlog should have drained (at least 1)."""
+        backlog = self._queue.qsize() + self._inflight
+        return max(1, math.ceil(backlog * self._service_s / self.workers))
+
+    def snapshot(self):
+        depth = self._queue.qsize()
+        with self._lock:
+            return {
+                "ready":         depth < self.max_queue * READY_FRACTION,
+                "queueDepth":    depth,
+                "queueLimit":    self.max_queue,
+                "inflight":      self._inflight,
+                "workers":       self.workers,
+                "deadlineMs":    self.default_deadline_ms,
+                "avgServiceMs":  round(self._service_s * 1000, 3),
+                "retryAfter":    self.retry_after(),
+                **self.counters,
+            }
+
+    # ── Worker side ───────────────────────────────────────────────────────────
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            with item.lock:
+                if item.abandoned:
+                    continue
+                if time.monotonic() >= item.deadline:
+                    item.expired = True
+                else:
+                    item.started = True
+            if item.expired:
+                self._count("expired")
+                item.done.set()
+                continue
+
+            with self._lock:
+                self._inflight += 1
+            t0 = time.perf_counter()
+            try:
+                item.result = item.fn(item.data)
+            except Exception as e:
+                item.error = e
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self._inflight -= 1
+                self._service_s += EWMA_ALPHA * (elapsed - self._service_s)
+                self.counters["failed" if item.error is not None else "completed"] += 1
+            item.done.set()
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
@@ -0,0 +1,405 @@
+"""
+batch_scheduler.py — Batch engine behind irrigationScheduler.js's runScheduler.
+
+One run covers every farmer with a location:
+
+  1. users are grouped by normalised location (trimmed, single-spaced,
+     lower-case), so a city shared by a thousand farmers is fetched once
+  2. each location's current weather comes from the TTL cache
+     (WEATHER_CACHE_TTL_S, default 1800) or from OpenWeatherMap via asyncio,
+     at most WEATHER_CONCURRENCY (default 16) requests in flight
+  3. the irrigation decision (same rules as makeDecision in
+     irrigationScheduler.js) is evaluated with numpy for all locations and
+     broadcast to their users
+  4. SMS texts for users with a phone are written to --sms-outbox (NDJSON);
+     irrigationScheduler.js sends them through smsSender.js. The file appears
+     before any insert, so its absence after a failed run means nothing was
+     written
+  5. one WeatherData document per freshly fetched location and one
+     Notification per user go to MongoDB with unordered, chunked insert_many
+
+OWM_BASE_URL points the fetcher at any server speaking the /data/2.5/weather
+API; --stub-server runs a deterministic local stand-in for tests.
+
+Usage:
+  python ml/batch_scheduler.py                                  # Mongo users → Mongo writes
+  python ml/batch_scheduler.py --sms-outbox /tmp/sms.ndjson
+  python ml/batch_scheduler.py --users-file users.json --no-db  # dry run, JSON summary only
+  python ml/batch_scheduler.py --stub-server 8099               # stand-in weather API
+  python ml/batch_scheduler.py --benchmark 100000 --cities 500  # stub + synthetic users
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, quote, urlsplit
+from urllib.request import urlopen
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.path.join(BASE_DIR, "..", "cache", "weather", "current.json")
+OWM_BASE_URL = os.environ.get("OWM_BASE_URL", "https://api.openweathermap.org")
+CONCURRENCY = int(os.environ.get("WEATHER_CONCURRENCY", "16"))
+CACHE_TTL_S = float(os.environ.get("WEATHER_CACHE_TTL_S", "1800"))
+FETCH_TIMEOUT_S = 8
+RETRY_STATUS = (429, 500, 502, 503, 504)
+INSERT_CHUNK = 10000
+
+# decision codes, in makeDecision's order of precedence
+NO_ACTION_WET, IRRIGATE, CAUTION, GOOD = 0, 1, 2, 3
+DECISION_TYPE = {NO_ACTION_WET: "no-action", IRRIGATE: "irrigate", CAUTION: "caution", GOOD: "no-action"}
+DECISION_TITLE = {
+    NO_ACTION_WET: "✅ No Irrigation Needed",
+    IRRIGATE:      "🔴 Irrigate Now!",
+    CAUTION:       "🟡 Monitor Your Crops",
+    GOOD:          "✅ Conditions Are Good",
+}
+
+
+def normalize_location(location):
+    return " ".join(str(location or "").split()).lower()
+
+
+def _js(v):
+    """Number formatting of a JS template literal (65 → "65", 65.5 → "65.5", missing → "undefined")."""
+    if v is None:
+        return "undefined"
+    return str(int(v)) if float(v).is_integer() else str(v)
+
+
+# ── Weather fetching ──────────────────────────────────────────────────────────
+class WeatherCache:
+    """{"<base url>|<location>": {"at": epoch, "data": owm json}} persisted as one JSON file."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL_S):
+        self.path, self.ttl = path, ttl
+        self.entries = {}
+        if path and ttl > 0:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, key, now):
+        e = self.entries.get(key)
+        return e["data"] if e and now - e["at"] < self.ttl else None
+
+    def put(self, key, data, now):
+        self.entries[key] = {"at": now, "data": data}
+
+    def save(self, now):
+        if not self.path or self.ttl <= 0:
+            return
+        fresh = {k: e for k, e in self.entries.items() if now - e["at"] < self.ttl}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(fresh, f)
+        os.replace(tmp, self.path)
+
+
+def _retry_after(headers, default=1.0):
+    """Seconds to wait from a Retry-After header; HTTP-date or junk values get the default."""
+    try:
+        return max(0.0, float((headers or {}).get("Retry-After") or default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _get_json(url, timeout):
+    for attempt in range(2):
+        try:
+            with urlopen(url, timeout=timeout) as r:
+                return json.loads(r.read())
+        except HTTPError as e:
+            if e.code not in RETRY_STATUS or attempt:
+                raise
+            time.sleep(_retry_after(e.headers))
+
+
+async def fetch_locations(locations, api_key, base_url=OWM_BASE_URL, concurrency=CONCURRENCY,
+                          cache=None, timeout=FETCH_TIMEOUT_S):
+    """{location: (owm json or None, "cache" | "fetched" | "error: ...")}."""
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="owm"))
+    sem = asyncio.Semaphore(concurrency)
+    now = time.time()
+
+    async def one(loc):
+        key = f"{base_url}|{loc}"      # stand-in servers never share entries with the real API
+        hit = cache.get(key, now) if cache else None
+        if hit is not None:
+            return loc, hit, "cache"
+        url = f"{base_url}/data/2.5/weather?q={quote(loc)}&appid={api_key}&units=metric"
+        async with sem:
+            try:
+                data = await asyncio.to_thread(_get_json, url, timeout)
+            except Exception as e:
+                return loc, None, f"error: {e}"
+        if cache:
+            cache.put(key, data, now)
+        return loc, data, "fetched"
+
+    results = await asyncio.gather(*(one(loc) for loc in locations))
+    return {loc: (data, status) for loc, data, status in results}
+
+
+# ── Decisions (vectorised makeDecision) ───────────────────────────────────────
+def weather_arrays(weathers):
+    def num(w, section, key, default):
+        v = (w.get(section) or {}).get(key)
+        return default if v is None else float(v)
+    return {
+        "temp":     np.array([num(w, "main", "temp", 25.0) for w in weathers]),
+        "humidity": np.array([num(w, "main", "humidity", 60.0) for w in weathers]),
+        "rain1h":   np.array([num(w, "rain", "1h", 0.0) for w in weathers]),
+        "rain3h":   np.array([num(w, "rain", "3h", 0.0) for w in weathers]),
+        "descRain": np.array([("rain" in (((w.get("weather") or [{}])[0] or {}).get("description") or ""))
+                              for w in weathers], dtype=bool),
+    }
+
+
+def decide(a):
+    """Decision code per location, same precedence as makeDecision."""
+    wet = (a["rain1h"] > 1) | (a["rain3h"] > 3) | a["descRain"] | (a["humidity"] > 80)
+    irrigate = (a["temp"] > 32) & (a["humidity"] < 45)
+    caution = (a["temp"] > 26) | (a["humidity"] < 60)
+    return np.select([wet, irrigate, caution], [NO_ACTION_WET, IRRIGATE, CAUTION], GOOD).astype(np.int8)
+
+
+def decision_message(code, w):
+    temp = (w.get("main") or {}).get("temp")
+    temp = 25.0 if temp is None else float(temp)
+    hum = (w.get("main") or {}).get("humidity")
+    hum = _js(60 if hum is None else hum)
+    if code == NO_ACTION_WET:
+        return f"Rain detected or humidity is high ({hum}%). No irrigation required today."
+    if code == IRRIGATE:
+        return f"Hot & dry conditions — Temp: {temp:.1f}°C, Humidity: {hum}%. Your crops need water urgently."
+    if code == CAUTION:
+        return (f"Warm weather ahead — Temp: {temp:.1f}°C, Humidity: {hum}%. "
+                f"Consider irrigating if soil feels dry.")
+    return f"Weather is favourable — Temp: {temp:.1f}°C, Humidity: {hum}%. No immediate irrigation needed."
+
+
+def weather_summary(w):
+    main, wind = w.get("main") or {}, w.get("wind") or {}
+    temp = main.get("temp")
+    return (f"Temp: {'undefined' if temp is None else f'{float(temp):.1f}'}°C, "
+            f"Humidity: {_js(main.get('humidity'))}%, Wind: {_js(wind.get('speed'))} m/s")
+
+
+def weather_doc(w, city, now):
+    """WeatherData document with the soil-moisture formula of weatherRoutes.js."""
+    main, wind = w.get("main") or {}, w.get("wind") or {}
+    temp, hum = main.get("temp") or 0, main.get("humidity") or 0
+    rain, speed = (w.get("rain") or {}).get("1h") or 0, wind.get("speed") or 0
+    moisture = max(0.0, min(100.0, hum * 0.5 + rain * 0.3 - temp * 0.1 - speed * 0.1))
+    coord = w.get("coord") or {}
+    return {"temperature": temp, "humidity": hum, "rainfall": rain, "windSpeed": speed,
+            "pressure": main.get("pressure") or 0, "city": city, "cityKey": normalize_location(city),
+            "lat": coord.get("lat"), "lon": coord.get("lon"), "soilMoisture": round(moisture, 1),
+            "createdAt": now, "updatedAt": now, "__v": 0}
+
+
+# ── Engine ────────────────────────────────────────────────────────────────────
+def run_batch(users, api_key, base_url=OWM_BASE_URL, concurrency=CONCURRENCY, cache=None, now=None):
+    """Evaluate every user. Returns (weather docs, notification docs, sms list, summary)."""
+    now = now or datetime.now(timezone.utc)
+    timings = {}
+    t0 = time.perf_counter()
+    users = [u for u in users if normalize_location(u.get("location"))]
+    keys = np.array([normalize_location(u["location"]) for u in users], dtype=object)
+    locations, inverse = np.unique(keys, return_inverse=True) if len(keys) else (np.array([], dtype=object), np.array([], dtype=np.intp))
+    timings["group_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fetched = asyncio.run(fetch_locations(list(locations), api_key, base_url, concurrency, cache))
+    if cache:
+        cache.save(time.time())
+    timings["fetch_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ok = np.array([fetched[loc][0] is not None for loc in locations], dtype=bool)
+    weathers = [fetched[loc][0] or {} for loc in locations]
+    codes = decide(weather_arrays(weathers)) if len(weathers) else np.array([], dtype=np.int8)
+    messages = [decision_message(c, w) for c, w in zip(codes.tolist(), weathers)]
+    summaries = [weather_summary(w) for w in weathers]
+
+    # WeatherData keeps the spelling most users typed for the location
+    spelling = {}
+    for u, i in zip(users, inverse.tolist()):
+        spelling.setdefault(i, {}).setdefault(u["location"], 0)
+        spelling[i][u["location"]] += 1
+    weather_docs = [weather_doc(weathers[i], max(spelling[i], key=spelling[i].get), now)
+                    for i, loc in enumerate(locations) if fetched[loc][1] == "fetched"]
+
+    notifications, sms = [], []
+    for u, i in zip(users, inverse.tolist()):
+        if not ok[i]:
+            continue                    # weather fetch failed: skipped, as runScheduler does
+        c = int(codes[i])
+        notifications.append({"userId": u["email"], "title": DECISION_TITLE[c], "message": messages[i],
+                              "type": DECISION_TYPE[c], "location": u["location"],
+                              "weatherSummary": summaries[i], "isRead": False, "createdAt": now, "__v": 0})
+        if u.get("phone"):
+            sms.append({"to": u["phone"],
+                        "body": (f"🌾 Smart Irrigation Alert\n{DECISION_TITLE[c]}\n{messages[i]}\n"
+                                 f"📍 {u['location']} | {summaries[i]}")})
+    timings["decide_s"] = time.perf_counter() - t0
+
+    statuses = [s for _, s in fetched.values()]
+    user_codes = codes[inverse][ok[inverse]] if len(users) else codes
+    summary = {
+        "users":         len(users),
+        "locations":     len(locations),
+        "fetched":       statuses.count("fetched"),
+        "cached":        statuses.count("cache"),
+        "failed":        sum(s.startswith("error") for s in statuses),
+        "errors":        sorted({s for s in statuses if s.startswith("error")})[:5],
+        "notifications": len(notifications),
+        "weatherDocs":   len(weather_docs),
+        "sms":           len(sms),
+        "decisions":     {DECISION_TITLE[c]: int(np.sum(user_codes == c)) for c in DECISION_TITLE},
+        **{k: round(v, 3) for k, v in timings.items()},
+    }
+    return weather_docs, notifications, sms, summary
+
+
+def insert_chunked(collection, docs):
+    inserted = 0
+    for start in range(0, len(docs), INSERT_CHUNK):
+        inserted += len(collection.insert_many(docs[start:start + INSERT_CHUNK], ordered=False).inserted_ids)
+    return inserted
+
+
+def load_users(path=None, db=None):
+    fields = {"_id": 0, "email": 1, "phone": 1, "location": 1}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            text = f.read().strip()
+        return json.loads(text) if text.startswith("[") else [json.loads(line) for line in text.splitlines() if line]
+    return list(db["users"].find({"location": {"$nin": ["", None]}}, fields))
+
+
+# ── Stand-in weather API ──────────────────────────────────────────────────────
+def stub_weather(city):
+    """Deterministic OWM-shaped /data/2.5/weather body for a city name."""
+    h = hashlib.sha256(normalize_location(city).encode()).digest()
+    temp = 15 + h[0] / 255 * 25
+    hum = 20 + h[1] / 255 * 75
+    rain = round(h[2] / 255 * 4, 1) if h[3] < 64 else 0
+    return {"coord": {"lat": round(8 + h[4] / 255 * 27, 4), "lon": round(68 + h[5] / 255 * 29, 4)},
+            "weather": [{"description": "light rain" if rain else "clear sky"}],
+            "main": {"temp": round(temp, 2), "humidity": int(hum), "pressure": 1000 + h[6] % 30},
+            "wind": {"speed": round(h[7] / 255 * 8, 1)}, "rain": {"1h": rain} if rain else {},
+            "name": city}
+
+
+def make_stub_server(port=0, latency_ms=0):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            city = (parse_qs(url.query).get("q") or [""])[0]
+            if url.path != "/data/2.5/weather" or not city:
+                body, code = b'{"cod":"404","message":"city not found"}', 404
+            else:
+                if latency_ms:
+                    time.sleep(latency_ms / 1000)
+                body, code = json.dumps(stub_weather(city)).encode(), 200
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    return server
+
+
+def benchmark(n_users, n_cities, latency_ms, concurrency):
+    server = make_stub_server(0, latency_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    rng = np.random.default_rng(42)
+    cities = [f"City {i}" for i in range(n_cities)]
+    picks = rng.integers(0, n_cities, n_users)
+    users = [{"email": f"farmer{i}@example.com", "phone": "+910000000000" if i % 3 == 0 else "",
+              "location": (cities[c].upper() if i % 2 else f" {cities[c]} ")} for i, c in enumerate(picks)]
+    t0 = time.perf_counter()
+    weather_docs, notifications, sms, summary = run_batch(users, "stub", base, concurrency, cache=None)
+    total = time.perf_counter() - t0
+    server.shutdown()
+    return {**summary, "stubLatencyMs": latency_ms, "concurrency": concurrency, "total_s": round(total, 3),
+            "sequentialEstimate_s": round(n_users * latency_ms / 1000, 1)}
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Location-deduplicated irrigation alert batch.")
+    p.add_argument("--users-file", help="JSON list / NDJSON of {email, phone, location} instead of Mongo users")
+    p.add_argument("--no-db", action="store_true", help="do not write WeatherData / Notification documents")
+    p.add_argument("--sms-outbox", help="write SMS jobs ({to, body} per line) to this NDJSON file")
+    p.add_argument("--base-url", default=OWM_BASE_URL, help="weather API base (env OWM_BASE_URL)")
+    p.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    p.add_argument("--ttl", type=float, default=CACHE_TTL_S, help="weather cache TTL seconds (0 = off)")
+    p.add_argument("--stub-server", type=int, metavar="PORT", help="serve the stand-in weather API and exit on ^C")
+    p.add_argument("--stub-latency-ms", type=float, default=0)
+    p.add_argument("--benchmark", type=int, metavar="USERS")
+    p.add_argument("--cities", type=int, default=500, help="distinct cities for --benchmark")
+    args = p.parse_args(argv)
+
+    if args.stub_server is not None:
+        server = make_stub_server(args.stub_server, args.stub_latency_ms)
+        print(f"Stand-in weather API on http://127.0.0.1:{server.server_address[1]}", flush=True)
+        server.serve_forever()
+        return 0
+    if args.benchmark:
+        print(json.dumps(benchmark(args.benchmark, args.cities, args.stub_latency_ms or 50, args.concurrency),
+                         indent=2, ensure_ascii=False))
+        return 0
+
+    api_key = os.environ.get("OPENWEATHER_API_KEY", "")
+    if not api_key and "api.openweathermap.org" in args.base_url:
+        print(json.dumps({"error": "OPENWEATHER_API_KEY not set"}))
+        return 2
+    db = None
+    if not (args.users_file and args.no_db):
+        from pymongo import MongoClient
+        db = MongoClient("mongodb://127.0.0.1:27017/", serverSelectionTimeoutMS=3000)["smart_irrigation"]
+    users = load_users(args.users_file, db)
+
+    weather_docs, notifications, sms, summary = run_batch(
+        users, api_key, args.base_url, args.concurrency, WeatherCache(ttl=args.ttl))
+    if args.sms_outbox:
+        # the outbox appears (atomically) before the first insert: irrigationScheduler.js redoes a
+        # failed run user by user only when it is missing, i.e. when nothing was written
+        tmp = args.sms_outbox + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(m, ensure_ascii=False) + "\n" for m in sms)
+        os.replace(tmp, args.sms_outbox)
+    t0 = time.perf_counter()
+    if not args.no_db:
+        summary["weatherInserted"] = insert_chunked(db["weatherdatas"], weather_docs) if weather_docs else 0
+        summary["notificationsInserted"] = insert_chunked(db["notifications"], notifications) if notifications else 0
+    summary["write_s"] = round(time.perf_counter() - t0, 3)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+binning.py — uint8 feature bins shared by out-of-core training and inference.
+
+fit_edges() picks at most MAX_BINS - 1 thresholds per encoded column from a
+sample (midpoints between distinct values when there are few, quantiles
+otherwise); bin_matrix() maps a float32 feature matrix to uint8 bin codes,
+code = number of thresholds <= x, so values beyond the sample's range land in
+the first / last bin. One-hot columns get a single 0.5 threshold.
+
+BinnedModel is what train_binned.py saves as payload["model"]: the trees were
+fitted on bin codes, and predict() / predict_proba() bin the raw encoded rows
+first, so predict_*.py, bulk_score.py and predict_server.py load it like any
+other artifact. Requires xgboost at load time.
+
+Usage:
+  edges = fit_edges(X_sample)
+  codes = bin_matrix(X, edges)                 # (n, n_features) uint8
+"""
+import numpy as np
+
+MAX_BINS = 255             # codes 0..254; the booster histograms get one bin per code
+
+
+def fit_edges(X, max_bins=MAX_BINS):
+    """Per-column float64 threshold arrays (len <= max_bins - 1) from a sample matrix."""
+    X = np.asarray(X, dtype=np.float64)
+    qs = np.linspace(0, 1, max_bins + 1)[1:-1]
+    edges = []
+    for j in range(X.shape[1]):
+        values = np.unique(X[:, j])
+        if len(values) <= max_bins:
+            cuts = (values[:-1] + values[1:]) / 2          # every distinct value keeps its own bin
+        else:
+            cuts = np.unique(np.quantile(X[:, j], qs))
+        edges.append(cuts)
+    return edges
+
+
+def bin_matrix(X, edges, out=None):
+    """uint8 bin codes of X (float32 rows in encoder column order)."""
+    X = np.asarray(X)
+    if out is None:
+        out = np.empty(X.shape, dtype=np.uint8)
+    for j, cuts in enumerate(edges):
+        out[:, j] = np.searchsorted(cuts, X[:, j], side="right")
+    return out
+
+
+class BinnedModel:
+    """Booster trained on bin codes, with the sklearn-style predict / predict_proba the loaders use."""
+
+    def __init__(self, booster, edges, classes=None, kind="hgb"):
+        self.booster = booster
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.n_features_in_ = len(self.edges)
+        self.kind = kind
+        if classes is not None:
+            self.classes_ = np.asarray(classes)    # regressors have no classes_ (is_classifier checks)
+
+    def bin(self, X):
+        return bin_matrix(np.asarray(X, dtype=np.float32).reshape(-1, self.n_features_in_), self.edges)
+
+    def get_booster(self):
+        return self.booster
+
+    def _raw(self, X):
+        return self.booster.inplace_predict(self.bin(X).astype(np.float32))
+
+    def predict_proba(self, X):
+        if not hasattr(self, "classes_"):
+            raise AttributeError("predict_proba is only available for classifiers")
+        return np.asarray(self._raw(X)).reshape(-1, len(self.classes_))
+
+    def predict(self, X):
+        if hasattr(self, "classes_"):
+            return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+        return np.asarray(self._raw(X), dtype=np.float64).reshape(-1)
+
+    @property
+    def nbytes(self):
+        return len(self.booster.save_raw()) + sum(e.nbytes for e in self.edges)
+
+    def info(self):
+        return {"type": f"BinnedModel({self.kind})", "rounds": self.booster.num_boosted_rounds(),
+                "bins": [len(e) + 1 for e in self.edges], "model_bytes": self.nbytes}
@@ -0,0 +1,246 @@
+"""
+bulk_score.py — Offline bulk scoring for CSV / NDJSON files of any size.
+
+Reads the input in fixed-size chunks, scores chunks in parallel across a
+process pool (each worker loads the model once), and streams results to the
+output file in input order. Memory stays bounded by
+chunk_size x (2 x workers) rows no matter how big the input is.
+
+Progress is checkpointed to <output>.progress.json after every chunk, so an
+interrupted run can be continued with --resume.
+
+Usage:
+  python ml/bulk_score.py crop   farmers.csv     scored.csv
+  python ml/bulk_score.py soil   samples.ndjson  scored.ndjson --workers 4 --chunk-size 20000
+  python ml/bulk_score.py yield  fields.csv      scored.ndjson --keep farmerId,crop
+  python ml/bulk_score.py crop   farmers.csv     scored.csv --resume
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+warnings.filterwarnings("ignore")
+
+from model_loader import MODEL_KINDS, find_model, load_bundle
+
+OUTPUT_FIELDS = {
+    "crop":     ["predictedCrop"],
+    "soil":     ["predicted_label", "probability"],
+    "yield":    ["predicted_yield_per_ha"],
+    "rainfall": ["predicted_rainfall"],
+}
+
+# ── Input readers (stream dict records, never the whole file) ─────────────────
+def _is_ndjson(path):
+    return path.lower().endswith((".ndjson", ".jsonl", ".json"))
+
+
+def read_records(path):
+    if _is_ndjson(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for rec in csv.DictReader(f):
+                yield rec
+
+
+def read_chunks(path, chunk_size):
+    chunk = []
+    for rec in read_records(path):
+        chunk.append(rec)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ── Worker side: model is loaded once per process ─────────────────────────────
+_bundle = None
+
+
+def _init_worker(kind, model_path):
+    global _bundle
+    warnings.filterwarnings("ignore")
+    _bundle = load_bundle(kind, model_path)
+
+
+def _score_chunk(records):
+    return _bundle.score(records)
+
+
+# ── Output writer ─────────────────────────────────────────────────────────────
+class ResultWriter:
+    def __init__(self, path, kind, keep, append):
+        self.path   = path
+        self.kind   = kind
+        self.keep   = keep
+        self.ndjson = _is_ndjson(path)
+        self.header_written = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.f      = open(path, "a" if append else "w", encoding="utf-8", newline="")
+        self.csv    = None
+
+    def _project(self, rec):
+        return {k: rec.get(k) for k in self.keep} if self.keep else dict(rec)
+
+    def write(self, records, results):
+        if self.ndjson:
+            for rec, res in zip(records, results):
+                self.f.write(json.dumps({**self._project(rec), **res}) + "\n")
+        else:
+            if self.csv is None:
+                in_fields = self.keep or list(records[0].keys())
+                fields = in_fields + OUTPUT_FIELDS[self.kind] + ["error"]
+                self.csv = csv.DictWriter(self.f, fieldnames=fields, extrasaction="ignore")
+                if not self.header_written:
+                    self.csv.writeheader()
+                    self.header_written = True
+            for rec, res in zip(records, results):
+                self.csv.writerow({**self._project(rec), **res})
+        self.f.flush()
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+
+# ── Progress checkpoint ───────────────────────────────────────────────────────
+def _progress_path(output):
+    return output + ".progress.json"
+
+
+def load_progress(args):
+    path = _progress_path(args.output)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    for key in ("kind", "input", "chunk_size"):
+        if state.get(key) != getattr(args, key):
+            raise SystemExit(f"progress file {path} was written for a different {key} "
+                             f"({state.get(key)!r}) — delete it or drop --resume")
+    return state
+
+
+def save_progress(args, chunks_done, rows_done, output_bytes, done=False):
+    path = _progress_path(args.output)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({
+            "kind":         args.kind,
+            "input":        args.input,
+            "chunk_size":   args.chunk_size,
+            "chunks_done":  chunks_done,
+            "rows_done":    rows_done,
+            "output_bytes": output_bytes,
+            "done":         done,
+        }, f)
+    os.replace(tmp, path)
+
+
+# ── Main loop ─────────────────────────────────────────────────────────────────
+def run(args):
+    model_path = args.model or find_model(args.kind)
+    if not model_path:
+        print(json.dumps({"error": "model-not-found", "kind": args.kind}))
+        return 2
+
+    state = load_progress(args) if args.resume else None
+    chunks_done = state["chunks_done"] if state else 0
+    rows_done   = state["rows_done"] if state else 0
+    if state and state.get("done"):
+        print(json.dumps({"status": "already-complete", "rows": rows_done}))
+        return 0
+    if state and not os.path.exists(args.output):
+        raise SystemExit(f"cannot resume: {args.output} is missing")
+    if state:
+        # drop anything written after the last checkpoint (partial chunk)
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.truncate(state["output_bytes"])
+
+    keep = [k for k in (args.keep or "").split(",") if k]
+    writer = ResultWriter(args.output, args.kind, keep, append=state is not None)
+    chunks = read_chunks(args.input, args.chunk_size)
+    for _ in range(chunks_done):
+        next(chunks, None)
+
+    t0 = time.perf_counter()
+    rows_this_run = 0
+    errors = 0
+
+    def commit(records, results):
+        nonlocal chunks_done, rows_done, rows_this_run, errors
+        output_bytes = writer.write(records, results)
+        chunks_done += 1
+        rows_done += len(records)
+        rows_this_run += len(records)
+        errors += sum(1 for r in results if "error" in r)
+        save_progress(args, chunks_done, rows_done, output_bytes)
+        if not args.quiet:
+            rate = rows_this_run / max(time.perf_counter() - t0, 1e-9)
+            print(f"chunk {chunks_done}: {rows_done} rows scored ({rate:,.0f} rows/s)", file=sys.stderr, flush=True)
+
+    try:
+        if args.workers <= 1:
+            _init_worker(args.kind, model_path)
+            for records in chunks:
+                commit(records, _score_chunk(records))
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                     initargs=(args.kind, model_path)) as pool:
+                # bounded in-flight window keeps memory flat; results are written in order
+                pending = deque()
+                for records in chunks:
+                    pending.append((records, pool.submit(_score_chunk, records)))
+                    if len(pending) >= args.workers * 2:
+                        recs, fut = pending.popleft()
+                        commit(recs, fut.result())
+                while pending:
+                    recs, fut = pending.popleft()
+                    commit(recs, fut.result())
+    finally:
+        output_bytes = writer.f.tell()
+        writer.close()
+
+    save_progress(args, chunks_done, rows_done, output_bytes, done=True)
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({
+        "status":   "complete",
+        "kind":     args.kind,
+        "rows":     rows_done,
+        "errors":   errors,
+        "seconds":  round(elapsed, 3),
+        "rows_per_sec": round(rows_this_run / elapsed, 1) if elapsed > 0 else None,
+        "output":   os.path.abspath(args.output),
+    }))
+    return 0
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Bulk-score a CSV/NDJSON file with a trained model.")
+    p.add_argument("kind", choices=MODEL_KINDS)
+    p.add_argument("input", help="input .csv or .ndjson/.jsonl file")
+    p.add_argument("output", help="output .csv or .ndjson/.jsonl file")
+    p.add_argument("--model", help="artifact path (default: same lookup as predict_*.py)")
+    p.add_argument("--chunk-size", type=int, default=10000)
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    p.add_argument("--keep", help="comma-separated input columns to copy to the output (default: all)")
+    p.add_argument("--resume", action="store_true", help="continue from <output>.progress.json")
+    p.add_argument("--quiet", action="store_true")
+    args = p.parse_args(argv)
+    args.input = os.path.abspath(args.input)
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
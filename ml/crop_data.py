@@ -0,0 +1,117 @@
+"""
+crop_data.py — Synthetic crop datasets shared by the crop trainers and the tools
+that need the same rows (held-out parity checks, sweeps, tuning, evaluation).
+
+Each crop occupies a clearly different zone in feature space. generate_frame()
+reproduces exactly the rows train_model.py has always produced with seed 42;
+generate_kaggle_frame() the 7-feature, 22-crop rows of train_xgboost.py.
+"""
+import random
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+NUMERIC_COLS = ["temperature","humidity","rainfall","soil_ph","soilMoisture","nitrogen","phosphorus","potassium"]
+CAT_COLS     = ["soilType","region","season"]
+
+CROP_PROFILES = [
+#    crop          n    temp       hum        rain         ph          moist        N            P            K          soils                      seasons            regions
+    ("Rice",      300, (22,32), (75,95), (160,280), (5.5,7.0), (50,80),  (60,120),(25,55),(25,55), ["Clay","Loamy"],            ["Kharif"],        ["South","East","West"]),
+    ("Wheat",     300, (8,18),  (40,65), (50,100),  (6.0,7.5), (30,55),  (80,120),(30,70),(35,65), ["Loamy","Sandy"],           ["Rabi"],           ["North","Central"]),
+    ("Corn",      250, (20,30), (55,75), (80,160),  (5.5,7.0), (40,65),  (70,110),(30,65),(30,60), ["Loamy","Clay"],            ["Kharif","Rabi"],  ["North","Central","West"]),
+    ("Millet",    250, (25,35), (30,55), (25,70),   (5.5,7.5), (15,40),  (15,45), (10,40),(10,40), ["Sandy","Red","Loamy"],     ["Kharif","Zaid"],  ["South","West"]),
+    ("Cotton",    250, (28,40), (50,70), (60,120),  (6.0,8.0), (30,55),  (10,30), (10,30),(15,35), ["Black","Red","Sandy"],     ["Kharif"],         ["South","Central"]),
+    ("Jute",      200, (27,37), (75,95), (140,280), (6.0,7.5), (60,90),  (60,100),(30,60),(30,60), ["Clay","Loamy"],            ["Kharif"],         ["East"]),
+    ("Apple",     250, (2,12),  (65,90), (100,180), (5.5,6.8), (45,75),  (40,75), (25,55),(30,60), ["Loamy","Sandy"],           ["Rabi"],           ["North"]),
+    ("Banana",    250, (24,34), (75,95), (150,280), (5.5,7.0), (50,85),  (80,120),(30,60),(50,90), ["Sandy","Loamy"],           ["Kharif","Zaid"],  ["South","East"]),
+    ("Grapes",    200, (22,32), (55,80), (60,110),  (6.0,7.5), (30,60),  (20,55), (15,45),(30,65), ["Sandy","Loamy"],           ["Rabi"],           ["South","West"]),
+    ("Mango",     200, (26,38), (45,80), (80,150),  (5.5,7.5), (35,65),  (15,40), (10,30),(15,40), ["Sandy","Red","Loamy"],     ["Zaid","Kharif"],  ["South","Central"]),
+    ("Papaya",    200, (24,34), (65,90), (100,200), (6.0,7.5), (45,80),  (40,70), (20,50),(20,50), ["Clay","Loamy"],            ["Kharif","Zaid"],  ["South","East"]),
+    ("Coconut",   200, (24,34), (75,95), (150,250), (5.5,7.0), (55,85),  (15,35), (10,30),(50,90), ["Sandy","Loamy"],           ["Kharif","Zaid"],  ["South"]),
+    ("Coffee",    200, (18,26), (70,95), (120,240), (5.5,6.5), (55,85),  (40,75), (20,50),(20,60), ["Clay","Red"],              ["Kharif","Rabi"],  ["South"]),
+    ("Sugarcane", 200, (23,38), (60,90), (150,300), (6.0,7.5), (50,85),  (70,120),(30,60),(15,55), ["Clay","Loamy","Black"],    ["Kharif","Zaid"],  ["South","Central"]),
+    ("Chickpea",  200, (18,27), (35,60), (50,90),   (6.0,8.0), (20,45),  (35,70), (55,90),(15,45), ["Sandy","Loamy","Black"],  ["Rabi"],           ["North","Central"]),
+    ("Lentil",    200, (14,22), (45,70), (55,100),  (6.0,8.0), (25,50),  (15,45), (20,55),(15,40), ["Sandy","Loamy"],          ["Rabi"],           ["North","Central"]),
+    ("Groundnut", 200, (25,35), (40,65), (60,120),  (5.5,7.0), (25,55),  (15,40), (25,55),(20,50), ["Sandy","Loamy","Red"],    ["Kharif","Rabi"],  ["South","Central"]),
+]
+
+
+def gen(rng, crop, n, temp, hum, rain, ph, moist, N, P, K, soils, seasons, regions):
+    rows = []
+    for _ in range(n):
+        rows.append({
+            "crop":         crop,
+            "temperature":  round(rng.uniform(*temp),  1),
+            "humidity":     round(rng.uniform(*hum),   1),
+            "rainfall":     round(rng.uniform(*rain),  1),
+            "soil_ph":      round(rng.uniform(*ph),    2),
+            "soilMoisture": round(rng.uniform(*moist), 1),
+            "nitrogen":     round(rng.uniform(*N),     1),
+            "phosphorus":   round(rng.uniform(*P),     1),
+            "potassium":    round(rng.uniform(*K),     1),
+            "soilType":     rng.choice(soils),
+            "season":       rng.choice(seasons),
+            "region":       rng.choice(regions),
+        })
+    return rows
+
+
+def generate_rows(seed=42, scale=1.0):
+    """All profile rows; `scale` multiplies every crop's sample count."""
+    rng = random.Random(seed)
+    rows = []
+    for crop, n, *ranges in CROP_PROFILES:
+        rows += gen(rng, crop, max(1, int(round(n * scale))), *ranges)
+    return rows
+
+
+def generate_frame(seed=42, scale=1.0):
+    return pd.DataFrame(generate_rows(seed, scale))
+
+
+def split_indices(y, test_size=0.2, random_state=42):
+    """Row indices of the stratified train/test split train_model.py uses."""
+    idx = list(range(len(y)))
+    return train_test_split(idx, test_size=test_size, random_state=random_state, stratify=y)
+
+
+# ── Kaggle Crop Recommendation ranges (train_xgboost.py) ──────────────────────
+KAGGLE_FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+
+KAGGLE_RANGES = [
+#    label          N          P          K          temp     hum      ph         rain
+    ("rice",        (60,99),   (35,55),   (35,55),   (20,27), (80,87), (5.5,7.0), (180,270)),
+    ("maize",       (60,99),   (35,55),   (19,35),   (18,25), (55,75), (5.5,7.5), (55,125)),
+    ("chickpea",    (35,60),   (55,75),   (70,90),   (17,24), (14,25), (5.5,7.5), (55,110)),
+    ("kidneybeans", (10,35),   (55,80),   (15,35),   (17,24), (18,26), (5.5,7.5), (100,200)),
+    ("pigeonpeas",  (15,40),   (55,80),   (15,40),   (23,30), (25,50), (5.0,7.0), (100,180)),
+    ("mothbeans",   (15,40),   (35,60),   (15,35),   (24,34), (47,65), (3.5,6.5), (30,80)),
+    ("mungbean",    (15,40),   (35,60),   (15,35),   (24,34), (80,92), (6.0,7.5), (30,70)),
+    ("blackgram",   (35,60),   (55,80),   (15,35),   (24,34), (60,72), (6.5,7.5), (55,110)),
+    ("lentil",      (15,40),   (55,80),   (15,35),   (17,24), (60,80), (5.5,7.5), (35,70)),
+    ("pomegranate", (17,40),   (13,20),   (196,220), (20,28), (88,95), (5.5,7.5), (100,230)),
+    ("banana",      (80,105),  (72,102),  (48,70),   (25,30), (75,90), (5.5,7.0), (90,150)),
+    ("mango",       (14,22),   (14,22),   (29,42),   (24,35), (47,60), (4.5,7.0), (90,200)),
+    ("grapes",      (17,23),   (120,135), (195,210), (8,17),  (80,92), (5.5,7.0), (60,105)),
+    ("watermelon",  (97,112),  (16,22),   (48,55),   (24,34), (80,92), (5.5,7.5), (40,90)),
+    ("muskmelon",   (96,112),  (17,22),   (48,55),   (24,34), (90,97), (6.0,7.5), (20,50)),
+    ("apple",       (0,20),    (120,135), (195,210), (20,25), (90,97), (5.5,7.0), (100,200)),
+    ("orange",      (0,20),    (4,12),    (8,15),    (10,20), (90,97), (6.0,7.5), (100,200)),
+    ("papaya",      (48,58),   (58,68),   (48,58),   (30,42), (90,97), (6.5,7.5), (120,220)),
+    ("coconut",     (0,20),    (0,20),    (28,42),   (25,34), (90,97), (5.0,7.5), (150,230)),
+    ("cotton",      (95,118),  (35,55),   (35,55),   (21,30), (75,85), (5.8,8.0), (60,110)),
+    ("jute",        (60,80),   (35,60),   (35,60),   (24,37), (70,90), (6.0,7.5), (150,250)),
+    ("coffee",      (97,118),  (27,38),   (28,42),   (23,30), (55,70), (6.0,7.0), (150,270)),
+]
+
+
+def generate_kaggle_frame(seed=42, n=200):
+    """train_xgboost.py's rows: n uniform samples per crop over KAGGLE_RANGES, shuffled."""
+    rng = np.random.RandomState(seed)
+    frames = []
+    for label, *ranges in KAGGLE_RANGES:
+        frame = {col: rng.uniform(lo, hi, n) for col, (lo, hi) in zip(KAGGLE_FEATURES, ranges)}
+        frames.append(pd.DataFrame({**frame, "label": [label] * n}))
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=seed)
+
@@ -0,0 +1,253 @@
+"""
+drift.py — Constant-memory input-drift sketches for the prediction server.
+
+At training time build_reference() summarises the encoded training matrix and
+is saved in the artifact (payload["drift_reference"], plain dict of lists):
+
+  numeric features      decile bin edges + the training share of each bin,
+                        plus the training min/max (values outside count as
+                        out-of-range)
+  categorical features  share of each one-hot category
+
+At serving time a DriftMonitor observes every encoded row. observe() only
+copies the float32 row into a small staging block (well under a few µs); each
+full block is folded into the histograms with a handful of vectorised numpy
+ops, so memory stays fixed however many requests arrive. report() compares
+live and reference shares with the population stability index (PSI):
+
+  PSI < 0.1 stable · 0.1–0.25 moderate · > 0.25 significant
+
+and also returns the out-of-range rate per numeric feature and the rate of
+unseen (or missing) categories per categorical column.
+
+DriftRegistry keeps one monitor per served model ("crop:global",
+"yield:punjab", ...), built from that artifact's own reference on first use;
+a reloaded artifact starts a fresh window.
+
+Usage:
+  from drift import build_reference, DriftMonitor
+  payload["drift_reference"] = build_reference(encoder, X_train)
+  monitor = DriftMonitor(encoder, payload["drift_reference"])
+  monitor.observe(x_row); monitor.observe(X_batch); monitor.report()
+
+  drifts = DriftRegistry()
+  drifts.observe("yield:global", bundle, x_row); drifts.report()
+"""
+import threading
+import time
+import weakref
+
+import numpy as np
+
+N_BINS = 10
+BLOCK_ROWS = 256
+PSI_EPS = 1e-4
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+
+
+def _column_groups(encoder):
+    """(numeric names, numeric positions, {categorical col: [(value, position), ...]})."""
+    pos = {c: i for i, c in enumerate(encoder.feature_columns)}
+    numeric = [c for c in encoder.numeric_cols if c in pos]
+    groups = {}
+    for c in encoder.categorical_cols:
+        cols = [(v, pos[f"{c}_{v}"]) for v in encoder.categories.get(c, []) if f"{c}_{v}" in pos]
+        if cols:
+            groups[c] = cols
+    return numeric, [pos[c] for c in numeric], groups
+
+
+def build_reference(encoder, X, n_bins=N_BINS):
+    """Reference sketch of the encoded training matrix X (plain lists, pickle-safe)."""
+    X = np.asarray(X, dtype=np.float64)
+    numeric, num_pos, groups = _column_groups(encoder)
+    ref = {"rows": int(len(X)), "bins": n_bins, "numeric": {}, "categorical": {}}
+    qs = np.linspace(0, 1, n_bins + 1)[1:-1]
+    for name, p in zip(numeric, num_pos):
+        col = X[:, p]
+        inner = np.unique(np.quantile(col, qs))
+        edges = np.concatenate([[col.min()], inner, [np.nextafter(col.max(), np.inf)]])
+        counts = np.histogram(col, bins=edges)[0]
+        ref["numeric"][name] = {"edges": edges.tolist(), "share": (counts / max(1, len(col))).tolist(),
+                                "mean": float(col.mean()), "std": float(col.std())}
+    for c, cols in groups.items():
+        sums = X[:, [p for _, p in cols]].sum(axis=0)
+        ref["categorical"][c] = {"values": [v for v, _ in cols],
+                                 "share": (sums / max(1, len(X))).tolist()}
+    return ref
+
+
+def psi(ref_share, live_counts):
+    live = np.asarray(live_counts, dtype=np.float64)
+    total = live.sum()
+    if total == 0:
+        return None
+    p = np.clip(np.asarray(ref_share, dtype=np.float64), PSI_EPS, None)
+    q = np.clip(live / total, PSI_EPS, None)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def _level(score):
+    if score is None:
+        return "no-data"
+    return "significant" if score > PSI_SIGNIFICANT else "moderate" if score > PSI_MODERATE else "stable"
+
+
+class DriftMonitor:
+    def __init__(self, encoder, reference, block_rows=BLOCK_ROWS):
+        self.reference = reference
+        numeric, num_pos, groups = _column_groups(encoder)
+        # features the reference knows about (artifact and encoder may disagree after a schema change)
+        keep = [i for i, n in enumerate(numeric) if n in reference["numeric"]]
+        self.num_names = [numeric[i] for i in keep]
+        self.num_pos = np.array([num_pos[i] for i in keep], dtype=np.intp)
+        ref_num = [reference["numeric"][n] for n in self.num_names]
+        width = max((len(r["edges"]) for r in ref_num), default=2)
+        # ragged edges padded with +inf so one (F, width) comparison bins every feature;
+        # bin 0 = below training min, bin len(edges)-1 = above training max
+        self.edges = np.full((len(ref_num), width), np.inf)
+        for i, r in enumerate(ref_num):
+            self.edges[i, :len(r["edges"])] = r["edges"]
+        self.n_edges = np.array([len(r["edges"]) for r in ref_num], dtype=np.intp)
+
+        self.cat_names = [c for c in groups if c in reference["categorical"]]
+        self.cat_values = [[v for v, _ in groups[c]] for c in self.cat_names]
+        cat_pos = [p for c in self.cat_names for _, p in groups[c]]
+        self.cat_pos = np.array(cat_pos, dtype=np.intp)
+        sizes = [len(groups[c]) for c in self.cat_names]
+        self.cat_starts = np.cumsum([0] + sizes[:-1]).astype(np.intp)
+
+        self.block = np.zeros((block_rows, len(encoder.feature_columns)), dtype=np.float32)
+        self._fill = 0
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._fill = 0
+            self.rows = 0
+            self.since = time.time()
+            self.num_counts = np.zeros((len(self.num_names), self.edges.shape[1] + 1), dtype=np.int64)
+            self.num_sum = np.zeros(len(self.num_names))
+            self.num_min = np.full(len(self.num_names), np.inf)
+            self.num_max = np.full(len(self.num_names), -np.inf)
+            self.cat_counts = np.zeros(len(self.cat_pos), dtype=np.int64)
+            self.cat_unseen = np.zeros(len(self.cat_names), dtype=np.int64)
+
+    # ── hot path ──────────────────────────────────────────────────────────────
+    def observe(self, x):
+        """Record encoded rows: one row (1-D or (1, n_features)) or an (n, n_features) batch."""
+        X = x.reshape(-1, self.block.shape[1])
+        with self._lock:
+            while len(X):
+                take = min(len(X), len(self.block) - self._fill)
+                self.block[self._fill:self._fill + take] = X[:take]
+                self._fill += take
+                X = X[take:]
+                if self._fill == len(self.block):
+                    self._fold()
+
+    def _fold(self):
+        B = self.block[:self._fill]
+        self._fill = 0
+        if not len(B):
+            return
+        self.rows += len(B)
+        if len(self.num_pos):
+            V = B[:, self.num_pos].astype(np.float64)                      # (n, F)
+            bins = (V[:, :, None] >= self.edges[None, :, :]).sum(axis=2)   # (n, F)
+            F = len(self.num_pos)
+            np.add.at(self.num_counts, (np.broadcast_to(np.arange(F), bins.shape), bins), 1)
+            self.num_sum += V.sum(axis=0)
+            np.minimum(self.num_min, V.min(axis=0), out=self.num_min)
+            np.maximum(self.num_max, V.max(axis=0), out=self.num_max)
+        if len(self.cat_pos):
+            C = B[:, self.cat_pos]
+            self.cat_counts += C.sum(axis=0).astype(np.int64)
+            self.cat_unseen += (np.add.reduceat(C, self.cat_starts, axis=1) == 0).sum(axis=0)
+
+    # ── report ────────────────────────────────────────────────────────────────
+    def report(self):
+        with self._lock:
+            self._fold()
+            rows = self.rows
+            numeric, categorical = {}, {}
+            for i, name in enumerate(self.num_names):
+                ref = self.reference["numeric"][name]
+                n_edges = self.n_edges[i]
+                counts = self.num_counts[i, :n_edges + 1]
+                # inner bins 1..n_edges-1 line up with the reference histogram; the two
+                # out-of-range bins had no training mass and count against the score
+                score = psi([0.0, *ref["share"], 0.0], counts)
+                outside = int(counts[0] + counts[n_edges:].sum())
+                numeric[name] = {
+                    "psi": None if score is None else round(score, 4), "level": _level(score),
+                    "outOfRangeRate": round(outside / rows, 4) if rows else None,
+                    "mean": round(float(self.num_sum[i]) / rows, 3) if rows else None,
+                    "refMean": round(ref["mean"], 3),
+                    "min": float(self.num_min[i]) if rows else None,
+                    "max": float(self.num_max[i]) if rows else None,
+                    "refRange": [ref["edges"][0], ref["edges"][-1]],
+                }
+            for j, name in enumerate(self.cat_names):
+                ref = self.reference["categorical"][name]
+                start = self.cat_starts[j]
+                counts = self.cat_counts[start:start + len(self.cat_values[j])]
+                score = psi(ref["share"], counts)
+                categorical[name] = {
+                    "psi": None if score is None else round(score, 4), "level": _level(score),
+                    "unseenRate": round(int(self.cat_unseen[j]) / rows, 4) if rows else None,
+                    "counts": dict(zip(self.cat_values[j], counts.tolist())),
+                }
+        scores = [f["psi"] for f in (*numeric.values(), *categorical.values()) if f["psi"] is not None]
+        worst = max(scores) if scores else None
+        return {"rows": rows, "since": self.since, "referenceRows": self.reference.get("rows"),
+                "maxPsi": worst, "level": _level(worst), "numeric": numeric, "categorical": categorical}
+
+
+class DriftRegistry:
+    """One DriftMonitor per served model, keyed "kind:key".
+
+    Monitors are created on the first observation from the bundle's saved
+    drift_reference (or `fallback[name]`); bundles without one are not
+    monitored. The registry holds bundles weakly, so evicted fleet models are
+    not kept alive, and a different bundle under the same name (a reload)
+    replaces the monitor.
+    """
+
+    def __init__(self, fallback=None):
+        self.fallback = dict(fallback or {})
+        self._entries = {}            # name -> (weakref to bundle, monitor or None, path)
+        self._lock = threading.Lock()
+
+    def monitor(self, name, bundle):
+        entry = self._entries.get(name)
+        if entry is not None and entry[0]() is bundle:
+            return entry[1]
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry[0]() is not bundle:
+                ref = bundle.payload.get("drift_reference") or self.fallback.get(name)
+                monitor = DriftMonitor(bundle.encoder, ref) if ref else None
+                entry = self._entries[name] = (weakref.ref(bundle), monitor, bundle.path)
+            return entry[1]
+
+    def observe(self, name, bundle, x):
+        monitor = self.monitor(name, bundle)
+        if monitor is not None:
+            monitor.observe(x)
+
+    def get(self, name):
+        entry = self._entries.get(name)
+        return entry[1] if entry else None
+
+    def reset(self):
+        for _, monitor, _ in list(self._entries.values()):
+            if monitor is not None:
+                monitor.reset()
+
+    def report(self):
+        """{name: {"path", **DriftMonitor.report()}} for every monitored model."""
+        return {name: {"path": path, **monitor.report()}
+                for name, (_, monitor, path) in sorted(self._entries.items()) if monitor is not None}
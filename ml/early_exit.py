@@ -0,0 +1,300 @@
+"""
+early_exit.py — Progressive tree evaluation for the crop models (RandomForest
+from train_model.py / train_direct.py — plain or compacted by model_compact.py —
+and XGBoost from train_xgboost.py).
+
+Trees are evaluated in blocks; a row stops as soon as
+  * exact mode:       the leading class can no longer be overturned by the
+                      trees still to come (same answer as model.predict), or
+  * confidence mode:  the leader's running share reaches `confidence`
+                      (faster, may differ from the full ensemble).
+Every prediction reports how many trees it actually used.
+
+Usage:
+  python ml/early_exit.py --benchmark
+  python ml/early_exit.py --benchmark --block-size 5 --confidence 0.9
+"""
+import argparse
+import json
+import sys
+import time
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+warnings.filterwarnings("ignore")
+
+ProgressiveResult = namedtuple("ProgressiveResult", ["labels", "trees_used", "n_trees"])
+
+# guards the "can no longer be overturned" test against float summation noise
+_EPS = 1e-9
+
+
+class _ForestScorer:
+    """sklearn RandomForestClassifier: each tree adds a probability vector summing to 1."""
+
+    def __init__(self, model):
+        self.classes = model.classes_
+        self.trees = [est.tree_ for est in model.estimators_]
+        self.n_units = len(self.trees)
+        self.trees_per_unit = 1
+        self.default_growth = 1.0
+        # per-node class distribution, normalised once (tree_.value holds counts
+        # or fractions depending on the sklearn version)
+        self.tables = []
+        for t in self.trees:
+            v = t.value[:, 0, :].astype(np.float64)
+            s = v.sum(axis=1, keepdims=True)
+            s[s == 0] = 1.0
+            self.tables.append(v / s)
+
+    def zeros(self, n):
+        return np.zeros((n, len(self.classes)), dtype=np.float64)
+
+    def accumulate(self, S, X, start, end):
+        for t in range(start, end):
+            S += self.tables[t][self.trees[t].apply(X)]
+
+    def decided(self, S, end, confidence):
+        remaining = self.n_units - end
+        top2 = np.partition(S, -2, axis=1)[:, -2:] if S.shape[1] > 1 else np.hstack([np.zeros_like(S), S])
+        lead, second = top2[:, 1], top2[:, 0]
+        done = lead - second > remaining + _EPS
+        if confidence is not None:
+            done |= lead / end >= confidence
+        return done
+
+    def finish(self, S):
+        return self.classes[np.argmax(S, axis=1)]
+
+
+class _CompactScorer(_ForestScorer):
+    """model_compact.CompactForest: same per-tree probability vectors, walked as flat arrays."""
+
+    def __init__(self, model):
+        self.model = model
+        self.classes = model.classes_
+        self.n_units = model.n_estimators
+        self.trees_per_unit = 1
+        self.default_growth = 1.0
+
+    def accumulate(self, S, X, start, end):
+        S += self.model.tree_values(X, start, end)
+
+
+class _BoosterScorer:
+    """XGBoost classifier: leaf margins per boosting round, one tree per class group."""
+
+    def __init__(self, model):
+        import xgboost as xgb
+        self.xgb = xgb
+        self.classes = model.classes_
+        self.booster = model.get_booster()
+        self.groups = len(self.classes) if len(self.classes) > 2 else 1
+
+        trees = self.booster.trees_to_dataframe()
+        n_trees = int(trees["Tree"].max()) + 1
+        self.n_units = n_trees // self.groups
+        self.trees_per_unit = self.groups
+        self.default_growth = 2.0
+
+        self.leaf_values = []
+        lo = np.zeros((self.n_units, self.groups))
+        hi = np.zeros((self.n_units, self.groups))
+        for tid, t in trees.groupby("Tree"):
+            leaves = t[t["Feature"] == "Leaf"]
+            table = np.zeros(int(t["Node"].max()) + 1)
+            table[leaves["Node"].to_numpy(dtype=int)] = leaves["Gain"].to_numpy()
+            self.leaf_values.append(table)
+            r, g = divmod(int(tid), self.groups)
+            lo[r, g] = leaves["Gain"].min()
+            hi[r, g] = leaves["Gain"].max()
+        # suffix sums: bounds on what rounds [r, n_units) can still add to each class
+        self.rest_lo = np.vstack([np.cumsum(lo[::-1], axis=0)[::-1], np.zeros((1, self.groups))])
+        self.rest_hi = np.vstack([np.cumsum(hi[::-1], axis=0)[::-1], np.zeros((1, self.groups))])
+
+        # base margin = full margin minus the sum of every tree's leaf value
+        probe = np.zeros((1, self.booster.num_features()), dtype=np.float32)
+        leaves = self.booster.predict(xgb.DMatrix(probe), pred_leaf=True).astype(np.intp).reshape(1, -1)
+        S = self.zeros(1)
+        for tree in range(leaves.shape[1]):
+            S[:, tree % self.groups] += self.leaf_values[tree][leaves[:, tree]]
+        full = self.booster.predict(xgb.DMatrix(probe), output_margin=True).reshape(1, -1)
+        self.base = (full - S)[0]
+
+    def zeros(self, n):
+        return np.zeros((n, self.groups), dtype=np.float64)
+
+    def accumulate(self, S, X, start, end):
+        # margin of rounds [start, end) only; inplace_predict skips DMatrix construction
+        margin = self.booster.inplace_predict(X, iteration_range=(start, end), predict_type="margin")
+        S += np.asarray(margin, dtype=np.float64).reshape(len(X), -1) - self.base
+
+    def decided(self, S, end, confidence):
+        M = S + self.base
+        lo, hi = self.rest_lo[end], self.rest_hi[end]
+        if self.groups == 1:
+            m = M[:, 0]
+            done = (m + lo[0] > _EPS) | (m + hi[0] < -_EPS)
+            if confidence is not None:
+                p = 1.0 / (1.0 + np.exp(-m))
+                done |= np.maximum(p, 1.0 - p) >= confidence
+            return done
+        lead = np.argmax(M, axis=1)
+        rows = np.arange(len(M))
+        worst_lead = M[rows, lead] + lo[lead]
+        best_other = M + hi
+        best_other[rows, lead] = -np.inf
+        done = worst_lead > best_other.max(axis=1) + _EPS
+        if confidence is not None:
+            P = np.exp(M - M.max(axis=1, keepdims=True))
+            P /= P.sum(axis=1, keepdims=True)
+            done |= P[rows, lead] >= confidence
+        return done
+
+    def finish(self, S):
+        M = S + self.base
+        if self.groups == 1:
+            return self.classes[(M[:, 0] > 0).astype(int)]
+        return self.classes[np.argmax(M, axis=1)]
+
+
+class ProgressiveForest:
+    """Block-wise tree evaluation with early exit.
+
+    block_size  — trees (boosting rounds for XGBoost) evaluated between checks
+    confidence  — optional leader share / probability at which a row may stop early;
+                  None keeps exact mode (identical answers to model.predict)
+    growth      — factor applied to the block size after every check (1.0 = fixed blocks)
+    """
+
+    def __init__(self, model, block_size=5, confidence=None, growth=None):
+        if hasattr(model, "estimators_") and hasattr(model.estimators_[0], "tree_"):
+            self.scorer = _ForestScorer(model)
+        elif hasattr(model, "tree_values") and getattr(model, "classes_", None) is not None:
+            self.scorer = _CompactScorer(model)
+        elif hasattr(model, "get_booster"):
+            self.scorer = _BoosterScorer(model)
+        else:
+            raise TypeError(f"progressive evaluation not supported for {type(model).__name__}")
+        self.block_size = max(1, int(block_size))
+        # each booster call has a fixed cost, so booster blocks grow geometrically
+        self.growth = growth if growth is not None else self.scorer.default_growth
+        self.confidence = confidence
+        self.n_trees = self.scorer.n_units * self.scorer.trees_per_unit
+
+    @classmethod
+    def supports(cls, model):
+        return (hasattr(model, "estimators_") and hasattr(model.estimators_[0], "tree_")) \
+            or (hasattr(model, "tree_values") and getattr(model, "classes_", None) is not None) \
+            or hasattr(model, "get_booster")
+
+    def predict(self, X, confidence="default"):
+        conf = self.confidence if confidence == "default" else confidence
+        sc = self.scorer
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n = len(X)
+        S = sc.zeros(n)
+        used = np.zeros(n, dtype=np.int64)
+        active = np.arange(n)
+
+        start, block = 0, self.block_size
+        while start < sc.n_units:
+            end = min(sc.n_units, start + block)
+            S_act = S[active]
+            sc.accumulate(S_act, X[active], start, end)
+            S[active] = S_act
+            used[active] = end
+            if end == sc.n_units:
+                break
+            active = active[~sc.decided(S_act, end, conf)]
+            if active.size == 0:
+                break
+            start = end
+            block = max(block, int(block * self.growth))
+
+        return ProgressiveResult(sc.finish(S), used * sc.trees_per_unit, self.n_trees)
+
+
+# ── Benchmark: exact-mode parity on held-out rows + average speedup ───────────
+def _timed(fn, repeat=3):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def benchmark(args):
+    from crop_data import generate_frame, split_indices
+    from model_loader import load_bundle
+
+    bundle = load_bundle("crop", args.model)
+    model = bundle.model
+    if not ProgressiveForest.supports(model):
+        return {"error": f"unsupported model type {type(model).__name__}"}
+
+    df = generate_frame(seed=42)
+    _, test_idx = split_indices(df["crop"])
+    X = bundle.encoder.transform(df.iloc[test_idx].reset_index(drop=True))
+
+    exact = ProgressiveForest(model, block_size=args.block_size)
+    full_pred, t_full = _timed(lambda: model.predict(X))
+    res, t_prog = _timed(lambda: exact.predict(X))
+    parity = float(np.mean(res.labels == full_pred))
+
+    # single-row latency (what predict_server.py pays per request)
+    sample = X[: args.single_rows]
+    _, t_full_1 = _timed(lambda: [model.predict(sample[i:i + 1]) for i in range(len(sample))], repeat=1)
+    _, t_prog_1 = _timed(lambda: [exact.predict(sample[i:i + 1]) for i in range(len(sample))], repeat=1)
+
+    report = {
+        "model": type(model).__name__,
+        "n_trees": exact.n_trees,
+        "block_size": args.block_size,
+        "heldout_rows": int(len(X)),
+        "exact": {
+            "parity_with_full_predict": parity,
+            "avg_trees_used": round(float(res.trees_used.mean()), 2),
+            "tree_fraction": round(float(res.trees_used.mean()) / exact.n_trees, 4),
+            "batch_ms_full": round(t_full * 1000, 2),
+            "batch_ms_progressive": round(t_prog * 1000, 2),
+            "single_row_us_full": round(t_full_1 / len(sample) * 1e6, 1),
+            "single_row_us_progressive": round(t_prog_1 / len(sample) * 1e6, 1),
+            "single_row_speedup": round(t_full_1 / t_prog_1, 2),
+        },
+    }
+    if args.confidence is not None:
+        conf = ProgressiveForest(model, block_size=args.block_size, confidence=args.confidence)
+        cres, t_conf = _timed(lambda: conf.predict(X))
+        report["confidence"] = {
+            "threshold": args.confidence,
+            "agreement_with_full_predict": float(np.mean(cres.labels == full_pred)),
+            "avg_trees_used": round(float(cres.trees_used.mean()), 2),
+            "batch_ms_progressive": round(t_conf * 1000, 2),
+        }
+    return report
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Progressive (early-exit) crop model evaluation.")
+    p.add_argument("--benchmark", action="store_true", help="verify exact-mode parity and time it")
+    p.add_argument("--model", help="crop artifact path (default ml/model.pkl)")
+    p.add_argument("--block-size", type=int, default=5)
+    p.add_argument("--confidence", type=float, default=None)
+    p.add_argument("--single-rows", type=int, default=300)
+    args = p.parse_args(argv)
+    if not args.benchmark:
+        p.print_help()
+        return 2
+    report = benchmark(args)
+    print(json.dumps(report, indent=2))
+    exact = report.get("exact")
+    return 0 if exact and exact["parity_with_full_predict"] == 1.0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
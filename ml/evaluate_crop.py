@@ -0,0 +1,266 @@
+"""
+evaluate_crop.py — Batched evaluation of the crop model; fills ml_metrics and
+ml_test_set (read by /api/ml/metrics and /api/ml/test-set).
+
+All evaluation rows (held-out split, labelled files, Mongo collections) are
+encoded into one float32 matrix and scored with a single chunked
+predict_proba pass. Accuracy, macro-F1, the confusion matrix and per-class
+one-vs-rest counts come from one np.bincount — no per-row Python — so
+hundreds of thousands of rows evaluate in seconds.
+
+train_model.py calls evaluate_and_store() after fitting. Run standalone to
+re-evaluate an existing artifact against new data without retraining:
+
+Usage:
+  python ml/evaluate_crop.py                                   # held-out split of ml/model.pkl
+  python ml/evaluate_crop.py --data field_labels.csv --label-col crop
+  python ml/evaluate_crop.py --collection crop_samples --no-heldout
+  python ml/evaluate_crop.py --synthetic 500000 --no-db        # speed check
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+warnings.filterwarnings("ignore")
+
+from model_loader import load_bundle
+
+CHUNK_ROWS = 65536          # predict_proba chunk (bounds peak memory)
+INSERT_BATCH = 10000        # ml_test_set insert_many batch
+LATENCY_SAMPLE = 200        # single-row timings per evaluation
+
+
+# ── Scoring ───────────────────────────────────────────────────────────────────
+def predict_proba_batched(model, X, chunk_rows=CHUNK_ROWS):
+    """One predict_proba pass over X in chunks. Returns (proba, chunk_ms list)."""
+    proba = None
+    chunk_ms = []
+    for start in range(0, len(X), chunk_rows):
+        t0 = time.perf_counter()
+        p = model.predict_proba(X[start:start + chunk_rows])
+        chunk_ms.append((time.perf_counter() - t0) * 1000)
+        if proba is None:
+            proba = np.empty((len(X), p.shape[1]), dtype=np.float32)
+        proba[start:start + len(p)] = p
+    if proba is None:
+        proba = np.empty((0, len(model.classes_)), dtype=np.float32)
+    return proba, chunk_ms
+
+
+def single_row_latency(bundle, records, n=LATENCY_SAMPLE):
+    """p50/p95/p99 (ms) of encode + predict for one request, as predict_server.py does it."""
+    sample = records[:n]
+    if not sample:
+        return None
+    lat = np.empty(len(sample))
+    for i, rec in enumerate(sample):
+        t0 = time.perf_counter()
+        bundle.model.predict(bundle.encoder.transform_one(rec).reshape(1, -1))
+        lat[i] = (time.perf_counter() - t0) * 1000
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+            "rows": len(sample)}
+
+
+def classification_metrics(true_idx, pred_idx, classes):
+    """Vectorized metrics from integer class indices (true_idx == -1: label unknown to the model)."""
+    k = len(classes)
+    n = len(true_idx)
+    known = true_idx >= 0
+    cm = np.bincount(true_idx[known] * k + pred_idx[known], minlength=k * k).reshape(k, k)
+    tp = np.diag(cm)
+    fp = cm.sum(axis=0) - tp
+    fn = cm.sum(axis=1) - tp
+    tn = int(known.sum()) - tp - fp - fn
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall    = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1        = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    support = tp + fn
+    present = support > 0
+    return {
+        "rows":           int(n),
+        "unknown_labels": int(n - known.sum()),
+        "accuracy":       float(tp.sum() / n) if n else 0.0,
+        "f1_macro":       float(f1[present].mean()) if present.any() else 0.0,
+        "classes":        list(classes),
+        "confusion_matrix": cm.tolist(),
+        "per_class": {
+            c: {"precision": round(float(precision[i]), 4), "recall": round(float(recall[i]), 4),
+                "f1": round(float(f1[i]), 4), "support": int(support[i]),
+                "tp": int(tp[i]), "fp": int(fp[i]), "fn": int(fn[i]), "tn": int(tn[i])}
+            for i, c in enumerate(classes)
+        },
+    }
+
+
+def evaluate(bundle, frame, label_col="crop", source_col=None):
+    """Score every row of `frame` in one batched pass.
+
+    Returns (metrics, scored) — scored is a DataFrame of the valid rows with
+    predicted_label / confidence / correct columns added.
+    """
+    classes = bundle.labels(bundle.model.classes_)
+    t0 = time.perf_counter()
+    X, valid = bundle.encoder.encode(frame)
+    encode_s = time.perf_counter() - t0
+
+    frame = frame[valid].reset_index(drop=True)
+    X = X[valid]
+    proba, chunk_ms = predict_proba_batched(bundle.model, X)
+    predict_s = sum(chunk_ms) / 1000
+
+    pred_idx = proba.argmax(axis=1) if len(proba) else np.empty(0, dtype=np.intp)
+    true_idx = pd.Categorical(frame[label_col].astype(str), categories=classes).codes.astype(np.intp)
+
+    metrics = classification_metrics(true_idx, pred_idx, classes)
+    metrics["invalid_rows"] = int((~valid).sum())
+    metrics["mean_confidence"] = round(float(proba.max(axis=1).mean()), 4) if len(proba) else None
+    if source_col and source_col in frame.columns:
+        # per-source accuracy / macro-F1 (held-out vs stored test set vs new data)
+        metrics["by_source"] = {}
+        for src in frame[source_col].unique():
+            m = (frame[source_col] == src).to_numpy()
+            sub = classification_metrics(true_idx[m], pred_idx[m], classes)
+            metrics["by_source"][str(src)] = {k: sub[k] for k in ("rows", "unknown_labels", "accuracy", "f1_macro")}
+    metrics["latency"] = {
+        "encode_ms":        round(encode_s * 1000, 2),
+        "predict_ms":       round(predict_s * 1000, 2),
+        "rows_per_sec":     round(len(X) / predict_s, 1) if predict_s > 0 else None,
+        "chunk_ms_p50":     round(float(np.percentile(chunk_ms, 50)), 2) if chunk_ms else None,
+        "chunk_ms_max":     round(float(max(chunk_ms)), 2) if chunk_ms else None,
+        "single_row":       single_row_latency(bundle, frame.head(LATENCY_SAMPLE).to_dict("records")),
+    }
+
+    scored = frame.copy()
+    scored["actual_label"] = scored[label_col].astype(str)
+    scored["predicted_label"] = np.asarray(classes, dtype=object)[pred_idx] if len(pred_idx) else []
+    scored["confidence"] = proba.max(axis=1).astype(np.float64) if len(proba) else []
+    scored["correct"] = scored["actual_label"] == scored["predicted_label"]
+    return metrics, scored
+
+
+# ── Evaluation data ───────────────────────────────────────────────────────────
+def heldout_frame():
+    """The exact test rows train_model.py holds out (seed 42, stratified 20%)."""
+    from crop_data import generate_frame, split_indices
+    df = generate_frame(seed=42)
+    _, test_idx = split_indices(df["crop"])
+    return df.iloc[test_idx].reset_index(drop=True)
+
+
+def read_labelled_file(path):
+    if path.lower().endswith((".ndjson", ".jsonl", ".json")):
+        return pd.read_json(path, lines=True)
+    return pd.read_csv(path)
+
+
+def read_collection(db, name, label_col):
+    rows = list(db[name].find({label_col: {"$exists": True}}, {"_id": 0}))
+    return pd.DataFrame(rows)
+
+
+def _db(timeout_ms=3000):
+    from pymongo import MongoClient
+    client = MongoClient("mongodb://127.0.0.1:27017/", serverSelectionTimeoutMS=timeout_ms)
+    client.admin.command("ping")
+    return client["smart_irrigation"]
+
+
+# ── Persisting ────────────────────────────────────────────────────────────────
+TEST_SET_FIELDS = ["temperature", "humidity", "rainfall", "soil_ph", "soilMoisture", "nitrogen",
+                   "phosphorus", "potassium", "soilType", "region", "season"]
+
+
+def store(db, metrics, scored, model_path, write_test_set=True):
+    now = datetime.utcnow()
+    doc = {"createdAt": now, "model": "crop", "model_path": model_path,
+           "test_rows": metrics["rows"], **metrics}
+    db["ml_metrics"].insert_one(doc)
+    doc.pop("_id", None)
+
+    inserted = 0
+    if write_test_set and len(scored):
+        cols = [c for c in TEST_SET_FIELDS + ["source"] if c in scored.columns]
+        out = scored[cols + ["actual_label", "predicted_label", "confidence", "correct"]].copy()
+        out["createdAt"] = now
+        records = out.to_dict("records")
+        db["ml_test_set"].delete_many({})
+        for start in range(0, len(records), INSERT_BATCH):
+            db["ml_test_set"].insert_many(records[start:start + INSERT_BATCH], ordered=False)
+        inserted = len(records)
+    return doc, inserted
+
+
+def evaluate_and_store(bundle, frames, label_col="crop", write_db=True, write_test_set=True):
+    """Concatenate {source: DataFrame} frames, evaluate in one pass, optionally write Mongo."""
+    parts = [f.assign(source=src) for src, f in frames.items() if f is not None and len(f)]
+    if not parts:
+        raise ValueError("no evaluation rows")
+    frame = pd.concat(parts, ignore_index=True)
+    metrics, scored = evaluate(bundle, frame, label_col=label_col, source_col="source")
+    stored = None
+    if write_db:
+        try:
+            db = _db()
+            _, inserted = store(db, metrics, scored, bundle.path, write_test_set)
+            stored = {"ml_metrics": 1, "ml_test_set": inserted}
+        except Exception as e:
+            print(f"WARNING: could not write ml_metrics/ml_test_set ({e})", file=sys.stderr)
+    return metrics, stored
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Evaluate the crop model and fill ml_metrics / ml_test_set.")
+    p.add_argument("--model", help="crop artifact path (default ml/model.pkl)")
+    p.add_argument("--data", action="append", default=[], help="labelled .csv/.ndjson file (repeatable)")
+    p.add_argument("--collection", action="append", default=[], help="labelled Mongo collection (repeatable)")
+    p.add_argument("--label-col", default="crop")
+    p.add_argument("--no-heldout", action="store_true", help="skip train_model.py's held-out split")
+    p.add_argument("--synthetic", type=int, default=0, help="add N freshly generated rows (speed check)")
+    p.add_argument("--no-db", action="store_true", help="print metrics only")
+    p.add_argument("--no-test-set", action="store_true", help="write ml_metrics but not ml_test_set rows")
+    args = p.parse_args(argv)
+
+    try:
+        bundle = load_bundle("crop", args.model)
+    except FileNotFoundError:
+        print(json.dumps({"error": "model-not-found"}))
+        return 2
+
+    frames = {}
+    if not args.no_heldout:
+        frames["heldout"] = heldout_frame()
+    for path in args.data:
+        frames[os.path.basename(path)] = read_labelled_file(path)
+    if args.collection:
+        db = _db()
+        for name in args.collection:
+            frames[name] = read_collection(db, name, args.label_col)
+    if args.synthetic:
+        from crop_data import CROP_PROFILES, generate_frame
+        per_profile = sum(n for _, n, *_ in CROP_PROFILES)
+        frames["synthetic"] = generate_frame(seed=7, scale=args.synthetic / per_profile)
+
+    t0 = time.perf_counter()
+    try:
+        metrics, stored = evaluate_and_store(bundle, frames, args.label_col,
+                                             write_db=not args.no_db, write_test_set=not args.no_test_set)
+    except ValueError as e:
+        print(json.dumps({"error": str(e)}))
+        return 2
+    metrics["seconds"] = round(time.perf_counter() - t0, 3)
+    metrics["stored"] = stored
+    print(json.dumps(metrics))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
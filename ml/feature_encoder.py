@@ -0,0 +1,234 @@
+"""
+feature_encoder.py — One FeatureEncoder shared by training and inference.
+
+The encoder is fitted by the train_*.py scripts and pickled inside the model
+artifact (payload["encoder"]), so predict_*.py / predict_server.py rebuild the
+exact training columns without re-implementing one-hot logic.
+
+  * numeric columns are copied as float32 (with per-column defaults, or
+    required when the default is None)
+  * categorical columns are one-hot encoded as "<col>_<value>", in the same
+    order pandas get_dummies produced, so legacy artifacts keep working
+  * column positions are precomputed once; rows are written straight into a
+    preallocated float32 array — no per-request dict / DataFrame
+"""
+import numpy as np
+import pandas as pd
+
+# values predict.py treated as "not provided"
+_MISSING = (None, "", "None")
+
+
+def _to_float(v):
+    if v in _MISSING:
+        return None
+    try:
+        f = float(v)
+    except (ValueError, TypeError):
+        return None
+    return None if f != f else f
+
+
+class FeatureEncoder:
+    def __init__(self, numeric_cols, categorical_cols=(), defaults=None, aliases=None,
+                 case_insensitive=False):
+        """
+        numeric_cols      — numeric feature names, in model column order
+        categorical_cols  — columns to one-hot encode (categories learned by fit)
+        defaults          — {numeric_col: default}; a missing column or None means required
+        aliases           — {model_col: input_key} when the model was trained on other names
+        case_insensitive  — match categorical values ignoring case (predict_yield.py behaviour)
+        """
+        self.numeric_cols     = list(numeric_cols)
+        self.categorical_cols = list(categorical_cols)
+        self.defaults         = dict(defaults or {})
+        self.aliases          = dict(aliases or {})
+        self.case_insensitive = case_insensitive
+        self.categories       = {}
+        self.feature_columns  = list(self.numeric_cols)
+        self._build_index()
+
+    # ── fitting ───────────────────────────────────────────────────────────────
+    def fit(self, df):
+        """Learn the sorted category list of every categorical column."""
+        self.categories = {c: sorted(df[c].astype(str).unique().tolist()) for c in self.categorical_cols}
+        self.feature_columns = list(self.numeric_cols)
+        for c in self.categorical_cols:
+            self.feature_columns += [f"{c}_{v}" for v in self.categories[c]]
+        self._build_index()
+        return self
+
+    @classmethod
+    def from_columns(cls, feature_columns, categorical_values=None, defaults=None, aliases=None,
+                     case_insensitive=False):
+        """Rebuild an encoder for an artifact saved before encoders were pickled."""
+        categorical_values = categorical_values or {}
+        one_hot = {f"{c}_{v}" for c, values in categorical_values.items() for v in values}
+        enc = cls([c for c in feature_columns if c not in one_hot], list(categorical_values),
+                  defaults=defaults, aliases=aliases, case_insensitive=case_insensitive)
+        enc.categories = {c: list(v) for c, v in categorical_values.items()}
+        enc.feature_columns = list(feature_columns)
+        enc._build_index()
+        return enc
+
+    @property
+    def categorical_values(self):
+        return {c: list(v) for c, v in self.categories.items()}
+
+    @property
+    def n_features(self):
+        return len(self.feature_columns)
+
+    def _key(self, v):
+        v = "" if v is None else str(v)
+        return v.lower() if self.case_insensitive else v
+
+    def _build_index(self):
+        pos = {c: i for i, c in enumerate(self.feature_columns)}
+        # (model column position, input key, default)
+        self._num_index = [(pos[c], self.aliases.get(c, c), self.defaults.get(c))
+                           for c in self.numeric_cols if c in pos]
+        # {categorical col: {normalised value: model column position}}
+        self._cat_index = {}
+        for c in self.categorical_cols:
+            lookup = {}
+            for v in self.categories.get(c, []):
+                idx = pos.get(f"{c}_{v}")
+                if idx is not None:
+                    lookup.setdefault(self._key(v), idx)
+            self._cat_index[c] = lookup
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_index()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_num_index", None)
+        state.pop("_cat_index", None)
+        return state
+
+    # ── single row ────────────────────────────────────────────────────────────
+    def transform_one(self, record, out=None):
+        """Encode one dict into `out` (a zeroed float32 row) and return it.
+
+        Raises ValueError when a required numeric value is missing or invalid.
+        """
+        if out is None:
+            out = np.zeros(len(self.feature_columns), dtype=np.float32)
+        for idx, key, default in self._num_index:
+            v = _to_float(record.get(key))
+            if v is None:
+                if default is None:
+                    raise ValueError(f"missing or invalid value for '{key}'")
+                v = default
+            out[idx] = v
+        for c, lookup in self._cat_index.items():
+            idx = lookup.get(self._key(record.get(c)))
+            if idx is not None:
+                out[idx] = 1.0
+        return out
+
+    # ── batches ───────────────────────────────────────────────────────────────
+    def encode(self, records):
+        """Encode a list of dicts or a DataFrame.
+
+        Returns (X, valid): X is a float32 (n, n_features) array and valid a
+        bool mask; rows with a missing required value are False and left zeroed.
+        """
+        if isinstance(records, pd.DataFrame):
+            return self._encode_frame(records)
+        X = np.zeros((len(records), len(self.feature_columns)), dtype=np.float32)
+        valid = np.ones(len(records), dtype=bool)
+        for i, rec in enumerate(records):
+            try:
+                self.transform_one(rec, out=X[i])
+            except ValueError:
+                X[i] = 0.0
+                valid[i] = False
+        return X, valid
+
+    def _encode_frame(self, df):
+        n = len(df)
+        X = np.zeros((n, len(self.feature_columns)), dtype=np.float32)
+        valid = np.ones(n, dtype=bool)
+        for idx, key, default in self._num_index:
+            if key in df.columns:
+                col = pd.to_numeric(df[key], errors="coerce").to_numpy(dtype=np.float64)
+            else:
+                col = np.full(n, np.nan)
+            missing = np.isnan(col)
+            if missing.any():
+                if default is None:
+                    valid &= ~missing
+                    col = np.where(missing, 0.0, col)
+                else:
+                    col = np.where(missing, default, col)
+            X[:, idx] = col
+        rows = np.arange(n)
+        for c, lookup in self._cat_index.items():
+            if c not in df.columns or not lookup:
+                continue
+            # categorical dtype codes: -1 for unseen values, no get_dummies copy
+            values = df[c].fillna("").astype(str)
+            if self.case_insensitive:
+                values = values.str.lower()
+            keys = list(lookup)
+            codes = pd.Categorical(values, categories=keys).codes
+            hit = codes >= 0
+            positions = np.fromiter((lookup[k] for k in keys), dtype=np.intp, count=len(keys))
+            X[rows[hit], positions[codes[hit]]] = 1.0
+        X[~valid] = 0.0
+        return X, valid
+
+    def transform(self, records):
+        """Encode a batch and raise ValueError if any row is missing a required value."""
+        X, valid = self.encode(records)
+        if not valid.all():
+            bad = np.flatnonzero(~valid)[:5].tolist()
+            raise ValueError(f"missing required feature values in rows {bad}")
+        return X
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+
+# ── Per-model schemas (defaults mirror the original predict_*.py scripts) ─────
+CROP_NUMERIC = ["temperature", "humidity", "rainfall", "soil_ph", "soilMoisture",
+                "nitrogen", "phosphorus", "potassium"]
+CROP_CATEGORICAL = ["soilType", "region", "season"]
+CROP_DEFAULTS = {
+    "temperature":  25.0,
+    "humidity":     60.0,
+    "rainfall":    100.0,
+    "soil_ph":       6.5,
+    "soilMoisture": 40.0,
+    "nitrogen":     40.0,
+    "phosphorus":   20.0,
+    "potassium":    30.0,
+}
+# train_xgboost.py uses the Kaggle column names
+CROP_ALIASES = {"N": "nitrogen", "P": "phosphorus", "K": "potassium", "ph": "soil_ph"}
+
+SOIL_FEATURES = ["nitrogen", "phosphorus", "potassium", "ph"]
+YIELD_NUMERIC = ["area", "rainfall", "temperature", "fertilizer"]
+RAINFALL_FEATURES = ["temperature", "humidity", "soilMoisture", "rainfall_lag1", "dayofyear"]
+
+
+def crop_encoder(numeric_cols=None, categorical_cols=None):
+    numeric_cols = CROP_NUMERIC if numeric_cols is None else numeric_cols
+    categorical_cols = CROP_CATEGORICAL if categorical_cols is None else categorical_cols
+    defaults = {**CROP_DEFAULTS, **{a: CROP_DEFAULTS[c] for a, c in CROP_ALIASES.items()}}
+    return FeatureEncoder(numeric_cols, categorical_cols, defaults=defaults, aliases=CROP_ALIASES)
+
+
+def soil_encoder():
+    return FeatureEncoder(SOIL_FEATURES)
+
+
+def yield_encoder():
+    return FeatureEncoder(YIELD_NUMERIC, ["crop"], defaults={"fertilizer": 0.0}, case_insensitive=True)
+
+
+def rainfall_encoder():
+    return FeatureEncoder(RAINFALL_FEATURES)
@@ -0,0 +1,634 @@
+"""
+history_archive.py — Columnar archive for weatherdatas, soilpredictions and predictionhistories.
+
+`compact` moves documents older than the retention window out of MongoDB
+into monthly partitions under ARCHIVE_DIR (HISTORY_ARCHIVE_DIR, default
+<repo>/archive/history):
+
+  <collection>/<YYYY-MM>.<stamp>/<column>.npy     one file per column (partition or segment)
+  manifest.json                                   partitions, row counts, time ranges, schema
+
+Columns are stored as arrays numpy can memory-map:
+  float   float64, NaN for missing (numbers and booleans)
+  time    int64 epoch milliseconds, TIME_NULL for missing
+  oid     uint8 (n, 12) raw ObjectId bytes
+  str     int32 dictionary codes (-1 missing) + <column>.dict.json
+  json    as str, values are JSON text (nested objects such as PredictionHistory.input)
+
+Each collection's `watermark` in the manifest splits the history exactly:
+rows created before it are read from the archive, the rest from MongoDB. A
+batch of at most FLUSH_ROWS is flushed as a segment (a partition holding just
+that batch) → manifest (new segment + watermark, atomic replace) → bulk delete
+of the archived _ids, so a crash at any point leaves every row readable
+exactly once, and each flush writes only its own rows. Once a month is
+complete its segments are merged into one partition in a single rewrite. A
+re-run drops the _ids already archived (only rows older than the watermark
+can be). Replaced partition directories are removed by a later run once older
+than GC_GRACE_S (readers may still have them mapped).
+
+read_history() is what trainers and exports use: archive partitions outside
+[start, end) are skipped from the manifest alone, only the requested column
+files are opened (mmap_mode="r"), and the live collection fills in from the
+watermark on.
+
+Usage:
+  python ml/history_archive.py compact                                  # retention 90 days
+  python ml/history_archive.py compact --collections weatherdatas --retention-days 30 --dry-run
+  python ml/history_archive.py export soilpredictions > soil_predictions.csv
+  python ml/history_archive.py stats
+  python ml/history_archive.py --benchmark 2000000                      # synthetic, no Mongo
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.environ.get("HISTORY_ARCHIVE_DIR", os.path.join(BASE_DIR, "..", "archive", "history"))
+RETENTION_DAYS = float(os.environ.get("HISTORY_RETENTION_DAYS", "90"))
+COLLECTIONS = ("weatherdatas", "soilpredictions", "predictionhistories")
+TIME_FIELD = "createdAt"
+TIME_NULL = np.iinfo(np.int64).min
+FLUSH_ROWS = 200000            # a month larger than this is flushed as several segments
+DELETE_CHUNK = 10000
+GC_GRACE_S = 3600
+MANIFEST_VERSION = 1
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# columns of /api/ml/soil-history/export, in order
+SOIL_EXPORT_COLUMNS = ["createdAt", "nitrogen", "phosphorus", "potassium", "ph", "predictedLabel", "probability"]
+
+
+# ── Column encoding ───────────────────────────────────────────────────────────
+def _is_oid(v):
+    return (type(v).__name__ == "ObjectId") or (isinstance(v, bytes) and len(v) == 12)
+
+
+def _kind_of(values):
+    present = [v for v in values if v is not None]
+    if not present:
+        return None
+    if all(isinstance(v, datetime) for v in present):
+        return "time"
+    if all(_is_oid(v) for v in present):
+        return "oid"
+    if all(isinstance(v, (int, float, bool, np.integer, np.floating)) for v in present):
+        return "float"
+    if all(isinstance(v, str) for v in present):
+        return "str"
+    return "json"
+
+
+def _ms(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)      # pymongo hands back naive UTC datetimes
+    return (dt - EPOCH) // timedelta(milliseconds=1)
+
+
+def _json_text(v):
+    return None if v is None else json.dumps(v, sort_keys=True, default=str)
+
+
+def encode(kind, values):
+    """(array, dictionary or None) for a list of Python values."""
+    n = len(values)
+    if kind == "float":
+        return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64), None
+    if kind == "time":
+        return np.array([TIME_NULL if v is None else _ms(v) for v in values], dtype=np.int64), None
+    if kind == "oid":
+        out = np.zeros((n, 12), dtype=np.uint8)
+        for i, v in enumerate(values):
+            if v is not None:
+                out[i] = np.frombuffer(v if isinstance(v, bytes) else v.binary, dtype=np.uint8)
+        return out, None
+    if kind == "json":
+        values = [_json_text(v) for v in values]
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    return codes.astype(np.int32), [str(u) for u in uniques]
+
+
+def decode(kind, arr, dictionary=None):
+    """numpy column (object arrays for str / json / oid, datetime64[ms] for time)."""
+    if kind == "float":
+        return np.asarray(arr, dtype=np.float64)
+    if kind == "time":
+        arr = np.asarray(arr)
+        out = arr.astype("datetime64[ms]")
+        out[arr == TIME_NULL] = np.datetime64("NaT")
+        return out
+    if kind == "oid":
+        return np.array([bytes(r).hex() if r.any() else None for r in np.asarray(arr)], dtype=object)
+    values = list(dictionary or [])
+    if kind == "json":
+        values = [json.loads(v) for v in values]
+    lookup = np.empty(len(values) + 1, dtype=object)
+    lookup[:len(values)] = values
+    lookup[-1] = None
+    codes = np.asarray(arr)
+    return lookup[np.where(codes < 0, len(values), codes)]
+
+
+def _to_values(kind, arr, dictionary):
+    """Column back to Python values that encode() accepts (used when a column changes kind)."""
+    if kind == "time":
+        return [None if v == TIME_NULL else datetime.fromtimestamp(v / 1000, timezone.utc) for v in arr.tolist()]
+    if kind == "oid":
+        return [bytes(r) if r.any() else None for r in np.asarray(arr)]
+    if kind == "float":
+        return [None if v != v else v for v in np.asarray(arr).tolist()]
+    return decode("str", arr, dictionary).tolist()       # json stays as its text
+
+
+def columns_from_docs(docs):
+    """{field: (kind, array, dictionary)} over the union of the documents' fields."""
+    fields = list(dict.fromkeys(k for d in docs for k in d))
+    cols = {}
+    for f in fields:
+        values = [d.get(f) for d in docs]
+        kind = _kind_of(values) or "float"
+        arr, dictionary = encode(kind, values)
+        cols[f] = (kind, arr, dictionary)
+    return cols
+
+
+def _take(col, idx):
+    kind, arr, dictionary = col
+    return kind, np.asarray(arr)[idx], dictionary
+
+
+def _null_column(kind, n):
+    if kind == "float":
+        return np.full(n, np.nan)
+    if kind == "time":
+        return np.full(n, TIME_NULL, dtype=np.int64)
+    if kind == "oid":
+        return np.zeros((n, 12), dtype=np.uint8)
+    return np.full(n, -1, dtype=np.int32)
+
+
+def concat_many(parts):
+    """Row-wise concatenation of [(columns, rows)] in one pass; fields missing in a part are
+    null, a field stored with different kinds becomes json (str + str re-factorizes)."""
+    out = {}
+    for f in list(dict.fromkeys(f for cols, _ in parts for f in cols)):
+        kinds = {cols[f][0] for cols, _ in parts if f in cols}
+        if len(kinds) == 1:
+            kind = kinds.pop()
+            if kind in ("str", "json"):
+                values = []
+                for cols, n in parts:
+                    values += _to_values(kind, cols[f][1], cols[f][2]) if f in cols else [None] * n
+                arr, dictionary = encode("str", values)
+                out[f] = (kind, arr, dictionary)
+            else:
+                out[f] = (kind, np.concatenate([np.asarray(cols[f][1]) if f in cols else _null_column(kind, n)
+                                                for cols, n in parts]), None)
+        else:
+            values = []
+            for cols, n in parts:
+                if f not in cols:
+                    values += [None] * n
+                    continue
+                k = cols[f][0]
+                values += [_json_text(v) if k != "json" else v for v in _to_values(k, cols[f][1], cols[f][2])]
+            arr, dictionary = encode("str", values)
+            out[f] = ("json", arr, dictionary)
+    return out
+
+
+# ── Manifest + partitions ─────────────────────────────────────────────────────
+class Archive:
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = os.path.abspath(root)
+        self.manifest_path = os.path.join(self.root, "manifest.json")
+        self.manifest = self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"version": MANIFEST_VERSION, "collections": {}}
+
+    def reload(self):
+        self.manifest = self._load()
+        return self
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        self.manifest["updatedAt"] = datetime.now(timezone.utc).isoformat()
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+
+    def collection(self, name):
+        return self.manifest["collections"].setdefault(name, {"timeField": TIME_FIELD, "watermark": None,
+                                                              "partitions": {}})
+
+    def watermark(self, name):
+        return (self.manifest["collections"].get(name) or {}).get("watermark")
+
+    def partitions(self, name, start_ms=None, end_ms=None):
+        """Manifest entries of the partitions that can hold rows in [start_ms, end_ms)."""
+        parts = (self.manifest["collections"].get(name) or {}).get("partitions", {})
+        return [p for _, p in sorted(parts.items())
+                if (start_ms is None or p["max"] >= start_ms) and (end_ms is None or p["min"] < end_ms)]
+
+    # ── partition files ───────────────────────────────────────────────────────
+    def read_partition(self, part, columns=None, mmap=True):
+        """{field: (kind, array, dictionary)}; arrays are memory-mapped when mmap."""
+        path = os.path.join(self.root, part["dir"])
+        out = {}
+        for f, kind in part["columns"].items():
+            if columns is not None and f not in columns:
+                continue
+            arr = np.load(os.path.join(path, f"{f}.npy"), mmap_mode="r" if mmap else None)
+            dictionary = None
+            if kind in ("str", "json"):
+                with open(os.path.join(path, f"{f}.dict.json"), encoding="utf-8") as fh:
+                    dictionary = json.load(fh)
+            out[f] = (kind, arr, dictionary)
+        return out
+
+    def write_partition(self, name, month, cols, n):
+        """Write a new partition directory; returns its manifest entry (not yet registered)."""
+        rel = os.path.join(name, f"{month}.{time.time_ns()}")
+        path = os.path.join(self.root, rel)
+        os.makedirs(path)
+        nbytes = 0
+        for f, (kind, arr, dictionary) in cols.items():
+            file = os.path.join(path, f"{f}.npy")
+            np.save(file, np.ascontiguousarray(arr))
+            nbytes += os.path.getsize(file)
+            if dictionary is not None:
+                with open(os.path.join(path, f"{f}.dict.json"), "w", encoding="utf-8") as fh:
+                    json.dump(dictionary, fh)
+                nbytes += os.path.getsize(os.path.join(path, f"{f}.dict.json"))
+        t = cols[TIME_FIELD][1]
+        return {"dir": rel.replace(os.sep, "/"), "month": month, "rows": int(n), "min": int(t.min()),
+                "max": int(t.max()), "columns": {f: c[0] for f, c in cols.items()}, "bytes": nbytes}
+
+    def month_parts(self, name, month):
+        """{manifest key: entry} of a month's partition and segments."""
+        parts = (self.manifest["collections"].get(name) or {}).get("partitions", {})
+        return {k: p for k, p in parts.items() if p["month"] == month}
+
+    def append(self, name, docs, watermark_ms):
+        """Write docs (all of one month, sorted by createdAt) as a new segment of that month
+        and move the watermark to watermark_ms in the same manifest write. Returns rows added.
+
+        Only the new rows are written; merge() folds a month's segments together."""
+        month = datetime.fromtimestamp(_ms(docs[0][TIME_FIELD]) / 1000, timezone.utc).strftime("%Y-%m")
+        new = columns_from_docs(docs)
+        n_new = len(docs)
+        coll = self.collection(name)
+        existing = self.month_parts(name, month)
+        wm = coll["watermark"]
+        if existing and wm is not None and "_id" in new:
+            # a re-run after a crash between manifest write and delete sees archived _ids again;
+            # only rows created before the watermark can have been archived
+            t = new[TIME_FIELD][1]
+            old = t < wm
+            if old.any():
+                lo, hi = int(t[old].min()), int(t[old].max())
+                seen = set()
+                for part in existing.values():
+                    if part["max"] >= lo and part["min"] <= hi and "_id" in part["columns"]:
+                        seen.update(bytes(r) for r in self.read_partition(part, ["_id"])["_id"][1])
+                keep = np.array([not (o and bytes(r) in seen) for o, r in zip(old, new["_id"][1])], dtype=bool)
+                new = {f: _take(c, keep) for f, c in new.items()}
+                n_new = int(keep.sum())
+        if n_new:
+            order = np.argsort(new[TIME_FIELD][1], kind="stable")
+            new = {f: _take(c, order) for f, c in new.items()}
+            key = month if month not in coll["partitions"] else f"{month}.{time.time_ns()}"
+            coll["partitions"][key] = self.write_partition(name, month, new, n_new)
+        coll["watermark"] = max(watermark_ms, wm or watermark_ms)
+        self.save()
+        return n_new
+
+    def merge(self, name, month):
+        """Rewrite a month's segments as one partition (one manifest write). Returns rows merged."""
+        existing = self.month_parts(name, month)
+        if len(existing) < 2:
+            return 0
+        parts = [(self.read_partition(p), p["rows"]) for _, p in sorted(existing.items())]
+        cols = concat_many(parts)
+        n = sum(rows for _, rows in parts)
+        order = np.argsort(cols[TIME_FIELD][1], kind="stable")
+        cols = {f: _take(c, order) for f, c in cols.items()}
+        entry = self.write_partition(name, month, cols, n)
+        coll = self.collection(name)
+        for key, part in existing.items():
+            del coll["partitions"][key]
+            coll.setdefault("retired", []).append({"dir": part["dir"], "at": time.time()})
+        coll["partitions"][month] = entry
+        self.save()
+        return n
+
+    def segmented_months(self, name):
+        parts = (self.manifest["collections"].get(name) or {}).get("partitions", {}).values()
+        months = [p["month"] for p in parts]
+        return sorted({m for m in months if months.count(m) > 1})
+
+    def gc(self, grace_s=GC_GRACE_S):
+        """Remove replaced partition directories once no reader should still hold them."""
+        removed = 0
+        now = time.time()
+        for coll in self.manifest["collections"].values():
+            keep = []
+            for r in coll.get("retired", []):
+                if now - r["at"] < grace_s:
+                    keep.append(r)
+                    continue
+                shutil.rmtree(os.path.join(self.root, r["dir"]), ignore_errors=True)
+                removed += 1
+            coll["retired"] = keep
+        if removed:
+            self.save()
+        return removed
+
+    def stats(self):
+        out = {}
+        for name, coll in self.manifest["collections"].items():
+            parts = coll["partitions"].values()
+            wm = coll.get("watermark")
+            out[name] = {"partitions": len(parts), "rows": sum(p["rows"] for p in parts),
+                         "bytes": sum(p["bytes"] for p in parts),
+                         "watermark": None if wm is None else _utc(wm).isoformat()}
+        return out
+
+
+# ── Reading archive + live together ───────────────────────────────────────────
+def _to_utc_ms(v):
+    if v is None:
+        return None
+    return _ms(v if isinstance(v, datetime) else pd.Timestamp(v).to_pydatetime())
+
+
+def _utc(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc)
+
+
+def read_history(db, name, start=None, end=None, columns=None, query=None, archive=None):
+    """DataFrame of a collection's full history (archive + live), sorted by createdAt.
+
+    start / end bound createdAt ([start, end)); columns limits the fields read
+    (archive column files and the Mongo projection); query is an extra Mongo
+    filter on equality fields, applied to archived rows too. `_id` is only
+    returned when asked for in columns (as a hex string). db may be None to
+    read the archive alone.
+    """
+    archive = archive or Archive()
+    start_ms, end_ms = _to_utc_ms(start), _to_utc_ms(end)
+    wm = archive.watermark(name)
+    want = None if columns is None else list(dict.fromkeys(list(columns) + [TIME_FIELD] + list(query or {})))
+
+    frames = []
+    # live rows first: a compaction running meanwhile only retires partitions, it never
+    # deletes what an earlier manifest still points at
+    if db is not None:
+        live_time = {}
+        if start_ms is not None:
+            live_time["$gte"] = _utc(max(start_ms, wm or start_ms))
+        elif wm is not None:
+            live_time["$not"] = {"$lt": _utc(wm)}       # keeps documents without a createdAt
+        if end_ms is not None:
+            live_time["$lt"] = _utc(end_ms)
+        mongo_query = dict(query or {})
+        if live_time:
+            mongo_query[TIME_FIELD] = live_time
+        projection = {f: 1 for f in want} if want is not None else None
+        if projection is not None and "_id" not in want:
+            projection["_id"] = 0
+        elif projection is None and not (columns and "_id" in columns):
+            projection = {"_id": 0}
+        rows = list(db[name].find(mongo_query, projection))
+        if rows:
+            live = pd.DataFrame(rows)
+            if "_id" in live.columns:
+                live["_id"] = live["_id"].astype(str)
+            frames.append(live)
+
+    if wm is not None and (end_ms is None or end_ms > 0):
+        hi = wm if end_ms is None else min(wm, end_ms)
+        for part in archive.partitions(name, start_ms, hi):
+            cols = archive.read_partition(part, want)
+            t = np.asarray(cols[TIME_FIELD][1])
+            mask = t < hi
+            if start_ms is not None:
+                mask &= t >= start_ms
+            for f, v in (query or {}).items():
+                if f not in cols:
+                    mask[:] = False
+                    break
+                kind, arr, dictionary = cols[f]
+                if kind == "str":
+                    mask &= np.asarray(arr) == (dictionary.index(v) if v in dictionary else -2)
+                elif kind == "float":
+                    mask &= np.asarray(arr) == v
+                else:
+                    mask &= np.array([x == v for x in decode(kind, arr, dictionary)], dtype=bool)
+            if not mask.any():
+                continue
+            idx = np.flatnonzero(mask)
+            data = {f: decode(kind, np.asarray(arr)[idx], dictionary)
+                    for f, (kind, arr, dictionary) in cols.items()
+                    if f != "_id" or (columns and "_id" in columns)}
+            frames.append(pd.DataFrame(data))
+
+    if not frames:
+        return pd.DataFrame(columns=want or [])
+    df = pd.concat(frames[::-1], ignore_index=True, sort=False)
+    if TIME_FIELD in df.columns:
+        df[TIME_FIELD] = pd.to_datetime(df[TIME_FIELD])
+        df = df.sort_values(TIME_FIELD, kind="stable").reset_index(drop=True)
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
+# ── Compaction ────────────────────────────────────────────────────────────────
+def _month_key(dt):
+    return (dt.year, dt.month)
+
+
+def compact_collection(db, archive, name, cutoff, dry_run=False):
+    """Archive + delete every document of `name` created before cutoff."""
+    coll = db[name]
+    cursor = coll.find({TIME_FIELD: {"$lt": cutoff}}).sort(TIME_FIELD, 1).batch_size(10000)
+    summary = {"archived": 0, "deleted": 0, "partitions": set()}
+    batch = []
+    month = [None]                # month of the segments being written
+
+    def merge(until=None):
+        # a finished month (and any left segmented by an interrupted run) becomes one partition
+        for m in archive.segmented_months(name):
+            if until is None or m < until:
+                archive.merge(name, m)
+
+    def flush(watermark_dt):
+        if dry_run:
+            summary["archived"] += len(batch)
+            summary["partitions"].add(batch[0][TIME_FIELD].strftime("%Y-%m"))
+            return
+        batch_month = batch[0][TIME_FIELD].strftime("%Y-%m")
+        if month[0] is not None and batch_month != month[0]:
+            merge(until=batch_month)
+        month[0] = batch_month
+        summary["archived"] += archive.append(name, batch, _ms(watermark_dt))
+        summary["partitions"].add(batch[0][TIME_FIELD].strftime("%Y-%m"))
+        ids = [d["_id"] for d in batch]
+        for i in range(0, len(ids), DELETE_CHUNK):
+            summary["deleted"] += coll.delete_many({"_id": {"$in": ids[i:i + DELETE_CHUNK]}}).deleted_count
+
+    for doc in cursor:
+        ts = doc[TIME_FIELD]
+        if batch and batch[-1][TIME_FIELD] != ts and (
+                _month_key(ts) != _month_key(batch[0][TIME_FIELD]) or len(batch) >= FLUSH_ROWS):
+            flush(ts)             # everything before this document is archived
+            batch = []
+        batch.append(doc)
+    if batch:
+        flush(cutoff)
+    elif not dry_run:
+        c = archive.collection(name)
+        c["watermark"] = max(_ms(cutoff), c["watermark"] or 0)
+        archive.save()
+    if not dry_run:
+        merge()
+    summary["partitions"] = sorted(summary["partitions"])
+    return summary
+
+
+def compact(db, collections=COLLECTIONS, retention_days=RETENTION_DAYS, dry_run=False, archive=None):
+    archive = archive or Archive()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    cutoff = cutoff.replace(microsecond=cutoff.microsecond // 1000 * 1000)    # the watermark's precision
+    t0 = time.perf_counter()
+    out = {"cutoff": cutoff.isoformat(), "retentionDays": retention_days, "dryRun": dry_run, "collections": {}}
+    for name in collections:
+        out["collections"][name] = compact_collection(db, archive, name, cutoff, dry_run)
+    if not dry_run:
+        out["gcRemoved"] = archive.gc()
+    out["seconds"] = round(time.perf_counter() - t0, 3)
+    return out
+
+
+# ── Export ────────────────────────────────────────────────────────────────────
+def _num(v):
+    """JavaScript number formatting (45.0 → "45"), '' for missing."""
+    if v is None or v != v:
+        return ""
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def export_soil_csv(db, out, archive=None):
+    """The /soil-history/export CSV (newest first) over archive + live rows."""
+    df = read_history(db, "soilpredictions", columns=SOIL_EXPORT_COLUMNS, archive=archive)
+    df = df.iloc[::-1]
+    out.write(",".join(SOIL_EXPORT_COLUMNS))
+    stamps = (pd.to_datetime(df["createdAt"]).dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z").tolist() \
+        if len(df) else []
+    cols = {c: (df[c].tolist() if c in df.columns else [None] * len(df)) for c in SOIL_EXPORT_COLUMNS}
+    for i, ts in enumerate(stamps):
+        label = cols["predictedLabel"][i]
+        label = "" if label is None or label != label else label
+        out.write("\n" + ",".join([ts, _num(cols["nitrogen"][i]), _num(cols["phosphorus"][i]),
+                                   _num(cols["potassium"][i]), _num(cols["ph"][i]),
+                                   '"' + str(label).replace('"', '""') + '"', _num(cols["probability"][i])]))
+    return len(stamps)
+
+
+# ── Benchmark (synthetic weather history, no Mongo) ───────────────────────────
+def benchmark(n_rows, months=24, seed=42):
+    rng = np.random.default_rng(seed)
+    root = tempfile.mkdtemp(prefix="history-archive-")
+    archive = Archive(root)
+    end = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    start = end - timedelta(days=30 * months)
+    ts = np.sort(rng.integers(_ms(start), _ms(end), n_rows))
+    cities = [f"City {i}" for i in range(200)]
+    city_idx = rng.integers(0, len(cities), n_rows)
+    temp, hum = rng.uniform(5, 40, n_rows).round(1), rng.uniform(20, 95, n_rows).round(0)
+    rain, moist = rng.exponential(2, n_rows).round(1), rng.uniform(5, 70, n_rows).round(1)
+
+    def doc(i):
+        return {"_id": rng.bytes(12), "temperature": float(temp[i]), "humidity": float(hum[i]),
+                "rainfall": float(rain[i]), "soilMoisture": float(moist[i]), "city": cities[city_idx[i]],
+                "createdAt": datetime.fromtimestamp(ts[i] / 1000, timezone.utc), "__v": 0}
+
+    t0 = time.perf_counter()
+    months_of = ts.astype("datetime64[ms]").astype("datetime64[M]").astype(np.int64)
+    bounds = np.flatnonzero(np.diff(months_of)) + 1
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, n_rows]):
+        docs = [doc(i) for i in range(lo, hi)]
+        archive.append("weatherdatas", docs, int(ts[hi - 1]) + 1)
+    write_s = time.perf_counter() - t0
+    stats = archive.stats()["weatherdatas"]
+
+    t0 = time.perf_counter()
+    full = read_history(None, "weatherdatas", archive=archive)
+    full_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    recent = read_history(None, "weatherdatas", start=end - timedelta(days=60),
+                          columns=["temperature", "humidity", "soilMoisture", "rainfall"], archive=archive)
+    pruned_s = time.perf_counter() - t0
+    assert len(full) == n_rows and full["createdAt"].is_monotonic_increasing
+    shutil.rmtree(root, ignore_errors=True)
+    mongo_bytes = n_rows * 180        # ~BSON size of one weatherdatas document
+    return {"rows": n_rows, "partitions": stats["partitions"], "archiveMB": round(stats["bytes"] / 2**20, 1),
+            "approxBsonMB": round(mongo_bytes / 2**20, 1), "write_s": round(write_s, 3),
+            "fullRead_s": round(full_s, 3), "last60DaysRows": len(recent),
+            "last60Days4Cols_s": round(pruned_s, 4)}
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def _db():
+    from pymongo import MongoClient
+    return MongoClient("mongodb://127.0.0.1:27017/", serverSelectionTimeoutMS=3000)["smart_irrigation"]
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Columnar archive of old prediction / weather history.")
+    p.add_argument("command", nargs="?", choices=("compact", "export", "stats"))
+    p.add_argument("collection", nargs="?", help="export: collection (soilpredictions)")
+    p.add_argument("--collections", default=",".join(COLLECTIONS))
+    p.add_argument("--retention-days", type=float, default=RETENTION_DAYS)
+    p.add_argument("--dry-run", action="store_true", help="count what would be archived, change nothing")
+    p.add_argument("--benchmark", type=int, metavar="ROWS")
+    args = p.parse_args(argv)
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.benchmark), indent=2))
+        return 0
+    if args.command == "stats":
+        print(json.dumps(Archive().stats()))
+        return 0
+    if args.command == "compact":
+        names = [c for c in args.collections.split(",") if c]
+        unknown = sorted(set(names) - set(COLLECTIONS))
+        if unknown:
+            p.error(f"unknown collections: {unknown}")
+        print(json.dumps(compact(_db(), names, args.retention_days, args.dry_run)))
+        return 0
+    if args.command == "export":
+        if args.collection != "soilpredictions":
+            p.error("export supports: soilpredictions")
+        export_soil_csv(_db(), sys.stdout)
+        return 0
+    p.print_help()
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
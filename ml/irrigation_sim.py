@@ -0,0 +1,452 @@
+"""
+irrigation_sim.py — Season-long Monte Carlo irrigation simulation.
+
+waterBalance.js walks the next 7 forecast days once. This engine runs the
+same daily bucket model (Hargreaves ET0 x Kc, SOIL_WHC x root depth field
+capacity, MAD = FC x (1 - p), the same skip-on-rain rule, refill to FC) over
+the WHOLE growth cycle given by the CROP_KC stage lengths, for thousands of
+stochastic weather traces per farm, and reports percentile water budgets
+and stress-day risk.
+
+Weather traces (n_traces x season_days arrays, generated without Python loops):
+  history  days resampled from the farm city's weatherdatas — for each season
+           day a random historical day within +/-15 days of the same
+           day-of-year (all cities pooled when the city has too little history)
+  model    rainfall_model.pkl's recursive daily path from the latest
+           observation, with gamma-distributed multiplicative noise;
+           temperature follows the observation with AR(1) noise
+  auto     history when there is enough of it, otherwise model
+
+The bucket model itself advances one day at a time over all traces at once
+(season_days vectorized steps per farm). Farms are spread across a process
+pool.
+
+weatherdatas.rainfall is OpenWeatherMap's rain.1h (mm/h); a day's rain is the
+mean reading x SIM_RAIN_HOURS (default 24; the model source is scaled the same way). Tmax/Tmin are the day's extreme readings (one reading:
++/- half of DIURNAL_RANGE).
+
+Input: JSON list of farms
+  {"id", "city", "crop", "soilType", "plantingDate": "2026-06-15",
+   "rootDepth": 0.5, "fieldSize": 0 (m2, for litres), "lat": 20.0,
+   "soilMoisture": 65 (% at planting; default: latest city reading)}
+
+Usage:
+  python ml/irrigation_sim.py farms.json --traces 5000
+  python ml/irrigation_sim.py farms.json --source model --workers 4
+  python ml/irrigation_sim.py farms.json --history readings.ndjson --no-db
+  python ml/irrigation_sim.py --benchmark
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+warnings.filterwarnings("ignore")
+
+# mirrors backend/services/waterBalance.js — keep in sync
+CROP_KC = {
+    "rice":      {"initial": 1.05, "mid": 1.20, "late": 0.75, "days": [30, 60, 30],   "p": 0.2},
+    "wheat":     {"initial": 0.30, "mid": 1.15, "late": 0.40, "days": [20, 60, 30],   "p": 0.55},
+    "maize":     {"initial": 0.30, "mid": 1.20, "late": 0.60, "days": [20, 40, 30],   "p": 0.55},
+    "cotton":    {"initial": 0.45, "mid": 1.15, "late": 0.70, "days": [30, 50, 55],   "p": 0.65},
+    "sugarcane": {"initial": 0.40, "mid": 1.25, "late": 0.75, "days": [35, 105, 70],  "p": 0.65},
+    "potato":    {"initial": 0.50, "mid": 1.15, "late": 0.75, "days": [25, 30, 30],   "p": 0.35},
+    "tomato":    {"initial": 0.60, "mid": 1.15, "late": 0.80, "days": [30, 40, 45],   "p": 0.40},
+    "onion":     {"initial": 0.50, "mid": 1.00, "late": 0.75, "days": [15, 25, 10],   "p": 0.30},
+    "banana":    {"initial": 0.50, "mid": 1.10, "late": 1.00, "days": [120, 60, 180], "p": 0.35},
+    "chickpea":  {"initial": 0.40, "mid": 1.00, "late": 0.35, "days": [20, 35, 15],   "p": 0.45},
+    "mungbean":  {"initial": 0.40, "mid": 1.05, "late": 0.60, "days": [20, 30, 20],   "p": 0.45},
+    "jute":      {"initial": 0.40, "mid": 1.15, "late": 0.50, "days": [25, 60, 30],   "p": 0.30},
+    "coffee":    {"initial": 0.90, "mid": 0.95, "late": 0.95, "days": [30, 90, 30],   "p": 0.40},
+    "default":   {"initial": 0.40, "mid": 1.10, "late": 0.60, "days": [25, 50, 25],   "p": 0.50},
+}
+SOIL_WHC = {"sandy": 110, "loamy": 170, "clay": 200, "red": 140, "black": 190, "default": 160}
+STAGES = ("initial", "mid", "late")
+
+# mm/h reading -> mm/day; SIM_RAIN_HOURS=1 when readings already hold daily totals
+RAIN_RATE_HOURS = float(os.environ.get("SIM_RAIN_HOURS", "24"))
+DIURNAL_RANGE = 10.0        # degC, when a day has a single reading
+DOY_WINDOW = 15             # resampling window (+/- days of year)
+MIN_HISTORY_DAYS = 30       # fewer distinct days -> pool all cities / use the model
+RAIN_GAMMA_SHAPE = 0.6      # model source: rain x Gamma(k, 1/k) (mean 1, CV ~1.3)
+TEMP_NOISE_SD = 2.0         # model source: AR(1) daily temperature noise
+TEMP_NOISE_PHI = 0.7
+SKIP_RAIN_MM = 5            # waterBalance.js skipDueToRain threshold
+DEFAULT_MOISTURE_PCT = 65
+DEFAULT_LAT = 20.0
+DEFAULT_TRACES = 2000
+PERCENTILES = (10, 50, 90, 95)
+
+
+# ── FAO-56 pieces (vectorized ports of waterBalance.js) ───────────────────────
+def crop_params(crop):
+    return CROP_KC.get(str(crop or "").lower(), CROP_KC["default"])
+
+
+def kc_curve(crop):
+    """(Kc per season day 1..L, stage index per day) — getKc() for every day of the cycle."""
+    kc = crop_params(crop)
+    d1, d2, d3 = kc["days"]
+    stage = np.repeat(np.arange(3), [d1, d2, d3])
+    return np.array([kc["initial"], kc["mid"], kc["late"]])[stage], stage
+
+
+def extraterrestrial_radiation(lat_deg, doy):
+    phi = np.radians(lat_deg)
+    dr = 1 + 0.033 * np.cos(2 * np.pi / 365 * doy)
+    delta = 0.409 * np.sin(2 * np.pi / 365 * doy - 1.39)
+    ws = np.arccos(np.clip(-np.tan(phi) * np.tan(delta), -1, 1))
+    return (24 * 60 / np.pi) * 0.0820 * dr * (ws * np.sin(phi) * np.sin(delta)
+                                              + np.cos(phi) * np.cos(delta) * np.sin(ws))
+
+
+def hargreaves_et0(tmax, tmin, ra):
+    td = np.maximum(tmax - tmin, 0)
+    return np.maximum(0, 0.0023 * ((tmax + tmin) / 2 + 17.8) * np.sqrt(td) * ra * 0.408)
+
+
+# ── Weather history ───────────────────────────────────────────────────────────
+def daily_history(readings):
+    """weatherdatas rows -> one row per (city, date): doy, tmax, tmin, rain (mm/day), soilMoisture."""
+    df = pd.DataFrame(readings)
+    if df.empty or "createdAt" not in df.columns:
+        return pd.DataFrame(columns=["city", "date", "doy", "tmax", "tmin", "rain", "soilMoisture"])
+    df["city"] = df.get("city", pd.Series("", index=df.index)).fillna("").astype(str).str.strip().str.lower()
+    for c in ("temperature", "rainfall", "soilMoisture"):
+        df[c] = pd.to_numeric(df[c], errors="coerce") if c in df.columns else np.nan
+    df["date"] = pd.to_datetime(df["createdAt"]).dt.normalize()
+    df = df.dropna(subset=["temperature"])
+    g = df.groupby(["city", "date"], sort=True)
+    day = g.agg(tmax=("temperature", "max"), tmin=("temperature", "min"), n=("temperature", "size"),
+                rain=("rainfall", "mean"), soilMoisture=("soilMoisture", "last")).reset_index()
+    single = day["n"] == 1
+    day.loc[single, "tmax"] += DIURNAL_RANGE / 2
+    day.loc[single, "tmin"] -= DIURNAL_RANGE / 2
+    day["rain"] = day["rain"].fillna(0).clip(lower=0) * RAIN_RATE_HOURS
+    day["doy"] = day["date"].dt.dayofyear
+    return day.drop(columns="n")
+
+
+class DoyPool:
+    """Historical days grouped by day-of-year window, stored CSR-style.
+
+    For target day-of-year d, candidates are indices[offsets[d - 1]:offsets[d]]:
+    every historical day within +/-window days (circular) — or all days when
+    the window is empty.
+    """
+
+    def __init__(self, days, window=DOY_WINDOW):
+        self.tmax = days["tmax"].to_numpy(np.float64)
+        self.tmin = days["tmin"].to_numpy(np.float64)
+        self.rain = days["rain"].to_numpy(np.float64)
+        doy = days["doy"].to_numpy()
+        target = np.arange(1, 367)[:, None]
+        dist = np.abs(target - doy[None, :])
+        mask = np.minimum(dist, 366 - dist) <= window
+        mask[~mask.any(axis=1)] = True
+        rows, cols = np.nonzero(mask)
+        self.indices = cols
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=366))])
+        self.n_days = len(doy)
+
+    def arrays(self):
+        return {"tmax": self.tmax, "tmin": self.tmin, "rain": self.rain,
+                "indices": self.indices, "offsets": self.offsets}
+
+
+def resample_traces(pool, season_doy, n_traces, rng):
+    """(n_traces, L) tmax / tmin / rain drawn day by day from the pool, in one shot."""
+    row = season_doy - 1
+    start = pool["offsets"][row]
+    count = pool["offsets"][row + 1] - start
+    pick = start[None, :] + (rng.random((n_traces, len(row))) * count[None, :]).astype(np.int64)
+    idx = pool["indices"][pick]
+    return pool["tmax"][idx], pool["tmin"][idx], pool["rain"][idx]
+
+
+def model_traces(rain_path, temp, n_traces, rng):
+    """Noise around the rainfall model's expected path (mm/day) and the observed temperature."""
+    from scipy.signal import lfilter
+    L = len(rain_path)
+    rain = rain_path[None, :] * rng.gamma(RAIN_GAMMA_SHAPE, 1 / RAIN_GAMMA_SHAPE, (n_traces, L))
+    eps = rng.normal(0, TEMP_NOISE_SD * np.sqrt(1 - TEMP_NOISE_PHI ** 2), (n_traces, L))
+    tmean = temp + lfilter([1.0], [1.0, -TEMP_NOISE_PHI], eps, axis=1)
+    return tmean + DIURNAL_RANGE / 2, tmean - DIURNAL_RANGE / 2, rain
+
+
+# ── Bucket model ──────────────────────────────────────────────────────────────
+def simulate(tmax, tmin, rain, kc, stage, ra, fc, p, sm0):
+    """Daily bucket model over all traces. Returns per-trace season totals."""
+    n, L = rain.shape
+    etc = hargreaves_et0(tmax, tmin, ra[None, :]) * kc[None, :]
+    mad = fc * (1 - p)
+    sm = np.full(n, sm0)
+    rainfed = sm.copy()
+    irrigation = np.zeros(n)
+    stage_irr = np.zeros((n, 3))
+    events = np.zeros(n, dtype=np.int32)
+    stress = np.zeros(n, dtype=np.int32)
+    rainfed_stress = np.zeros(n, dtype=np.int32)
+    for t in range(L):
+        r = rain[:, t]
+        sm = np.minimum(fc, np.maximum(0, sm + r - etc[:, t]))
+        below = sm < mad
+        skip = (r > SKIP_RAIN_MM) & (sm + r > mad)
+        need = below & ~skip
+        amount = np.where(need, fc - sm, 0.0)
+        irrigation += amount
+        stage_irr[:, stage[t]] += amount
+        events += need
+        stress += below & skip            # below MAD but irrigation skipped for rain
+        sm = np.where(need, fc, sm)
+        rainfed = np.minimum(fc, np.maximum(0, rainfed + r - etc[:, t]))
+        rainfed_stress += rainfed < mad
+    return {"irrigation": irrigation, "stage_irrigation": stage_irr, "events": events,
+            "stress": stress, "rainfed_stress": rainfed_stress,
+            "etc": etc.sum(axis=1), "rain": rain.sum(axis=1)}
+
+
+def _pct(a, digits=1):
+    a = np.asarray(a, dtype=np.float64)
+    q = np.percentile(a, PERCENTILES)
+    return {"mean": round(float(a.mean()), digits),
+            **{f"p{k}": round(float(v), digits) for k, v in zip(PERCENTILES, q)}}
+
+
+def simulate_farm(task):
+    """One farm, all traces. `task` is plain data so it can cross a process boundary."""
+    farm = task["farm"]
+    rng = np.random.default_rng(task["seed"])
+    kc, stage = kc_curve(farm.get("crop"))
+    L = len(kc)
+    planted = task["planted"]
+    season_doy = np.array([(planted + timedelta(days=t + 1)).timetuple().tm_yday for t in range(L)])
+    ra = extraterrestrial_radiation(float(farm.get("lat") or DEFAULT_LAT), season_doy)
+    params = crop_params(farm.get("crop"))
+    whc = SOIL_WHC.get(str(farm.get("soilType") or "").lower(), SOIL_WHC["default"])
+    fc = whc * float(farm.get("rootDepth") or 0.5)
+    sm0 = float(task["soilMoisture"]) / 100 * fc
+
+    if task["source"] == "history":
+        tmax, tmin, rain = resample_traces(task["pool"], season_doy, task["traces"], rng)
+    else:
+        tmax, tmin, rain = model_traces(task["rainPath"][:L], task["temperature"], task["traces"], rng)
+
+    res = simulate(tmax, tmin, rain, kc, stage, ra, fc, params["p"], sm0)
+    field = float(farm.get("fieldSize") or 0)
+    out = {
+        "id":             farm.get("id"),
+        "city":           farm.get("city"),
+        "crop":           str(farm.get("crop") or "default").lower(),
+        "soilType":       farm.get("soilType"),
+        "plantingDate":   planted.date().isoformat(),
+        "seasonDays":     L,
+        "stageDays":      params["days"],
+        "source":         task["source"],
+        "poolDays":       task.get("poolDays"),
+        "traces":         task["traces"],
+        "fieldCapacityMm": round(fc, 1),
+        "madMm":          round(fc * (1 - params["p"]), 1),
+        "irrigationMm":   _pct(res["irrigation"]),
+        "irrigationEvents": _pct(res["events"]),
+        "etcMm":          _pct(res["etc"]),
+        "rainMm":         _pct(res["rain"]),
+        "stageIrrigationMm": {s: _pct(res["stage_irrigation"][:, i]) for i, s in enumerate(STAGES)},
+        "stressDays":     _pct(res["stress"]),
+        "rainfedStressDays": _pct(res["rainfed_stress"]),
+        "stressRisk": {
+            "anyStressDay":        round(float((res["stress"] > 0).mean()), 4),
+            "rainfedAnyStressDay": round(float((res["rainfed_stress"] > 0).mean()), 4),
+            "rainfedOver10Days":   round(float((res["rainfed_stress"] > 10).mean()), 4),
+        },
+    }
+    if field > 0:
+        out["volumeLiters"] = {k: round(v * field) for k, v in out["irrigationMm"].items()}
+    return out
+
+
+# ── Inputs ────────────────────────────────────────────────────────────────────
+def load_readings(db=None, path=None):
+    if path:
+        if path.lower().endswith((".ndjson", ".jsonl", ".json")):
+            return pd.read_json(path, lines=path.lower().endswith((".ndjson", ".jsonl")))
+        return pd.read_csv(path)
+    if db is None:
+        return pd.DataFrame()
+    # archived history (history_archive.py) + live rows
+    from history_archive import read_history
+    return read_history(db, "weatherdatas", columns=["city", "createdAt", "temperature", "humidity",
+                                                     "rainfall", "soilMoisture"])
+
+
+def _planting(farm):
+    d = farm.get("plantingDate")
+    return pd.Timestamp(d).to_pydatetime().replace(tzinfo=None) if d else datetime.now()
+
+
+def _model_paths(farms, readings, planted):
+    """Expected daily rain (mm) for each farm from one recursive forecast over all of them."""
+    from rain_forecast import RainForecaster
+    forecaster = RainForecaster.load()
+    latest = {}
+    if len(readings):
+        r = readings.copy()
+        r["city"] = r["city"].fillna("").astype(str).str.strip().str.lower()
+        latest = r.sort_values("createdAt").groupby("city").last().to_dict("index")
+    obs = []
+    for farm, when in zip(farms, planted):
+        last = latest.get(str(farm.get("city") or "").strip().lower(), {})
+        obs.append({k: farm.get(k, last.get(k)) for k in ("temperature", "humidity", "soilMoisture", "rainfall")}
+                   | {"dayofyear": when.timetuple().tm_yday})
+    X, errors = forecaster.observations(obs)
+    horizon = max(len(kc_curve(f.get("crop"))[0]) for f in farms)
+    paths = np.zeros((len(farms), horizon))
+    ok = np.array([e is None for e in errors], dtype=bool)
+    if ok.any():
+        years = np.array([when.year for when in planted])[ok]
+        paths[ok] = np.clip(forecaster.recursive(X[ok], horizon, years), 0, None) * RAIN_RATE_HOURS
+    temps = [float(o["temperature"]) if o.get("temperature") is not None else np.nan for o in obs]
+    return paths, ok, temps
+
+
+def build_tasks(farms, readings, source="auto", traces=DEFAULT_TRACES, seed=42):
+    days = daily_history(readings)
+    planted = [_planting(f) for f in farms]
+    pools, city_moisture = {}, {}
+    if len(days):
+        city_moisture = days.sort_values("date").groupby("city")["soilMoisture"].last().dropna().to_dict()
+        all_pool = DoyPool(days) if days["date"].nunique() >= MIN_HISTORY_DAYS else None
+        for city, sub in days.groupby("city"):
+            pools[city] = DoyPool(sub) if len(sub) >= MIN_HISTORY_DAYS else all_pool
+        pools[None] = all_pool
+
+    tasks, errors, want_model = [], [], []
+    for i, farm in enumerate(farms):
+        city = str(farm.get("city") or "").strip().lower()
+        pool = pools.get(city, pools.get(None))
+        task = {"farm": farm, "planted": planted[i], "traces": int(traces), "seed": [int(seed), i],
+                "soilMoisture": farm.get("soilMoisture", city_moisture.get(city, DEFAULT_MOISTURE_PCT))}
+        if source in ("auto", "history") and pool is not None:
+            task.update(source="history", pool=pool.arrays(), poolDays=pool.n_days)
+        elif source == "history":
+            errors.append({"index": i, "id": farm.get("id"), "error": "not enough weather history"})
+            continue
+        else:
+            task["source"] = "model"
+            want_model.append(len(tasks))
+        tasks.append(task)
+
+    if want_model:
+        try:
+            paths, ok, temps = _model_paths([tasks[j]["farm"] for j in want_model], readings,
+                                            [tasks[j]["planted"] for j in want_model])
+        except FileNotFoundError:
+            paths = None
+        keep = []
+        for k, j in enumerate(want_model):
+            t = tasks[j]
+            if paths is None or not ok[k] or np.isnan(temps[k]):
+                errors.append({"index": farms.index(t["farm"]), "id": t["farm"].get("id"),
+                               "error": "no weather history and no usable rainfall model input "
+                                        "(needs temperature/humidity/soilMoisture/rainfall)"})
+                continue
+            t.update(rainPath=paths[k], temperature=temps[k])
+            keep.append(j)
+        drop = set(want_model) - set(keep)
+        tasks = [t for j, t in enumerate(tasks) if j not in drop]
+    return tasks, errors
+
+
+def run(farms, readings, source="auto", traces=DEFAULT_TRACES, workers=None, seed=42):
+    t0 = time.perf_counter()
+    tasks, errors = build_tasks(farms, readings, source, traces, seed)
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(simulate_farm, tasks))
+    else:
+        results = [simulate_farm(t) for t in tasks]
+    return {"farms": results, "errors": errors, "traces": int(traces),
+            "workers": workers, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def synthetic_readings(cities, years=3, seed=0):
+    """Monsoon-shaped daily readings for the benchmark (no Mongo needed)."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    start = datetime(datetime.now().year - years, 1, 1)
+    n = years * 365
+    doy = (np.arange(n) % 365) + 1
+    monsoon = np.exp(-((doy - 200) / 35.0) ** 2)
+    for c in cities:
+        temp = 27 + 6 * np.sin(2 * np.pi * (doy - 100) / 365) + rng.normal(0, 1.5, n)
+        wet = rng.random(n) < 0.1 + 0.7 * monsoon
+        rate = np.where(wet, rng.gamma(0.8, 0.2 + 1.5 * monsoon), 0.0)
+        for d in range(n):
+            rows.append({"city": c, "createdAt": start + timedelta(days=int(d), hours=12),
+                         "temperature": float(temp[d]), "rainfall": float(rate[d]), "soilMoisture": 40.0})
+    return pd.DataFrame(rows)
+
+
+def benchmark(traces, workers):
+    cities = ["pune", "nagpur", "indore", "patna", "jaipur"]
+    readings = synthetic_readings(cities)
+    crops = ["rice", "wheat", "maize", "cotton", "sugarcane", "tomato", "banana", "onion"]
+    farms = [{"id": f"farm-{i}", "city": cities[i % len(cities)], "crop": crops[i % len(crops)],
+              "soilType": ["sandy", "loamy", "clay", "black"][i % 4],
+              "plantingDate": f"{datetime.now().year}-06-{1 + i % 28:02d}", "fieldSize": 10000}
+             for i in range(16)]
+    serial = run(farms, readings, "history", traces, workers=1)
+    pooled = run(farms, readings, "history", traces, workers=workers)
+    return {"farms": len(farms), "traces": traces, "serial_seconds": serial["seconds"],
+            "pool_seconds": pooled["seconds"], "workers": pooled["workers"],
+            "farm_days_per_sec": round(sum(f["seasonDays"] for f in serial["farms"]) * traces / serial["seconds"]),
+            "example": serial["farms"][0]}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Season-long Monte Carlo irrigation simulation.")
+    p.add_argument("farms", nargs="?", help="JSON list of farms ('-' for stdin)")
+    p.add_argument("--traces", type=int, default=DEFAULT_TRACES)
+    p.add_argument("--source", choices=("auto", "history", "model"), default="auto")
+    p.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--history", help="weather readings file (.csv/.json/.ndjson) instead of weatherdatas")
+    p.add_argument("--no-db", action="store_true", help="do not read weatherdatas")
+    p.add_argument("--benchmark", action="store_true")
+    args = p.parse_args(argv)
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.traces, args.workers or os.cpu_count() or 1), indent=2))
+        return 0
+    if not args.farms:
+        p.print_help()
+        return 2
+    farms = json.load(sys.stdin if args.farms == "-" else open(args.farms, "r", encoding="utf-8"))
+    if isinstance(farms, dict):
+        farms = farms.get("farms", [farms])
+
+    db = None
+    if not args.history and not args.no_db:
+        try:
+            from pymongo import MongoClient
+            client = MongoClient("mongodb://127.0.0.1:27017/", serverSelectionTimeoutMS=3000)
+            client.admin.command("ping")
+            db = client["smart_irrigation"]
+        except Exception as e:
+            print(f"WARNING: weatherdatas not available ({e}); using the rainfall model", file=sys.stderr)
+    readings = load_readings(db, args.history)
+    print(json.dumps(run(farms, readings, args.source, args.traces, args.workers, args.seed)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+job_runner.py — Background training job runner (HTTP, port 5002).
+
+Queues train_*.py runs so the Node routes no longer fit models inside the
+request:
+
+  * dedupe       a request for a model that already has a queued/running job
+                 returns that job instead of starting a second fit
+  * concurrency  at most JOB_RUNNER_CONCURRENCY fits run at once (default 1)
+  * progress     every output line updates the job; JSON lines printed by the
+                 trainers are kept as metrics. Status is mirrored to
+                 ml/jobs/<id>.json for callers that prefer files — on state
+                 changes and metrics, otherwise at most every
+                 JOB_PERSIST_INTERVAL seconds, written outside the job lock.
+                 Files are deleted with the jobs dropped from the history
+  * cancel       queued jobs are dropped, running ones are terminated
+
+Endpoints:
+  GET  /health
+  GET  /jobs                  recent jobs
+  POST /jobs                  {"model": "crop"|"soil"|"yield"|"rainfall", "args": [...]}
+  GET  /jobs/<id>?wait=30     status; blocks up to `wait` seconds for a finished state
+  POST /jobs/<id>/cancel
+
+Start: python ml/job_runner.py  (spawned by backend/server.js)
+"""
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PORT = int(os.environ.get("JOB_RUNNER_PORT", 5002))
+CONCURRENCY = max(1, int(os.environ.get("JOB_RUNNER_CONCURRENCY", 1)))
+JOBS_DIR = os.path.join(BASE_DIR, "jobs")
+MAX_JOBS_KEPT = 200
+LOG_TAIL = 200
+PERSIST_INTERVAL = float(os.environ.get("JOB_PERSIST_INTERVAL", 1.0))
+
+TRAIN_SCRIPTS = {
+    "crop":     "train_model.py",
+    "soil":     "train_soil.py",
+    "yield":    "train_yield.py",
+    "rainfall": "train_rainfall.py",
+}
+ACTIVE = ("queued", "running")
+
+
+class Job:
+    def __init__(self, model, args):
+        self.id         = uuid.uuid4().hex[:12]
+        self.model      = model
+        self.args       = [str(a) for a in args]
+        self.status     = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.ended_at   = None
+        self.returncode = None
+        self.lines      = 0
+        self.last_line  = ""
+        self.log        = deque(maxlen=LOG_TAIL)
+        self.metrics    = None
+        self.error      = None
+        self.cancel_requested = False
+        self.proc       = None
+        self.write_lock = threading.Lock()   # orders this job's file writes
+        self.persisted  = 0.0
+
+    def to_dict(self, log=False):
+        now = self.ended_at or time.time()
+        d = {
+            "id":         self.id,
+            "model":      self.model,
+            "args":       self.args,
+            "status":     self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "ended_at":   self.ended_at,
+            "elapsed_s":  round(now - self.started_at, 2) if self.started_at else 0.0,
+            "returncode": self.returncode,
+            "lines":      self.lines,
+            "progress":   self.last_line,
+            "metrics":    self.metrics,
+            "error":      self.error,
+        }
+        if log:
+            d["log"] = list(self.log)
+        return d
+
+
+class JobRunner:
+    def __init__(self, concurrency=CONCURRENCY, jobs_dir=JOBS_DIR, cwd=None):
+        self.jobs     = OrderedDict()
+        self.active   = {}  # dedupe key -> job
+        self.queue    = queue.Queue()
+        self.lock     = threading.Lock()
+        self.changed  = threading.Condition(self.lock)
+        self.jobs_dir = jobs_dir
+        # trainers write some artifacts relative to the cwd, exactly as the old
+        # exec() calls from the backend did — keep the runner's cwd
+        self.cwd      = cwd or os.getcwd()
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._prune_files()
+        for _ in range(concurrency):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    # ── API ───────────────────────────────────────────────────────────────────
+    def submit(self, model, args=()):
+        """Queue a training job; returns (job, deduped)."""
+        if model not in TRAIN_SCRIPTS:
+            raise ValueError(f"unknown model: {model}")
+        if not isinstance(args, (list, tuple)) or not all(isinstance(a, (str, int, float)) for a in args):
+            raise ValueError("args must be a list of strings")
+        key = (model, tuple(str(a) for a in args))
+        with self.lock:
+            existing = self.active.get(key)
+            if existing is not None and existing.status in ACTIVE:
+                return existing, True
+            job = Job(model, args)
+            self.jobs[job.id] = job
+            self.active[key] = job
+            dropped = self._trim()
+        for old in dropped:
+            self._unlink(old)
+        self._persist(job)
+        self.queue.put(job)
+        return job, False
+
+    def get(self, job_id, wait=0.0):
+        deadline = time.time() + max(0.0, wait)
+        with self.lock:
+            job = self.jobs.get(job_id)
+            while job is not None and job.status in ACTIVE and time.time() < deadline:
+                self.changed.wait(timeout=deadline - time.time())
+            return job
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ACTIVE:
+                return job
+            job.cancel_requested = True
+            queued, proc = job.status == "queued", job.proc
+            if queued:
+                self._finish(job, "cancelled")
+        if queued:
+            self._persist(job)
+        elif proc is not None:
+            proc.terminate()
+            threading.Timer(5.0, lambda: proc.poll() is None and proc.kill()).start()
+        return job
+
+    def list(self):
+        with self.lock:
+            return [j.to_dict() for j in reversed(self.jobs.values())]
+
+    # ── internals ─────────────────────────────────────────────────────────────
+    def _trim(self):
+        """Drop the oldest finished jobs past MAX_JOBS_KEPT; returns them (caller holds
+        self.lock and unlinks their files after releasing it)."""
+        dropped = []
+        while len(self.jobs) > MAX_JOBS_KEPT:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.status in ACTIVE:
+                break
+            dropped.append(self.jobs.popitem(last=False)[1])
+        return dropped
+
+    def _prune_files(self):
+        """Keep only the newest MAX_JOBS_KEPT status files left by earlier runs."""
+        files = [e for e in os.scandir(self.jobs_dir) if e.name.endswith((".json", ".json.tmp"))]
+        files.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        for e in [f for f in files if f.name.endswith(".tmp")] + \
+                 [f for f in files if f.name.endswith(".json")][MAX_JOBS_KEPT:]:
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+
+    def _path(self, job):
+        return os.path.join(self.jobs_dir, f"{job.id}.json")
+
+    def _persist(self, job):
+        """Mirror the job to <id>.json. Called WITHOUT self.lock: only the snapshot
+        takes it, the file write does not block readers or the output loop."""
+        with job.write_lock:
+            with self.lock:
+                if self.jobs.get(job.id) is not job:
+                    return      # trimmed meanwhile; its file is gone
+                snapshot = job.to_dict(log=True)
+                job.persisted = time.monotonic()
+            path = self._path(job)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, path)
+
+    def _unlink(self, job):
+        with job.write_lock:
+            for path in (self._path(job), self._path(job) + ".tmp"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _finish(self, job, status, error=None):
+        # caller holds self.lock, and calls _persist(job) once it has released it
+        job.status = status
+        job.error = error
+        job.ended_at = time.time()
+        job.proc = None
+        key = (job.model, tuple(job.args))
+        if self.active.get(key) is job:
+            del self.active[key]
+        self.changed.notify_all()
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                if job.status != "queued":
+                    continue  # cancelled while waiting
+                job.status = "running"
+                job.started_at = time.time()
+                script = os.path.join(BASE_DIR, TRAIN_SCRIPTS[job.model])
+                try:
+                    job.proc = subprocess.Popen(
+                        [sys.executable, "-u", script, *job.args], cwd=self.cwd,
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                        text=True, encoding="utf-8", errors="replace")
+                except OSError as e:
+                    self._finish(job, "failed", str(e))
+                    proc = None
+                else:
+                    self.changed.notify_all()
+                    proc = job.proc
+            self._persist(job)
+            if proc is not None:
+                self._run(job, proc)
+
+    def _run(self, job, proc):
+        for line in proc.stdout:
+            line = line.rstrip()
+            if not line:
+                continue
+            metrics = None
+            if line.startswith("{"):
+                try:
+                    metrics = json.loads(line)
+                except ValueError:
+                    pass
+            with self.lock:
+                job.lines += 1
+                job.last_line = line[:500]
+                job.log.append(line)
+                if isinstance(metrics, dict):
+                    job.metrics = metrics
+                self.changed.notify_all()
+                due = isinstance(metrics, dict) or time.monotonic() - job.persisted >= PERSIST_INTERVAL
+            if due:
+                self._persist(job)
+        rc = proc.wait()
+        with self.lock:
+            job.returncode = rc
+            if job.cancel_requested:
+                self._finish(job, "cancelled")
+            elif rc == 0:
+                self._finish(job, "succeeded")
+            else:
+                self._finish(job, "failed", f"exit code {rc}: {job.last_line}")
+        self._persist(job)
+
+
+runner = None
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # suppress request logs
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["health"]:
+            self._respond(200, {"status": "ok", "concurrency": CONCURRENCY, "models": list(TRAIN_SCRIPTS)})
+        elif parts == ["jobs"]:
+            self._respond(200, {"jobs": runner.list()})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+            job = runner.get(parts[1], wait=min(wait, 60.0))
+            if job is None:
+                self._respond(404, {"error": "job not found"})
+            else:
+                with runner.lock:
+                    status = job.to_dict(log=True)
+                self._respond(200, status)
+        else:
+            self._respond(404, {"error": "not found"})
+
+    def do_POST(self):
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        try:
+            if parts == ["jobs"]:
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(data, dict):
+                    raise ValueError("request body must be a JSON object")
+                job, deduped = runner.submit(data.get("model"), data.get("args") or [])
+                with runner.lock:
+                    status = {**job.to_dict(), "deduped": deduped}
+                self._respond(200 if deduped else 202, status)
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                job = runner.cancel(parts[1])
+                if job is None:
+                    self._respond(404, {"error": "job not found"})
+                else:
+                    with runner.lock:
+                        status = job.to_dict()
+                    self._respond(200, status)
+            else:
+                self._respond(404, {"error": "not found"})
+        except ValueError as e:
+            self._respond(400, {"error": str(e)})
+        except Exception as e:
+            self._respond(500, {"error": str(e)})
+
+    def _respond(self, code, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    runner = JobRunner()
+    server = ThreadingHTTPServer(("127.0.0.1", PORT), Handler)
+    print(f"Job runner listening on http://127.0.0.1:{PORT} (concurrency {CONCURRENCY})", flush=True)
+    server.serve_forever()
@@ -0,0 +1,461 @@
+"""
+materialize_recommendations.py — Precomputed crop / yield / rainfall answers for every registered farm.
+
+One run scores every User with a location:
+
+  1. inputs per user: the latest WeatherData of their location (cityKey),
+     their latest SoilPrediction (nitrogen / phosphorus / potassium / pH) and
+     the season of today's date (Kharif Jun–Oct, Rabi Nov–Mar, Zaid Apr–May).
+     WeatherData.rainfall is a 1-hour reading, so the rainfall the models see
+     comes from the daily weather rollups (a day = mean reading x
+     SIM_RAIN_HOURS, as in irrigation_sim.py): the crop model gets the last
+     7 days' total (what the crop form fills in), the yield model the season's
+     expected total (mean day x season length); the 1-hour reading only seeds
+     the rain forecast
+  2. identical input rows are scored once: one predict_proba call for the
+     crop model (top --top crops), one yield call for each user's recommended
+     crop, and one multi-day rain_forecast.py call per distinct location
+  3. each user's answer is upserted into the `recommendations` collection
+     (keyed by userEmail) with the artifact versions that produced it
+     ({crop, yield, rainfall} as in prediction_log.model_version)
+
+`recommendation_state` ({_id: "current"}) gets the model versions BEFORE the
+documents are rewritten, so entries scored by an older model read as stale
+(and fall back to live inference) while a run is in progress. A stored
+`--user` run records its versions there too, so after a retrain the entries
+it rewrites are fresh before the next batch.
+
+irrigationScheduler.js runs this after every weather refresh and nightly;
+trainingJobs.js after every successful retrain. GET /api/ml/recommendations
+serves the stored answer and calls `--user <email>` (same code, one row) when
+the entry is missing or stale, or `--user <email> --inputs '{...}'` for
+custom inputs (scored, not stored).
+
+Usage:
+  python ml/materialize_recommendations.py                            # every user → Mongo
+  python ml/materialize_recommendations.py --user farmer@example.com  # one user, upserted
+  python ml/materialize_recommendations.py --user farmer@example.com --inputs '{"season": "Rabi"}'
+  python ml/materialize_recommendations.py --benchmark 100000 --cities 500   # synthetic, no Mongo
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import warnings
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+warnings.filterwarnings("ignore")
+
+from batch_scheduler import normalize_location
+from irrigation_sim import RAIN_RATE_HOURS
+from model_loader import find_model, load_bundle
+from prediction_log import model_version
+from rain_forecast import RainForecaster
+from weather_rollup import ROLLUPS, _tz
+
+COLLECTION = "recommendations"
+STATE = "recommendation_state"
+STATE_ID = "current"
+TOP_CROPS = 3
+FORECAST_DAYS = 7
+YIELD_AREA_HA = 1.0          # yields are stored per hectare
+WEATHER_MAX_AGE_DAYS = float(os.environ.get("RECOMMENDATION_WEATHER_MAX_AGE_DAYS", "7"))
+WRITE_CHUNK = 10000
+
+# inputs a caller may override with --inputs (the crop model's raw inputs)
+INPUT_FIELDS = ("temperature", "humidity", "rainfall", "seasonRainfall", "soilMoisture", "nitrogen",
+                "phosphorus", "potassium", "soil_ph", "soilType", "region", "season")
+RAIN_WEEK_DAYS = 7
+
+
+def season_of(month):
+    if 6 <= month <= 10:
+        return "Kharif"
+    if month >= 11 or month <= 3:
+        return "Rabi"
+    return "Zaid"
+
+
+def season_bounds(day):
+    """(first day, length in days) of the season `day` falls in."""
+    y, m = day.year, day.month
+    if 6 <= m <= 10:
+        start, end = date(y, 6, 1), date(y, 11, 1)
+    elif m >= 11:
+        start, end = date(y, 11, 1), date(y + 1, 4, 1)
+    elif m <= 3:
+        start, end = date(y - 1, 11, 1), date(y, 4, 1)
+    else:
+        start, end = date(y, 4, 1), date(y, 6, 1)
+    return start, (end - start).days
+
+
+def inputs_hash(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+# ── Inputs ────────────────────────────────────────────────────────────────────
+def load_users(db, email=None):
+    query = {"location": {"$nin": ["", None]}}
+    if email:
+        query = {"email": email}
+    return list(db["users"].find(query, {"_id": 0, "email": 1, "location": 1}))
+
+
+def latest_weather(db, now, locations=None):
+    """{normalised location: newest WeatherData doc} over the last WEATHER_MAX_AGE_DAYS."""
+    match = {"createdAt": {"$gte": now - timedelta(days=WEATHER_MAX_AGE_DAYS)}}
+    if locations is not None:
+        # cityKey is the normalised location (WeatherData.js), on the {cityKey, createdAt} index
+        match["cityKey"] = {"$in": sorted(locations)}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"createdAt": -1}},
+        {"$group": {"_id": "$cityKey", "doc": {"$first": "$$ROOT"}}},
+    ]
+    latest = {}
+    for r in db["weatherdatas"].aggregate(pipeline):
+        loc = r["_id"] or normalize_location(r["doc"].get("city"))
+        if loc not in latest or r["doc"]["createdAt"] > latest[loc]["createdAt"]:
+            latest[loc] = r["doc"]      # rows not yet backfilled group under a null cityKey
+    return latest
+
+
+def rainfall_totals(db, now, locations=None):
+    """{location: {"week": mm, "season": mm}} from the daily weather rollups.
+
+    week: total over the last RAIN_WEEK_DAYS days; season: the current season's
+    mean day x its length. Days without readings are filled with the mean of
+    the days that have them.
+    """
+    tz = _tz()
+    today = now.astimezone(tz).date()
+    season_start, season_len = season_bounds(today)
+    week_start = today - timedelta(days=RAIN_WEEK_DAYS - 1)
+    first = min(season_start, week_start)
+    lower = datetime(first.year, first.month, first.day, tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+    query = {"granularity": "day", "bucket": {"$gte": lower}}
+    query["city"] = {"$in": sorted(locations)} if locations is not None else {"$ne": "*"}
+    days = {}
+    for r in db[ROLLUPS].find(query, {"_id": 0, "city": 1, "date": 1, "rainfall": 1}):
+        st = r.get("rainfall") or {}
+        if st.get("n"):
+            days.setdefault(normalize_location(r["city"]), {})[r["date"]] = st["sum"] / st["n"] * RAIN_RATE_HOURS
+    out = {}
+    for loc, per_day in days.items():
+        week = [v for d, v in per_day.items() if d >= week_start.isoformat()]
+        season = [v for d, v in per_day.items() if d >= season_start.isoformat()]
+        out[loc] = {"week": round(float(np.mean(week)) * RAIN_WEEK_DAYS, 1) if week else None,
+                    "season": round(float(np.mean(season)) * season_len, 1) if season else None}
+    return out
+
+
+def latest_soil(db, emails=None):
+    """{userEmail: newest SoilPrediction doc}."""
+    pipeline = [{"$sort": {"createdAt": -1}},
+                {"$group": {"_id": "$userEmail", "doc": {"$first": "$$ROOT"}}}]
+    if emails is not None:
+        pipeline.insert(0, {"$match": {"userEmail": {"$in": list(emails)}}})
+    return {r["_id"]: r["doc"] for r in db["soilpredictions"].aggregate(pipeline) if r["_id"]}
+
+
+def build_inputs(users, weather, soil, now, overrides=None, rain=None):
+    """Model inputs per user, or the reason the user cannot be scored.
+
+    rain: rainfall_totals() output. Returns (rows, skipped): rows are
+    (user, inputs, weather doc, soil doc).
+    """
+    season = season_of(now.month)
+    rain = rain or {}
+    rows, skipped = [], {}
+    for u in users:
+        loc = normalize_location(u.get("location"))
+        w = weather.get(loc)
+        if w is None and not overrides:
+            skipped[u["email"]] = "no-recent-weather"
+            continue
+        w = w or {}
+        s = soil.get(u["email"]) or {}
+        totals = rain.get(loc) or {}
+        inputs = {
+            "city":           loc,
+            "temperature":    w.get("temperature"),
+            "humidity":       w.get("humidity"),
+            "rainfall":       totals.get("week"),
+            "seasonRainfall": totals.get("season"),
+            "rainfall1h":     w.get("rainfall"),
+            "soilMoisture":   w.get("soilMoisture"),
+            "nitrogen":       s.get("nitrogen"),
+            "phosphorus":     s.get("phosphorus"),
+            "potassium":      s.get("potassium"),
+            "soil_ph":        s.get("ph"),
+            "soilType":       "",
+            "region":         "",
+            "season":         season,
+        }
+        if overrides:
+            inputs.update({k: v for k, v in overrides.items() if k in INPUT_FIELDS})
+        rows.append((u, inputs, w, s))
+    return rows, skipped
+
+
+# ── Models ────────────────────────────────────────────────────────────────────
+class Recommender:
+    """The crop / yield / rainfall artifacts, scored over whole batches of input rows."""
+
+    def __init__(self, top=TOP_CROPS, days=FORECAST_DAYS):
+        self.top, self.days = top, days
+        self.crop = load_bundle("crop")
+        self.yield_ = load_bundle("yield") if find_model("yield") else None
+        self.rain = RainForecaster.load() if find_model("rainfall") else None
+        self.versions = {
+            "crop":     model_version(self.crop.path),
+            "yield":    model_version(self.yield_.path) if self.yield_ else None,
+            "rainfall": model_version(self.rain.bundle.path) if self.rain else None,
+        }
+
+    def crops(self, inputs):
+        """[{"predictedCrop", "topCrops": [{"crop", "probability"}]} | {"error"}] per input row."""
+        X, errors = self.crop.features(inputs)
+        out = [{"error": e} if e else None for e in errors]
+        ok = np.flatnonzero([e is None for e in errors])
+        if not len(ok):
+            return out
+        U, inverse = np.unique(X[ok], axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        model = self.crop.model
+        if hasattr(model, "predict_proba"):
+            P = model.predict_proba(U)
+            k = min(self.top, P.shape[1])
+            order = np.argsort(-P, axis=1, kind="stable")[:, :k]
+            names = np.asarray(self.crop.labels(model.classes_), dtype=object)
+            per_row = [{"predictedCrop": names[o[0]],
+                        "topCrops": [{"crop": names[c], "probability": round(float(p[c]), 4)} for c in o]}
+                       for o, p in zip(order, P)]
+        else:
+            per_row = [{"predictedCrop": c, "topCrops": [{"crop": c, "probability": None}]}
+                       for c in self.crop.labels(model.predict(U))]
+        for i, j in zip(ok, inverse):
+            out[i] = per_row[j]
+        return out
+
+    def yields(self, inputs, crops):
+        """predicted_yield_per_ha of each row's recommended crop (None when it cannot be scored)."""
+        out = [None] * len(inputs)
+        if self.yield_ is None:
+            return out
+        idx = [i for i, c in enumerate(crops) if "predictedCrop" in c]
+        records = [{"area": YIELD_AREA_HA, "rainfall": inputs[i]["seasonRainfall"],
+                    "temperature": inputs[i]["temperature"], "crop": crops[i]["predictedCrop"]} for i in idx]
+        if not records:
+            return out
+        X, errors = self.yield_.features(records)
+        ok = np.flatnonzero([e is None for e in errors])
+        if len(ok):
+            U, inverse = np.unique(X[ok], axis=0, return_inverse=True)
+            pred = np.asarray(self.yield_.predict_matrix(U), dtype=np.float64)
+            for r, j in zip(ok, inverse.reshape(-1)):
+                out[idx[r]] = {"crop": records[r]["crop"], "predicted_yield_per_ha": round(float(pred[j]), 3)}
+        return out
+
+    def forecasts(self, inputs):
+        """Rain forecast per row, computed once per distinct location.
+
+        The forecaster is seeded with the latest 1-hour reading, the scale it was trained on.
+        """
+        out = [None] * len(inputs)
+        if self.rain is None:
+            return out
+        first = {}
+        for i, rec in enumerate(inputs):
+            first.setdefault((rec["city"], rec["temperature"], rec["humidity"], rec["soilMoisture"],
+                              rec.get("rainfall1h")), []).append(i)
+        groups = list(first.values())
+        cities = [{**{k: inputs[g[0]][k] for k in ("city", "temperature", "humidity", "soilMoisture")},
+                   "rainfall": inputs[g[0]].get("rainfall1h")} for g in groups]
+        for g, fc in zip(groups, self.rain.forecast(cities, self.days)):
+            if "error" in fc:
+                continue
+            fc = {"days": self.days, "dayofyear": fc["dayofyear"], "rainfall_mm": fc["rainfall_mm"],
+                  "total_mm": round(float(sum(fc["rainfall_mm"])), 3)}
+            for i in g:
+                out[i] = fc
+        return out
+
+    def score(self, inputs):
+        """(crop, yield, rainfall) answers for a list of input dicts, all vectorized."""
+        timings = {}
+        t0 = time.perf_counter()
+        crops = self.crops(inputs)
+        timings["crop_s"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        yields = self.yields(inputs, crops)
+        timings["yield_s"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        rain = self.forecasts(inputs)
+        timings["rainfall_s"] = time.perf_counter() - t0
+        return crops, yields, rain, timings
+
+
+def _when(v):
+    return v if isinstance(v, datetime) else None
+
+
+def materialize(rows, recommender, now):
+    """One `recommendations` document per scorable row. Returns (docs, timings)."""
+    inputs = [r[1] for r in rows]
+    crops, yields, rain, timings = recommender.score(inputs)
+    docs = []
+    for (u, rec, w, s), crop, y, fc in zip(rows, crops, yields, rain):
+        docs.append({
+            "userEmail":         u["email"],
+            "location":          u.get("location"),
+            "inputs":            rec,
+            "inputsHash":        inputs_hash(rec),
+            "crop":              crop,
+            "yield":             y,
+            "rainfall":          fc,
+            "modelVersion":      recommender.versions,
+            "weatherObservedAt": _when(w.get("createdAt")),
+            "soilObservedAt":    _when(s.get("createdAt")),
+            "computedAt":        now,
+        })
+    return docs, timings
+
+
+def write_docs(db, docs):
+    from pymongo import UpdateOne
+    coll = db[COLLECTION]
+    coll.create_index("userEmail", unique=True)
+    written = 0
+    for start in range(0, len(docs), WRITE_CHUNK):
+        ops = [UpdateOne({"userEmail": d["userEmail"]}, {"$set": d}, upsert=True)
+               for d in docs[start:start + WRITE_CHUNK]]
+        res = coll.bulk_write(ops, ordered=False)
+        written += res.upserted_count + res.modified_count
+    return written
+
+
+def _jsonable(doc):
+    return json.loads(json.dumps(doc, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v)))
+
+
+# ── Benchmark (synthetic users, no Mongo) ─────────────────────────────────────
+def benchmark(n_users, n_cities, recommender, seed=42):
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+    cities = [f"city {i}" for i in range(n_cities)]
+    weather = {c: {"city": c, "temperature": round(float(rng.uniform(10, 38)), 1),
+                   "humidity": int(rng.integers(25, 95)), "rainfall": round(float(rng.exponential(2)), 1),
+                   "soilMoisture": round(float(rng.uniform(10, 60)), 1), "createdAt": now} for c in cities}
+    users = [{"email": f"farmer{i}@example.com", "location": cities[c]}
+             for i, c in enumerate(rng.integers(0, n_cities, n_users))]
+    # a soil test for one user in four, drawn from a few typical profiles
+    profiles = [{"nitrogen": n, "phosphorus": p, "potassium": k, "ph": ph / 10}
+                for n, p, k, ph in rng.integers([20, 10, 20, 55], [120, 60, 90, 80], size=(20, 4)).tolist()]
+    soil = {u["email"]: profiles[i % 20] for i, u in enumerate(users) if i % 4 == 0}
+    rain = {c: {"week": round(float(rng.uniform(25, 300)), 1), "season": round(float(rng.uniform(50, 800)), 1)}
+            for c in cities}
+
+    t0 = time.perf_counter()
+    rows, skipped = build_inputs(users, weather, soil, now, rain=rain)
+    inputs_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    docs, timings = materialize(rows, recommender, now)
+    total = time.perf_counter() - t0
+
+    # the same answers one user at a time, as a live route would compute them
+    sample = rows[:min(200, len(rows))]
+    t0 = time.perf_counter()
+    for i, row in enumerate(sample):
+        single, _ = materialize([row], recommender, now)
+        assert single[0]["crop"] == docs[i]["crop"]
+    per_user = (time.perf_counter() - t0) / max(len(sample), 1)
+    return {"users": n_users, "cities": n_cities, "documents": len(docs), "skipped": len(skipped),
+            "distinctCropInputs": len({d["inputsHash"] for d in docs}), "inputs_s": round(inputs_s, 3),
+            **{k: round(v, 3) for k, v in timings.items()}, "total_s": round(total, 3),
+            "usersPerSec": round(len(docs) / total, 1) if total else None,
+            "perUserLiveMs": round(per_user * 1000, 3),
+            "perUserLiveEstimate_s": round(per_user * len(docs), 1), "modelVersion": recommender.versions}
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Precompute crop / yield / rainfall recommendations for every user.")
+    p.add_argument("--user", help="score one user (email) now instead of everyone")
+    p.add_argument("--inputs", help="JSON overrides of the model inputs (with --user; scored, not stored)")
+    p.add_argument("--no-db", action="store_true", help="print the documents instead of writing them")
+    p.add_argument("--top", type=int, default=TOP_CROPS, help="crops kept per user")
+    p.add_argument("--days", type=int, default=FORECAST_DAYS, help="rainfall forecast horizon")
+    p.add_argument("--benchmark", type=int, metavar="USERS", help="synthetic users, no Mongo")
+    p.add_argument("--cities", type=int, default=500, help="distinct locations for --benchmark")
+    args = p.parse_args(argv)
+
+    recommender = Recommender(args.top, args.days)
+    if args.benchmark:
+        print(json.dumps(benchmark(args.benchmark, args.cities, recommender), indent=2))
+        return 0
+    overrides = json.loads(args.inputs) if args.inputs else None
+    if overrides and not args.user:
+        p.error("--inputs needs --user")
+
+    from pymongo import MongoClient
+    db = MongoClient("mongodb://127.0.0.1:27017/", serverSelectionTimeoutMS=3000)["smart_irrigation"]
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+
+    users = load_users(db, args.user)
+    if args.user and not users:
+        print(json.dumps({"error": "user-not-found", "user": args.user}))
+        return 2
+    if args.user:
+        locations = {normalize_location(u.get("location")) for u in users} - {""}
+        weather = latest_weather(db, now, locations) if locations else {}
+        rain = rainfall_totals(db, now, locations) if locations else {}
+        soil = latest_soil(db, [args.user])
+    else:
+        weather, rain, soil = latest_weather(db, now), rainfall_totals(db, now), latest_soil(db)
+    rows, skipped = build_inputs(users, weather, soil, now, overrides, rain)
+
+    stored = not (overrides or args.no_db)
+    if stored and not args.user:
+        db[STATE].update_one({"_id": STATE_ID}, {"$set": {"modelVersion": recommender.versions,
+                                                          "startedAt": now}}, upsert=True)
+    docs, timings = materialize(rows, recommender, now)
+
+    if args.user:
+        if not docs:
+            print(json.dumps({"error": skipped.get(args.user, "no-inputs"), "user": args.user}))
+            return 2
+        if stored:
+            write_docs(db, docs)
+            # after a retrain the live answer is the current one: entries rescored with these
+            # versions must not read as stale until the next batch
+            db[STATE].update_one({"_id": STATE_ID}, {"$set": {"modelVersion": recommender.versions}},
+                                 upsert=True)
+        print(json.dumps({**_jsonable(docs[0]), "source": "live", "stored": stored}))
+        return 0
+
+    summary = {"users": len(users), "documents": len(docs), "skipped": len(skipped),
+               "locations": len(weather), "soilProfiles": len(soil), "modelVersion": recommender.versions,
+               **{k: round(v, 3) for k, v in timings.items()}}
+    if args.no_db:
+        for d in docs:
+            print(json.dumps(_jsonable(d)))
+    else:
+        t0 = time.perf_counter()
+        summary["written"] = write_docs(db, docs) if docs else 0
+        summary["write_s"] = round(time.perf_counter() - t0, 3)
+        db[STATE].update_one({"_id": STATE_ID}, {"$set": {"completedAt": datetime.now(timezone.utc),
+                                                          "documents": len(docs), "skipped": len(skipped)}})
+    summary["total_s"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,459 @@
+"""
+model_compact.py — Compact in-memory forests and a per-model memory report.
+
+CompactForest replaces a fitted sklearn RandomForest / ExtraTrees (classifier
+or regressor) with a handful of flat arrays shared by all trees:
+
+  internal nodes  feature (int8/int16), threshold (float32), left/right child
+                  (smallest unsigned type that holds the node count)
+  leaves          float32 values — class distribution (classifiers) or the
+                  prediction (regressors), plus the leaf's weighted training
+                  sample count; internal nodes carry no values (explain.py
+                  rebuilds them as the sample-weighted mean of their children)
+
+Thresholds are rounded DOWN to float32. sklearn compares float32 inputs
+against float64 thresholds, and for any float32 x, x <= t exactly when
+x <= the largest float32 <= t, so predictions match the original forest.
+Training-only state (impurity, internal-node sample counts, per-tree
+estimator objects) is dropped. All trees are walked together — one vectorized step per tree
+level — which also avoids sklearn's per-tree dispatch for single rows.
+
+Optional pruning collapses sibling leaves whose values differ by at most
+`prune_tol` (max-abs class-probability difference; for regressors a fraction
+of the spread of leaf values). Given validation rows, the tolerance is halved
+until predictions change on at most `max_change` of them.
+
+Trainers call compact_payload() before saving when asked to (--compact or
+ML_COMPACT=1; the sklearn object is kept by default; ML_PRUNE_TOL enables
+pruning, validated on the trainer's test split). Single-row scoring gets
+faster; large batches are slower than sklearn's Cython traversal (~3-4x),
+memory is what this buys — hence opt-in.
+
+Usage:
+  python ml/model_compact.py model-info                       # every artifact found
+  python ml/model_compact.py model-info ml/soil_model.pkl --together
+  python ml/model_compact.py compact ml/yield_model.pkl --prune 0.01 [--out compact.pkl]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+warnings.filterwarnings("ignore")
+
+CHUNK_ROWS = 1024          # rows per traversal block (bounds the rows x trees x classes gather)
+MIN_PRUNE_TOL = 1e-4
+
+
+def _index_dtype(n):
+    for dt in (np.uint8, np.uint16, np.uint32):
+        if n <= np.iinfo(dt).max:
+            return dt
+    return np.uint64
+
+
+def _feature_dtype(n):
+    return np.int8 if n <= np.iinfo(np.int8).max else np.int16
+
+
+def _float32_floor(t):
+    """Largest float32 <= t (elementwise)."""
+    t32 = t.astype(np.float32)
+    over = t32.astype(np.float64) > t
+    t32[over] = np.nextafter(t32[over], np.float32(-np.inf))
+    return t32
+
+
+def _walk(left, right):
+    """(reachable node ids, depth) — breadth-first from the root, one array op per level."""
+    seen, frontier, depth = [np.array([0])], np.array([0]), 0
+    while True:
+        frontier = frontier[left[frontier] >= 0]
+        if frontier.size == 0:
+            break
+        frontier = np.concatenate([left[frontier], right[frontier]])
+        seen.append(frontier)
+        depth += 1
+    return np.sort(np.concatenate(seen)), depth
+
+
+# ── Pruning ───────────────────────────────────────────────────────────────────
+def _prune_tree(left, right, value, weight, tol):
+    """Merge sibling leaves with near-identical values, bottom-up, in place. Returns merges."""
+    merged = 0
+    while True:
+        internal = np.flatnonzero(left >= 0)
+        if internal.size == 0:
+            return merged
+        l, r = left[internal], right[internal]
+        both = (left[l] < 0) & (left[r] < 0)
+        cand, l, r = internal[both], l[both], r[both]
+        if cand.size == 0:
+            return merged
+        diff = np.abs(value[l] - value[r]).reshape(len(cand), -1).max(axis=1)
+        ok = diff <= tol
+        if not ok.any():
+            return merged
+        cand, l, r = cand[ok], l[ok], r[ok]
+        wl, wr = weight[l], weight[r]
+        w = np.where(wl + wr > 0, wl + wr, 1.0)
+        shape = (-1,) + (1,) * (value.ndim - 1)
+        value[cand] = (value[l] * wl.reshape(shape) + value[r] * wr.reshape(shape)) / w.reshape(shape)
+        weight[cand] = wl + wr
+        left[cand] = -1
+        right[cand] = -1
+        merged += len(cand)
+
+
+def _sklearn_trees(model):
+    """Per-tree (left, right, feature, threshold, value, weight) copies from a fitted forest."""
+    classifier = hasattr(model, "classes_")
+    trees = []
+    for est in model.estimators_:
+        t = est.tree_
+        if classifier:
+            v = t.value[:, 0, :].astype(np.float64)
+            s = v.sum(axis=1, keepdims=True)
+            s[s == 0] = 1.0
+            v = v / s                      # counts or fractions depending on sklearn version
+        else:
+            v = t.value[:, 0, 0].astype(np.float64)
+        trees.append([t.children_left.astype(np.int64), t.children_right.astype(np.int64),
+                      t.feature.astype(np.int64), t.threshold.astype(np.float64), v,
+                      t.weighted_n_node_samples.astype(np.float64)])
+    return trees
+
+
+# ── Compact forest ────────────────────────────────────────────────────────────
+class CompactForest:
+    """Drop-in predict / predict_proba / apply for a compacted tree ensemble."""
+
+    def __init__(self, trees, n_features, classes=None, source=None):
+        """trees: per-tree (left, right, feature, threshold, value, weight) in sklearn layout
+        (left == -1 marks a leaf). Unreachable nodes (left behind by pruning) are dropped."""
+        self.classes_ = np.asarray(classes) if classes is not None else None
+        self.n_features_in_ = int(n_features)
+        self.n_outputs_ = 1
+        self.n_estimators = len(trees)
+        self.source = source
+
+        walks = [_walk(t[0], t[1]) for t in trees]
+        internal_ids = [ids[t[0][ids] >= 0] for t, (ids, _) in zip(trees, walks)]
+        leaf_ids = [ids[t[0][ids] < 0] for t, (ids, _) in zip(trees, walks)]
+        n_internal = sum(len(i) for i in internal_ids)
+        n_leaves = sum(len(l) for l in leaf_ids)
+        idx_t = _index_dtype(n_internal + n_leaves)
+
+        self.feature = np.empty(n_internal, dtype=_feature_dtype(n_features))
+        self.threshold = np.empty(n_internal, dtype=np.float32)
+        self.children = np.empty((2, n_internal), dtype=idx_t)
+        self.values = np.empty((n_leaves, len(classes)) if classes is not None else n_leaves, dtype=np.float32)
+        self.leaf_weight = np.empty(n_leaves, dtype=np.float32)
+        self.roots = np.empty(len(trees), dtype=idx_t)
+
+        i_off, l_off = 0, 0
+        for k, (t, ii, ll) in enumerate(zip(trees, internal_ids, leaf_ids)):
+            left, right, feat, thr, val, weight = t[:6]
+            new_id = np.full(len(left), -1, dtype=np.int64)
+            new_id[ii] = i_off + np.arange(len(ii))
+            new_id[ll] = n_internal + l_off + np.arange(len(ll))
+            self.roots[k] = new_id[0]
+            self.feature[i_off:i_off + len(ii)] = feat[ii]
+            self.threshold[i_off:i_off + len(ii)] = _float32_floor(thr[ii])
+            self.children[0, i_off:i_off + len(ii)] = new_id[left[ii]]
+            self.children[1, i_off:i_off + len(ii)] = new_id[right[ii]]
+            self.values[l_off:l_off + len(ll)] = val[ll]
+            self.leaf_weight[l_off:l_off + len(ll)] = weight[ll]
+            i_off += len(ii)
+            l_off += len(ll)
+        self.n_internal, self.n_leaves = n_internal, n_leaves
+        self.max_depth = max((d for _, d in walks), default=0)
+
+    @classmethod
+    def supports(cls, model):
+        return (hasattr(model, "estimators_") and len(model.estimators_) > 0
+                and hasattr(model.estimators_[0], "tree_") and getattr(model, "n_outputs_", 1) == 1)
+
+    @classmethod
+    def from_sklearn(cls, model, prune_tol=0.0):
+        trees = _sklearn_trees(model)
+        merged = 0
+        if prune_tol > 0:
+            if hasattr(model, "classes_"):
+                tol = prune_tol
+            else:
+                leaf_vals = np.concatenate([t[4][t[0] < 0] for t in trees])
+                tol = prune_tol * float(leaf_vals.max() - leaf_vals.min())
+            for t in trees:
+                merged += _prune_tree(t[0], t[1], t[4], t[5], tol)
+        cf = cls(trees, model.n_features_in_, getattr(model, "classes_", None),
+                 source=type(model).__name__)
+        cf.pruned_nodes = merged
+        cf.prune_tol = prune_tol
+        return cf
+
+    # ── scoring ───────────────────────────────────────────────────────────────
+    @property
+    def is_classifier(self):
+        return self.classes_ is not None
+
+    def apply(self, X, start=0, end=None):
+        """Leaf index (into self.values) of every row in trees [start, end)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        roots = self.roots[start:end].astype(np.int64)
+        n, t = len(X), len(roots)
+        node = np.broadcast_to(roots, (n, t)).ravel().copy()
+        xbase = np.repeat(np.arange(n, dtype=np.int64) * X.shape[1], t)
+        flat = X.ravel()
+        # only (row, tree) pairs still on an internal node take part in each step
+        active = np.flatnonzero(node < self.n_internal)
+        while active.size:
+            idx = node[active]
+            go_left = flat[xbase[active] + self.feature[idx]] <= self.threshold[idx]
+            nxt = np.where(go_left, self.children[0, idx], self.children[1, idx])
+            node[active] = nxt
+            active = active[nxt < self.n_internal]
+        return node.reshape(n, t) - self.n_internal
+
+    def tree_values(self, X, start=0, end=None):
+        """Sum of leaf values over trees [start, end) — (n, classes) or (n,)."""
+        out = np.zeros((len(X),) + self.values.shape[1:], dtype=np.float64)
+        for s in range(0, len(X), CHUNK_ROWS):
+            out[s:s + CHUNK_ROWS] = self.values[self.apply(X[s:s + CHUNK_ROWS], start, end)].sum(axis=1, dtype=np.float64)
+        return out
+
+    def predict_proba(self, X):
+        if not self.is_classifier:
+            raise AttributeError("predict_proba is only available for classifiers")
+        return self.tree_values(X) / self.n_estimators
+
+    def predict(self, X):
+        mean = self.tree_values(X) / self.n_estimators
+        if self.is_classifier:
+            return self.classes_[np.argmax(mean, axis=1)]
+        return mean
+
+    # ── reporting ─────────────────────────────────────────────────────────────
+    @property
+    def nbytes(self):
+        arrays = (self.feature, self.threshold, self.children, self.values, self.roots,
+                  getattr(self, "leaf_weight", None))
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def info(self):
+        return {"type": f"CompactForest({self.source})", "trees": self.n_estimators,
+                "nodes": self.n_internal + self.n_leaves, "leaves": self.n_leaves,
+                "max_depth": self.max_depth, "array_bytes": self.nbytes,
+                "pruned_nodes": getattr(self, "pruned_nodes", 0),
+                "dtypes": {"feature": str(self.feature.dtype), "threshold": str(self.threshold.dtype),
+                           "children": str(self.children.dtype), "values": str(self.values.dtype)}}
+
+
+# ── Compaction ────────────────────────────────────────────────────────────────
+def _changed(a, b):
+    if a.dtype.kind == "f" and b.dtype.kind == "f":
+        return float(np.mean(~np.isclose(a, b, rtol=1e-3, atol=1e-6)))
+    return float(np.mean(a != b))
+
+
+def compact_model(model, prune_tol=0.0, X_val=None, max_change=0.0):
+    """CompactForest for a supported forest (anything else is returned unchanged).
+
+    With X_val and prune_tol > 0 the tolerance is halved until the pruned
+    forest's predictions differ from the unpruned one on at most `max_change`
+    of the rows.
+    """
+    if not CompactForest.supports(model):
+        return model
+    exact = CompactForest.from_sklearn(model)
+    if prune_tol <= 0:
+        return exact
+    if X_val is None:
+        return CompactForest.from_sklearn(model, prune_tol)
+    reference = exact.predict(X_val)
+    tol = prune_tol
+    while tol >= MIN_PRUNE_TOL:
+        pruned = CompactForest.from_sklearn(model, tol)
+        change = _changed(reference, pruned.predict(X_val))
+        if change <= max_change:
+            pruned.validation_change = change
+            return pruned
+        tol /= 2
+    return exact
+
+
+def compact_payload(payload, prune_tol=None, X_val=None, max_change=None):
+    """Compact payload['model'] (and rainfall direct payload['models']) in place; returns payload.
+
+    prune_tol / max_change default to ML_PRUNE_TOL (0: exact) / ML_PRUNE_MAX_CHANGE (0.01).
+    For payload['models'], X_val may be a list with one validation matrix per model.
+    """
+    if prune_tol is None:
+        prune_tol = float(os.environ.get("ML_PRUNE_TOL", "0"))
+    if max_change is None:
+        max_change = float(os.environ.get("ML_PRUNE_MAX_CHANGE", "0.01"))
+    if "model" in payload:
+        payload["model"] = compact_model(payload["model"], prune_tol, X_val, max_change)
+    if isinstance(payload.get("models"), list):
+        X_vals = X_val if isinstance(X_val, list) else [X_val] * len(payload["models"])
+        payload["models"] = [compact_model(m, prune_tol, Xv, max_change)
+                             for m, Xv in zip(payload["models"], X_vals)]
+    return payload
+
+
+def compact_option():
+    """Call once at the top of a train_*.py script: True when compaction was asked for.
+
+    Opt-in with a `--compact` argument (removed from sys.argv so the script's own
+    argument handling is unaffected) or ML_COMPACT=1; --no-compact is accepted
+    and removed too. Off by default: compact forests score large batches several
+    times slower than sklearn, and bulk scoring, sweeps and tuning load the
+    same artifacts.
+    """
+    flag = None
+    for arg in list(sys.argv[1:]):
+        if arg in ("--compact", "--no-compact"):
+            flag = arg == "--compact"
+            sys.argv.remove(arg)
+    if flag is not None:
+        return flag
+    return os.environ.get("ML_COMPACT", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+# ── model-info ────────────────────────────────────────────────────────────────
+def rss_bytes():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _model_bytes(model):
+    if isinstance(model, CompactForest):
+        return model.nbytes
+    if hasattr(model, "estimators_") and hasattr(model.estimators_[0], "tree_"):
+        total = 0
+        for est in model.estimators_:
+            state = est.tree_.__getstate__()
+            total += state["nodes"].nbytes + state["values"].nbytes
+        return total
+    return None
+
+
+def _describe(model):
+    if isinstance(model, CompactForest):
+        return model.info()
+    out = {"type": type(model).__name__}
+    if hasattr(model, "estimators_") and hasattr(model.estimators_[0], "tree_"):
+        counts = [est.tree_.node_count for est in model.estimators_]
+        out.update(trees=len(counts), nodes=int(sum(counts)),
+                   leaves=int(sum(est.tree_.n_leaves for est in model.estimators_)),
+                   max_depth=int(max(est.tree_.max_depth for est in model.estimators_)),
+                   array_bytes=_model_bytes(model))
+    elif hasattr(model, "get_booster"):
+        out.update(trees=len(model.get_booster().get_dump()),
+                   array_bytes=len(model.get_booster().save_raw("ubj")))
+    return out
+
+
+def measure(path):
+    """Load one artifact in THIS process and report load time, RSS growth and model shape."""
+    rss0 = rss_bytes()
+    t0 = time.perf_counter()
+    payload = joblib.load(path)
+    load_s = time.perf_counter() - t0
+    rss1 = rss_bytes()
+    models = payload.get("models") if isinstance(payload, dict) and "models" in payload else None
+    if models is None:
+        models = [payload["model"] if isinstance(payload, dict) and "model" in payload else payload]
+    described = [_describe(m) for m in models]
+    info = described[0] if len(described) == 1 else {"models": described}
+    return {"path": os.path.abspath(path), "file_bytes": os.path.getsize(path),
+            "load_ms": round(load_s * 1000, 1),
+            "rss_after_load_mb": round(rss1 / 2**20, 1) if rss1 else None,
+            "rss_delta_mb": round((rss1 - rss0) / 2**20, 1) if rss0 and rss1 else None,
+            **info}
+
+
+def _measure_fresh(paths):
+    """Run measure() in a fresh interpreter so RSS numbers are not polluted by earlier loads."""
+    # imported as a module (not run as __main__) so unpickled CompactForests are the same class
+    cmd = [sys.executable, "-c", "import sys, model_compact; model_compact._measure_main(sys.argv[1:])", *paths]
+    out = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if out.returncode != 0:
+        return {"paths": paths, "error": out.stderr.strip().splitlines()[-1:] or ["failed"]}
+    return json.loads(out.stdout)
+
+
+def model_info(paths, together=False):
+    from model_loader import MODEL_KINDS, find_model
+    if not paths:
+        paths = [p for p in (find_model(k) for k in MODEL_KINDS) if p]
+        from rain_forecast import find_direct_model
+        if find_direct_model():
+            paths.append(find_direct_model())
+    report = {"models": [_measure_fresh([p])["models"][0] for p in paths]}
+    if together:
+        # every artifact loaded into one process — what predict_server / a worker really holds
+        report["together"] = _measure_fresh(paths)["process"]
+    return report
+
+
+def _measure_main(paths):
+    base = rss_bytes()
+    models = [measure(p) for p in paths]
+    end = rss_bytes()
+    print(json.dumps({"models": models,
+                      "process": {"paths": paths,
+                                  "baseline_rss_mb": round(base / 2**20, 1) if base else None,
+                                  "rss_after_load_mb": round(end / 2**20, 1) if end else None,
+                                  "models_rss_mb": round((end - base) / 2**20, 1) if base and end else None}}))
+
+
+def compact_file(path, prune_tol=0.0, out=None):
+    before = _measure_fresh([path])["models"][0]
+    payload = joblib.load(path)
+    if isinstance(payload, dict):
+        compact_payload(payload, prune_tol)
+    else:
+        payload = compact_model(payload, prune_tol)     # legacy bare-model pickle stays bare
+    out = out or path
+    joblib.dump(payload, out, compress=3)
+    return {"before": before, "after": _measure_fresh([out])["models"][0]}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Compact forests / report model memory.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    info = sub.add_parser("model-info", help="node counts, bytes, load time and RSS per model")
+    info.add_argument("paths", nargs="*", help="artifacts (default: every model found)")
+    info.add_argument("--together", action="store_true", help="also load all of them into one process")
+    comp = sub.add_parser("compact", help="rewrite an artifact with CompactForest models")
+    comp.add_argument("path")
+    comp.add_argument("--prune", type=float, default=0.0, help="leaf-merge tolerance (0 = exact)")
+    comp.add_argument("--out", help="write here instead of overwriting")
+    args = p.parse_args(argv)
+
+    if args.cmd == "model-info":
+        print(json.dumps(model_info(args.paths, args.together), indent=2))
+    else:
+        print(json.dumps(compact_file(args.path, args.prune, args.out), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    # run through the importable module so pickled CompactForests reference model_compact, not __main__
+    import model_compact
+    sys.exit(model_compact.main())
@@ -0,0 +1,364 @@
+"""
+model_fleet.py — Lazily loaded per-region / per-customer models under a memory budget.
+
+Specialised artifacts live next to the global ones, one directory per kind:
+
+  ml/models/<kind>/<key>.pkl      e.g. ml/models/crop/punjab.pkl,
+                                       ml/models/yield/customer-acme.pkl
+
+A request names the keys it could use, most specific first (customer, then
+region); the first key with an artifact wins, otherwise the global model from
+model_loader.find_model(kind) answers. Artifacts are loaded on first use and
+kept in an LRU under MODEL_FLEET_BUDGET_MB; the least recently used unpinned
+models are evicted when a load pushes the fleet over budget. Concurrent
+requests for a model that is still loading wait for that one load.
+
+The directory is rescanned every MODEL_FLEET_SCAN_S seconds, so a request for a
+key without an artifact costs a dict lookup, not a filesystem probe. The
+rescan also drops resident models whose file changed (mtime or size) or went
+away, so an artifact replaced by `install` — from this process or the CLI — is
+reloaded on its next request. Resident size is the model's pickled size
+(CompactForest: its arrays; xgboost: the raw booster).
+
+  MODEL_FLEET_DIR        artifact root                   (default ml/models)
+  MODEL_FLEET_BUDGET_MB  resident model budget           (default 512)
+  MODEL_FLEET_PIN        never evicted, e.g. "crop:punjab,yield:global"
+  MODEL_FLEET_PRELOAD    loaded at startup, same format
+  MODEL_FLEET_SCAN_S     directory rescan interval       (default 30)
+
+Usage:
+  from model_fleet import ModelFleet
+  fleet = ModelFleet()
+  bundle, key = fleet.get("crop", data.get("customer"), data.get("region"))
+
+  python ml/model_fleet.py install crop punjab path/to/model.pkl
+  python ml/model_fleet.py list
+  python ml/model_fleet.py --benchmark      # synthetic fleet, hit rate + load latency
+"""
+import argparse
+import json
+import os
+import pickle
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+from model_loader import MODEL_KINDS, find_model, load_bundle
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DIR = os.path.join(BASE_DIR, "models")
+GLOBAL = "global"
+LOAD_SAMPLES = 256
+
+
+def _env(name, default, cast=int):
+    value = os.environ.get(name)
+    return cast(value) if value not in (None, "") else default
+
+
+def normalize_key(key):
+    """Artifact-safe key: lower case, anything outside [a-z0-9_-] becomes '-'."""
+    return re.sub(r"[^a-z0-9_-]+", "-", str(key or "").strip().lower()).strip("-")
+
+
+def parse_refs(spec):
+    """'crop:punjab,yield:global' -> [("crop", "punjab"), ("yield", "global")]."""
+    refs = []
+    for part in (spec or "").split(","):
+        kind, _, key = part.strip().partition(":")
+        if kind in MODEL_KINDS:
+            refs.append((kind, normalize_key(key) or GLOBAL))
+    return refs
+
+
+class _ByteCounter:
+    """File-like sink that only counts what pickle writes."""
+
+    def __init__(self):
+        self.n = 0
+
+    def write(self, b):
+        self.n += memoryview(b).nbytes
+
+
+def estimate_nbytes(model, path=None):
+    """Resident size of a loaded model, close enough to budget with."""
+    if hasattr(model, "nbytes"):                      # CompactForest
+        return int(model.nbytes)
+    if hasattr(model, "get_booster"):                 # xgboost
+        return len(model.get_booster().save_raw())
+    # sklearn forests and anything else: the pickled size counts every tree's node and
+    # value arrays plus the estimator objects (the compressed file is far smaller)
+    counter = _ByteCounter()
+    try:
+        pickle.dump(model, counter, protocol=pickle.HIGHEST_PROTOCOL)
+        return counter.n
+    except Exception:
+        return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+
+def file_signature(path):
+    """(mtime_ns, size) of an artifact, or None when it is missing."""
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class _Entry:
+    __slots__ = ("bundle", "nbytes", "pinned", "hits", "load_ms", "loaded_at", "signature")
+
+    def __init__(self, bundle, nbytes, pinned, load_ms, signature=None):
+        self.bundle, self.nbytes, self.pinned = bundle, nbytes, pinned
+        self.hits, self.load_ms, self.loaded_at = 0, load_ms, time.time()
+        self.signature = signature          # file_signature at load; None: registered via put()
+
+
+class ModelFleet:
+    def __init__(self, root=None, budget_mb=None, pinned=None, preload=None, scan_s=None):
+        self.root = root or os.environ.get("MODEL_FLEET_DIR") or DEFAULT_DIR
+        self.budget = (budget_mb or _env("MODEL_FLEET_BUDGET_MB", 512, float)) * 2**20
+        self.scan_s = scan_s if scan_s is not None else _env("MODEL_FLEET_SCAN_S", 30, float)
+        self.pinned = set(pinned if pinned is not None else parse_refs(os.environ.get("MODEL_FLEET_PIN")))
+
+        self._entries = OrderedDict()        # (kind, key) -> _Entry, least recently used first
+        self._loading = {}                   # (kind, key) -> Event set when the load finishes
+        self._lock = threading.Lock()
+        self._catalog, self._scanned = {}, 0.0
+        self.used = 0
+        self.load_ms = deque(maxlen=LOAD_SAMPLES)
+        self.counters = {"hits": 0, "misses": 0, "fallbacks": 0, "loads": 0, "loadErrors": 0,
+                         "evictions": 0, "overBudget": 0, "reloads": 0}
+        for kind, key in (preload if preload is not None else parse_refs(os.environ.get("MODEL_FLEET_PRELOAD"))):
+            try:
+                self._acquire(kind, key)
+            except FileNotFoundError as e:
+                print(f"model_fleet: preload {kind}:{key} skipped ({e})", file=sys.stderr)
+
+    # ── Catalog ───────────────────────────────────────────────────────────────
+    def catalog(self):
+        """{kind: {key: path}} of specialised artifacts, rescanned every scan_s seconds."""
+        if time.monotonic() - self._scanned >= self.scan_s:
+            found = {}
+            for kind in MODEL_KINDS:
+                d = os.path.join(self.root, kind)
+                if os.path.isdir(d):
+                    found[kind] = {normalize_key(f[:-4]): os.path.join(d, f)
+                                   for f in os.listdir(d) if f.endswith(".pkl")}
+            self._catalog, self._scanned = found, time.monotonic()
+            self._drop_changed()
+        return self._catalog
+
+    def _drop_changed(self):
+        """Forget resident models whose artifact was replaced or removed since they loaded."""
+        with self._lock:
+            loaded = [(ref, e) for ref, e in self._entries.items() if e.signature is not None]
+        paths = {ref: find_model(ref[0]) if ref[1] == GLOBAL else self._catalog.get(ref[0], {}).get(ref[1])
+                 for ref, _ in loaded}
+        stale = [ref for ref, e in loaded if file_signature(paths[ref]) != e.signature]
+        if stale:
+            with self._lock:
+                for ref in stale:
+                    self.invalidate(*ref, _locked=True)
+
+    def invalidate(self, kind, key, _locked=False):
+        """Drop a resident model so the next request loads its artifact again."""
+        ref = (kind, normalize_key(key) or GLOBAL)
+        if not _locked:
+            with self._lock:
+                return self.invalidate(*ref, _locked=True)
+        entry = self._entries.pop(ref, None)
+        if entry is not None:
+            self.used -= entry.nbytes
+            self.counters["reloads"] += 1
+        return entry is not None
+
+    def install(self, kind, key, source):
+        """Copy `source` in as the <kind>/<key> artifact (atomic replace) and reload it on next use."""
+        load_bundle(kind, source)            # refuse artifacts the server could not load
+        key = normalize_key(key)
+        dest = os.path.join(self.root, kind, f"{key}.pkl")
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copy(source, dest + ".tmp")
+        os.replace(dest + ".tmp", dest)
+        self._scanned = 0.0                  # next lookup sees the new key
+        self.invalidate(kind, key)
+        return dest
+
+    def resolve(self, kind, *keys):
+        """First key with a specialised artifact, else GLOBAL."""
+        available = self.catalog().get(kind, {})
+        for key in keys:
+            key = normalize_key(key)
+            if key and key in available:
+                return key
+        return GLOBAL
+
+    def path(self, kind, key):
+        if key == GLOBAL:
+            return find_model(kind)
+        return self.catalog().get(kind, {}).get(key)
+
+    # ── Lookup ────────────────────────────────────────────────────────────────
+    def get(self, kind, *keys):
+        """(bundle, key) for the most specific of `keys` that has an artifact."""
+        key = self.resolve(kind, *keys)
+        if key == GLOBAL and any(normalize_key(k) for k in keys):
+            self.counters["fallbacks"] += 1
+        return self._acquire(kind, key), key
+
+    def put(self, kind, key, bundle, pinned=False):
+        """Register an already loaded bundle (e.g. the server's startup crop model)."""
+        ref = (kind, normalize_key(key) or GLOBAL)
+        if pinned:
+            self.pinned.add(ref)
+        with self._lock:
+            self._insert(ref, _Entry(bundle, estimate_nbytes(bundle.model, bundle.path), ref in self.pinned, 0.0))
+
+    def pin(self, kind, key, pinned=True):
+        ref = (kind, normalize_key(key) or GLOBAL)
+        with self._lock:
+            (self.pinned.add if pinned else self.pinned.discard)(ref)
+            if ref in self._entries:
+                self._entries[ref].pinned = pinned
+            if not pinned:
+                self._evict(keep=None)
+
+    def _acquire(self, kind, key):
+        ref = (kind, key)
+        while True:
+            with self._lock:
+                entry = self._entries.get(ref)
+                if entry is not None:
+                    self._entries.move_to_end(ref)
+                    entry.hits += 1
+                    self.counters["hits"] += 1
+                    return entry.bundle
+                waiting = self._loading.get(ref)
+                if waiting is None:
+                    done = self._loading[ref] = threading.Event()
+                    self.counters["misses"] += 1
+                    break
+            # another request is loading this model; take its result (or retry after a failure)
+            waiting.wait()
+        try:
+            t0 = time.perf_counter()
+            path = self.path(kind, key)
+            signature = file_signature(path)        # before the read: a replace during it reloads later
+            bundle = load_bundle(kind, path)
+            ms = (time.perf_counter() - t0) * 1000
+            entry = _Entry(bundle, estimate_nbytes(bundle.model, bundle.path), ref in self.pinned, ms,
+                           signature)
+            with self._lock:
+                self._insert(ref, entry)
+                self.load_ms.append(ms)
+                self.counters["loads"] += 1
+            return bundle
+        except Exception:
+            self.counters["loadErrors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._loading[ref]
+            done.set()
+
+    # ── LRU (call with the lock held) ─────────────────────────────────────────
+    def _insert(self, ref, entry):
+        old = self._entries.pop(ref, None)
+        if old is not None:
+            self.used -= old.nbytes
+        self._entries[ref] = entry
+        self.used += entry.nbytes
+        self._evict(keep=ref)
+
+    def _evict(self, keep):
+        for ref in [r for r, e in self._entries.items() if not e.pinned and r != keep]:
+            if self.used <= self.budget:
+                return
+            self.used -= self._entries.pop(ref).nbytes
+            self.counters["evictions"] += 1
+        if self.used > self.budget:
+            # pinned models (or one model bigger than the budget) are kept regardless
+            self.counters["overBudget"] += 1
+
+    # ── Reporting ─────────────────────────────────────────────────────────────
+    def stats(self):
+        with self._lock:
+            entries = [{"model": f"{k}:{key}", "mb": round(e.nbytes / 2**20, 2), "pinned": e.pinned,
+                        "hits": e.hits, "loadMs": round(e.load_ms, 1)}
+                       for (k, key), e in reversed(self._entries.items())]
+            loads = sorted(self.load_ms)
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "resident": len(entries), "usedMb": round(self.used / 2**20, 2),
+            "budgetMb": round(self.budget / 2**20, 2), **self.counters,
+            "hitRate": round(self.counters["hits"] / lookups, 4) if lookups else None,
+            "loadMs": {"p50": round(loads[len(loads) // 2], 1), "p95": round(loads[int(len(loads) * 0.95)], 1),
+                       "max": round(loads[-1], 1)} if loads else None,
+            "available": {k: sorted(v) for k, v in self.catalog().items()},
+            "models": entries,       # most recently used first
+        }
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def _benchmark(n_models=24, requests=2000, budget_models=8, seed=42):
+    """Synthetic fleet: copies of the global crop artifact, Zipf-skewed region traffic."""
+    import tempfile
+
+    import numpy as np
+
+    src = find_model("crop")
+    if not src:
+        raise FileNotFoundError("model-not-found: crop")
+    root = tempfile.mkdtemp(prefix="fleet-bench-")
+    try:
+        os.makedirs(os.path.join(root, "crop"))
+        for i in range(n_models):
+            shutil.copy(src, os.path.join(root, "crop", f"region-{i}.pkl"))
+        size = estimate_nbytes(load_bundle("crop", src).model, src)
+        fleet = ModelFleet(root=root, budget_mb=size * budget_models / 2**20 + 0.01, pinned=[], preload=[])
+        rng = np.random.default_rng(seed)
+        regions = np.minimum(rng.zipf(1.3, requests) - 1, n_models + 4)   # a few keys have no artifact
+        t0 = time.perf_counter()
+        for r in regions:
+            fleet.get("crop", f"region-{r}")
+        elapsed = time.perf_counter() - t0
+        st = fleet.stats()
+        st.pop("available")
+        st["models"] = st["models"][:5]
+        return {"artifacts": n_models, "lookups": requests, "modelMb": round(size / 2**20, 2),
+                "elapsedS": round(elapsed, 2), **st}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Per-region / per-customer model fleet.")
+    p.add_argument("command", nargs="?", choices=["install", "list"], default="list")
+    p.add_argument("kind", nargs="?", choices=MODEL_KINDS)
+    p.add_argument("key", nargs="?")
+    p.add_argument("source", nargs="?", help="artifact to install")
+    p.add_argument("--benchmark", action="store_true")
+    args = p.parse_args(argv)
+    if args.benchmark:
+        print(json.dumps(_benchmark(), indent=2))
+        return 0
+    fleet = ModelFleet(pinned=[], preload=[])
+    if args.command == "install":
+        if not (args.kind and args.key and args.source):
+            p.error("install needs <kind> <key> <source.pkl>")
+        # a running server notices the new file on its next rescan (MODEL_FLEET_SCAN_S)
+        dest = fleet.install(args.kind, args.key, args.source)
+        print(json.dumps({"installed": f"{args.kind}:{normalize_key(args.key)}", "path": dest}))
+        return 0
+    print(json.dumps({k: {key: os.path.getsize(path) for key, path in sorted(v.items())}
+                      for k, v in fleet.catalog().items()}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
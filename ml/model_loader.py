@@ -0,0 +1,241 @@
+"""
+model_loader.py — Shared artifact lookup + feature assembly for every model
+(crop, soil, yield, rainfall) so batch tools score rows exactly like the
+single-row predict_*.py scripts do.
+
+Usage:
+  from model_loader import load_bundle
+  bundle = load_bundle("crop")
+  bundle.score([{"temperature": 25, "humidity": 80, "rainfall": 200}])
+"""
+import os
+import warnings
+
+import joblib
+import numpy as np
+
+from feature_encoder import (FeatureEncoder, YIELD_NUMERIC, crop_encoder, rainfall_encoder,
+                             soil_encoder, yield_encoder)
+
+# encoders hand sklearn a bare float32 array; artifacts fitted on DataFrames would warn every call
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODEL_KINDS = ("crop", "soil", "yield", "rainfall")
+
+# where each predict_*.py looks for its artifact (first hit wins)
+MODEL_CANDIDATES = {
+    "crop": [
+        os.path.join(BASE_DIR, "model.pkl"),
+    ],
+    "soil": [
+        os.path.join(BASE_DIR, "soil_model.pkl"),
+        os.path.join(BASE_DIR, "..", "soil_model.pkl"),
+        os.path.join(BASE_DIR, "..", "..", "soil_model.pkl"),
+    ],
+    "yield": [
+        os.path.join(BASE_DIR, "yield_model.pkl"),
+        os.path.join(BASE_DIR, "..", "yield_model.pkl"),
+        os.path.join(BASE_DIR, "..", "..", "yield_model.pkl"),
+    ],
+    "rainfall": [
+        os.path.join(BASE_DIR, "rainfall_model.pkl"),
+        os.path.join(BASE_DIR, "..", "rainfall_model.pkl"),
+        os.path.join(BASE_DIR, "..", "..", "rainfall_model.pkl"),
+        os.path.join(BASE_DIR, "..", "..", "backend", "rainfall_model.pkl"),
+    ],
+}
+
+
+def find_model(kind):
+    """Return the absolute path of the first existing artifact for `kind`, or None."""
+    if kind not in MODEL_CANDIDATES:
+        raise ValueError(f"unknown model kind: {kind}")
+    for c in MODEL_CANDIDATES[kind]:
+        if os.path.exists(c):
+            return os.path.abspath(c)
+    return None
+
+
+class ModelBundle:
+    """A loaded artifact plus the FeatureEncoder that turns raw records into X."""
+
+    def __init__(self, kind, model, encoder, classes=None, label_encoder=None, path=None, payload=None):
+        self.kind          = kind
+        self.model         = model
+        self.encoder       = encoder
+        self.classes       = list(classes) if classes is not None else []
+        self.label_encoder = label_encoder
+        self.path          = path
+        self.payload       = payload if isinstance(payload, dict) else {}
+        self._explainer    = None
+        self._explain_checked = False
+
+    @property
+    def feature_columns(self):
+        return self.encoder.feature_columns
+
+    @property
+    def cat_values(self):
+        return self.encoder.categorical_values
+
+    # ── features ──────────────────────────────────────────────────────────────
+    def features(self, records):
+        """Build the float32 feature matrix for a list of dict records.
+
+        Returns (X, errors) where errors[i] is a message for rows that could
+        not be encoded (their X row is left at zero and must not be reported).
+        """
+        X, valid = self.encoder.encode(records)
+        errors = [None] * len(records)
+        for i in np.flatnonzero(~valid):
+            try:
+                self.encoder.transform_one(records[i])
+            except ValueError as e:
+                errors[i] = f"ValueError: {e}"
+        return X, errors
+
+    # ── scoring ───────────────────────────────────────────────────────────────
+    def predict_matrix(self, X):
+        """Raw model output for an already-encoded matrix."""
+        return self.model.predict(X)
+
+    def labels(self, pred):
+        """Map raw class predictions to display labels."""
+        if self.label_encoder is not None:
+            return [str(v) for v in self.label_encoder.inverse_transform(np.asarray(pred, dtype=int))]
+        if self.kind == "soil" and len(self.classes) > 0:
+            return [self.classes[int(v)] for v in pred]
+        return [str(v) for v in pred]
+
+    def score(self, records):
+        """Score records and return one output dict per record (same keys as predict_*.py)."""
+        X, errors = self.features(records)
+        ok = np.array([e is None for e in errors], dtype=bool)
+        out = [{"error": e} if e else None for e in errors]
+        if not ok.any():
+            return out
+
+        X_ok = X[ok]
+        pred = self.predict_matrix(X_ok)
+        proba = None
+        if self.kind == "soil" and hasattr(self.model, "predict_proba"):
+            proba = self.model.predict_proba(X_ok).max(axis=1)
+        if self.kind in ("crop", "soil"):
+            pred = self.labels(pred)
+
+        for j, i in enumerate(np.flatnonzero(ok)):
+            out[i] = self._format(pred[j], None if proba is None else proba[j])
+        return out
+
+    # ── explanations ──────────────────────────────────────────────────────────
+    def explainer(self):
+        """TreeExplainer for this model; its leaf tables are built on first use."""
+        if self._explainer is None:
+            from explain import TreeExplainer
+            self._explainer = TreeExplainer(self.model)
+        return self._explainer
+
+    def input_groups(self):
+        """(input names, (n_features, n_inputs) 0/1 matrix) folding one-hot columns into their input."""
+        owner = {f"{c}_{v}": c for c in self.encoder.categorical_cols for v in self.encoder.categories.get(c, [])}
+        cols = [owner.get(c, c) for c in self.feature_columns]
+        names = list(dict.fromkeys(cols))
+        G = np.zeros((len(cols), len(names)))
+        G[np.arange(len(cols)), [names.index(c) for c in cols]] = 1.0
+        return names, G
+
+    def explain(self, records, top=None):
+        """score() plus an "explanation" per record: base value + per-input contributions
+        that add up to the explained output (the predicted class probability, or the value).
+
+        The first call also checks additivity against the model's own output.
+        """
+        X, errors = self.features(records)
+        ok = np.array([e is None for e in errors], dtype=bool)
+        out = [{"error": e} if e else None for e in errors]
+        if not ok.any():
+            return out
+
+        ex = self.explainer()
+        X_ok = X[ok]
+        explained = ex.explain(X_ok)
+        if not self._explain_checked:
+            err = ex.additivity(X_ok, explained)
+            if err > ex.tolerance:
+                raise RuntimeError(f"explanations do not add up to the model output (max error {err:.3g})")
+            self._explain_checked = True
+        output, target, bias, contrib = explained
+        value = output[np.arange(len(X_ok)), target]
+        if ex.is_classifier:
+            pred = self.model.classes_[target]
+            pred = self.labels(pred) if self.kind in ("crop", "soil") else pred
+        else:
+            pred = value
+        names, G = self.input_groups()
+        by_input = contrib @ G
+
+        for j, i in enumerate(np.flatnonzero(ok)):
+            order = np.argsort(-np.abs(by_input[j]))[:top]
+            proba = float(value[j]) if ex.space == "probability" else None
+            out[i] = {**self._format(pred[j], proba), "explanation": {
+                "space": ex.space, "baseValue": round(float(bias[j]), 6), "value": round(float(value[j]), 6),
+                "contributions": {names[k]: round(float(by_input[j, k]), 6) for k in order},
+            }}
+        return out
+
+    def _format(self, p, proba):
+        if self.kind == "crop":
+            return {"predictedCrop": p}
+        if self.kind == "soil":
+            return {"predicted_label": p, "probability": None if proba is None else float(proba)}
+        if self.kind == "yield":
+            return {"predicted_yield_per_ha": float(p)}
+        return {"predicted_rainfall": float(p)}
+
+
+def bundle_from_payload(kind, raw, path=None):
+    """Wrap a joblib/pickle payload in a ModelBundle, handling every artifact layout in use.
+
+    Artifacts written before encoders were pickled get an equivalent encoder
+    rebuilt from their saved column lists.
+    """
+    payload = raw if isinstance(raw, dict) else {}
+    model = payload["model"] if "model" in payload else raw
+    encoder = payload.get("encoder")
+
+    if kind == "crop":
+        if encoder is None:
+            if "model" in payload:
+                cols = payload.get("feature_columns") or payload.get("features")
+                cat_values = payload.get("categorical_values", {})
+            else:
+                # legacy 3-feature model (temp/hum/rain only)
+                cols, cat_values = ["temperature", "humidity", "rainfall"], {}
+            base = crop_encoder()
+            encoder = FeatureEncoder.from_columns(cols, cat_values, defaults=base.defaults, aliases=base.aliases)
+        return ModelBundle(kind, model, encoder, classes=payload.get("crops"),
+                           label_encoder=payload.get("label_encoder"), path=path, payload=payload)
+    if kind == "soil":
+        return ModelBundle(kind, model, encoder or soil_encoder(), classes=payload.get("classes", []),
+                           path=path, payload=payload)
+    if kind == "yield":
+        if encoder is None:
+            cats = payload.get("ohe_categories", [])
+            cols = payload.get("feature_columns") or YIELD_NUMERIC + [f"crop_{c}" for c in cats]
+            base = yield_encoder()
+            encoder = FeatureEncoder.from_columns(cols, {"crop": cats}, defaults=base.defaults,
+                                                  case_insensitive=True)
+        return ModelBundle(kind, model, encoder, path=path, payload=payload)
+    if kind == "rainfall":
+        return ModelBundle(kind, model, encoder or rainfall_encoder(), path=path, payload=payload)
+    raise ValueError(f"unknown model kind: {kind}")
+
+
+def load_bundle(kind, path=None):
+    """Load the artifact for `kind` (from `path` or the usual candidate locations)."""
+    path = path or find_model(kind)
+    if not path or not os.path.exists(path):
+        raise FileNotFoundError(f"model-not-found: {kind}")
+    return bundle_from_payload(kind, joblib.load(path), path=path)
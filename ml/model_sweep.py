@@ -0,0 +1,360 @@
+"""
+model_sweep.py — Latency / size vs accuracy sweep for the crop, soil, yield and
+rainfall models.
+
+Trains every candidate of a grid (RandomForest vs XGBoost x n_estimators x
+max_depth) in parallel on the same split the train_*.py scripts use, then
+measures each candidate serially so timings are not skewed by the pool:
+
+  * quality         accuracy (classifiers) or RMSE (regressors) on the held-out rows
+  * artifact_kb     joblib.dump(compress=3) size, the format retrain_fast.py ships
+  * load_ms         joblib.load of that artifact
+  * single_row_ms   p50 / p95 of encoder.transform_one + predict (predict_server.py path)
+  * rows_per_sec    batch throughput on the held-out matrix
+
+The report lists the Pareto front (quality vs single-row p95 vs size) and picks
+the most accurate candidate that fits the latency budget (smallest artifact
+wins ties). --write installs the pick where predict_*.py looks for it.
+
+Usage:
+  python ml/model_sweep.py crop
+  python ml/model_sweep.py soil --latency-budget-ms 2 --workers 4
+  python ml/model_sweep.py crop --trees 25,50,100 --depths 8,none --families rf --write
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import joblib
+import numpy as np
+import pandas as pd
+
+warnings.filterwarnings("ignore")
+
+from feature_encoder import CROP_ALIASES, crop_encoder, rainfall_encoder, soil_encoder, yield_encoder
+from history_archive import COLLECTIONS as ARCHIVED_COLLECTIONS, read_history
+from model_loader import MODEL_CANDIDATES, MODEL_KINDS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CLASSIFIERS = ("crop", "soil")
+
+
+# ── Datasets (same rows and split as the matching train_*.py) ────────────────
+def _mongo_rows(collection, seeder=None):
+    """Rows of a smart_irrigation collection, or the seeder's synthetic docs if Mongo is down."""
+    try:
+        from pymongo import MongoClient
+        client = MongoClient("mongodb://127.0.0.1:27017/", serverSelectionTimeoutMS=2000)
+        db = client['smart_irrigation']
+        if collection in ARCHIVED_COLLECTIONS:
+            rows = read_history(db, collection).to_dict("records")
+        else:
+            rows = list(db[collection].find().sort('createdAt', 1))
+        if rows:
+            return rows, "mongo"
+    except Exception:
+        pass
+    if seeder is None:
+        return [], "none"
+    module = __import__(seeder)
+    return list(module.sample_docs), seeder
+
+
+def load_dataset(kind, shuffle=True, dataset=None):
+    """Return dict(encoder, X_train, X_test, y_train, y_test, test_records, label_encoder, source).
+
+    shuffle=False keeps the Mongo/seeder row order in the split (chronological
+    for rainfall, used by tune.py's time-series folds); crop always uses its
+    fixed stratified split. dataset="kaggle" (crop only) is train_xgboost.py's
+    7-feature, 22-crop data instead of train_model.py's.
+    """
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import LabelEncoder
+
+    if kind == "crop" and dataset == "kaggle":
+        from crop_data import KAGGLE_FEATURES, generate_kaggle_frame, split_indices
+        df = generate_kaggle_frame(seed=42)
+        encoder = crop_encoder(KAGGLE_FEATURES, [])
+        le = LabelEncoder().fit(df["label"])
+        y = le.transform(df["label"])
+        train_idx, test_idx = split_indices(y)
+        X = encoder.transform(df.rename(columns=CROP_ALIASES))
+        test_df = df.iloc[test_idx].rename(columns=CROP_ALIASES)
+        return dict(encoder=encoder, X_train=X[train_idx], X_test=X[test_idx],
+                    y_train=y[train_idx], y_test=y[test_idx], label_encoder=le,
+                    test_records=test_df.to_dict("records"), source="crop_data.kaggle")
+    if dataset is not None:
+        raise ValueError(f"unknown {kind} dataset: {dataset}")
+
+    if kind == "crop":
+        from crop_data import CAT_COLS, NUMERIC_COLS, generate_frame, split_indices
+        df = generate_frame(seed=42)
+        encoder = crop_encoder(NUMERIC_COLS, CAT_COLS).fit(df)
+        le = LabelEncoder().fit(df["crop"])
+        train_idx, test_idx = split_indices(df["crop"])
+        X = encoder.transform(df)
+        y = le.transform(df["crop"])
+        test_df = df.iloc[test_idx]
+        return dict(encoder=encoder, X_train=X[train_idx], X_test=X[test_idx],
+                    y_train=y[train_idx], y_test=y[test_idx], label_encoder=le,
+                    test_records=test_df.to_dict("records"), source="crop_data")
+
+    if kind == "soil":
+        rows, source = _mongo_rows("soil_samples", "seed_soil_sample_data")
+        features, target = ["nitrogen", "phosphorus", "potassium", "ph"], "label"
+        encoder = soil_encoder()
+    elif kind == "yield":
+        rows, source = _mongo_rows("yield_samples", "seed_yield_sample_data")
+        features, target = ["area", "rainfall", "temperature", "fertilizer", "crop"], "yield_per_ha"
+        encoder = yield_encoder()
+    elif kind == "rainfall":
+        rows, source = _mongo_rows("weatherdatas")
+        features, target = list(rainfall_encoder().numeric_cols), "target_rainfall"
+        encoder = rainfall_encoder()
+    else:
+        raise ValueError(f"unknown model kind: {kind}")
+
+    if len(rows) < 30:
+        raise SystemExit(f"not enough {kind} rows to sweep (need >= 30, found {len(rows)})")
+    df = pd.DataFrame(rows)
+    if kind == "rainfall":
+        # train_rainfall.py: lag + day-of-year features, target is the next record's rainfall
+        df['createdAt'] = pd.to_datetime(df['createdAt'])
+        df = df.sort_values('createdAt').reset_index(drop=True)
+        df['rainfall_lag1'] = df['rainfall'].shift(1)
+        df['dayofyear'] = df['createdAt'].dt.dayofyear
+        if 'soilMoisture' not in df.columns:
+            df['soilMoisture'] = 50.0
+        df['soilMoisture'] = df['soilMoisture'].fillna(df['soilMoisture'].median())
+        df = df.dropna(subset=['rainfall_lag1', 'temperature', 'humidity', 'rainfall'])
+        df['target_rainfall'] = df['rainfall'].shift(-1)
+    for c in features:
+        if c != "crop":
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+    df = df.dropna(subset=features + [target]).reset_index(drop=True)
+
+    X_df = df[features]
+    if kind == "yield":
+        encoder.fit(X_df)
+    le = None
+    y = df[target].to_numpy()
+    if kind == "soil":
+        le = LabelEncoder()
+        y = le.fit_transform(y)
+    else:
+        y = pd.to_numeric(pd.Series(y)).to_numpy(dtype=np.float64)
+    X_train, X_test, y_train, y_test = train_test_split(X_df, y, test_size=0.2, random_state=42, shuffle=shuffle)
+    return dict(encoder=encoder, X_train=encoder.transform(X_train), X_test=encoder.transform(X_test),
+                y_train=y_train, y_test=y_test, label_encoder=le,
+                test_records=X_test.to_dict("records"), source=source)
+
+
+# ── Candidates ────────────────────────────────────────────────────────────────
+def candidate_grid(families, trees, depths):
+    # boosted trees need a finite depth, so 'none' only applies to RandomForest
+    return [{"family": f, "n_estimators": n, "max_depth": d}
+            for f, n, d in product(families, trees, depths) if not (f == "xgb" and d is None)]
+
+
+def _name(c):
+    return f"{c['family']}-n{c['n_estimators']}-d{c['max_depth'] or 'none'}"
+
+
+def build_model(kind, cand):
+    n, depth = cand["n_estimators"], cand["max_depth"]
+    if cand["family"] == "xgb":
+        import xgboost as xgb
+        cls = xgb.XGBClassifier if kind in CLASSIFIERS else xgb.XGBRegressor
+        return cls(n_estimators=n, max_depth=depth, learning_rate=0.1, subsample=0.8,
+                   colsample_bytree=0.8, random_state=42, n_jobs=1)
+    from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+    cls = RandomForestClassifier if kind in CLASSIFIERS else RandomForestRegressor
+    return cls(n_estimators=n, max_depth=depth, random_state=42, n_jobs=1)
+
+
+def artifact_payload(kind, model, data, cand):
+    """Payload in the layout the matching train_*.py writes (so load_bundle reads it)."""
+    encoder = data["encoder"]
+    meta = {"family": cand["family"], "n_estimators": cand["n_estimators"],
+            "max_depth": cand["max_depth"]}
+    if kind == "crop":
+        payload = {"model": model, "feature_columns": encoder.feature_columns,
+                   "categorical_values": encoder.categorical_values, "encoder": encoder}
+        if cand["family"] == "xgb":
+            payload.update({"label_encoder": data["label_encoder"], "model_type": "xgboost",
+                            "crops": list(data["label_encoder"].classes_)})
+    elif kind == "soil":
+        payload = {"model": model, "classes": list(data["label_encoder"].classes_), "encoder": encoder}
+    elif kind == "yield":
+        payload = {"model": model, "ohe_categories": encoder.categories["crop"],
+                   "feature_columns": encoder.feature_columns, "encoder": encoder}
+    else:
+        payload = {"model": model, "feature_columns": encoder.feature_columns, "encoder": encoder}
+    payload["sweep"] = meta
+    return payload
+
+
+# ── Worker side: dataset is built once per process ────────────────────────────
+_data = None
+
+
+def _init_worker(kind):
+    global _data
+    warnings.filterwarnings("ignore")
+    _data = load_dataset(kind)
+
+
+def _train_candidate(kind, cand, out_dir):
+    """Fit one candidate and dump its artifact; timings are measured later, serially."""
+    model = build_model(kind, cand)
+    y_train = _data["y_train"]
+    if kind == "crop" and cand["family"] == "rf":
+        y_train = _data["label_encoder"].inverse_transform(y_train)
+    t0 = time.perf_counter()
+    model.fit(_data["X_train"], y_train)
+    fit_s = time.perf_counter() - t0
+    path = os.path.join(out_dir, _name(cand) + ".pkl")
+    joblib.dump(artifact_payload(kind, model, _data, cand), path, compress=3)
+    return {**cand, "name": _name(cand), "path": path, "fit_s": round(fit_s, 3)}
+
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+def measure(kind, result, data, single_rows):
+    from sklearn.metrics import accuracy_score, mean_squared_error
+
+    t0 = time.perf_counter()
+    payload = joblib.load(result["path"])
+    load_ms = (time.perf_counter() - t0) * 1000
+    model, encoder = payload["model"], payload["encoder"]
+
+    X_test, y_test = data["X_test"], data["y_test"]
+    t0 = time.perf_counter()
+    pred = model.predict(X_test)
+    batch_s = time.perf_counter() - t0
+
+    if kind in CLASSIFIERS:
+        if kind == "crop" and result["family"] == "rf":
+            pred = data["label_encoder"].transform(pred)
+        quality = {"accuracy": round(float(accuracy_score(y_test, np.asarray(pred, dtype=int))), 4)}
+    else:
+        quality = {"rmse": round(float(mean_squared_error(y_test, pred) ** 0.5), 4)}
+
+    # predict_server.py path: encode one dict, predict one row
+    records = data["test_records"][:single_rows]
+    lat = np.empty(len(records))
+    for i, rec in enumerate(records):
+        t0 = time.perf_counter()
+        model.predict(encoder.transform_one(rec).reshape(1, -1))
+        lat[i] = (time.perf_counter() - t0) * 1000
+
+    return {
+        **{k: v for k, v in result.items() if k != "path"},
+        **quality,
+        "artifact_kb":      round(os.path.getsize(result["path"]) / 1024, 1),
+        "load_ms":          round(load_ms, 2),
+        "single_row_p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "single_row_p95_ms": round(float(np.percentile(lat, 95)), 3),
+        "rows_per_sec":     round(len(X_test) / batch_s, 1) if batch_s > 0 else None,
+    }
+
+
+def _score(kind, r):
+    """Higher is better."""
+    return r["accuracy"] if kind in CLASSIFIERS else -r["rmse"]
+
+
+def pareto_front(kind, results):
+    """Candidates not dominated on (quality, single-row p95, artifact size)."""
+    def dominates(a, b):
+        ge = (_score(kind, a) >= _score(kind, b) and a["single_row_p95_ms"] <= b["single_row_p95_ms"]
+              and a["artifact_kb"] <= b["artifact_kb"])
+        gt = (_score(kind, a) > _score(kind, b) or a["single_row_p95_ms"] < b["single_row_p95_ms"]
+              or a["artifact_kb"] < b["artifact_kb"])
+        return ge and gt
+    front = [r for r in results if not any(dominates(o, r) for o in results if o is not r)]
+    return sorted(front, key=lambda r: r["single_row_p95_ms"])
+
+
+def pick(kind, results, latency_budget_ms, size_budget_kb=None):
+    ok = [r for r in results if r["single_row_p95_ms"] <= latency_budget_ms
+          and (size_budget_kb is None or r["artifact_kb"] <= size_budget_kb)]
+    if not ok:
+        return None
+    return max(ok, key=lambda r: (_score(kind, r), -r["artifact_kb"], -r["single_row_p95_ms"]))
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def _parse_list(text, cast):
+    return [None if v.strip().lower() == "none" else cast(v) for v in text.split(",") if v.strip()]
+
+
+def run(args):
+    families = _parse_list(args.families, str)
+    if "xgb" in families:
+        try:
+            import xgboost  # noqa: F401
+        except ImportError:
+            print("xgboost not installed — sweeping RandomForest only", file=sys.stderr)
+            families = [f for f in families if f != "xgb"]
+    grid = candidate_grid(families, _parse_list(args.trees, int), _parse_list(args.depths, int))
+
+    data = load_dataset(args.kind)
+    with tempfile.TemporaryDirectory(prefix=f"sweep_{args.kind}_") as out_dir:
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.kind,)) as pool:
+            trained = list(pool.map(_train_candidate, [args.kind] * len(grid), grid, [out_dir] * len(grid)))
+        train_s = time.perf_counter() - t0
+        results = [measure(args.kind, r, data, args.single_rows) for r in trained]
+
+        best = pick(args.kind, results, args.latency_budget_ms, args.size_budget_kb)
+        installed = None
+        if args.write and best:
+            installed = os.path.abspath(MODEL_CANDIDATES[args.kind][0])
+            joblib.dump(joblib.load(os.path.join(out_dir, best["name"] + ".pkl")), installed, compress=3)
+
+    report = {
+        "kind":              args.kind,
+        "data_source":       data["source"],
+        "train_rows":        int(len(data["X_train"])),
+        "test_rows":         int(len(data["X_test"])),
+        "candidates":        len(results),
+        "train_seconds":     round(train_s, 2),
+        "latency_budget_ms": args.latency_budget_ms,
+        "size_budget_kb":    args.size_budget_kb,
+        "pareto_front":      [r["name"] for r in pareto_front(args.kind, results)],
+        "pick":              best,
+        "installed":         installed,
+        "results":           sorted(results, key=lambda r: -_score(args.kind, r)),
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return 0 if best else 1
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Sweep model size/latency vs accuracy and pick one under a budget.")
+    p.add_argument("kind", choices=MODEL_KINDS)
+    p.add_argument("--families", default="rf,xgb", help="comma list of rf,xgb")
+    p.add_argument("--trees", default="10,25,50,100,200")
+    p.add_argument("--depths", default="6,12,none", help="comma list; 'none' = unlimited (RF only)")
+    p.add_argument("--latency-budget-ms", type=float, default=float(os.environ.get("SWEEP_LATENCY_BUDGET_MS", 5.0)),
+                   help="max single-row p95 latency for the pick (env SWEEP_LATENCY_BUDGET_MS)")
+    p.add_argument("--size-budget-kb", type=float, default=None)
+    p.add_argument("--single-rows", type=int, default=200, help="rows timed one at a time per candidate")
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    p.add_argument("--out", help="also write the JSON report to this file")
+    p.add_argument("--write", action="store_true", help="install the picked artifact for predict_*.py")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -1,28 +1,16 @@
-import os
 import sys
-from datetime import datetime
 
-import joblib
+from model_loader import find_model, load_bundle
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # look for model in ml/ then parent folders (trained scripts may save to different cwd)
-candidates = [
-    os.path.join(BASE_DIR, 'rainfall_model.pkl'),
-    os.path.join(BASE_DIR, '..', 'rainfall_model.pkl'),
-    os.path.join(BASE_DIR, '..', '..', 'rainfall_model.pkl'),
-    os.path.join(BASE_DIR, '..', '..', 'backend', 'rainfall_model.pkl')
-]
-model_path = None
-for c in candidates:
-    if os.path.exists(c):
-        model_path = os.path.abspath(c)
-        break
+model_path = find_model('rainfall')
 
 if not model_path:
     print('ERROR: model not found')
     sys.exit(2)
 
-model = joblib.load(model_path)
+bundle = load_bundle('rainfall', model_path)
+model = bundle.model
 
 # expected args: temperature humidity soilMoisture rainfall_lag1 dayofyear
 if len(sys.argv) < 6:
@@ -36,5 +24,9 @@ soilMoisture = float(sys.argv[3])
 rainfall_lag1 = float(sys.argv[4])
 dayofyear = int(sys.argv[5])
 
-pred = model.predict([[temperature, humidity, soilMoisture, rainfall_lag1, dayofyear]])
+X = bundle.encoder.transform_one({
+    'temperature': temperature, 'humidity': humidity, 'soilMoisture': soilMoisture,
+    'rainfall_lag1': rainfall_lag1, 'dayofyear': dayofyear,
+}).reshape(1, -1)
+pred = model.predict(X)
 print(float(pred[0]))
@@ -2,81 +2,280 @@
 predict_server.py — Persistent HTTP prediction server.
 Loads the ML model ONCE at startup, then serves fast predictions via HTTP.
 Start: python ml/predict_server.py  (runs on port 5001)
+
+  POST /predict-crop   single crop recommendation ({"explain": true} adds per-input contributions)
+  POST /predict-yield  single yield estimate {"area", "rainfall", "temperature", "crop", ...}
+  POST /forecast-rain  {"cities": [...], "days": 7, "method": "recursive"|"direct"}
+  POST /sweep          {"base": {...}, "axes": {...}, "sort": "yield", "limit": 50}
+  POST /rotation-plan  {"field": {...}, "seasons": 10, "startSeason": "Kharif"} crop sequence per season
+  GET  /health         readiness + queue stats + model fleet (503 while not ready)
+  POST /admin/profile  {"requests": 100, "modes": ["cprofile", "tracemalloc", "sample"]}
+  GET  /admin/profile  status + last report; /admin/profile/<id>/<file> downloads it
+  GET  /admin/prediction-log   event log counters (buffered, written, dropped, ...)
+  GET  /drift          live inputs vs the training reference (PSI per feature), per served
+                       model; the global crop model's report stays at the top level
+  GET  /nearest-stations?lat=..&lon=..&k=3&maxAgeHours=24
+                       k nearest weather stations + IDW moisture / rain / temperature
+  POST /drift/reset    start a fresh observation window
+
+POST work goes through admission.py: a bounded queue in front of the
+inference workers, per-request deadlines (X-Request-Deadline-Ms header) and
+an immediate 503 + Retry-After when saturated. Every POST to a predict route
+is recorded as a prediction event by prediction_log.py (ring buffer +
+background NDJSON/Mongo flush), off the response path, whatever its status,
+with the versions of the models that answered it ({kind: version}).
+
+Predict requests may carry "customer" and/or "region": model_fleet.py serves a
+specialised artifact from ml/models/<kind>/<key>.pkl when one exists (loaded
+on first use, LRU-evicted under MODEL_FLEET_BUDGET_MB) and the global model
+otherwise.
 """
 import json
 import os
 import sys
+import threading
+import time
 import warnings
+from functools import partial
 warnings.filterwarnings("ignore")
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
-import joblib
-import pandas as pd
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+from admission import AdmissionController, DeadlineExceeded, Overloaded
+from drift import DriftRegistry, build_reference
+from early_exit import ProgressiveForest
+from explain import TreeExplainer
+from model_fleet import GLOBAL, ModelFleet
+from model_loader import find_model, load_bundle
+from prediction_log import PredictionLog, model_version
+from profiling import RequestProfiler
+from rotation_plan import RotationPlanner, run_plan
+from rain_forecast import RainForecaster, find_direct_model
+from scenario_sweep import ScenarioSweeper, run_sweep
+from station_index import DEFAULT_K, DEFAULT_MAX_AGE_H, StationIndex
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PORT = 5001
 
 # ── Load model once at startup ────────────────────────────────────────────────
-model_path = os.path.join(BASE_DIR, "model.pkl")
+model_path = find_model("crop") or os.path.join(BASE_DIR, "model.pkl")
 if not os.path.exists(model_path):
     print(json.dumps({"error": "model-not-found", "path": model_path}), flush=True)
     sys.exit(2)
 
 print(f"Loading model from {model_path} ...", flush=True)
-raw = joblib.load(model_path)
-if isinstance(raw, dict) and "model" in raw:
-    model        = raw["model"]
-    feature_cols = raw["feature_columns"]
-    cat_values   = raw.get("categorical_values", {})
-else:
-    model        = raw
-    feature_cols = ["temperature", "humidity", "rainfall"]
-    cat_values   = {}
+bundle       = load_bundle("crop", model_path)
+encoder      = bundle.encoder
+feature_cols = bundle.feature_columns
+crop_version = model_version(model_path)
+
+# early-exit scoring (request {"earlyExit": true}); EARLY_EXIT_CONFIDENCE enables the approximate mode
+progressive = None
+if ProgressiveForest.supports(bundle.model):
+    _conf = os.environ.get("EARLY_EXIT_CONFIDENCE")
+    progressive = ProgressiveForest(bundle.model,
+                                    block_size=int(os.environ.get("EARLY_EXIT_BLOCK", "5")),
+                                    confidence=float(_conf) if _conf else None)
+
+# input-drift sketches against the references saved at training time, one per served model
+# ("crop:global", "yield:punjab", ...); a global crop artifact trained before references
+# existed gets one rebuilt from the same synthetic rows (crop_data seed 42)
+drift_reference = bundle.payload.get("drift_reference")
+if drift_reference is None:
+    from crop_data import generate_frame
+    drift_reference = build_reference(encoder, encoder.transform(generate_frame(seed=42)))
+drifts = DriftRegistry(fallback={f"crop:{GLOBAL}": drift_reference})
+
+# per-region / per-customer models; the startup crop model is the pinned global fallback
+fleet = ModelFleet()
+fleet.put("crop", GLOBAL, bundle, pinned=True)
+
+# explanation tables for the global crop model are built with it, not on the first request
+if TreeExplainer.supports(bundle.model):
+    bundle.explainer()
 
 print(f"Model loaded. Features: {len(feature_cols)}. Ready on port {PORT}.", flush=True)
 
 
+def model_keys(data):
+    """Fleet keys a request may be served by, most specific first."""
+    return data.get("customer"), data.get("region")
+
+
+# the models a handler answered with, recorded on the inference worker running it
+_served = threading.local()
+
+
+def served(*bundles, **versions):
+    """Note the bundles (and extra artifact versions) answering the current request."""
+    for b in bundles:
+        if b is not None:
+            _served.versions[b.kind] = model_version(b.path)
+    _served.versions.update(versions)
+
+
+def traced(fn, data):
+    """fn(data) on the inference worker -> (result, {kind: version} of the models used)."""
+    _served.versions = {}
+    try:
+        return fn(data), _served.versions
+    except Exception as e:
+        e.model_versions = _served.versions
+        raise
+
+
 def predict(data):
     """Run inference and return {'predictedCrop': '...'}."""
-    def safe_float(v, default):
-        try:
-            return float(v) if v not in (None, "", "None") else default
-        except (ValueError, TypeError):
-            return default
-
-    temperature  = safe_float(data.get("temperature"),  25.0)
-    humidity     = safe_float(data.get("humidity"),     60.0)
-    rainfall     = safe_float(data.get("rainfall"),    100.0)
-    soil_ph      = safe_float(data.get("soil_ph"),       6.5)
-    soilMoisture = safe_float(data.get("soilMoisture"), 40.0)
-    nitrogen     = safe_float(data.get("nitrogen"),     40.0)
-    phosphorus   = safe_float(data.get("phosphorus"),   20.0)
-    potassium    = safe_float(data.get("potassium"),    30.0)
-    soilType     = data.get("soilType", "")
-    region       = data.get("region",   "")
-    season       = data.get("season",   "")
-
-    row = {
-        "temperature":  temperature,
-        "humidity":     humidity,
-        "rainfall":     rainfall,
-        "soil_ph":      soil_ph,
-        "soilMoisture": soilMoisture,
-        "nitrogen":     nitrogen,
-        "phosphorus":   phosphorus,
-        "potassium":    potassium,
-    }
-
-    input_cats = {"soilType": soilType, "region": region, "season": season}
-    for cat_col, values in cat_values.items():
-        user_val = input_cats.get(cat_col, "")
-        for v in values:
-            row[f"{cat_col}_{v}"] = 1.0 if user_val == v else 0.0
-
-    X_values = [row.get(col, 0.0) for col in feature_cols]
-    X = pd.DataFrame([X_values], columns=feature_cols)
-    pred = model.predict(X)
-    return {"predictedCrop": str(pred[0])}
+    specialised, key = fleet.get("crop", *model_keys(data))
+    served(specialised)
+    if data.get("explain"):
+        result = explained(specialised, data)
+        drifts.observe(f"crop:{key}", specialised, specialised.encoder.transform_one(data))
+        return result if key == GLOBAL else {**result, "model": f"crop:{key}"}
+    # encoder writes straight into one float32 row (missing values -> training defaults)
+    X = specialised.encoder.transform_one(data).reshape(1, -1)
+    drifts.observe(f"crop:{key}", specialised, X)
+    if key != GLOBAL:
+        # early exit is tied to the global model's forest
+        return {"predictedCrop": specialised.labels(specialised.predict_matrix(X))[0], "model": f"crop:{key}"}
+    if progressive is not None and data.get("earlyExit"):
+        res = progressive.predict(X)
+        return {"predictedCrop": bundle.labels(res.labels)[0],
+                "treesUsed": int(res.trees_used[0]), "totalTrees": res.n_trees}
+    pred = bundle.predict_matrix(X)
+    return {"predictedCrop": bundle.labels(pred)[0]}
+
+
+# rainfall forecaster is loaded on first use (the rainfall model may be trained after startup)
+forecaster = None
+forecaster_lock = threading.Lock()
+
+
+def forecast_rain(data):
+    global forecaster
+    specialised, key = fleet.get("rainfall", *model_keys(data))
+    if key != GLOBAL:
+        # direct multi-horizon models are trained globally, so specialised forecasts are recursive
+        fc = RainForecaster(specialised)
+    else:
+        with forecaster_lock:
+            if forecaster is None or forecaster.bundle is not specialised:
+                forecaster = RainForecaster(specialised, RainForecaster.load_direct())
+            fc = forecaster
+    cities = data.get("cities") or []
+    days   = int(data.get("days", 7))
+    method = data.get("method", "recursive")
+    served(specialised)
+    if method == "direct" and fc.direct:
+        served(rainfallDirect=model_version(find_direct_model()))
+    X, errors = fc.observations(cities)
+    forecasts = fc.forecast(cities, days, method, observed=(X, errors))
+    ok = [i for i, e in enumerate(errors) if e is None]
+    if ok:
+        drifts.observe(f"rainfall:{key}", specialised, X[ok])      # one batch, not a row at a time
+    return {"days": days, "method": method, "forecasts": forecasts, "model": f"rainfall:{key}"}
+
+
+def explained(model_bundle, data):
+    """Prediction + per-input contributions (explain.py), checked for additivity on first use."""
+    if not TreeExplainer.supports(model_bundle.model):
+        raise ValueError("explanations are not available for this model; retrain or re-compact it")
+    top = data.get("explainTop")
+    result = model_bundle.explain([data], top=int(top) if top else None)[0]
+    if "error" in result:
+        raise ValueError(result["error"])
+    return result
+
+
+def predict_yield(data):
+    specialised, key = fleet.get("yield", *model_keys(data))
+    served(specialised)
+    if data.get("explain"):
+        result = explained(specialised, data)
+    else:
+        result = specialised.score([data])[0]
+        if "error" in result:
+            raise ValueError(result["error"])
+    drifts.observe(f"yield:{key}", specialised, specialised.encoder.transform_one(data))
+    return {**result, "model": f"yield:{key}"}
+
+
+# what-if sweeps reuse the crop bundle; the yield model is picked up once it exists
+sweeper = None
+
+
+def sweep(data):
+    global sweeper
+    if sweeper is None or sweeper.yield_ is None:
+        yield_path = find_model("yield")
+        sweeper = ScenarioSweeper(bundle, load_bundle("yield", yield_path) if yield_path else None)
+    served(sweeper.crop, sweeper.yield_)
+    return run_sweep(sweeper, data)
+
+
+# rotation plans share the crop bundle; the memo of scored rows (keyed by the crop model's
+# version) lives across requests, and the planner is rebuilt when the yield artifact changes
+planner = None
+
+
+def rotation_plan(data):
+    global planner
+    yield_path = find_model("yield")
+    if planner is None or planner.versions["yield"] != (model_version(yield_path) if yield_path else None):
+        planner = RotationPlanner(bundle, load_bundle("yield", yield_path) if yield_path else None)
+    served(planner.crop, planner.yield_)
+    return run_plan(planner, data)
+
+
+class PredictServer(ThreadingHTTPServer):
+    # connection threads only parse and wait; inference runs on admission's workers
+    daemon_threads = True
+    request_queue_size = 128    # listen backlog: shed with a 503 instead of resetting connections
+
+
+# ── Admission control ─────────────────────────────────────────────────────────
+admission = AdmissionController()
+# admin/profile arms it for the next N requests; cProfile covers the handler run on the
+# inference worker, the stack sampler also sees connection threads (body parsing, JSON)
+profiler = RequestProfiler(thread_filter=lambda t: t is not threading.main_thread())
+
+# path -> (handler, default deadline in ms; None = PREDICT_DEADLINE_MS)
+ROUTES = {
+    "/predict-crop":  (predict, None),
+    "/predict-yield": (predict_yield, None),
+    "/forecast-rain": (forecast_rain, 30000),
+    "/sweep":         (sweep, 30000),
+    "/rotation-plan": (rotation_plan, 30000),
+}
+
+# weather stations by coordinate; refreshed from WeatherData in the background, lookups are
+# lock-free snapshot reads so they are answered on the connection thread, outside admission
+stations = StationIndex()
+stations.start_refresh()
+
+
+def nearest_stations(query):
+    q = {k: v[0] for k, v in parse_qs(query).items()}
+    try:
+        lat, lon = float(q["lat"]), float(q["lon"])
+        k = int(q.get("k", DEFAULT_K))
+        max_age = float(q.get("maxAgeHours", DEFAULT_MAX_AGE_H))
+    except (KeyError, ValueError):
+        raise ValueError("lat and lon are required numbers (k, maxAgeHours optional)")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat/lon out of range")
+    return {**stations.nearest(lat, lon, min(max(k, 1), 50), max_age), "index": stations.stats()}
+
+
+# prediction events: emit() only appends to a ring buffer, a background thread does the I/O
+prediction_log = PredictionLog()
+
+
+def log_prediction(route, data, result, status, started, versions=None):
+    prediction_log.emit({"route": route, "input": data, "output": result, "status": status,
+                         "modelVersion": versions or None,
+                         "latencyMs": round((time.perf_counter() - started) * 1000, 3)})
 
 
 class Handler(BaseHTTPRequestHandler):
@@ -84,34 +283,99 @@ class Handler(BaseHTTPRequestHandler):
         pass  # suppress request logs
 
     def do_GET(self):
-        if self.path == "/health":
-            self._respond(200, {"status": "ok", "features": len(feature_cols)})
+        url = urlsplit(self.path)
+        if url.path == "/nearest-stations":
+            try:
+                self._respond(200, nearest_stations(url.query))
+            except ValueError as e:
+                self._respond(400, {"error": str(e)})
+        elif self.path == "/health":
+            state = admission.snapshot()
+            body = {"status": "ok" if state["ready"] else "busy", "features": len(feature_cols), **state,
+                    "modelFleet": fleet.stats()}
+            if state["ready"]:
+                self._respond(200, body)
+            else:
+                self._respond(503, body, {"Retry-After": state["retryAfter"]})
+        elif self.path == "/admin/profile":
+            self._respond(200, profiler.status())
+        elif self.path == "/admin/prediction-log":
+            self._respond(200, prediction_log.stats())
+        elif self.path == "/drift":
+            models = drifts.report()
+            crop = models.get(f"crop:{GLOBAL}") or drifts.monitor(f"crop:{GLOBAL}", bundle).report()
+            self._respond(200, {"model": "crop", "modelVersion": crop_version, **crop, "models": models})
+        elif self.path.startswith("/admin/profile/"):
+            report_id, _, name = self.path[len("/admin/profile/"):].partition("/")
+            path = profiler.report_file(report_id, name)
+            if path is None:
+                return self._respond(404, {"error": "no such profile file"})
+            with open(path, "rb") as f:
+                self._respond_bytes(200, f.read(), "application/octet-stream" if name.endswith(".prof") else "text/plain")
         else:
             self._respond(404, {"error": "not found"})
 
     def do_POST(self):
-        if self.path == "/predict-crop":
+        if self.path == "/admin/profile":
             try:
                 length = int(self.headers.get("Content-Length", 0))
-                body   = self.rfile.read(length)
-                data   = json.loads(body)
-                result = predict(data)
-                self._respond(200, result)
-            except Exception as e:
-                self._respond(500, {"error": str(e)})
-        else:
-            self._respond(404, {"error": "not found"})
+                data = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(data, dict):
+                    raise ValueError("request body must be a JSON object")
+                self._respond(200, profiler.arm(data.get("requests", 100), data.get("modes"),
+                                                data.get("sampleIntervalMs", 5)))
+            except ValueError as e:
+                self._respond(400, {"error": str(e)})
+            return
+        if self.path == "/drift/reset":
+            drifts.reset()
+            return self._respond(200, {"reset": True, "since": time.time()})
+        route = ROUTES.get(self.path)
+        if route is None:
+            return self._respond(404, {"error": "not found"})
+        fn, default_deadline = route
+        started = time.perf_counter()
+        data = None
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data   = json.loads(self.rfile.read(length))
+            if not isinstance(data, dict):
+                raise ValueError("request body must be a JSON object")
+            deadline = self.headers.get("X-Request-Deadline-Ms", default_deadline)
+            result, versions = admission.submit(partial(profiler.call, partial(traced, fn)), data,
+                                                float(deadline) if deadline is not None else None)
+            self._respond(200, result)
+            log_prediction(self.path, data, result, 200, started, versions)
+            return
+        except (Overloaded, DeadlineExceeded) as e:
+            error, code = e, 503
+            body, headers = {"error": str(e), "retryAfter": e.retry_after}, {"Retry-After": e.retry_after}
+        except FileNotFoundError as e:
+            error, code, body, headers = e, 503, {"error": str(e)}, None
+            if self.path == "/forecast-rain":
+                body = {"error": "Rainfall model not available. Run /api/ml/train-rainfall first."}
+        except ValueError as e:
+            error, code, body, headers = e, 400, {"error": str(e)}, None
+        except Exception as e:
+            error, code, body, headers = e, 500, {"error": str(e)}, None
+        # every answer is one event, errors included
+        self._respond(code, body, headers)
+        log_prediction(self.path, data, body, code, started, getattr(error, "model_versions", None))
+
+    def _respond(self, code, obj, headers=None):
+        self._respond_bytes(code, json.dumps(obj).encode(), "application/json", headers)
 
-    def _respond(self, code, obj):
-        body = json.dumps(obj).encode()
+    def _respond_bytes(self, code, body, content_type, headers=None):
         self.send_response(code)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
         self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, str(v))
         self.end_headers()
         self.wfile.write(body)
 
 
 if __name__ == "__main__":
-    server = HTTPServer(("127.0.0.1", PORT), Handler)
+    server = PredictServer(("127.0.0.1", PORT), Handler)
     print(f"Prediction server listening on http://127.0.0.1:{PORT}", flush=True)
     server.serve_forever()
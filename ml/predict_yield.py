@@ -1,31 +1,17 @@
 import json
-import os
 import sys
 
-import joblib
-import numpy as np
+from model_loader import find_model, load_bundle
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # search candidate locations for the model
-candidates = [
-    os.path.join(BASE_DIR, 'yield_model.pkl'),
-    os.path.join(BASE_DIR, '..', 'yield_model.pkl'),
-    os.path.join(BASE_DIR, '..', '..', 'yield_model.pkl'),
-]
-model_path = None
-for c in candidates:
-    if os.path.exists(c):
-        model_path = os.path.abspath(c)
-        break
+model_path = find_model('yield')
 
 if not model_path:
     print(json.dumps({'error': 'model-not-found'}))
     sys.exit(2)
 
-payload = joblib.load(model_path)
-model = payload['model']
-ohe_cats = payload.get('ohe_categories', [])
-feature_columns = payload.get('feature_columns', [])
+bundle = load_bundle('yield', model_path)
+model = bundle.model
 
 if len(sys.argv) < 5:
     print(json.dumps({'error': 'missing-args', 'usage': 'predict_yield.py <area> <rainfall> <temperature> <crop> [fertilizer]'}))
@@ -37,14 +23,10 @@ temperature = float(sys.argv[3])
 crop = str(sys.argv[4])
 fertilizer = float(sys.argv[5]) if len(sys.argv) > 5 else 0.0
 
-# build input row matching feature_columns
-row = { 'area': area, 'rainfall': rainfall, 'temperature': temperature, 'fertilizer': fertilizer }
-# add OHE crop columns
-for c in ohe_cats:
-    row[f'crop_{c}'] = 1.0 if c.lower() == crop.lower() else 0.0
-
-# ensure column order
-X = np.array([row.get(col, 0.0) for col in feature_columns]).reshape(1, -1)
+# encoder matches crop names case-insensitively and keeps the training column order
+X = bundle.encoder.transform_one({
+    'area': area, 'rainfall': rainfall, 'temperature': temperature, 'fertilizer': fertilizer, 'crop': crop,
+}).reshape(1, -1)
 
 pred = model.predict(X)
 pred_value = float(pred[0])
@@ -0,0 +1,178 @@
+"""
+prediction_log.py — Asynchronous prediction-event log for predict_server.py.
+
+Each served request becomes one event (route, inputs, output, model version,
+latency, status) pushed onto a bounded in-memory ring buffer. Logging never
+blocks inference:
+
+  - below SAMPLE_FRACTION full  → every event is kept
+  - above it                    → only 1 in PREDICTION_LOG_SAMPLE_EVERY is kept
+  - buffer full                 → the event is dropped (counted, never waited on)
+
+A background thread drains the buffer in batches into an append-only NDJSON
+file (rotated by size) and, when PREDICTION_LOG_MONGO is set, into the
+`prediction_events` collection with unordered insert_many. A slow disk or
+database only fills the buffer; requests keep their latency.
+
+  PREDICTION_LOG_PATH          NDJSON log file      (default ml/logs/predictions.ndjson)
+  PREDICTION_LOG_CAPACITY      ring buffer events   (default 8192)
+  PREDICTION_LOG_BATCH         events per flush     (default 512)
+  PREDICTION_LOG_INTERVAL_MS   max time between flushes (default 1000)
+  PREDICTION_LOG_SAMPLE_EVERY  keep-1-in-N under pressure (default 4)
+  PREDICTION_LOG_MAX_MB        rotate the file past this size (default 64)
+  PREDICTION_LOG_MONGO         MongoDB URI, e.g. mongodb://127.0.0.1:27017/ (default off)
+  PREDICTION_LOG=0             disable logging entirely
+
+Usage:
+  from prediction_log import PredictionLog
+  log = PredictionLog()
+  log.emit({"route": "/predict-crop", "input": {...}, "output": {...}, "latencyMs": 1.2})
+  log.stats()
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join(BASE_DIR, "logs", "predictions.ndjson")
+SAMPLE_FRACTION = 0.5
+MONGO_COLLECTION = "prediction_events"
+
+
+def _env(name, default, cast=int):
+    value = os.environ.get(name)
+    return cast(value) if value not in (None, "") else default
+
+
+class PredictionLog:
+    def __init__(self, path=None, capacity=None, batch=None, interval_ms=None,
+                 sample_every=None, max_mb=None, mongo_uri=None, enabled=None):
+        self.path = path or os.environ.get("PREDICTION_LOG_PATH") or DEFAULT_PATH
+        self.capacity = capacity or _env("PREDICTION_LOG_CAPACITY", 8192)
+        self.batch = batch or _env("PREDICTION_LOG_BATCH", 512)
+        self.interval = (interval_ms or _env("PREDICTION_LOG_INTERVAL_MS", 1000)) / 1000
+        self.sample_every = max(1, sample_every or _env("PREDICTION_LOG_SAMPLE_EVERY", 4))
+        self.max_bytes = (max_mb or _env("PREDICTION_LOG_MAX_MB", 64, float)) * 2**20
+        self.mongo_uri = mongo_uri if mongo_uri is not None else os.environ.get("PREDICTION_LOG_MONGO")
+        self.enabled = enabled if enabled is not None else os.environ.get("PREDICTION_LOG", "1") != "0"
+
+        # append/popleft are atomic, so emit() takes no lock (counters are approximate under contention)
+        self._buffer = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._seen = 0
+        self._collection = None
+        self.counters = {"emitted": 0, "sampledOut": 0, "dropped": 0, "written": 0,
+                         "mongoInserted": 0, "mongoFailed": 0, "flushes": 0, "writeErrors": 0}
+        self._thread = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    # ── Request side (never blocks) ───────────────────────────────────────────
+    def emit(self, event):
+        if not self.enabled:
+            return False
+        self._seen += 1
+        depth = len(self._buffer)
+        if depth >= self.capacity:
+            self.counters["dropped"] += 1
+            return False
+        if depth >= self.capacity * SAMPLE_FRACTION and self._seen % self.sample_every:
+            self.counters["sampledOut"] += 1
+            return False
+        event.setdefault("ts", datetime.now(timezone.utc).isoformat(timespec="milliseconds"))
+        self._buffer.append(event)
+        self.counters["emitted"] += 1
+        if depth + 1 >= self.batch:
+            self._wake.set()
+        return True
+
+    def stats(self):
+        return {"enabled": self.enabled, "path": self.path, "buffered": len(self._buffer),
+                "capacity": self.capacity, "mongo": bool(self.mongo_uri), **self.counters}
+
+    def close(self, timeout=5.0):
+        """Stop the flusher after draining what is buffered."""
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    # ── Flusher thread ────────────────────────────────────────────────────────
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        while self._buffer:
+            events = []
+            while self._buffer and len(events) < self.batch:
+                events.append(self._buffer.popleft())
+            self._write_file(events)
+            if self.mongo_uri:
+                self._write_mongo(events)
+            self.counters["flushes"] += 1
+
+    def _write_file(self, events):
+        lines = "".join(json.dumps(e, default=str, separators=(",", ":")) + "\n" for e in events)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+                root, ext = os.path.splitext(self.path)
+                os.replace(self.path, f"{root}-{stamp}{ext}")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self.counters["written"] += len(events)
+        except OSError:
+            self.counters["writeErrors"] += 1
+
+    def _write_mongo(self, events):
+        try:
+            if self._collection is None:
+                from pymongo import MongoClient
+                client = MongoClient(self.mongo_uri, serverSelectionTimeoutMS=2000)
+                self._collection = client["smart_irrigation"][MONGO_COLLECTION]
+            # insert_many adds _id to each dict; copies keep the buffered events untouched
+            result = self._collection.insert_many([dict(e) for e in events], ordered=False)
+            self.counters["mongoInserted"] += len(result.inserted_ids)
+        except ImportError:
+            self.mongo_uri = None       # pymongo not installed: file log only
+        except Exception as e:
+            # BulkWriteError still inserts the good documents when unordered
+            inserted = (getattr(e, "details", None) or {}).get("nInserted", 0)
+            self.counters["mongoInserted"] += inserted
+            self.counters["mongoFailed"] += len(events) - inserted
+
+
+def model_version(path):
+    """Short, stable id of a model artifact: <file>@<mtime>:<size>."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = datetime.fromtimestamp(st.st_mtime, timezone.utc).strftime("%Y%m%dT%H%M%S")
+    return f"{os.path.basename(path)}@{stamp}:{st.st_size}"
+
+
+if __name__ == "__main__":
+    # python ml/prediction_log.py [n] — emit n synthetic events as fast as possible, print stats
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    log = PredictionLog()
+    t0 = time.perf_counter()
+    for i in range(n):
+        log.emit({"route": "/bench", "input": {"i": i}, "output": {"ok": True}, "latencyMs": 0.1})
+    emit_us = (time.perf_counter() - t0) * 1e6 / n
+    log.close()
+    print(json.dumps({"events": n, "emitMicros": round(emit_us, 3), **log.stats()}, indent=2))
@@ -0,0 +1,298 @@
+"""
+profiling.py — On-demand profiling for predict_server.py and the train_*.py scripts.
+
+Three collectors, any combination:
+
+  cprofile     deterministic call stats (cprofile.txt sorted by cumulative time,
+               cprofile.prof for snakeviz / pstats)
+  tracemalloc  top allocation sites by size (alloc.txt)
+  sample       low-overhead sampling of thread stacks every few ms, written as
+               folded stacks (stacks.folded) for flamegraph.pl / speedscope
+
+Prediction server — armed at runtime, profiles the next N requests:
+  curl -XPOST 127.0.0.1:5001/admin/profile -d '{"requests": 200, "modes": ["cprofile", "sample"]}'
+  curl 127.0.0.1:5001/admin/profile                          # status + last report
+  curl 127.0.0.1:5001/admin/profile/<id>/stacks.folded       # download a file
+Reports are written to ml/profiles/<id>/.
+
+Trainers — one whole run, written next to the model artifact (<artifact>.profile/):
+  python ml/train_model.py --profile                     # all collectors
+  python ml/train_model.py --profile=cprofile,sample
+  ML_PROFILE=tracemalloc python ml/train_yield.py
+"""
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_DIR = os.path.join(BASE_DIR, "profiles")
+MODES = ("cprofile", "tracemalloc", "sample")
+REPORT_FILES = ("cprofile.txt", "cprofile.prof", "alloc.txt", "stacks.folded", "summary.json")
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 30
+SAMPLE_INTERVAL_MS = 5
+DISABLED = ("", "0", "false", "off", "no")
+# <utc second>-<pid>-<random>: two servers (or two trainers) starting in the same
+# second still get distinct report directories
+SESSION_ID = re.compile(r"\d{8}T\d{6}-\d+-[0-9a-f]{8}")
+
+
+def parse_modes(spec):
+    """"cprofile,sample" / ["cprofile"] / "1" / "all" -> validated list of modes.
+
+    "", "0", "false", "off" (and False) mean profiling is disabled -> [].
+    """
+    if spec is None or spec is True or (isinstance(spec, str) and spec.strip().lower() in ("1", "all")):
+        return list(MODES)
+    if spec is False or (isinstance(spec, str) and spec.strip().lower() in DISABLED):
+        return []
+    items = spec.split(",") if isinstance(spec, str) else list(spec)
+    modes = [m.strip().lower() for m in items if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        raise ValueError(f"unknown profiling mode(s) {unknown}; choose from {list(MODES)}")
+    return modes
+
+
+def session_id():
+    return f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{secrets.token_hex(4)}"
+
+
+# ── Sampling profiler ─────────────────────────────────────────────────────────
+class StackSampler:
+    """Background thread that snapshots other threads' stacks via sys._current_frames().
+
+    Cost is one frame walk per sampled thread per interval — nothing is added to
+    the profiled code itself. thread_filter(thread) picks which threads count.
+    """
+
+    def __init__(self, interval_ms=SAMPLE_INTERVAL_MS, thread_filter=None):
+        self.interval = interval_ms / 1000
+        self.thread_filter = thread_filter
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                thread = names.get(ident)
+                if ident == me or thread is None:
+                    continue
+                if self.thread_filter is not None and not self.thread_filter(thread):
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                parts.append(thread.name)
+                self.stacks[";".join(reversed(parts))] += 1
+                self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+# ── Report writing ────────────────────────────────────────────────────────────
+def _cprofile_text(profile):
+    buf = io.StringIO()
+    stats = pstats.Stats(profile, stream=buf)
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    return buf.getvalue()
+
+
+def _alloc_rows(snapshot):
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                       tracemalloc.Filter(False, "<frozen importlib._bootstrap>")))
+    return [{"where": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+             "kb": round(s.size / 1024, 1), "count": s.count}
+            for s in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]]
+
+
+def write_report(out_dir, summary, profile=None, alloc=None, sampler=None):
+    """Write whichever collectors ran into out_dir; returns the summary (with file list)."""
+    os.makedirs(out_dir, exist_ok=True)
+    files = []
+    if profile is not None:
+        profile.dump_stats(os.path.join(out_dir, "cprofile.prof"))
+        with open(os.path.join(out_dir, "cprofile.txt"), "w", encoding="utf-8") as f:
+            f.write(_cprofile_text(profile))
+        files += ["cprofile.txt", "cprofile.prof"]
+    if alloc is not None:
+        summary["top_allocations"] = alloc
+        with open(os.path.join(out_dir, "alloc.txt"), "w", encoding="utf-8") as f:
+            f.writelines(f"{a['kb']:>10.1f} KiB {a['count']:>8} blocks  {a['where']}\n" for a in alloc)
+        files.append("alloc.txt")
+    if sampler is not None:
+        summary["samples"] = sampler.samples
+        with open(os.path.join(out_dir, "stacks.folded"), "w", encoding="utf-8") as f:
+            f.write(sampler.folded())
+        files.append("stacks.folded")
+    summary["files"] = files + ["summary.json"]
+    summary["dir"] = out_dir
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+# ── Prediction server: profile the next N requests ────────────────────────────
+class RequestProfiler:
+    """Wraps request handlers; arm() turns collection on for the next N calls.
+
+    While armed, profiled calls are serialized on one lock so a single
+    cProfile.Profile never runs in two threads at once. Disarmed, call() is a
+    flag check and a direct call.
+    """
+
+    def __init__(self, out_root=PROFILES_DIR, thread_filter=None):
+        self.out_root = out_root
+        self.thread_filter = thread_filter
+        self._lock = threading.Lock()
+        self._call_lock = threading.Lock()
+        self._session = None
+        self.last_report = None
+
+    def arm(self, requests=100, modes=None, sample_interval_ms=SAMPLE_INTERVAL_MS):
+        requests = int(requests)
+        if requests < 1:
+            raise ValueError("requests must be >= 1")
+        modes = parse_modes(modes)
+        if not modes:
+            raise ValueError(f"no profiling modes selected; choose from {list(MODES)}")
+        with self._lock:
+            if self._session is not None:
+                raise ValueError(f"profiling session {self._session['id']} is already running")
+            session = {"id": session_id(), "modes": modes,
+                       "target": requests, "done": 0, "started": time.time(), "call_s": 0.0,
+                       "profile": cProfile.Profile() if "cprofile" in modes else None,
+                       "sampler": None}
+            if "tracemalloc" in modes and not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            if "sample" in modes:
+                session["sampler"] = StackSampler(sample_interval_ms, self.thread_filter).start()
+            self._session = session
+        return self.status()
+
+    def call(self, fn, data):
+        if self._session is None:
+            return fn(data)
+        with self._call_lock:
+            session = self._session
+            if session is None:
+                return fn(data)
+            profile = session["profile"]
+            t0 = time.perf_counter()
+            if profile is not None:
+                profile.enable()
+            try:
+                return fn(data)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                session["call_s"] += time.perf_counter() - t0
+                session["done"] += 1
+                if session["done"] >= session["target"]:
+                    self._finish()
+
+    def _finish(self):
+        with self._lock:
+            session, self._session = self._session, None
+        if session["sampler"] is not None:
+            session["sampler"].stop()
+        alloc = None
+        if "tracemalloc" in session["modes"]:
+            alloc = _alloc_rows(tracemalloc.take_snapshot())
+            tracemalloc.stop()
+        summary = {"id": session["id"], "modes": session["modes"], "requests": session["done"],
+                   "wall_s": round(time.time() - session["started"], 3),
+                   "mean_request_ms": round(session["call_s"] * 1000 / max(1, session["done"]), 3)}
+        self.last_report = write_report(os.path.join(self.out_root, session["id"]), summary,
+                                        session["profile"], alloc, session["sampler"])
+
+    def status(self):
+        with self._lock:
+            s = self._session
+            running = None if s is None else {"id": s["id"], "modes": s["modes"],
+                                              "requests": s["done"], "target": s["target"]}
+        return {"running": running, "last": self.last_report}
+
+    def report_file(self, report_id, name):
+        """Path of a report file, or None (ids and names are validated, no path traversal)."""
+        if name not in REPORT_FILES or not SESSION_ID.fullmatch(report_id):
+            return None
+        path = os.path.join(self.out_root, report_id, name)
+        return path if os.path.isfile(path) else None
+
+
+# ── Trainers: profile one whole run ───────────────────────────────────────────
+def profile_training(artifact):
+    """Call at the top of a train_*.py script.
+
+    Enabled by a `--profile[=modes]` argument (removed from sys.argv so the
+    script's own argument handling is unaffected) or ML_PROFILE=modes. A bare
+    --profile selects every collector; ML_PROFILE=, =0, =false or =off leaves
+    profiling off. The report is written to <artifact>.profile/ when the script
+    exits.
+    """
+    spec = os.environ.get("ML_PROFILE")
+    for arg in list(sys.argv[1:]):
+        if arg == "--profile" or arg.startswith("--profile="):
+            spec = arg.partition("=")[2] or "all"
+            sys.argv.remove(arg)
+    modes = parse_modes(spec) if spec is not None else []
+    if not modes:
+        return None
+    out_dir = os.path.abspath(artifact) + ".profile"
+    started = time.time()
+
+    if "tracemalloc" in modes:
+        tracemalloc.start(10)
+    main_thread = threading.main_thread()
+    sampler = StackSampler(thread_filter=lambda t: t is main_thread).start() if "sample" in modes else None
+    profile = cProfile.Profile() if "cprofile" in modes else None
+    if profile is not None:
+        profile.enable()
+
+    def finish():
+        if profile is not None:
+            profile.disable()
+        if sampler is not None:
+            sampler.stop()
+        alloc = _alloc_rows(tracemalloc.take_snapshot()) if "tracemalloc" in modes else None
+        if "tracemalloc" in modes:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        summary = {"script": os.path.basename(sys.argv[0]), "artifact": os.path.abspath(artifact),
+                   "modes": modes, "wall_s": round(time.time() - started, 3)}
+        if "tracemalloc" in modes:
+            summary["peak_traced_mb"] = round(peak / 2**20, 2)
+        write_report(out_dir, summary, profile, alloc, sampler)
+        print(f"Profile written to {out_dir}", file=sys.stderr)
+
+    atexit.register(finish)
+    return out_dir
@@ -0,0 +1,246 @@
+"""
+rain_forecast.py — Multi-day rainfall forecasts for many cities in one call.
+
+All cities advance together: every forecast day is ONE vectorized model call
+over an (n_cities x features) float32 matrix, instead of one predict_rain.py
+process per city per day.
+
+  recursive  rainfall_model.pkl predicts day k+1 from day k; the prediction is
+             fed back as rainfall_lag1 and dayofyear advances by one. Other
+             inputs (temperature, humidity, soilMoisture) are held at the
+             latest observation.
+  direct     rainfall_direct_model.pkl (python ml/train_rainfall.py --direct 7)
+             holds one model per horizon, each predicting day h straight from
+             the latest observation — no error feedback, horizon is capped at
+             the number of trained models.
+
+Input: JSON list of {"city", "temperature", "humidity", "soilMoisture",
+"rainfall", "dayofyear"} — rainfall is the latest observed value (used as
+rainfall_lag1); dayofyear defaults to today. Forecast days advance along the
+calendar of the current year (or of an optional "year" per city), so a leap
+year runs through day 366 before wrapping to 1.
+
+Usage:
+  python ml/rain_forecast.py cities.json --days 7
+  python ml/rain_forecast.py cities.json --days 7 --method direct
+  echo '[{"city":"Pune","temperature":29,"humidity":70,"soilMoisture":35,"rainfall":4}]' | python ml/rain_forecast.py - --days 3
+  python ml/rain_forecast.py --benchmark --days 7
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+warnings.filterwarnings("ignore")
+
+from model_loader import MODEL_CANDIDATES, load_bundle
+
+# rainfall_direct_model.pkl lives next to rainfall_model.pkl
+DIRECT_CANDIDATES = [os.path.join(os.path.dirname(p), "rainfall_direct_model.pkl")
+                     for p in MODEL_CANDIDATES["rainfall"]]
+METHODS = ("recursive", "direct")
+
+
+def find_direct_model():
+    for c in DIRECT_CANDIDATES:
+        if os.path.exists(c):
+            return os.path.abspath(c)
+    return None
+
+
+def _today_doy():
+    return datetime.now().timetuple().tm_yday
+
+
+def day_sequence(start_doy, days, year=None):
+    """(n, days) day-of-year of the start day and the days after it, read off real dates.
+
+    start_doy is taken in `year` (scalar or one per row; default this year), so
+    the sequence follows that year's length — 365 -> 366 -> 1 in a leap year.
+    """
+    start_doy = np.asarray(start_doy, dtype=np.int64)
+    year = np.broadcast_to(np.asarray(datetime.now().year if year is None else year, dtype=np.int64),
+                           start_doy.shape)
+    jan1 = (year - 1970).astype("datetime64[Y]").astype("datetime64[D]")
+    dates = (jan1 + (start_doy - 1))[:, None] + np.arange(days)
+    return (dates - dates.astype("datetime64[Y]").astype("datetime64[D]")).astype(np.int64) + 1
+
+
+class RainForecaster:
+    """Vectorized multi-step rainfall forecaster over the shared rainfall encoder."""
+
+    def __init__(self, bundle, direct=None):
+        self.bundle  = bundle
+        self.encoder = bundle.encoder
+        self.model   = bundle.model
+        self.direct  = direct  # payload from rainfall_direct_model.pkl, or None
+        cols = self.encoder.feature_columns
+        self.lag_idx = cols.index("rainfall_lag1")
+        self.doy_idx = cols.index("dayofyear")
+
+    @classmethod
+    def load(cls, model_path=None, direct_path=None):
+        return cls(load_bundle("rainfall", model_path), cls.load_direct(direct_path))
+
+    @staticmethod
+    def load_direct(direct_path=None):
+        """Payload of rainfall_direct_model.pkl, or None when it has not been trained."""
+        direct_path = direct_path or find_direct_model()
+        return joblib.load(direct_path) if direct_path and os.path.exists(direct_path) else None
+
+    @property
+    def max_direct_days(self):
+        return len(self.direct["models"]) if self.direct else 0
+
+    # ── inputs ────────────────────────────────────────────────────────────────
+    def observations(self, cities):
+        """Encode the latest observation of every city. Returns (X, errors)."""
+        today = _today_doy()
+        records = []
+        for c in cities:
+            rec = dict(c)
+            if rec.get("rainfall_lag1") is None:
+                rec["rainfall_lag1"] = rec.get("rainfall", 0.0)
+            if rec.get("dayofyear") is None:
+                rec["dayofyear"] = today
+            records.append(rec)
+        return self.bundle.features(records)
+
+    # ── forecasting ───────────────────────────────────────────────────────────
+    def recursive(self, X0, days, year=None):
+        X = X0.copy()
+        D = day_sequence(X[:, self.doy_idx], days, year)
+        out = np.empty((len(X), days), dtype=np.float64)
+        for k in range(days):
+            X[:, self.doy_idx] = D[:, k]
+            pred = self.model.predict(X)
+            out[:, k] = pred
+            X[:, self.lag_idx] = pred
+        return out
+
+    def direct_forecast(self, X0, days):
+        if days > self.max_direct_days:
+            raise ValueError(f"direct model covers {self.max_direct_days} days; "
+                             f"retrain with train_rainfall.py --direct {days}")
+        out = np.empty((len(X0), days), dtype=np.float64)
+        for h in range(days):
+            out[:, h] = self.direct["models"][h].predict(X0)
+        return out
+
+    def forecast_matrix(self, X0, days, method="recursive", year=None):
+        if method == "direct":
+            return self.direct_forecast(X0, days)
+        return self.recursive(X0, days, year)
+
+    def forecast(self, cities, days=7, method="recursive", observed=None):
+        """Forecast `days` daily rainfall values for every city dict.
+
+        Returns one {"city", "dayofyear": [...], "rainfall_mm": [...]} per input
+        (or {"city", "error"} for rows that could not be encoded). `observed` is
+        observations(cities) when the caller already encoded them.
+        """
+        if method not in METHODS:
+            raise ValueError(f"unknown method: {method}")
+        days = int(days)
+        if days < 1:
+            raise ValueError("days must be >= 1")
+        X, errors = observed if observed is not None else self.observations(cities)
+        ok = np.array([e is None for e in errors], dtype=bool)
+        results = [{"city": c.get("city"), "error": e} if e else None for c, e in zip(cities, errors)]
+        if ok.any():
+            X_ok = X[ok]
+            this_year = datetime.now().year
+            year = np.array([int(c.get("year") or this_year) for c, good in zip(cities, ok) if good])
+            R = np.round(self.forecast_matrix(X_ok, days, method, year), 3)
+            D = day_sequence(X_ok[:, self.doy_idx], days, year)
+            for j, i in enumerate(np.flatnonzero(ok)):
+                results[i] = {"city": cities[i].get("city"), "dayofyear": D[j].tolist(),
+                              "rainfall_mm": R[j].tolist()}
+        return results
+
+
+# ── Benchmark: 1 / 100 / 10,000 cities ───────────────────────────────────────
+def _synthetic_cities(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{"city": f"city-{i}",
+             "temperature":  float(rng.uniform(10, 38)),
+             "humidity":     float(rng.uniform(30, 95)),
+             "soilMoisture": float(rng.uniform(10, 80)),
+             "rainfall":     float(rng.choice([0.0, rng.uniform(0, 20)])),
+             "dayofyear":    int(rng.integers(1, 366))} for i in range(n)]
+
+
+def benchmark(fc, days, sizes=(1, 100, 10000)):
+    methods = ["recursive"] + (["direct"] if fc.max_direct_days >= days else [])
+    report = {"days": days, "methods": methods, "runs": []}
+    for n in sizes:
+        cities = _synthetic_cities(n)
+        for method in methods:
+            t0 = time.perf_counter()
+            fc.forecast(cities, days, method)
+            elapsed = time.perf_counter() - t0
+            report["runs"].append({"cities": n, "method": method,
+                                   "seconds": round(elapsed, 4),
+                                   "model_calls": days,
+                                   "city_days_per_sec": round(n * days / elapsed, 1)})
+        if n <= 100:
+            # baseline: one single-row model call per city per day (what per-city spawning does, minus the spawn)
+            X, _ = fc.observations(cities)
+            t0 = time.perf_counter()
+            for i in range(n):
+                fc.recursive(X[i:i + 1], days)
+            report["runs"].append({"cities": n, "method": "recursive-per-city",
+                                   "seconds": round(time.perf_counter() - t0, 4),
+                                   "model_calls": n * days})
+    return report
+
+
+def _read_cities(path):
+    text = sys.stdin.read() if path == "-" else open(path, "r", encoding="utf-8").read()
+    data = json.loads(text)
+    return data["cities"] if isinstance(data, dict) else data
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Multi-day rainfall forecast for many cities.")
+    p.add_argument("input", nargs="?", help="JSON list of city observations ('-' for stdin)")
+    p.add_argument("--days", type=int, default=7)
+    p.add_argument("--method", choices=METHODS, default="recursive")
+    p.add_argument("--model", help="rainfall_model.pkl path")
+    p.add_argument("--direct-model", help="rainfall_direct_model.pkl path")
+    p.add_argument("--benchmark", action="store_true", help="time 1 / 100 / 10,000 synthetic cities")
+    args = p.parse_args(argv)
+
+    try:
+        fc = RainForecaster.load(args.model, args.direct_model)
+    except FileNotFoundError:
+        print(json.dumps({"error": "Rainfall model not available. Run train_rainfall.py first."}))
+        return 2
+
+    if args.benchmark:
+        print(json.dumps(benchmark(fc, args.days), indent=2))
+        return 0
+    if not args.input:
+        p.print_help()
+        return 2
+
+    cities = _read_cities(args.input)
+    t0 = time.perf_counter()
+    try:
+        forecasts = fc.forecast(cities, args.days, args.method)
+    except ValueError as e:
+        print(json.dumps({"error": str(e)}))
+        return 2
+    print(json.dumps({"days": args.days, "method": args.method, "cities": len(cities),
+                      "seconds": round(time.perf_counter() - t0, 4), "forecasts": forecasts}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
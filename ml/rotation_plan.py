@@ -0,0 +1,336 @@
+"""
+rotation_plan.py — Multi-season crop rotation plans (Kharif → Rabi → Zaid → ...) for one field.
+
+A dynamic program over season states. A state is (soil N / P / K after the
+previous seasons, previous crop); each action plants one candidate crop:
+
+  reward     suitability ** w_s  x  relative yield ** w_y  x  (1 - monocropPenalty
+             when the crop repeats the previous one)
+               suitability     crop model probability for the crop under that
+                               season's climate and the state's soil nutrients
+               relative yield  yield model estimate / best candidate that season
+                               (1 for every crop without a yield model)
+  carry-over soil' = soil + CARRY_OVER[crop] + RECOVERY x (field soil - soil),
+             rounded to SOIL_STEP and clipped, so legumes rebuild nitrogen
+             and heavy feeders deplete it
+
+The naive search scores every path (candidates ** seasons model calls). Here
+each stage's reachable states are collected first, their distinct soil rows
+are encoded through the crop bundle's encoder (the categorical_values layout
+predict.py uses) and scored with ONE predict_proba call; rows seen before,
+in this plan or an earlier one, come from a process-wide memo keyed by the
+crop artifact's version and the row, so planners rebuilt for a new yield model
+keep it and a retrained crop model never reads its predecessor's entries.
+Yields depend only on season and crop and are scored once per season. A backward pass then
+picks the best crop for every state.
+
+  field      {"nitrogen", "phosphorus", "potassium", "soil_ph", "soilType",
+              "region", "area", ...}  (missing inputs use the crop defaults)
+  seasons    number of seasons to plan (<= MAX_SEASONS), from startSeason
+  climate    {"Kharif": {"temperature", "humidity", "rainfall", "soilMoisture"}, ...}
+             overrides SEASON_CLIMATE
+  crops      candidate crops (default: every annual crop the model knows)
+
+Usage:
+  python ml/rotation_plan.py request.json
+  python ml/rotation_plan.py --benchmark
+Served by predict_server.py as POST /rotation-plan.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import warnings
+
+import numpy as np
+
+warnings.filterwarnings("ignore")
+
+from model_loader import find_model, load_bundle
+from prediction_log import model_version
+from scenario_sweep import unique_rows
+
+SEASONS = ("Kharif", "Rabi", "Zaid")
+MAX_SEASONS = 30
+MEMO_MAX_ROWS = 200000          # memoized crop-model rows kept across plans
+TOP_ALTERNATIVES = 3
+
+# typical conditions per season, in the crop model's input units
+SEASON_CLIMATE = {
+    "Kharif": {"temperature": 29.0, "humidity": 80.0, "rainfall": 180.0, "soilMoisture": 60.0},
+    "Rabi":   {"temperature": 18.0, "humidity": 55.0, "rainfall": 60.0,  "soilMoisture": 35.0},
+    "Zaid":   {"temperature": 32.0, "humidity": 45.0, "rainfall": 50.0,  "soilMoisture": 25.0},
+}
+
+# nutrient change (N, P, K) of one season of each crop, before recovery
+NUTRIENTS = ("nitrogen", "phosphorus", "potassium")
+CARRY_OVER = {
+    "rice":      (-15, -5, -10),
+    "wheat":     (-15, -5, -8),
+    "corn":      (-20, -6, -8),
+    "maize":     (-20, -6, -8),
+    "millet":    (-6, -3, -4),
+    "cotton":    (-12, -5, -10),
+    "jute":      (-10, -4, -8),
+    "sugarcane": (-25, -8, -15),
+    "chickpea":  (15, -4, -4),
+    "lentil":    (15, -3, -4),
+    "groundnut": (12, -5, -6),
+}
+DEFAULT_CARRY_OVER = (-10, -4, -6)
+RECOVERY = 0.15                 # share of the gap to the field's own soil closed each season
+SOIL_STEP = 5
+SOIL_RANGE = ((0, 150), (0, 100), (0, 100))
+# orchard / multi-season crops do not fit a season-by-season rotation
+PERENNIAL = {"apple", "banana", "coconut", "coffee", "grapes", "mango", "papaya", "sugarcane"}
+MONOCROP_PENALTY = 0.3
+
+# (crop model version, encoded row bytes) -> class probabilities, shared by every planner
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def season_sequence(start, n):
+    if start not in SEASONS:
+        raise ValueError(f"startSeason must be one of {SEASONS}")
+    if not 1 <= n <= MAX_SEASONS:
+        raise ValueError(f"seasons must be between 1 and {MAX_SEASONS}")
+    i = SEASONS.index(start)
+    return [SEASONS[(i + k) % len(SEASONS)] for k in range(n)]
+
+
+def quantize(soil):
+    lo = np.array([r[0] for r in SOIL_RANGE])
+    hi = np.array([r[1] for r in SOIL_RANGE])
+    return np.clip(np.round(soil / SOIL_STEP) * SOIL_STEP, lo, hi).astype(np.int32)
+
+
+class RotationPlanner:
+    def __init__(self, crop_bundle, yield_bundle=None):
+        self.crop   = crop_bundle
+        self.yield_ = yield_bundle
+        self.crop_classes = np.asarray(crop_bundle.labels(crop_bundle.model.classes_), dtype=object)
+        enc = crop_bundle.encoder
+        inputs = [enc.aliases.get(c, c) for c in enc.feature_columns]
+        # nutrient columns the crop model reads (legacy 3-feature artifacts have none)
+        self.nutrient_cols = [(k, inputs.index(n)) for k, n in enumerate(NUTRIENTS) if n in inputs]
+        # artifact versions the plans come from (prediction_log.model_version: file, mtime, size)
+        self.versions = {"crop": model_version(crop_bundle.path) if crop_bundle.path else None,
+                         "yield": model_version(yield_bundle.path) if yield_bundle and yield_bundle.path else None}
+        self.memo = _memo
+        self.memo_lock = _memo_lock
+
+    @classmethod
+    def load(cls, crop_path=None, yield_path=None):
+        crop = load_bundle("crop", crop_path)
+        yield_path = yield_path or find_model("yield")
+        return cls(crop, load_bundle("yield", yield_path) if yield_path else None)
+
+    # ── candidates ────────────────────────────────────────────────────────────
+    def candidates(self, crops=None):
+        """Indices into crop_classes of the crops a plan may use."""
+        lookup = {str(c).lower(): i for i, c in enumerate(self.crop_classes)}
+        if crops:
+            unknown = [c for c in crops if str(c).lower() not in lookup]
+            if unknown:
+                raise ValueError(f"crops not known to the crop model: {unknown}")
+            idx = [lookup[str(c).lower()] for c in crops]
+        else:
+            idx = [i for i, c in enumerate(self.crop_classes) if str(c).lower() not in PERENNIAL]
+        return np.array(sorted(set(idx)), dtype=np.intp)
+
+    # ── memoized, batched model evaluation ────────────────────────────────────
+    def suitability(self, base_row, soils):
+        """Crop-model probabilities (len(soils) x classes) of one season's row with each soil."""
+        X = np.repeat(base_row[None, :], len(soils), axis=0)
+        for k, col in self.nutrient_cols:
+            X[:, col] = soils[:, k]
+        U, inv = unique_rows(X)
+        version = self.versions["crop"] or id(self.crop.model)
+        keys = [(version, r.tobytes()) for r in U]
+        with self.memo_lock:
+            cached = [self.memo.get(k) for k in keys]
+        missing = [i for i, c in enumerate(cached) if c is None]
+        if missing:
+            P = self.crop.model.predict_proba(U[missing])
+            with self.memo_lock:
+                if len(self.memo) + len(missing) > MEMO_MAX_ROWS:
+                    self.memo.clear()
+                for i, p in zip(missing, P):
+                    cached[i] = self.memo[keys[i]] = p
+        return np.vstack(cached)[inv], len(missing), len(U) - len(missing)
+
+    def relative_yields(self, field, climate, cand):
+        """(expected yield per candidate or NaN, yield relative to the season's best candidate)."""
+        n = len(cand)
+        if self.yield_ is None:
+            return np.full(n, np.nan), np.ones(n)
+        records = [{**field, **climate, "crop": str(self.crop_classes[c])} for c in cand]
+        Xy, valid = self.yield_.encoder.encode(records)
+        pred = np.full(n, np.nan)
+        if valid.any():
+            pred[valid] = self.yield_.model.predict(Xy[valid])
+        known = valid & (pred > 0)
+        if not known.any():
+            return pred, np.ones(n)
+        rel = np.where(known, pred / np.nanmax(np.where(known, pred, np.nan)), np.nan)
+        return pred, np.where(known, rel, np.nanmean(rel))       # crops the yield model lacks get the mean
+
+    # ── the dynamic program ───────────────────────────────────────────────────
+    def plan(self, field, seasons=6, start="Kharif", climate=None, crops=None, weights=None,
+             monocrop_penalty=MONOCROP_PENALTY):
+        t0 = time.perf_counter()
+        field = dict(field or {})
+        sequence = season_sequence(start, int(seasons))
+        cand = self.candidates(crops)
+        C = len(cand)
+        if C == 0:
+            raise ValueError("no candidate crops")
+        weights = weights or {}
+        w_s, w_y = float(weights.get("suitability", 1.0)), float(weights.get("yield", 1.0))
+        defaults = self.crop.encoder.defaults
+        baseline = np.array([float(field.get(n) if field.get(n) is not None else defaults.get(n, 0.0))
+                             for n in NUTRIENTS])
+        carry = np.array([CARRY_OVER.get(str(self.crop_classes[c]).lower(), DEFAULT_CARRY_OVER) for c in cand])
+
+        # one encoded row and one set of yields per distinct season
+        climates = {s: {**SEASON_CLIMATE[s], **((climate or {}).get(s) or {})} for s in set(sequence)}
+        base_rows, rel_yield, exp_yield = {}, {}, {}
+        for s, clim in climates.items():
+            X, valid = self.crop.encoder.encode([{**field, **clim, "season": s}])
+            if not valid.all():
+                raise ValueError(f"field + {s} climate are missing required crop inputs")
+            base_rows[s] = X[0]
+            exp_yield[s], rel_yield[s] = self.relative_yields(field, clim, cand)
+
+        # forward: reachable states per stage, rewards and transitions
+        soils = quantize(baseline[None, :])                  # distinct soil states at this stage
+        soil_of = np.zeros(1, dtype=np.intp)                 # state -> soil index
+        prev = np.full(1, -1, dtype=np.intp)                 # state -> previous candidate (-1: none)
+        stages, model_rows, memo_hits = [], 0, 0
+        for s in sequence:
+            P, scored, hits = self.suitability(base_rows[s], soils)
+            model_rows += scored
+            memo_hits += hits
+            suit = P[:, cand][soil_of]                                        # (states, C)
+            reward = suit ** w_s * rel_yield[s][None, :] ** w_y
+            reward = np.where(prev[:, None] == np.arange(C)[None, :], reward * (1 - monocrop_penalty), reward)
+            nxt_soil = quantize(soils[:, None, :] + carry[None, :, :]
+                                + RECOVERY * (baseline - soils)[:, None, :])  # (soils, C, 3)
+            flat = nxt_soil.reshape(-1, 3)
+            new_soils, soil_inv = np.unique(flat, axis=0, return_inverse=True)
+            soil_inv = soil_inv.reshape(len(soils), C)[soil_of]               # (states, C)
+            keys = soil_inv * C + np.arange(C)[None, :]                       # next state = (soil, crop)
+            uniq, nxt = np.unique(keys, return_inverse=True)
+            stages.append({"season": s, "soils": soils, "soil_of": soil_of, "prev": prev,
+                           "suit": suit, "reward": reward, "next": nxt.reshape(keys.shape)})
+            soils, soil_of, prev = new_soils, uniq // C, uniq % C
+
+        # backward: best value from every state to the end of the plan
+        V = np.zeros(len(soil_of))
+        for st in reversed(stages):
+            Q = st["reward"] + V[st["next"]]
+            st["Q"] = Q
+            V = Q.max(axis=1)
+
+        # read the plan off the start state
+        out, state = [], 0
+        for k, st in enumerate(stages):
+            Q = st["Q"][state]
+            a = int(np.argmax(Q))
+            before = st["soils"][st["soil_of"][state]]
+            after = quantize(before + carry[a] + RECOVERY * (baseline - before))
+            alt = np.argsort(-Q, kind="stable")[:TOP_ALTERNATIVES]
+            ey = exp_yield[st["season"]][a]
+            out.append({
+                "stage":         k + 1,
+                "season":        st["season"],
+                "crop":          str(self.crop_classes[cand[a]]),
+                "suitability":   round(float(st["suit"][state, a]), 4),
+                "expectedYield": None if np.isnan(ey) else round(float(ey), 3),
+                "reward":        round(float(st["reward"][state, a]), 4),
+                "soilBefore":    {n: int(v) for n, v in zip(NUTRIENTS, before)},
+                "soilAfter":     {n: int(v) for n, v in zip(NUTRIENTS, after)},
+                "alternatives":  [{"crop": str(self.crop_classes[cand[j]]), "value": round(float(Q[j]), 4)}
+                                  for j in alt],
+            })
+            state = int(st["next"][state, a])
+
+        return {
+            "plan":        out,
+            "totalScore":  round(float(stages[0]["Q"][0].max()), 4),
+            "candidates":  [str(self.crop_classes[c]) for c in cand],
+            "yieldModel":  self.yield_ is not None,
+            "stats": {
+                "seasons":          len(sequence),
+                "statesPerStage":   [int(len(st["prev"])) for st in stages],
+                "modelRows":        int(model_rows),
+                "memoHits":         int(memo_hits),
+                "naiveEvaluations": int(sum(C ** k for k in range(len(sequence)))),
+            },
+            "timing_ms": {"total": round((time.perf_counter() - t0) * 1000, 2)},
+        }
+
+
+def run_plan(planner, request):
+    return planner.plan(request.get("field") or {}, seasons=request.get("seasons", 6),
+                        start=request.get("startSeason", "Kharif"), climate=request.get("climate"),
+                        crops=request.get("crops"), weights=request.get("weights"),
+                        monocrop_penalty=float(request.get("monocropPenalty", MONOCROP_PENALTY)))
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+BENCHMARK_REQUEST = {
+    "field": {"nitrogen": 60, "phosphorus": 40, "potassium": 40, "soil_ph": 6.5,
+              "soilType": "Loamy", "region": "North", "area": 2.0},
+    "startSeason": "Kharif",
+}
+
+
+def benchmark(planner):
+    """Plan 3 / 6 / 10 seasons twice each (cold memo, then warm)."""
+    runs = []
+    for n in (3, 6, 10):
+        for memo in ("cold", "warm"):
+            if memo == "cold":
+                planner.memo.clear()
+            result = run_plan(planner, {**BENCHMARK_REQUEST, "seasons": n})
+            runs.append({"seasons": n, "memo": memo, **result["stats"], **result["timing_ms"],
+                         "crops": [p["crop"] for p in result["plan"]]})
+    return {"runs": runs}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Multi-season crop rotation plan for one field.")
+    p.add_argument("request", nargs="?", help="JSON file with field/seasons/startSeason/... ('-' for stdin)")
+    p.add_argument("--crop-model")
+    p.add_argument("--yield-model")
+    p.add_argument("--benchmark", action="store_true", help="time 3 / 6 / 10-season plans")
+    args = p.parse_args(argv)
+
+    try:
+        planner = RotationPlanner.load(args.crop_model, args.yield_model)
+    except FileNotFoundError as e:
+        print(json.dumps({"error": str(e)}))
+        return 2
+
+    if args.benchmark:
+        print(json.dumps(benchmark(planner), indent=2))
+        return 0
+    if args.request:
+        request = json.load(sys.stdin if args.request == "-" else open(args.request, "r", encoding="utf-8"))
+    else:
+        p.print_help()
+        return 2
+    try:
+        result = run_plan(planner, request)
+    except ValueError as e:
+        print(json.dumps({"error": str(e)}))
+        return 2
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+scenario_sweep.py — What-if sweeps over the crop and yield models.
+
+A base input plus axes to vary is expanded into the full cartesian grid as
+columns (np.indices, no per-combination dicts), encoded into one float32
+matrix per model and scored with ONE predict_proba (crop) and ONE predict
+(yield) call over the distinct feature rows. Only the top `limit` rows are
+turned into JSON.
+
+  base    {"temperature": 27, "humidity": 70, "rainfall": 150, "area": 2, ...}
+  axes    {"soilType": ["Clay", "Loamy"], "season": ["Kharif", "Rabi"],
+           "fertilizer": {"start": 0, "stop": 300, "step": 25},
+           "crop": ["Rice", "Wheat"]}
+  sort    "yield" | "total_yield" | "confidence" (default: yield when available)
+
+Without a "crop" axis each row's yield is estimated for the crop the crop
+model recommends; with one, every candidate crop is scored and the crop
+model's probability for it is returned as cropSuitability.
+
+Usage:
+  python ml/scenario_sweep.py request.json
+  python ml/scenario_sweep.py --benchmark
+Served by predict_server.py as POST /sweep.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+warnings.filterwarnings("ignore")
+
+from model_loader import find_model, load_bundle
+
+MAX_COMBINATIONS = 200000
+DEFAULT_LIMIT = 50
+SORT_KEYS = ("yield", "total_yield", "confidence")
+
+
+# ── Grid expansion ────────────────────────────────────────────────────────────
+def _range(spec):
+    start, stop, step = float(spec["start"]), float(spec["stop"]), float(spec.get("step", 1))
+    if not all(map(math.isfinite, (start, stop, step))):
+        raise ValueError("axis start / stop / step must be finite numbers")
+    if step <= 0:
+        raise ValueError("axis step must be > 0")
+    return start, stop, step
+
+
+def axis_length(spec):
+    """Number of values axis_values(spec) yields, computed without building them."""
+    if isinstance(spec, dict):
+        start, stop, step = _range(spec)
+        n = max(0, math.ceil((stop + step / 2 - start) / step))      # len(np.arange(...)) below
+        if n == 0:
+            raise ValueError("axis range is empty (stop < start)")
+        return n
+    if isinstance(spec, (list, tuple)):
+        if not spec:
+            raise ValueError("axis values must not be empty")
+        return len(spec)
+    return 1
+
+
+def axis_values(spec):
+    """A list of values, or {"start", "stop", "step"} for an inclusive numeric range."""
+    if isinstance(spec, dict):
+        start, stop, step = _range(spec)
+        return np.round(np.arange(start, stop + step / 2, step), 6).tolist()
+    if isinstance(spec, (list, tuple)):
+        if not spec:
+            raise ValueError("axis values must not be empty")
+        return list(spec)
+    return [spec]
+
+
+def expand_grid(base, axes, max_combinations=MAX_COMBINATIONS):
+    """DataFrame with one row per combination of the axes; base fills the other columns.
+
+    The size is checked from the axis lengths before any value is built, so an
+    oversized range is rejected without materialising it.
+    """
+    names = list(axes)
+    shape = tuple(axis_length(axes[n]) for n in names)
+    total = math.prod(shape)
+    if total > max_combinations:
+        raise ValueError(f"grid has {total} combinations (max {max_combinations})")
+    values = [axis_values(axes[n]) for n in names]
+    shape = tuple(len(v) for v in values)
+    total = math.prod(shape)
+    cols = {k: np.full(total, v, dtype=object) for k, v in base.items() if k not in axes}
+    if names:
+        idx = np.indices(shape).reshape(len(shape), -1)
+        for n, vals, i in zip(names, values, idx):
+            cols[n] = np.asarray(vals, dtype=object)[i]
+    return pd.DataFrame(cols, index=pd.RangeIndex(total))
+
+
+# ── Scoring ───────────────────────────────────────────────────────────────────
+def unique_rows(X):
+    """(unique rows, inverse index) — axes a model ignores (e.g. fertilizer for the
+    crop model) repeat identical feature rows, which only need scoring once."""
+    X = np.ascontiguousarray(X)
+    keys = X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1]))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return X[first], inverse.ravel()
+
+
+class ScenarioSweeper:
+    def __init__(self, crop_bundle, yield_bundle=None):
+        self.crop  = crop_bundle
+        self.yield_ = yield_bundle
+        self.crop_classes = np.asarray(crop_bundle.labels(crop_bundle.model.classes_), dtype=object)
+
+    @classmethod
+    def load(cls, crop_path=None, yield_path=None):
+        crop = load_bundle("crop", crop_path)
+        yield_path = yield_path or find_model("yield")
+        return cls(crop, load_bundle("yield", yield_path) if yield_path else None)
+
+    def score(self, grid):
+        """Add recommendedCrop / confidence / cropSuitability / predictedYield columns in place."""
+        X, valid = self.crop.encoder.encode(grid)
+        if not valid.all():
+            raise ValueError("base + axes are missing required crop inputs")
+        U, inv = unique_rows(X)
+        proba = self.crop.model.predict_proba(U)[inv]
+        top = proba.argmax(axis=1)
+        grid["recommendedCrop"] = self.crop_classes[top]
+        grid["confidence"] = proba[np.arange(len(top)), top].round(4)
+
+        if "crop" in grid.columns:
+            # crop model's probability for each candidate crop (-1: not a class it knows)
+            lookup = {c.lower(): i for i, c in enumerate(self.crop_classes)}
+            cand = grid["crop"].astype(str).str.lower().map(lookup).fillna(-1).astype(int).to_numpy()
+            known = cand >= 0
+            suit = np.zeros(len(grid))
+            suit[known] = proba[np.flatnonzero(known), cand[known]]
+            grid["cropSuitability"] = np.where(known, suit.round(4), np.nan)
+        else:
+            grid["crop"] = grid["recommendedCrop"]
+
+        if self.yield_ is not None:
+            Xy, yvalid = self.yield_.encoder.encode(grid)
+            pred = np.full(len(grid), np.nan)
+            if yvalid.any():
+                U, inv = unique_rows(Xy[yvalid])
+                pred[yvalid] = self.yield_.model.predict(U)[inv]
+            grid["predictedYield"] = pred.round(3)
+            if "area" in grid.columns:
+                area = pd.to_numeric(grid["area"], errors="coerce").to_numpy(dtype=float)
+                grid["totalYield"] = (pred * area).round(3)
+        return grid
+
+    def sweep(self, base, axes, sort=None, limit=DEFAULT_LIMIT, max_combinations=MAX_COMBINATIONS):
+        t0 = time.perf_counter()
+        grid = expand_grid(base or {}, axes or {}, max_combinations)
+        t_grid = time.perf_counter()
+        self.score(grid)
+        t_score = time.perf_counter()
+
+        if sort is None:
+            sort = "yield" if "predictedYield" in grid.columns else "confidence"
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {SORT_KEYS}")
+        column = {"yield": "predictedYield", "total_yield": "totalYield", "confidence": "confidence"}[sort]
+        if column not in grid.columns:
+            raise ValueError(f"cannot sort by {sort}: yield model or area not available")
+        order = np.argsort(-grid[column].fillna(-np.inf).to_numpy(), kind="stable")[:max(1, int(limit))]
+        top = grid.iloc[order]
+        varied = list(axes or {})
+        out_cols = [c for c in varied + ["recommendedCrop", "confidence", "cropSuitability",
+                                          "predictedYield", "totalYield"] if c in top.columns]
+        if "crop" not in varied and "crop" in out_cols:
+            out_cols.remove("crop")
+        rows = json.loads(top[out_cols].to_json(orient="records"))
+        return {
+            "combinations": int(len(grid)),
+            "axes":         varied,
+            "sort":         sort,
+            "yieldModel":   self.yield_ is not None,
+            "results":      rows,
+            "timing_ms": {
+                "expand": round((t_grid - t0) * 1000, 2),
+                "score":  round((t_score - t_grid) * 1000, 2),
+                "total":  round((time.perf_counter() - t0) * 1000, 2),
+            },
+        }
+
+
+def run_sweep(sweeper, request):
+    return sweeper.sweep(request.get("base", {}), request.get("axes", {}),
+                         sort=request.get("sort"), limit=request.get("limit", DEFAULT_LIMIT))
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+BENCHMARK_REQUEST = {
+    "base": {"temperature": 27, "humidity": 70, "rainfall": 150, "soil_ph": 6.5,
+             "nitrogen": 60, "phosphorus": 40, "potassium": 40, "area": 2.0},
+    "axes": {
+        "soilType":     ["Clay", "Loamy", "Sandy", "Red", "Black"],
+        "season":       ["Kharif", "Rabi", "Zaid"],
+        "region":       ["North", "South", "East", "West", "Central"],
+        "fertilizer":   {"start": 0, "stop": 300, "step": 10},
+        "soilMoisture": [20, 35, 50, 65, 80],
+        "crop":         ["Rice", "Wheat", "Maize", "Cotton", "Sugarcane"],
+    },
+    "limit": 20,
+}
+
+
+def benchmark(sweeper):
+    """Time the benchmark grid at ~13k and ~58k combinations."""
+    runs = []
+    for step in (50, 10):
+        request = json.loads(json.dumps(BENCHMARK_REQUEST))
+        request["axes"]["fertilizer"]["step"] = step
+        result = run_sweep(sweeper, request)
+        runs.append({"combinations": result["combinations"], "sort": result["sort"],
+                     "yieldModel": result["yieldModel"], **result["timing_ms"]})
+    return {"runs": runs}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="What-if sweep over the crop and yield models.")
+    p.add_argument("request", nargs="?", help="JSON file with base/axes/sort/limit ('-' for stdin)")
+    p.add_argument("--crop-model")
+    p.add_argument("--yield-model")
+    p.add_argument("--benchmark", action="store_true", help="time ~13k and ~58k-combination sweeps")
+    args = p.parse_args(argv)
+
+    try:
+        sweeper = ScenarioSweeper.load(args.crop_model, args.yield_model)
+    except FileNotFoundError as e:
+        print(json.dumps({"error": str(e)}))
+        return 2
+
+    if args.benchmark:
+        print(json.dumps(benchmark(sweeper), indent=2))
+        return 0
+    if args.request:
+        request = json.load(sys.stdin if args.request == "-" else open(args.request, "r", encoding="utf-8"))
+    else:
+        p.print_help()
+        return 2
+    try:
+        result = run_sweep(sweeper, request)
+    except ValueError as e:
+        print(json.dumps({"error": str(e)}))
+        return 2
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
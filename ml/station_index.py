@@ -0,0 +1,271 @@
+"""
+station_index.py — Nearest weather-station lookup for farm coordinates.
+
+Every city with WeatherData rows that carry lat/lon is a station holding its
+latest observation (soilMoisture, rainfall, temperature, humidity). Station
+positions are unit vectors on the sphere in a scipy cKDTree — chord distance
+orders exactly like great-circle distance, and a single-point query is a few
+tens of microseconds.
+
+  nearest(lat, lon, k)   k closest stations with an observation newer than
+                         max_age_hours, plus inverse-distance-weighted
+                         (1/d^2) soilMoisture / rainfall / temperature
+
+refresh() reads only WeatherData rows newer than its watermark (the
+{createdAt: -1} index; the first refresh aggregates just the newest rows per
+city) and swaps in a new immutable snapshot, so lookups never take a lock.
+New readings for known cities only replace the value arrays; the tree is
+rebuilt only when a city appears (or moves). predict_server.py keeps one index
+refreshed every STATION_REFRESH_S seconds (default 60) and serves
+GET /nearest-stations?lat=..&lon=..&k=3&maxAgeHours=24.
+
+Usage:
+  python ml/station_index.py 18.52 73.86 [--k 3] [--max-age-hours 24]
+  python ml/station_index.py --benchmark        # synthetic stations, lookup timing
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+VALUES = ("soilMoisture", "rainfall", "temperature", "humidity")
+IDW_VALUES = ("soilMoisture", "rainfall", "temperature")
+IDW_POWER = 2
+MIN_DISTANCE_KM = 0.1          # a farm on top of a station takes (almost) all its weight
+DEFAULT_K = 3
+DEFAULT_MAX_AGE_H = float(os.environ.get("STATION_MAX_AGE_H", "24"))
+REFRESH_S = float(os.environ.get("STATION_REFRESH_S", "60"))
+
+
+def normalize_city(city):
+    return str(city or "").strip().lower()
+
+
+def to_unit(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    c = np.cos(lat)
+    return np.stack([c * np.cos(lon), c * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _epoch(ts):
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if ts.tzinfo is None:              # pymongo hands back naive UTC
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class _Snapshot:
+    """Immutable view used by lookups: tree + per-station lists in the same order."""
+    __slots__ = ("cities", "coords", "tree", "values", "observed")
+
+    def __init__(self, cities, coords, tree, values, observed):
+        self.cities, self.coords, self.tree = cities, coords, tree
+        self.values, self.observed = values, observed
+
+
+class StationIndex:
+    def __init__(self):
+        self._stations = {}      # city -> {"lat", "lon", "observed", <values>}
+        self._snap = _Snapshot([], [], None, [], [])
+        self._write_lock = threading.Lock()
+        self.watermark = None
+        self.rebuilds = 0
+        self.unlocated = set()   # cities seen without coordinates
+
+    # ── Ingest ────────────────────────────────────────────────────────────────
+    def add_observations(self, rows):
+        """Fold WeatherData-like dicts (city, lat, lon, createdAt, values) into the index.
+
+        Rows without coordinates update a known station's values (same city)
+        or are counted as unlocated. Returns the number of rows applied.
+        """
+        applied = 0
+        with self._write_lock:
+            structural = False
+            for row in rows:
+                city = normalize_city(row.get("city"))
+                if not city:
+                    continue
+                observed = _epoch(row.get("createdAt") or time.time())
+                st = self._stations.get(city)
+                lat, lon = row.get("lat"), row.get("lon")
+                if lat is not None and lon is not None:
+                    lat, lon = float(lat), float(lon)
+                    if st is None or (st["lat"], st["lon"]) != (lat, lon):
+                        structural = True
+                        st = self._stations.setdefault(city, {"observed": -math.inf})
+                        st["lat"], st["lon"] = lat, lon
+                        self.unlocated.discard(city)
+                elif st is None:
+                    self.unlocated.add(city)
+                    continue
+                if observed >= st["observed"]:
+                    st["observed"] = observed
+                    for v in VALUES:
+                        value = row.get(v)
+                        st[v] = float(value) if value is not None else math.nan
+                applied += 1
+            if applied:
+                self._publish(structural)
+        return applied
+
+    def _publish(self, structural):
+        old = self._snap
+        cities = list(self._stations) if structural else old.cities
+        sts = [self._stations[c] for c in cities]
+        # plain lists: lookups touch k entries, where numpy scalar access costs more than it saves
+        values = [tuple(s.get(v, math.nan) for v in VALUES) for s in sts]
+        observed = [s["observed"] for s in sts]
+        if structural:
+            coords = [(s["lat"], s["lon"]) for s in sts]
+            tree = cKDTree(to_unit(*np.array(coords).T)) if coords else None
+            self.rebuilds += 1
+        else:
+            coords, tree = old.coords, old.tree
+        self._snap = _Snapshot(cities, coords, tree, values, observed)
+
+    def refresh(self, db):
+        """Pull WeatherData rows newer than the watermark from Mongo. Returns rows read."""
+        fields = {"_id": 0, "city": 1, "lat": 1, "lon": 1, "createdAt": 1, **{v: 1 for v in VALUES}}
+        if self.watermark is None:
+            rows = self._latest_per_city(db, fields)
+        else:
+            rows = list(db["weatherdatas"].find({"createdAt": {"$gt": self.watermark}}, fields).sort("createdAt", 1))
+        if rows:
+            self.add_observations(rows)
+            self.watermark = rows[-1]["createdAt"]
+        return len(rows)
+
+    @staticmethod
+    def _latest_per_city(db, fields):
+        """First refresh: per city, the newest row with coordinates and the newest row overall
+        (older rows may predate stored lat/lon), oldest first — not the whole collection."""
+        def newest(match):
+            pipeline = [{"$match": match}, {"$sort": {"createdAt": -1}},
+                        {"$group": {"_id": "$city", "doc": {"$first": "$$ROOT"}}},
+                        {"$replaceRoot": {"newRoot": "$doc"}}, {"$project": fields}]
+            return list(db["weatherdatas"].aggregate(pipeline, allowDiskUse=True))
+        rows = newest({"lat": {"$ne": None}, "lon": {"$ne": None}}) + newest({})
+        return sorted(rows, key=lambda r: _epoch(r.get("createdAt") or 0))
+
+    def start_refresh(self, interval=REFRESH_S, uri="mongodb://127.0.0.1:27017/"):
+        """Background refresh loop (daemon thread); stops quietly if pymongo is missing."""
+        def loop():
+            try:
+                from pymongo import MongoClient
+            except ImportError:
+                print("station_index: pymongo not installed, station lookups stay empty", file=sys.stderr)
+                return
+            db = MongoClient(uri, serverSelectionTimeoutMS=3000)["smart_irrigation"]
+            while True:
+                try:
+                    self.refresh(db)
+                except Exception as e:
+                    print(f"station_index: refresh failed: {e}", file=sys.stderr)
+                time.sleep(interval)
+        threading.Thread(target=loop, name="station-refresh", daemon=True).start()
+
+    # ── Lookup ────────────────────────────────────────────────────────────────
+    def nearest(self, lat, lon, k=DEFAULT_K, max_age_hours=DEFAULT_MAX_AGE_H, now=None):
+        snap = self._snap
+        n = len(snap.cities)
+        result = {"lat": lat, "lon": lon, "k": k, "stations": [], "estimate": None}
+        if n == 0 or k < 1:
+            return result
+        la, lo = math.radians(lat), math.radians(lon)
+        c = math.cos(la)
+        # over-fetch so stale stations can be skipped without a second query
+        kq = min(n, max(4 * k, 16))
+        chord, idx = snap.tree.query((c * math.cos(lo), c * math.sin(lo), math.sin(la)), k=kq)
+        chord, idx = ([chord], [idx]) if kq == 1 else (chord.tolist(), idx.tolist())
+        cutoff = (now or time.time()) - max_age_hours * 3600 if max_age_hours else -math.inf
+        picked = []
+        for d, i in zip(chord, idx):
+            if snap.observed[i] >= cutoff:
+                picked.append((i, 2 * EARTH_RADIUS_KM * math.asin(min(1.0, d / 2))))
+                if len(picked) == k:
+                    break
+        if not picked:
+            return result
+        weights = [1.0 / max(d, MIN_DISTANCE_KM) ** IDW_POWER for _, d in picked]
+        total = sum(weights)
+        estimate = {}
+        for j, name in enumerate(VALUES):
+            if name not in IDW_VALUES:
+                continue
+            pairs = [(w, snap.values[i][j]) for w, (i, _) in zip(weights, picked) if snap.values[i][j] == snap.values[i][j]]
+            wsum = sum(w for w, _ in pairs)
+            estimate[name] = round(sum(w * v for w, v in pairs) / wsum, 2) if pairs else None
+        result["stations"] = [
+            {"city": snap.cities[i], "lat": snap.coords[i][0], "lon": snap.coords[i][1],
+             "distanceKm": round(d, 2), "weight": round(w / total, 4),
+             "observedAt": datetime.fromtimestamp(snap.observed[i], timezone.utc).isoformat(),
+             **{name: (None if v != v else v) for name, v in zip(VALUES, snap.values[i])}}
+            for (i, d), w in zip(picked, weights)
+        ]
+        result["estimate"] = estimate
+        return result
+
+    def stats(self):
+        snap = self._snap
+        return {"stations": len(snap.cities), "unlocated": len(self.unlocated), "rebuilds": self.rebuilds,
+                "watermark": self.watermark.isoformat() if hasattr(self.watermark, "isoformat") else self.watermark}
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def _benchmark(n_stations=2000, n_queries=20000, seed=42):
+    rng = np.random.default_rng(seed)
+    index = StationIndex()
+    now = time.time()
+    lat, lon = rng.uniform(8, 35, n_stations), rng.uniform(68, 97, n_stations)   # India-sized box
+    t0 = time.perf_counter()
+    index.add_observations([{"city": f"station-{i}", "lat": lat[i], "lon": lon[i], "createdAt": now,
+                             "soilMoisture": 40.0, "rainfall": 1.0, "temperature": 28.0, "humidity": 70.0}
+                            for i in range(n_stations)])
+    build_ms = (time.perf_counter() - t0) * 1000
+    q_lat, q_lon = rng.uniform(8, 35, n_queries), rng.uniform(68, 97, n_queries)
+    t0 = time.perf_counter()
+    for a, b in zip(q_lat, q_lon):
+        index.nearest(float(a), float(b), k=DEFAULT_K)
+    lookup_us = (time.perf_counter() - t0) * 1e6 / n_queries
+    t0 = time.perf_counter()
+    index.add_observations([{"city": "station-0", "createdAt": now + 1, "soilMoisture": 55.0}])
+    update_ms = (time.perf_counter() - t0) * 1000
+    return {"stations": n_stations, "queries": n_queries, "build_ms": round(build_ms, 2),
+            "lookup_us": round(lookup_us, 2), "value_update_ms": round(update_ms, 3)}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Nearest weather stations + IDW estimate for a coordinate.")
+    p.add_argument("lat", type=float, nargs="?")
+    p.add_argument("lon", type=float, nargs="?")
+    p.add_argument("--k", type=int, default=DEFAULT_K)
+    p.add_argument("--max-age-hours", type=float, default=DEFAULT_MAX_AGE_H)
+    p.add_argument("--benchmark", action="store_true")
+    args = p.parse_args(argv)
+    if args.benchmark:
+        print(json.dumps(_benchmark(), indent=2))
+        return 0
+    if args.lat is None or args.lon is None:
+        p.error("lat and lon are required")
+    from pymongo import MongoClient
+    index = StationIndex()
+    index.refresh(MongoClient("mongodb://127.0.0.1:27017/", serverSelectionTimeoutMS=3000)["smart_irrigation"])
+    print(json.dumps({**index.nearest(args.lat, args.lon, args.k, args.max_age_hours), "index": index.stats()},
+                     indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Shared fixtures for the ml/ tests — the scripts import their siblings, so ml/ goes on sys.path."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def toy_data():
+    """Small float32 classification / regression problem with interacting features."""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(1500, 6)).astype(np.float32)
+    y_cls = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int) + (X[:, 3] > 1)
+    y_reg = 3 * X[:, 0] + X[:, 1] ** 2 + rng.normal(scale=0.1, size=len(X))
+    return X, y_cls, y_reg
+
+
+@pytest.fixture(scope="session")
+def toy_forests(toy_data):
+    from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+    X, y_cls, y_reg = toy_data
+    clf = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0).fit(X, y_cls)
+    reg = RandomForestRegressor(n_estimators=25, max_depth=8, random_state=0).fit(X, y_reg)
+    return clf, reg
+
+
+@pytest.fixture(scope="session")
+def crop_bundle():
+    """Small crop forest on the shared crop profile table, wrapped like a loaded artifact."""
+    from sklearn.ensemble import RandomForestClassifier
+    from crop_data import CAT_COLS, NUMERIC_COLS, generate_frame
+    from feature_encoder import crop_encoder
+    from model_loader import bundle_from_payload
+    df = generate_frame(seed=42)
+    encoder = crop_encoder(NUMERIC_COLS, CAT_COLS).fit(df)
+    X = encoder.transform(df)
+    model = RandomForestClassifier(n_estimators=20, max_depth=10, random_state=0).fit(X, df["crop"])
+    payload = {"model": model, "feature_columns": encoder.feature_columns,
+               "categorical_values": encoder.categorical_values, "encoder": encoder}
+    bundle = bundle_from_payload("crop", payload)
+    bundle.X = X                   # encoded training rows, for parity checks
+    return bundle
+
+
+@pytest.fixture(scope="session")
+def yield_bundle():
+    """Small yield forest on seed_yield_sample_data-style rows."""
+    from sklearn.ensemble import RandomForestRegressor
+    import pandas as pd
+    from feature_encoder import yield_encoder
+    from model_loader import bundle_from_payload
+    rng = np.random.default_rng(1)
+    crops = ["rice", "wheat", "maize", "chickpea", "cotton", "lentil"]
+    df = pd.DataFrame({"area": rng.uniform(0.5, 20, 600), "rainfall": rng.uniform(50, 800, 600),
+                       "temperature": rng.uniform(12, 38, 600), "fertilizer": rng.uniform(0, 300, 600),
+                       "crop": rng.choice(crops, 600)})
+    base = df["crop"].map({c: 1.5 + i for i, c in enumerate(crops)})
+    y = base * (0.5 + df["rainfall"] / 800) * (1 + df["fertilizer"] / 600)
+    encoder = yield_encoder().fit(df)
+    model = RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0).fit(encoder.transform(df), y)
+    return bundle_from_payload("yield", {"model": model, "encoder": encoder,
+                                         "feature_columns": encoder.feature_columns})
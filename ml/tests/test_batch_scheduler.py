@@ -0,0 +1,94 @@
+import threading
+from collections import Counter
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pytest
+
+import batch_scheduler
+from batch_scheduler import (DECISION_TITLE, DECISION_TYPE, decide, make_stub_server, run_batch,
+                             stub_weather, weather_arrays)
+
+USERS = [
+    {"email": "a@x.in", "phone": "+911", "location": "Pune"},
+    {"email": "b@x.in", "phone": "",     "location": "  pune "},
+    {"email": "c@x.in", "phone": "+913", "location": "PUNE"},
+    {"email": "d@x.in", "phone": "",     "location": "New  Delhi"},
+    {"email": "e@x.in", "phone": "+915", "location": "new delhi"},
+    {"email": "f@x.in", "phone": "+916", "location": "Atlantis"},
+    {"email": "g@x.in", "phone": "",     "location": " ATLANTIS"},
+    {"email": "h@x.in", "phone": "",     "location": "Nagpur"},
+    {"email": "i@x.in", "phone": "+919", "location": "   "},
+]
+
+
+def make_decision(w):
+    """Line-for-line port of makeDecision in backend/services/irrigationScheduler.js."""
+    temp = (w.get("main") or {}).get("temp", 25)
+    humidity = (w.get("main") or {}).get("humidity", 60)
+    rain1h = (w.get("rain") or {}).get("1h", 0)
+    rain3h = (w.get("rain") or {}).get("3h", 0)
+    desc = ((w.get("weather") or [{}])[0] or {}).get("description", "")
+    if rain1h > 1 or rain3h > 3 or "rain" in desc or humidity > 80:
+        return "no-action", "✅ No Irrigation Needed"
+    if temp > 32 and humidity < 45:
+        return "irrigate", "🔴 Irrigate Now!"
+    if temp > 26 or humidity < 60:
+        return "caution", "🟡 Monitor Your Crops"
+    return "no-action", "✅ Conditions Are Good"
+
+
+@pytest.fixture
+def stub():
+    server = make_stub_server(0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_one_fetch_per_location_and_failures_skip_users(stub, monkeypatch):
+    real, fetches = batch_scheduler._get_json, Counter()
+
+    def counting(url, timeout):
+        city = parse_qs(urlsplit(url).query)["q"][0]
+        fetches[city] += 1
+        if city == "atlantis":
+            raise HTTPError(url, 404, "city not found", {}, None)
+        return real(url, timeout)
+
+    monkeypatch.setattr(batch_scheduler, "_get_json", counting)
+    weather_docs, notifications, sms, summary = run_batch(USERS, "stub", stub, concurrency=4)
+
+    assert fetches == {"pune": 1, "new delhi": 1, "atlantis": 1, "nagpur": 1}
+    assert summary["users"] == 8 and summary["locations"] == 4
+    assert summary["fetched"] == 3 and summary["failed"] == 1
+
+    # the failed location's users get nothing; everyone else gets one notification
+    assert [n["userId"] for n in notifications] == ["a@x.in", "b@x.in", "c@x.in", "d@x.in", "e@x.in", "h@x.in"]
+    assert [m["to"] for m in sms] == ["+911", "+913", "+915"]
+    assert sorted(d["cityKey"] for d in weather_docs) == ["nagpur", "new delhi", "pune"]
+
+    for n in notifications:
+        assert (n["type"], n["title"]) == make_decision(stub_weather(n["location"]))
+
+
+def test_decide_matches_make_decision_thresholds():
+    weathers = [stub_weather(f"City {i}") for i in range(300)]
+    # edges of every threshold, plus missing sections falling back to makeDecision's defaults
+    for temp in (26, 26.01, 32, 32.01):
+        for hum in (44.99, 45, 59.99, 60, 80, 80.01):
+            weathers.append({"main": {"temp": temp, "humidity": hum}})
+    weathers += [{}, {"rain": {"1h": 1}}, {"rain": {"1h": 1.01}}, {"rain": {"3h": 3.01}},
+                 {"weather": [{"description": "heavy intensity rain"}], "main": {"temp": 35, "humidity": 20}}]
+    codes = decide(weather_arrays(weathers))
+    got = [(DECISION_TYPE[c], DECISION_TITLE[c]) for c in codes.tolist()]
+    assert got == [make_decision(w) for w in weathers]
+    assert len(np.unique(codes)) == 4
+
+
+@pytest.mark.parametrize("value,wait", [("3", 3.0), ("0.5", 0.5), (None, 1.0),
+                                        ("Wed, 21 Oct 2026 07:28:00 GMT", 1.0), ("soon", 1.0)])
+def test_retry_after_falls_back_to_one_second(value, wait):
+    assert batch_scheduler._retry_after({} if value is None else {"Retry-After": value}) == wait
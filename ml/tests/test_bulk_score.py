@@ -0,0 +1,113 @@
+import csv
+import json
+
+import joblib
+import pytest
+
+import bulk_score
+from bulk_score import parse_args, read_chunks, read_records
+from crop_data import generate_frame
+
+ROWS = 23
+CHUNK = 5
+
+
+@pytest.fixture(scope="module")
+def model_path(crop_bundle, tmp_path_factory):
+    path = tmp_path_factory.mktemp("model") / "crop.pkl"
+    joblib.dump(crop_bundle.payload, path)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def records():
+    df = generate_frame(seed=42).drop(columns="crop").sample(ROWS, random_state=0)
+    df.insert(0, "farmerId", [f"F{i:03d}" for i in range(ROWS)])
+    return df.to_dict("records")
+
+
+def write_input(path, records):
+    if str(path).endswith(".csv"):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=list(records[0]))
+            w.writeheader()
+            w.writerows(records)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(r) + "\n" for r in records)
+    return str(path)
+
+
+def score(model_path, src, out, *extra):
+    argv = ["crop", src, str(out), "--model", model_path, "--workers", "1",
+            "--chunk-size", str(CHUNK), "--quiet", *extra]
+    return bulk_score.run(parse_args(argv))
+
+
+def expected(crop_bundle, src):
+    recs = list(read_records(src))
+    return [r["predictedCrop"] for r in crop_bundle.score(recs)]
+
+
+def scored(out):
+    if str(out).endswith(".csv"):
+        with open(out, "r", encoding="utf-8", newline="") as f:
+            return [(r["farmerId"], r["predictedCrop"]) for r in csv.DictReader(f)]
+    with open(out, "r", encoding="utf-8") as f:
+        return [(r["farmerId"], r["predictedCrop"]) for r in map(json.loads, f)]
+
+
+@pytest.mark.parametrize("ext", [".csv", ".ndjson"])
+def test_chunked_scoring_matches_bundle(crop_bundle, model_path, records, tmp_path, ext):
+    src = write_input(tmp_path / f"in{ext}", records)
+    out = tmp_path / f"out{ext}"
+    assert [len(c) for c in read_chunks(src, CHUNK)] == [5, 5, 5, 5, 3]
+
+    assert score(model_path, src, out) == 0
+    ids = [r["farmerId"] for r in records]
+    assert scored(out) == list(zip(ids, expected(crop_bundle, src)))
+    progress = json.loads((tmp_path / f"out{ext}.progress.json").read_text())
+    assert progress["done"] and progress["chunks_done"] == 5 and progress["rows_done"] == ROWS
+
+
+@pytest.mark.parametrize("ext", [".csv", ".ndjson"])
+def test_resume_truncates_partial_chunk(crop_bundle, model_path, records, tmp_path, monkeypatch, ext):
+    src = write_input(tmp_path / f"in{ext}", records)
+    out = tmp_path / f"out{ext}"
+
+    # die on the third chunk, after two checkpoints
+    real, calls = bulk_score._score_chunk, []
+
+    def flaky(recs):
+        calls.append(len(recs))
+        if len(calls) == 3:
+            raise RuntimeError("worker died")
+        return real(recs)
+
+    monkeypatch.setattr(bulk_score, "_score_chunk", flaky)
+    with pytest.raises(RuntimeError):
+        score(model_path, src, out)
+    monkeypatch.setattr(bulk_score, "_score_chunk", real)
+
+    progress = json.loads((tmp_path / f"out{ext}.progress.json").read_text())
+    assert progress["chunks_done"] == 2 and progress["rows_done"] == 10 and not progress["done"]
+    assert out.stat().st_size == progress["output_bytes"]
+
+    # a half-written row past the checkpoint must be dropped on resume
+    with open(out, "a", encoding="utf-8") as f:
+        f.write("F999,half-a-row")
+    assert score(model_path, src, out, "--resume") == 0
+
+    ids = [r["farmerId"] for r in records]
+    assert scored(out) == list(zip(ids, expected(crop_bundle, src)))
+    assert score(model_path, src, out, "--resume") == 0     # already complete: untouched
+    assert len(scored(out)) == ROWS
+
+
+def test_resume_rejects_other_chunk_size(model_path, records, tmp_path):
+    src = write_input(tmp_path / "in.csv", records)
+    out = tmp_path / "out.csv"
+    bulk_score.save_progress(parse_args(["crop", src, str(out), "--chunk-size", "7"]), 1, 7, 0)
+    out.write_text("")
+    with pytest.raises(SystemExit, match="chunk_size"):
+        score(model_path, src, out, "--resume")
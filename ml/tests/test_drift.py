@@ -0,0 +1,22 @@
+import numpy as np
+
+from drift import DriftMonitor, build_reference
+
+
+def test_batch_observe_matches_row_by_row(crop_bundle):
+    ref = build_reference(crop_bundle.encoder, crop_bundle.X)
+    rows = DriftMonitor(crop_bundle.encoder, ref, block_rows=16)
+    batch = DriftMonitor(crop_bundle.encoder, ref, block_rows=16)
+    X = np.asarray(crop_bundle.X[:45], dtype=np.float32)
+
+    for x in X:
+        rows.observe(x)
+    batch.observe(X[:3])          # partial block, then batches straddling two block boundaries
+    batch.observe(X[3:40])
+    batch.observe(X[40:41].reshape(-1))
+    batch.observe(X[41:])
+
+    a, b = rows.report(), batch.report()
+    assert a["rows"] == b["rows"] == 45
+    a.pop("since"), b.pop("since")
+    assert a == b
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from early_exit import ProgressiveForest
+from model_compact import compact_model
+
+
+@pytest.fixture(scope="module")
+def crop_rows(crop_bundle):
+    return np.ascontiguousarray(crop_bundle.X, dtype=np.float32)
+
+
+@pytest.mark.parametrize("block_size", [1, 5])
+def test_exact_mode_matches_forest(crop_bundle, crop_rows, block_size):
+    model = crop_bundle.model
+    result = ProgressiveForest(model, block_size=block_size).predict(crop_rows)
+    np.testing.assert_array_equal(result.labels, model.predict(crop_rows))
+    assert result.n_trees == len(model.estimators_)
+    assert result.trees_used.max() <= result.n_trees
+    assert result.trees_used.mean() < result.n_trees        # most rows are decided early
+
+
+def test_exact_mode_matches_compact_forest(crop_bundle, crop_rows):
+    compact = compact_model(crop_bundle.model)
+    result = ProgressiveForest(compact, block_size=3).predict(crop_rows)
+    np.testing.assert_array_equal(result.labels, compact.predict(crop_rows))
+
+
+def test_exact_mode_matches_xgboost(toy_data):
+    xgb = pytest.importorskip("xgboost")
+    X, y, _ = toy_data
+    model = xgb.XGBClassifier(n_estimators=60, max_depth=4, random_state=0).fit(X, y)
+    result = ProgressiveForest(model, block_size=4).predict(X)
+    np.testing.assert_array_equal(result.labels, model.predict(X))
+    assert result.trees_used.max() <= result.n_trees
+
+
+def test_confidence_mode_uses_fewer_trees(crop_bundle, crop_rows):
+    pf = ProgressiveForest(crop_bundle.model, block_size=2)
+    exact = pf.predict(crop_rows)
+    fast = pf.predict(crop_rows, confidence=0.6)
+    assert fast.trees_used.sum() <= exact.trees_used.sum()
+    assert np.mean(fast.labels == exact.labels) > 0.95
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from explain import TreeExplainer
+from model_compact import CompactForest
+
+
+@pytest.mark.parametrize("which", [0, 1], ids=["classifier", "regressor"])
+def test_contributions_add_up_to_model_output(toy_data, toy_forests, which):
+    X = toy_data[0][:300]
+    ex = TreeExplainer(toy_forests[which])
+    assert ex.additivity(X) <= ex.tolerance
+
+
+@pytest.mark.parametrize("which", [0, 1], ids=["classifier", "regressor"])
+@pytest.mark.parametrize("prune", [0.0, 0.05])
+def test_compact_forest_explains_like_sklearn(toy_data, toy_forests, which, prune):
+    X = toy_data[0][:300]
+    model = toy_forests[which]
+    cf = CompactForest.from_sklearn(model, prune)
+    ex = TreeExplainer(cf)
+    assert ex.additivity(X) <= ex.tolerance
+    if prune == 0.0:
+        # internal values rebuilt from leaf weights are the sklearn node values (float32 leaves)
+        _, _, bias, contrib = TreeExplainer(model).explain(X)
+        _, _, cbias, ccontrib = ex.explain(X)
+        np.testing.assert_allclose(cbias, bias, atol=1e-6)
+        np.testing.assert_allclose(ccontrib, contrib, atol=1e-5)
+
+
+def test_compact_forest_without_leaf_weights_is_not_explained(toy_forests):
+    cf = CompactForest.from_sklearn(toy_forests[0])
+    del cf.leaf_weight          # artifacts compacted before leaf weights were stored
+    assert not TreeExplainer.supports(cf)
+    with pytest.raises(TypeError):
+        TreeExplainer(cf)
+
+
+def test_xgboost_contributions_add_up(toy_data):
+    xgb = pytest.importorskip("xgboost")
+    X, y_cls, _ = toy_data
+    model = xgb.XGBClassifier(n_estimators=20, max_depth=4).fit(X, y_cls)
+    ex = TreeExplainer(model)
+    assert ex.additivity(X[:200]) <= ex.tolerance
@@ -0,0 +1,139 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+import history_archive as ha
+
+NOW = datetime.now(timezone.utc).replace(microsecond=123000)
+COLUMNS = ["createdAt", "nitrogen", "potassium", "predictedLabel", "userEmail"]
+
+
+def _aware(v):
+    return v.replace(tzinfo=timezone.utc) if isinstance(v, datetime) and v.tzinfo is None else v
+
+
+def _match(doc, query):
+    for field, cond in query.items():
+        v = _aware(doc.get(field))
+        if not isinstance(cond, dict):
+            if v != cond:
+                return False
+            continue
+        for op, x in cond.items():
+            if op == "$in" and v not in x:
+                return False
+            if op == "$lt" and not (v is not None and v < _aware(x)):
+                return False
+            if op == "$gte" and not (v is not None and v >= _aware(x)):
+                return False
+            if op == "$not" and v is not None and v < _aware(x["$lt"]):
+                return False
+    return True
+
+
+class Cursor(list):
+    def sort(self, field, direction):
+        return Cursor(sorted(self, key=lambda d: d[field], reverse=direction < 0))
+
+    def batch_size(self, n):
+        return self
+
+
+class Deleted:
+    def __init__(self, n):
+        self.deleted_count = n
+
+
+class FakeCollection:
+    """The slice of pymongo's Collection that compact() and read_history() use."""
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    def find(self, query=None, projection=None):
+        out = []
+        for d in self.docs:
+            if _match(d, query or {}):
+                d = dict(d)
+                if projection and projection.get("_id") == 0:
+                    d.pop("_id", None)
+                out.append(d)
+        return Cursor(out)
+
+    def delete_many(self, query):
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not _match(d, query)]
+        return Deleted(before - len(self.docs))
+
+
+@pytest.fixture
+def db():
+    docs = []
+    for i in range(300):
+        t = (NOW - timedelta(days=200) + timedelta(hours=11 * i)).replace(tzinfo=None)   # as pymongo returns it
+        docs.append({"_id": os.urandom(12), "nitrogen": 40 + i % 7, "potassium": None if i % 5 == 0 else 30,
+                     "predictedLabel": ["Good", 'Bad "x"', None][i % 3], "userEmail": f"u{i % 4}@x",
+                     "createdAt": t, "__v": 0})
+    return {"soilpredictions": FakeCollection(docs)}
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(ha, "FLUSH_ROWS", 25)     # several segments per month
+    return ha.Archive(str(tmp_path))
+
+
+def history(db, root):
+    return ha.read_history(db, "soilpredictions", archive=ha.Archive(root))[COLUMNS].reset_index(drop=True)
+
+
+def test_compact_writes_each_row_once_and_merges_months(db, archive, monkeypatch):
+    before = history(db, archive.root)
+    written = []
+    write = archive.write_partition
+    monkeypatch.setattr(archive, "write_partition",
+                        lambda name, month, cols, n: (written.append(n), write(name, month, cols, n))[1])
+
+    out = ha.compact(db, ["soilpredictions"], 90, archive=archive)["collections"]["soilpredictions"]
+    old = len(before) - len(db["soilpredictions"].docs)
+    assert old > 3 * ha.FLUSH_ROWS
+    assert out["archived"] == out["deleted"] == old
+    # segments hold only their own batch; the one rewrite per month is the final merge
+    parts = archive.partitions("soilpredictions")
+    assert len(parts) == len({p["month"] for p in parts})
+    assert sum(written) == old + sum(p["rows"] for p in parts if p["rows"] > ha.FLUSH_ROWS)
+    pd.testing.assert_frame_equal(before, history(db, archive.root), check_dtype=False)
+
+
+def test_crash_between_write_and_delete_then_rerun(db, archive, monkeypatch):
+    before = history(db, archive.root)
+    live = db["soilpredictions"]
+    calls = []
+
+    def crash(query):
+        calls.append(1)
+        if len(calls) == 3:
+            raise ConnectionError("mongo went away")
+        return FakeCollection.delete_many(live, query)
+
+    monkeypatch.setattr(live, "delete_many", crash)
+    with pytest.raises(ConnectionError):
+        ha.compact(db, ["soilpredictions"], 90, archive=archive)
+
+    # the third segment is archived and behind the watermark but still in Mongo: read once
+    assert ha.Archive(archive.root).watermark("soilpredictions") is not None
+    pd.testing.assert_frame_equal(before, history(db, archive.root), check_dtype=False)
+
+    monkeypatch.undo()
+    monkeypatch.setattr(ha, "FLUSH_ROWS", 25)
+    rerun = ha.compact(db, ["soilpredictions"], 90, archive=ha.Archive(archive.root))
+    total = ha.Archive(archive.root).stats()["soilpredictions"]["rows"]
+    assert total == len(before) - len(live.docs)
+    assert rerun["collections"]["soilpredictions"]["deleted"] == total - 50
+    pd.testing.assert_frame_equal(before, history(db, archive.root), check_dtype=False)
+
+    again = ha.compact(db, ["soilpredictions"], 90, archive=ha.Archive(archive.root))
+    assert again["collections"]["soilpredictions"]["archived"] == 0
+    pd.testing.assert_frame_equal(before, history(db, archive.root), check_dtype=False)
@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+import job_runner
+from job_runner import JobRunner
+
+SCRIPT = """
+import json, sys
+for i in range(int(sys.argv[1])):
+    print(f"line {i}")
+print(json.dumps({"rmse": 1.5}))
+"""
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    script = tmp_path / "train_fake.py"
+    script.write_text(SCRIPT)
+    monkeypatch.setitem(job_runner.TRAIN_SCRIPTS, "fake", str(script))
+    return JobRunner(concurrency=1, jobs_dir=str(tmp_path / "jobs"), cwd=str(tmp_path))
+
+
+def status_file(runner, job, status, timeout=5):
+    """The mirrored file once it shows `status` (it is written just after the state changes)."""
+    deadline = time.time() + timeout
+    while True:
+        with open(runner._path(job), encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved["status"] == status or time.time() > deadline:
+            return saved
+        time.sleep(0.01)
+
+
+def test_output_lines_are_persisted_throttled(runner, monkeypatch):
+    writes = []
+    persist = runner._persist
+    monkeypatch.setattr(runner, "_persist", lambda job: (writes.append(job.lines), persist(job)))
+    job, _ = runner.submit("fake", ["500"])
+    assert runner.get(job.id, wait=30).status == "succeeded"
+    # queued, running, the metrics line and the final state — not one write per line
+    assert len(writes) < 20
+    saved = status_file(runner, job, "succeeded")
+    assert saved["status"] == "succeeded" and saved["lines"] == 501
+    assert saved["metrics"] == {"rmse": 1.5}
+
+
+def test_trimmed_jobs_lose_their_files(runner, monkeypatch):
+    monkeypatch.setattr(job_runner, "MAX_JOBS_KEPT", 2)
+    jobs = []
+    for n in range(4):
+        job, _ = runner.submit("fake", [str(n)])
+        runner.get(job.id, wait=30)
+        status_file(runner, job, "succeeded")
+        jobs.append(job)
+    files = sorted(p.name for p in Path(runner.jobs_dir).iterdir())
+    assert files == sorted(f"{j.id}.json" for j in jobs[-2:])
+
+
+def test_startup_prunes_stale_files(tmp_path, monkeypatch):
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    for i in range(5):
+        (jobs_dir / f"old{i}.json").write_text("{}")
+    (jobs_dir / "old9.json.tmp").write_text("")
+    monkeypatch.setattr(job_runner, "MAX_JOBS_KEPT", 3)
+    JobRunner(concurrency=1, jobs_dir=str(jobs_dir))
+    assert len(list(jobs_dir.glob("*.json"))) == 3 and not list(jobs_dir.glob("*.tmp"))
+
+
+@pytest.mark.parametrize("body,error", [
+    (b'["fake"]',                            "JSON object"),
+    (b'"fake"',                              "JSON object"),
+    (b'{"model": "fake", "args": "12"}',     "list of strings"),
+    (b'{"model": "fake", "args": {"n": 1}}', "list of strings"),
+    (b'{"model": "fake", "args": [[1]]}',    "list of strings"),
+    (b'{"model": "nope"}',                   "unknown model"),
+    (b'{not json',                           ""),
+])
+def test_post_rejects_malformed_bodies(runner, monkeypatch, body, error):
+    monkeypatch.setattr(job_runner, "runner", runner, raising=False)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), job_runner.Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        req = Request(f"http://127.0.0.1:{server.server_address[1]}/jobs", data=body, method="POST")
+        with pytest.raises(HTTPError) as e:
+            urlopen(req, timeout=5)
+        assert e.value.code == 400
+        assert error in json.loads(e.value.read())["error"]
+        assert runner.list() == []
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,78 @@
+import pickle
+import sys
+
+import numpy as np
+
+from model_compact import CompactForest, compact_model, compact_payload
+
+
+def at_thresholds(model, X):
+    """Rows whose feature values sit exactly on (float32-rounded) split thresholds."""
+    tree = model.estimators_[0].tree_
+    internal = np.flatnonzero(tree.children_left >= 0)[:len(X)]
+    X = X[:len(internal)].copy()
+    X[np.arange(len(internal)), tree.feature[internal]] = tree.threshold[internal].astype(np.float32)
+    return X
+
+
+def test_classifier_parity(toy_data, toy_forests):
+    X, _, _ = toy_data
+    clf = toy_forests[0]
+    compact = compact_model(clf)
+    assert isinstance(compact, CompactForest)
+    for rows in (X, at_thresholds(clf, X)):
+        np.testing.assert_array_equal(compact.predict(rows), clf.predict(rows))
+        np.testing.assert_allclose(compact.predict_proba(rows), clf.predict_proba(rows), atol=1e-6)
+
+
+def test_regressor_parity(toy_data, toy_forests):
+    X, _, _ = toy_data
+    reg = toy_forests[1]
+    compact = compact_model(reg)
+    for rows in (X, at_thresholds(reg, X), X[:1]):
+        np.testing.assert_allclose(compact.predict(rows), reg.predict(rows), rtol=1e-5, atol=1e-5)
+
+
+def test_compact_is_smaller_and_pickles(toy_data, toy_forests):
+    X, _, _ = toy_data
+    clf = toy_forests[0]
+    compact = compact_model(clf)
+    assert compact.nbytes < len(pickle.dumps(clf))
+    again = pickle.loads(pickle.dumps(compact))
+    np.testing.assert_array_equal(again.predict(X), clf.predict(X))
+
+
+def test_pruning_stays_within_max_change(toy_data, toy_forests):
+    X, _, _ = toy_data
+    clf = toy_forests[0]
+    pruned = compact_model(clf, prune_tol=0.5, X_val=X, max_change=0.01)
+    assert pruned.n_leaves <= compact_model(clf).n_leaves
+    assert np.mean(pruned.predict(X) != clf.predict(X)) <= 0.01
+
+
+def test_direct_payload_validates_each_model_on_its_own_rows(toy_data, toy_forests):
+    X, _, _ = toy_data
+    reg = toy_forests[1]
+    payload = compact_payload({"models": [reg, reg]}, prune_tol=0.2, X_val=[X[:500], X[500:]], max_change=0.0)
+    for model, rows in zip(payload["models"], (X[:500], X[500:])):
+        assert isinstance(model, CompactForest)
+        np.testing.assert_allclose(model.predict(rows), reg.predict(rows), rtol=1e-3, atol=1e-6)
+
+
+def test_unsupported_models_pass_through():
+    from sklearn.linear_model import LinearRegression
+    model = LinearRegression()
+    assert compact_model(model) is model
+
+
+def test_compaction_is_opt_in(monkeypatch):
+    from model_compact import compact_option
+    monkeypatch.delenv("ML_COMPACT", raising=False)
+    monkeypatch.setattr("sys.argv", ["train_x.py", "--rows", "10"])
+    assert compact_option() is False and sys.argv == ["train_x.py", "--rows", "10"]
+    monkeypatch.setattr("sys.argv", ["train_x.py", "--compact"])
+    assert compact_option() is True and sys.argv == ["train_x.py"]
+    monkeypatch.setenv("ML_COMPACT", "1")
+    assert compact_option() is True
+    monkeypatch.setattr("sys.argv", ["train_x.py", "--no-compact"])
+    assert compact_option() is False
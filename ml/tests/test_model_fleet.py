@@ -0,0 +1,33 @@
+import os
+
+import joblib
+
+from model_fleet import ModelFleet, estimate_nbytes
+
+
+def test_forest_size_counts_every_tree_array(crop_bundle):
+    trees = [e.tree_.__getstate__() for e in crop_bundle.model.estimators_]
+    arrays = sum(t["nodes"].nbytes + t["values"].nbytes for t in trees)
+    assert estimate_nbytes(crop_bundle.model) >= arrays
+
+
+def test_replaced_artifacts_are_reloaded(crop_bundle, tmp_path):
+    source = tmp_path / "punjab.pkl"
+    joblib.dump(crop_bundle.payload, source)
+    fleet = ModelFleet(root=str(tmp_path / "models"), budget_mb=64, pinned=[], preload=[], scan_s=0)
+
+    fleet.install("crop", "Punjab", str(source))
+    first, key = fleet.get("crop", "punjab")
+    assert key == "punjab" and fleet.get("crop", "punjab")[0] is first
+
+    # install from this process drops the resident copy right away
+    fleet.install("crop", "punjab", str(source))
+    second = fleet.get("crop", "punjab")[0]
+    assert second is not first
+
+    # a replace behind the fleet's back (the install CLI, a deploy) is seen on the next rescan
+    dest = fleet.path("crop", "punjab")
+    os.utime(dest, ns=(os.stat(dest).st_atime_ns, os.stat(dest).st_mtime_ns + 10**9))
+    third = fleet.get("crop", "punjab")[0]
+    assert third is not second
+    assert fleet.stats()["reloads"] == 2 and fleet.stats()["resident"] == 1
@@ -0,0 +1,37 @@
+import pytest
+
+import profiling
+from profiling import MODES, RequestProfiler, parse_modes
+
+
+@pytest.mark.parametrize("spec", ["", "0", "false", "OFF", " off ", False])
+def test_disabled_specs_select_nothing(spec):
+    assert parse_modes(spec) == []
+
+
+@pytest.mark.parametrize("spec", [None, True, "1", "all"])
+def test_enabled_specs_select_every_mode(spec):
+    assert parse_modes(spec) == list(MODES)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        parse_modes("cprofile,heap")
+
+
+def test_env_off_leaves_trainer_unprofiled(monkeypatch, tmp_path):
+    monkeypatch.setattr("sys.argv", ["train_x.py"])
+    for spec in ("", "0", "off"):
+        monkeypatch.setenv("ML_PROFILE", spec)
+        assert profiling.profile_training(str(tmp_path / "m.pkl")) is None
+
+
+def test_session_ids_are_distinct_within_a_second(tmp_path):
+    ids = {profiling.session_id() for _ in range(50)}
+    assert len(ids) == 50
+    profiler = RequestProfiler(out_root=str(tmp_path))
+    sid = profiling.session_id()
+    (tmp_path / sid).mkdir()
+    (tmp_path / sid / "summary.json").write_text("{}")
+    assert profiler.report_file(sid, "summary.json") is not None
+    assert profiler.report_file("../" + sid, "summary.json") is None
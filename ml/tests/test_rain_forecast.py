@@ -0,0 +1,38 @@
+import numpy as np
+
+from rain_forecast import day_sequence
+
+
+def test_leap_year_runs_through_day_366():
+    assert day_sequence([365], 3, 2024).tolist() == [[365, 366, 1]]
+
+
+def test_common_year_wraps_after_day_365():
+    assert day_sequence([364], 3, 2023).tolist() == [[364, 365, 1]]
+
+
+def test_year_per_row():
+    D = day_sequence(np.array([59, 59]), 2, np.array([2024, 2023]))
+    assert D.tolist() == [[59, 60], [59, 60]]
+    # Feb 29 only exists in the leap year: day 60 is Mar 1 in 2023, Feb 29 in 2024
+    assert day_sequence([1], 366, 2024)[0, -1] == 366
+    assert day_sequence([1], 366, 2023)[0, -1] == 1
+
+
+def test_forecast_reuses_caller_observations():
+    from sklearn.ensemble import RandomForestRegressor
+    from feature_encoder import rainfall_encoder
+    from model_loader import bundle_from_payload
+    from rain_forecast import RainForecaster, _synthetic_cities
+
+    encoder = rainfall_encoder()
+    cities = _synthetic_cities(40) + [{"city": "bad", "temperature": "hot"}]
+    X = encoder.encode(cities[:40])[0]
+    y = X[:, encoder.feature_columns.index("humidity")] / 10
+    model = RandomForestRegressor(n_estimators=5, max_depth=4, random_state=0).fit(X, y)
+    fc = RainForecaster(bundle_from_payload("rainfall", {"model": model, "encoder": encoder}))
+
+    observed = fc.observations(cities)
+    fc.observations = None            # forecast must not encode the cities again
+    assert fc.forecast(cities, 5, observed=observed) == RainForecaster(fc.bundle).forecast(cities, 5)
+    assert "error" in fc.forecast(cities, 5, observed=observed)[-1]
@@ -0,0 +1,62 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import rotation_plan
+from rotation_plan import (CARRY_OVER, DEFAULT_CARRY_OVER, NUTRIENTS, RECOVERY, SEASON_CLIMATE,
+                           RotationPlanner, quantize, season_sequence)
+
+FIELD = {"nitrogen": 60, "phosphorus": 40, "potassium": 40, "soil_ph": 6.5,
+         "soilType": "Loamy", "region": "North", "area": 2.0}
+CROPS = ["Rice", "Wheat", "Chickpea", "Lentil", "Millet"]
+
+
+def brute_force(planner, field, seasons, start, penalty):
+    """Best total reward over every crop sequence, scoring each path's soil states directly."""
+    cand = planner.candidates(CROPS)
+    names = [str(planner.crop_classes[c]) for c in cand]
+    carry = np.array([CARRY_OVER.get(n.lower(), DEFAULT_CARRY_OVER) for n in names])
+    baseline = np.array([float(field[n]) for n in NUTRIENTS])
+    sequence = season_sequence(start, seasons)
+    rows, rel = {}, {}
+    for s in set(sequence):
+        clim = SEASON_CLIMATE[s]
+        rows[s] = planner.crop.encoder.encode([{**field, **clim, "season": s}])[0][0]
+        rel[s] = planner.relative_yields(field, clim, cand)[1]
+
+    best, best_path = -np.inf, None
+    for path in itertools.product(range(len(cand)), repeat=len(sequence)):
+        soil, prev, total = quantize(baseline[None, :])[0], -1, 0.0
+        for s, a in zip(sequence, path):
+            P = planner.suitability(rows[s], soil[None, :])[0][0]
+            reward = P[cand[a]] * rel[s][a]
+            total += reward * (1 - penalty) if a == prev else reward
+            soil = quantize((soil + carry[a] + RECOVERY * (baseline - soil))[None, :])[0]
+            prev = a
+        if total > best + 1e-12:
+            best, best_path = total, [names[a] for a in path]
+    return best, best_path
+
+
+@pytest.mark.parametrize("start,seasons", [("Kharif", 3), ("Rabi", 4)])
+@pytest.mark.parametrize("with_yield", [False, True], ids=["crop-only", "with-yield"])
+def test_dp_matches_brute_force(crop_bundle, yield_bundle, start, seasons, with_yield):
+    planner = RotationPlanner(crop_bundle, yield_bundle if with_yield else None)
+    result = planner.plan(FIELD, seasons=seasons, start=start, crops=CROPS)
+    best, path = brute_force(planner, FIELD, seasons, start, rotation_plan.MONOCROP_PENALTY)
+    assert result["totalScore"] == pytest.approx(best, abs=1e-4)
+    assert [p["crop"] for p in result["plan"]] == path
+
+
+def test_memo_is_keyed_by_crop_model_version(crop_bundle, monkeypatch):
+    planner = RotationPlanner(crop_bundle)
+    row = crop_bundle.encoder.encode([{**FIELD, **SEASON_CLIMATE["Kharif"], "season": "Kharif"}])[0][0]
+    soils = quantize(np.array([[60.0, 40.0, 40.0]]))
+    _, scored, _ = planner.suitability(row, soils)
+    _, scored_again, hits = planner.suitability(row, soils)
+    assert scored_again == 0 and hits == 1
+    # a retrained crop artifact (new version) must not read the old entries
+    monkeypatch.setitem(planner.versions, "crop", "model.pkl@retrained")
+    _, scored_new, hits_new = planner.suitability(row, soils)
+    assert scored_new == 1 and hits_new == 0
@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from scenario_sweep import axis_length, axis_values, expand_grid
+
+
+@pytest.mark.parametrize("spec", [{"start": 0, "stop": 300, "step": 25}, {"start": 0.5, "stop": 0.9, "step": 0.1},
+                                  {"start": 5, "stop": 5}, {"start": -1, "stop": 2.2, "step": 0.3},
+                                  ["Clay", "Loamy"], "Kharif"])
+def test_axis_length_matches_values(spec):
+    assert axis_length(spec) == len(axis_values(spec))
+
+
+def test_oversized_range_is_rejected_before_it_is_built():
+    t0 = time.perf_counter()
+    with pytest.raises(ValueError, match="combinations"):
+        expand_grid({"temperature": 27}, {"fertilizer": {"start": 0, "stop": 1e12, "step": 1}})
+    with pytest.raises(ValueError, match="combinations"):
+        expand_grid({}, {f"a{i}": {"start": 0, "stop": 1e6} for i in range(8)})
+    assert time.perf_counter() - t0 < 0.5
+
+
+@pytest.mark.parametrize("spec", [{"start": 0, "stop": float("inf")}, {"start": 0, "stop": 1, "step": 0},
+                                  {"start": 2, "stop": 1}, []])
+def test_bad_axes_raise_value_error(spec):
+    with pytest.raises(ValueError):
+        expand_grid({}, {"fertilizer": spec})
+
+
+def test_grid_is_the_cartesian_product():
+    grid = expand_grid({"temperature": 27}, {"soilType": ["Clay", "Loamy"], "fertilizer": {"start": 0, "stop": 50, "step": 25}})
+    assert len(grid) == 6 and set(grid["temperature"]) == {27}
+    assert sorted(zip(grid["soilType"], grid["fertilizer"])) == \
+        sorted((s, f) for s in ("Clay", "Loamy") for f in (0.0, 25.0, 50.0))
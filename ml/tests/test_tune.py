@@ -0,0 +1,45 @@
+import json
+
+import tune
+
+
+def write(path, family, dataset, params):
+    path.write_text(json.dumps({"family": family, "dataset": dataset, "best": {"params": params}}))
+
+
+def test_each_family_reads_its_own_tuning_file(tmp_path, monkeypatch):
+    artifact = tmp_path / "model.pkl"
+    monkeypatch.setitem(tune.MODEL_CANDIDATES, "crop", [str(artifact)])
+    write(tmp_path / "model.pkl.rf.tuning.json", "rf", None, {"n_estimators": 400})
+    write(tmp_path / "model.pkl.xgb.tuning.json", "xgb", "kaggle", {"max_depth": 3})
+
+    rf, rf_tuning = tune.tuned_params("crop", "rf", {"n_estimators": 50})
+    xgb, xgb_tuning = tune.tuned_params("crop", "xgb", {"n_estimators": 300, "max_depth": 6})
+    assert rf == {"n_estimators": 400} and rf_tuning["family"] == "rf"
+    assert xgb == {"n_estimators": 300, "max_depth": 3} and xgb_tuning["family"] == "xgb"
+
+
+def test_xgb_tuning_on_the_rf_rows_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setitem(tune.MODEL_CANDIDATES, "crop", [str(tmp_path / "model.pkl")])
+    # legacy single file, tuned before crop xgb used train_xgboost.py's dataset
+    write(tmp_path / "model.pkl.tuning.json", "xgb", None, {"max_depth": 9})
+    assert tune.tuned_params("crop", "xgb", {"max_depth": 6}) == ({"max_depth": 6}, None)
+
+
+def test_kaggle_dataset_matches_train_xgboost_shape():
+    from model_sweep import load_dataset
+    data = load_dataset("crop", dataset="kaggle")
+    assert data["X_train"].shape == (3520, 7) and len(data["label_encoder"].classes_) == 22
+
+
+def test_write_replaces_artifact_atomically(tmp_path, monkeypatch, toy_forests):
+    import joblib
+    artifact = tmp_path / "model.pkl"
+    monkeypatch.setitem(tune.MODEL_CANDIDATES, "crop", [str(artifact)])
+    joblib.dump({"model": toy_forests[0]}, artifact)
+    tuning = {"family": "rf", "dataset": None, "best": {"params": {"n_estimators": 25}}}
+
+    written = tune._write("crop", tuning)
+    assert written == [tune.tuning_path("crop", "rf"), str(artifact)]
+    assert joblib.load(artifact)["tuning"] == tuning
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["model.pkl", "model.pkl.rf.tuning.json"]
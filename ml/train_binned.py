@@ -0,0 +1,336 @@
+"""
+train_binned.py — Out-of-core training for the crop / soil / yield models.
+
+The regular trainers load every sample into a DataFrame (plus encoded copies)
+before an exact-split RandomForest can fit. This mode keeps memory bounded by
+the chunk size, however many rows the collection holds:
+
+  1. edges     a sample (Mongo $sample, or the first chunk of a file) fits the
+               FeatureEncoder categories and the uint8 bin edges (binning.py)
+  2. one pass  the MongoDB cursor (or CSV / NDJSON file) is read in chunks of
+               --chunk-rows; each chunk is encoded, binned to uint8 and written
+               to <work-dir>/chunk-*.npy with its labels; a capped random
+               holdout of raw rows is kept for evaluation
+  3. fit       XGBoost reads the chunk files through a DataIter into an
+               external-memory quantile DMatrix and fits histogram gradient
+               boosting (--model hgb) or a binned random forest (--model
+               forest: parallel trees, one round). The booster still keeps a
+               gradient, hessian and prediction per row and output in RAM, so
+               once that state would exceed --memory-mb (default 1024) the fit
+               reads a uniform, fixed subset of the binned rows instead of all
+
+The artifact is a BinnedModel with the usual payload keys, written where
+find_model() looks (ml/model.pkl, ml/soil_model.pkl, ml/yield_model.pkl) unless
+--out is given, so the predict_*.py scripts and predict_server.py load it
+unchanged. sklearn's HistGradientBoosting is not used because it copies the
+whole matrix to float64 before binning.
+
+Usage:
+  python ml/train_binned.py soil                          # soil_samples → ml/soil_model.pkl
+  python ml/train_binned.py yield --model forest
+  python ml/train_binned.py yield --source data/yield_samples.csv
+  python ml/train_binned.py crop --source synthetic --rows 2000000 --out /tmp/crop_binned.pkl
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from binning import BinnedModel, bin_matrix, fit_edges
+from crop_data import CAT_COLS, NUMERIC_COLS, generate_frame
+from drift import build_reference
+from feature_encoder import crop_encoder, soil_encoder, yield_encoder
+from model_loader import MODEL_CANDIDATES
+
+try:
+    import resource           # peak RSS in the report (not available on Windows)
+except ImportError:
+    resource = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WORK_DIR = os.path.join(BASE_DIR, "..", "cache", "binned")
+CHUNK_ROWS = 100_000
+SAMPLE_ROWS = 200_000      # rows used to fit categories + bin edges
+HOLDOUT = 0.1
+MAX_HOLDOUT_ROWS = 200_000
+MEMORY_MB = 1024           # training-state budget (--memory-mb)
+# per-row state the booster keeps in RAM while the binned pages stay on disk:
+# float32 gradient + hessian + prediction per output, plus label and weight
+ROW_STATE_BYTES = 12
+ROW_FIXED_BYTES = 8
+
+SPECS = {
+    "crop":  {"collection": "crop_samples", "label": "crop", "task": "classification",
+              "encoder": lambda: crop_encoder(NUMERIC_COLS, CAT_COLS)},
+    "soil":  {"collection": "soil_samples", "label": "label", "task": "classification",
+              "encoder": soil_encoder},
+    "yield": {"collection": "yield_samples", "label": "yield_per_ha", "task": "regression",
+              "encoder": yield_encoder},
+}
+
+PARAMS = {
+    "hgb":    {"tree_method": "hist", "max_bin": 256, "eta": 0.1, "max_depth": 8, "subsample": 0.8,
+               "min_child_weight": 1.0},
+    "forest": {"tree_method": "hist", "max_bin": 256, "eta": 1.0, "max_depth": 12, "subsample": 0.632,
+               "colsample_bynode": 0.6, "num_parallel_tree": 100, "lambda": 0.0},
+}
+
+
+# ── Sources (each yields DataFrame chunks) ────────────────────────────────────
+def mongo_source(collection, chunk_rows):
+    def sample(n):
+        return pd.DataFrame(list(collection.aggregate([{"$sample": {"size": n}}, {"$project": {"_id": 0}}],
+                                                      allowDiskUse=True)))
+
+    def chunks():
+        buf = []
+        for doc in collection.find({}, {"_id": 0}).batch_size(min(chunk_rows, 10_000)):
+            buf.append(doc)
+            if len(buf) == chunk_rows:
+                yield pd.DataFrame(buf)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf)
+    return sample, chunks
+
+
+def file_source(path, chunk_rows):
+    def read():
+        if path.endswith((".ndjson", ".jsonl")):
+            return pd.read_json(path, lines=True, chunksize=chunk_rows)
+        return pd.read_csv(path, chunksize=chunk_rows)
+
+    def sample(n):
+        return next(iter(read())).head(n)
+    return sample, read
+
+
+def synthetic_source(kind, rows, chunk_rows):
+    if kind != "crop":
+        raise ValueError("--source synthetic is only available for crop (crop_data.py)")
+    per_seed = len(generate_frame(seed=0))
+
+    def chunks():
+        produced, seed = 0, 42
+        while produced < rows:
+            frames, n = [], 0
+            while n < min(chunk_rows, rows - produced):
+                frames.append(generate_frame(seed=seed))
+                n += per_seed
+                seed += 1
+            df = pd.concat(frames, ignore_index=True).head(min(chunk_rows, rows - produced))
+            produced += len(df)
+            yield df
+
+    def sample(n):
+        return next(chunks()).head(n)
+    return sample, chunks
+
+
+# ── Streaming pass ────────────────────────────────────────────────────────────
+def bin_to_disk(chunks, encoder, edges, label, task, work_dir, seed=42):
+    """Encode + bin every chunk to <work_dir>/chunk-*.npy; return (files, holdout, classes, counts)."""
+    rng = np.random.default_rng(seed)
+    classes = {}
+    files, hold_X, hold_y = [], [], []
+    counts = {"rows": 0, "dropped": 0, "train": 0, "holdout": 0}
+    for i, df in enumerate(chunks()):
+        counts["rows"] += len(df)
+        if label not in df.columns:
+            counts["dropped"] += len(df)
+            continue
+        X, valid = encoder.encode(df)
+        y = df[label]
+        valid &= y.notna().to_numpy()
+        if task == "regression":
+            y = pd.to_numeric(y, errors="coerce").to_numpy(dtype=np.float32)
+            valid &= ~np.isnan(y)
+        else:
+            y = y.astype(str).to_numpy()
+        counts["dropped"] += int((~valid).sum())
+        X, y = X[valid], y[valid]
+        if task == "classification":
+            y = np.fromiter((classes.setdefault(v, len(classes)) for v in y), dtype=np.int32, count=len(y))
+        hold = rng.random(len(X)) < HOLDOUT
+        room = MAX_HOLDOUT_ROWS - counts["holdout"]
+        if room <= 0:
+            hold[:] = False
+        elif hold.sum() > room:
+            hold[np.flatnonzero(hold)[room:]] = False
+        if hold.any():
+            hold_X.append(X[hold])
+            hold_y.append(y[hold])
+            counts["holdout"] += int(hold.sum())
+        X, y = X[~hold], y[~hold]
+        if not len(X):
+            continue
+        base = os.path.join(work_dir, f"chunk-{i:06d}")
+        np.save(base + ".x.npy", bin_matrix(X, edges))
+        np.save(base + ".y.npy", y)
+        files.append(base)
+        counts["train"] += len(X)
+    holdout = (np.concatenate(hold_X), np.concatenate(hold_y)) if hold_X else None
+    return files, holdout, list(classes), counts
+
+
+# ── Fit ───────────────────────────────────────────────────────────────────────
+def fit_fraction(train_rows, n_outputs, memory_mb):
+    """Share of the binned rows the fit can use within memory_mb of per-row training state."""
+    budget = int(memory_mb * 2**20 // (ROW_STATE_BYTES * n_outputs + ROW_FIXED_BYTES))
+    return min(1.0, budget / max(1, train_rows))
+
+
+def fit_booster(files, task, n_classes, family, rounds, holdout_codes, work_dir, threads, fraction=1.0):
+    import xgboost as xgb
+
+    def rows(i):
+        # same uniform subset on every pass over the chunks (the DMatrix iterates more than once)
+        x, y = np.load(files[i] + ".x.npy", mmap_mode="r"), np.load(files[i] + ".y.npy")
+        if fraction >= 1.0:
+            return np.asarray(x, dtype=np.float32), y
+        keep = np.random.default_rng(i).random(len(y)) < fraction
+        return x[keep].astype(np.float32), y[keep]
+
+    class ChunkIter(xgb.DataIter):
+        def __init__(self):
+            self._i = 0
+            super().__init__(cache_prefix=os.path.join(work_dir, "xgb-cache"), on_host=False)
+
+        def next(self, input_data):
+            if self._i == len(files):
+                return False
+            x, y = rows(self._i)
+            input_data(data=x, label=y)
+            self._i += 1
+            return True
+
+        def reset(self):
+            self._i = 0
+
+    dtrain = xgb.ExtMemQuantileDMatrix(ChunkIter(), max_bin=256, nthread=threads)
+    params = dict(PARAMS[family], nthread=threads, seed=42)
+    if task == "classification":
+        params.update(objective="multi:softprob", num_class=n_classes, eval_metric="mlogloss")
+    else:
+        params.update(objective="reg:squarederror", eval_metric="rmse")
+    evals, stop = [], None
+    if family == "hgb" and holdout_codes is not None:
+        evals, stop = [(xgb.DMatrix(holdout_codes[0].astype(np.float32), label=holdout_codes[1]), "holdout")], 20
+    booster = xgb.train(params, dtrain, num_boost_round=1 if family == "forest" else rounds,
+                        evals=evals, early_stopping_rounds=stop, verbose_eval=False)
+    if stop is not None and booster.best_iteration + 1 < booster.num_boosted_rounds():
+        # early stopping keeps training `stop` rounds past the best one; save only up to it
+        booster = booster[: booster.best_iteration + 1]
+    return booster
+
+
+def evaluate(model, task, X, y):
+    from sklearn.metrics import accuracy_score, f1_score, mean_squared_error, r2_score
+    pred = model.predict(X)
+    if task == "classification":
+        truth = np.asarray(model.classes_)[y]
+        return {"accuracy": float(accuracy_score(truth, pred)),
+                "f1_macro": float(f1_score(truth, pred, average="macro"))}
+    return {"rmse": float(mean_squared_error(y, pred) ** 0.5), "r2": float(r2_score(y, pred))}
+
+
+def build_payload(kind, model, encoder, class_names, reference, training):
+    payload = {"model": model, "encoder": encoder, "drift_reference": reference, "training": training}
+    if kind == "crop":
+        payload.update(feature_columns=encoder.feature_columns, categorical_values=encoder.categorical_values,
+                       crops=class_names)
+    elif kind == "soil":
+        payload["classes"] = class_names
+    else:
+        payload.update(ohe_categories=encoder.categories["crop"], feature_columns=encoder.feature_columns)
+    return payload
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Out-of-core uint8-binned training (crop / soil / yield).")
+    p.add_argument("kind", choices=sorted(SPECS))
+    p.add_argument("--source", default="mongo", help="mongo (default), synthetic (crop), or a .csv/.ndjson file")
+    p.add_argument("--rows", type=int, default=1_000_000, help="rows for --source synthetic")
+    p.add_argument("--model", choices=sorted(PARAMS), default="hgb")
+    p.add_argument("--rounds", type=int, default=300, help="max boosting rounds (hgb, early-stopped on the holdout)")
+    p.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    p.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--memory-mb", type=float, default=MEMORY_MB,
+                   help="RAM for per-row training state; larger collections are subsampled uniformly")
+    p.add_argument("--work-dir", default=DEFAULT_WORK_DIR)
+    p.add_argument("--keep", action="store_true", help="keep the binned chunk files")
+    p.add_argument("--out", help="artifact path (default: where find_model() looks)")
+    args = p.parse_args(argv)
+
+    spec = SPECS[args.kind]
+    if args.source == "mongo":
+        from pymongo import MongoClient
+        db = MongoClient("mongodb://127.0.0.1:27017/")["smart_irrigation"]
+        sample, chunks = mongo_source(db[spec["collection"]], args.chunk_rows)
+    elif args.source == "synthetic":
+        sample, chunks = synthetic_source(args.kind, args.rows, args.chunk_rows)
+    else:
+        sample, chunks = file_source(args.source, args.chunk_rows)
+
+    t0 = time.perf_counter()
+    sample_df = sample(SAMPLE_ROWS)
+    if sample_df.empty or spec["label"] not in sample_df.columns:
+        print(json.dumps({"error": "no-samples", "source": args.source}))
+        return 2
+    encoder = spec["encoder"]()
+    if encoder.categorical_cols:
+        encoder.fit(sample_df.dropna(subset=[spec["label"]]))
+    X_sample, valid = encoder.encode(sample_df)
+    X_sample = X_sample[valid]
+    edges = fit_edges(X_sample)
+    reference = build_reference(encoder, X_sample)
+    del sample_df
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f"{args.kind}-", dir=args.work_dir)
+    try:
+        files, holdout, class_names, counts = bin_to_disk(chunks, encoder, edges, spec["label"],
+                                                          spec["task"], work_dir)
+        if not files:
+            print(json.dumps({"error": "no-valid-rows", **counts}))
+            return 2
+        t_bin = time.perf_counter()
+        holdout_codes = (bin_matrix(holdout[0], edges), holdout[1]) if holdout is not None else None
+        n_outputs = len(class_names) if spec["task"] == "classification" else 1
+        fraction = fit_fraction(counts["train"], n_outputs, args.memory_mb)
+        booster = fit_booster(files, spec["task"], len(class_names), args.model, args.rounds,
+                              holdout_codes, work_dir, args.threads, fraction)
+        t_fit = time.perf_counter()
+        # soil labels go through payload["classes"] (predict_soil.py maps indices); crop predicts names
+        model_classes = None
+        if spec["task"] == "classification":
+            model_classes = class_names if args.kind == "crop" else np.arange(len(class_names))
+        model = BinnedModel(booster, edges, model_classes, kind=args.model)
+        metrics = evaluate(model, spec["task"], *holdout) if holdout is not None else {}
+        disk_mb = sum(os.path.getsize(os.path.join(work_dir, f)) for f in os.listdir(work_dir)) / 2**20
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    training = {"mode": "binned", "model": args.model, "source": args.source, **counts,
+                "fitRows": int(round(counts["train"] * fraction)), "memoryMb": args.memory_mb,
+                "rounds": booster.num_boosted_rounds(), "bins": max(len(e) + 1 for e in edges)}
+    out_path = args.out or MODEL_CANDIDATES[args.kind][0]
+    joblib.dump(build_payload(args.kind, model, encoder, class_names, reference, training), out_path, compress=3)
+    print(json.dumps({"kind": args.kind, "path": out_path, **training, **metrics,
+                      "binSeconds": round(t_bin - t0, 2), "fitSeconds": round(t_fit - t_bin, 2),
+                      "binnedMb": round(disk_mb, 1),
+                      "peakRssMb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+                      if resource else None}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,15 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 
+from feature_encoder import crop_encoder
+from model_compact import compact_option, compact_payload
+from profiling import profile_training
+
+# --profile / ML_PROFILE=cprofile,tracemalloc,sample → model.pkl.profile/
+profile_training(os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.pkl"))
+# --compact / ML_COMPACT=1 → flat float32 forests in the artifact (model_compact.py)
+compact = compact_option()
+
 # ── reproducible results ──────────────────────────────────────────────────────
 random.seed(42)
 
@@ -67,9 +76,10 @@ print("Crops:", df["crop"].value_counts().to_dict())
 numeric_cols = ["temperature","humidity","rainfall","soil_ph","soilMoisture","nitrogen","phosphorus","potassium"]
 cat_cols     = ["soilType","region","season"]
 
-X_num = df[numeric_cols].astype(float)
-X_cat = pd.get_dummies(df[cat_cols].astype(str), prefix=cat_cols)
-X = pd.concat([X_num.reset_index(drop=True), X_cat.reset_index(drop=True)], axis=1)
+# categorical dtype codes straight into one float32 matrix (no get_dummies copies);
+# the fitted encoder is saved with the model so inference uses identical columns
+encoder = crop_encoder(numeric_cols, cat_cols).fit(df)
+X = encoder.transform(df)
 y = df["crop"]
 
 print(f"Feature matrix: {X.shape[0]} rows × {X.shape[1]} columns")
@@ -87,17 +97,19 @@ print(classification_report(y_test, y_pred))
 
 # ── Save model payload ─────────────────────────────────────────────────────────
 # Capture categorical values seen during training so predict.py can OHE correctly
-cat_values = {}
-for c in cat_cols:
-    cat_values[c] = sorted(df[c].unique().tolist())
+cat_values = encoder.categorical_values
 
 payload = {
     "model":               model,
-    "feature_columns":     list(X.columns),
+    "feature_columns":     encoder.feature_columns,
     "categorical_values":  cat_values,
+    "encoder":             encoder,
 }
 
 # Save to ml/model.pkl (same location predict.py looks for)
+if compact:
+    compact_payload(payload, X_val=X_test)   # flat float32 arrays instead of the sklearn object graph
+
 out_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.pkl")
 joblib.dump(payload, out_path, compress=3)
 print(f"\n✅ Model saved → {out_path}")
@@ -1,3 +1,6 @@
+import json
+import os
+import sys
 from datetime import datetime
 
 import joblib
@@ -7,19 +10,28 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.model_selection import train_test_split
 
+from drift import build_reference
+from feature_encoder import rainfall_encoder
+from history_archive import read_history
+from model_compact import compact_option, compact_payload
+from profiling import profile_training
+from tune import tuned_params
+
+# --profile / ML_PROFILE=cprofile,tracemalloc,sample → rainfall_model.pkl.profile/
+profile_training('rainfall_model.pkl')
+# --compact / ML_COMPACT=1 → flat float32 forests in the artifact (model_compact.py)
+compact = compact_option()
+
 # Connect to MongoDB
 client = MongoClient("mongodb://127.0.0.1:27017/")
 db = client['smart_irrigation']
-collection = db['weatherdatas']
 
-# Load data
-rows = list(collection.find().sort('createdAt', 1))
-if len(rows) < 30:
+# Load data: archived history (history_archive.py) + live weatherdatas, oldest first
+df = read_history(db, 'weatherdatas')
+if len(df) < 30:
     print('Not enough rows in weatherdatas to train rainfall model (need >= 30)')
     exit()
 
-df = pd.DataFrame(rows)
-
 # ensure datetime
 if 'createdAt' in df.columns:
     df['createdAt'] = pd.to_datetime(df['createdAt'])
@@ -52,23 +64,102 @@ df = df.dropna(subset=['target_rainfall'])
 FEATURES = ['temperature', 'humidity', 'soilMoisture', 'rainfall_lag1', 'dayofyear']
 X = df[FEATURES]
 y = df['target_rainfall']
+encoder = rainfall_encoder()
+
+# ── Direct multi-step models: python ml/train_rainfall.py --direct 7 ──────────
+# one regressor per horizon h, trained per city on the daily mean rainfall h days
+# ahead with a time-ordered split; used by rain_forecast.py --method direct
+# next to model_loader's rainfall_model.pkl, where rain_forecast.py looks for it
+DIRECT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rainfall_direct_model.pkl')
+
+def daily_frame(df):
+    """One row per (city, calendar day): mean readings, gaps filled with NaN rows.
+
+    weatherdatas interleaves cities and arrives every few hours, so a shift over
+    the raw rows is neither "h days ahead" nor "the same city". Each city is put
+    on its own daily calendar (missing days stay NaN) so shift(-h) within a city
+    is exactly h days; rainfall stays the mean reading (the rate predict_rain.py
+    and the recursive forecast work in). Rows without a city cannot be placed
+    and are dropped.
+    """
+    d = df.copy()
+    d['city'] = d.get('city', pd.Series('', index=d.index)).fillna('').astype(str) \
+        .str.strip().str.replace(r'\s+', ' ', regex=True).str.lower()
+    d = d[d['city'] != '']
+    d['date'] = d['createdAt'].dt.normalize()
+    cols = ['temperature', 'humidity', 'soilMoisture', 'rainfall']
+    day = d.groupby(['city', 'date'])[cols].mean()
+    frames = []
+    for city, g in day.groupby(level='city'):
+        g = g.droplevel('city').asfreq('D')
+        g['city'] = city
+        frames.append(g)
+    day = pd.concat(frames).rename_axis('date').reset_index() if frames else \
+        pd.DataFrame(columns=['date', 'city'] + cols)
+    day['rainfall_lag1'] = day['rainfall']
+    day['dayofyear'] = day['date'].dt.dayofyear
+    day['soilMoisture'] = day['soilMoisture'].fillna(day['soilMoisture'].median()).fillna(50)
+    return day
+
+
+def time_split(dates, test_size=0.2):
+    """Boolean test mask: the latest test_size share of days (no future rows in training)."""
+    cutoff = dates.quantile(1 - test_size)
+    return dates > cutoff
+
+
+if '--direct' in sys.argv:
+    horizons = int(sys.argv[sys.argv.index('--direct') + 1])
+    day = daily_frame(df)
+    base = day.dropna(subset=['temperature', 'humidity', 'rainfall_lag1'])
+    models, horizon_rmse, X_vals = [], [], []
+    for h in range(1, horizons + 1):
+        target = day.groupby('city')['rainfall'].shift(-h).loc[base.index]
+        ok = target.notna()
+        rows, yh = base[ok], target[ok]
+        test = time_split(rows['date'])
+        if test.all() or not test.any():
+            print(f'Not enough distinct days to train and test horizon {h}')
+            sys.exit(1)
+        m = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
+        m.fit(encoder.transform(rows.loc[~test, FEATURES]), yh[~test])
+        Xh_test = encoder.transform(rows.loc[test, FEATURES])
+        horizon_rmse.append(float(mean_squared_error(yh[test], m.predict(Xh_test)) ** 0.5))
+        models.append(m)
+        X_vals.append(Xh_test)
+    payload = {'models': models, 'feature_columns': encoder.feature_columns, 'encoder': encoder}
+    if compact:
+        # each horizon's compacted forest is checked against its own held-out days
+        compact_payload(payload, X_val=X_vals)
+    joblib.dump(payload, DIRECT_PATH)
+    print(f"Direct models trained for {horizons} horizons — saved to {DIRECT_PATH}")
+    print(json.dumps({'horizons': horizons, 'rmse_by_horizon': horizon_rmse, 'rows': int(len(base)),
+                      'cities': int(base['city'].nunique())}))
+    sys.exit(0)
 
 # train/test
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-model = RandomForestRegressor(n_estimators=100, random_state=42)
-model.fit(X_train, y_train)
+params, tuning = tuned_params('rainfall', 'rf', {'n_estimators': 100})   # python ml/tune.py rainfall --write
+model = RandomForestRegressor(**params, random_state=42)
+model.fit(encoder.transform(X_train), y_train)
 
 # evaluate
-pred = model.predict(X_test)
+pred = model.predict(encoder.transform(X_test))
 # some sklearn versions don't support squared=False — compute RMSE manually
 mse = mean_squared_error(y_test, pred)
 rmse = float(mse ** 0.5)
 mae = mean_absolute_error(y_test, pred)
 r2 = r2_score(y_test, pred)
 
-# save model
-joblib.dump(model, 'rainfall_model.pkl')
+# save model + encoder (predict_rain.py still accepts the older bare-model pickle)
+payload = {'model': model, 'feature_columns': encoder.feature_columns, 'encoder': encoder,
+           'drift_reference': build_reference(encoder, encoder.transform(X_train))}
+if tuning:
+    payload['tuning'] = tuning
+if compact:
+    compact_payload(payload, X_val=encoder.transform(X_test))
+joblib.dump(payload, 'rainfall_model.pkl')
 
 # save a small test-set to DB for inspection
 test_docs = []
@@ -9,6 +9,17 @@ from sklearn.metrics import accuracy_score, classification_report, f1_score
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 
+from drift import build_reference
+from feature_encoder import soil_encoder
+from model_compact import compact_option, compact_payload
+from profiling import profile_training
+from tune import tuned_params
+
+# --profile / ML_PROFILE=cprofile,tracemalloc,sample → soil_model.pkl.profile/
+profile_training('soil_model.pkl')
+# --compact / ML_COMPACT=1 → flat float32 forests in the artifact (model_compact.py)
+compact = compact_option()
+
 # Connect to MongoDB
 client = MongoClient("mongodb://127.0.0.1:27017/")
 db = client['smart_irrigation']
@@ -39,6 +50,7 @@ df = df.dropna(subset=['nitrogen', 'phosphorus', 'potassium', 'ph', 'label'])
 FEATURES = ['nitrogen', 'phosphorus', 'potassium', 'ph']
 X = df[FEATURES]
 y = df['label']
+encoder = soil_encoder()
 
 # encode labels
 le = LabelEncoder()
@@ -46,17 +58,24 @@ y_enc = le.fit_transform(y)
 
 X_train, X_test, y_train, y_test = train_test_split(X, y_enc, test_size=0.2, random_state=42)
 
-model = RandomForestClassifier(n_estimators=200, random_state=42)
-model.fit(X_train, y_train)
+params, tuning = tuned_params('soil', 'rf', {'n_estimators': 200})   # python ml/tune.py soil --write
+model = RandomForestClassifier(**params, random_state=42)
+model.fit(encoder.transform(X_train), y_train)
 
 # evaluate
-pred = model.predict(X_test)
+pred = model.predict(encoder.transform(X_test))
 acc = accuracy_score(y_test, pred)
 f1 = f1_score(y_test, pred, average='macro')
 report = classification_report(y_test, pred, output_dict=True)
 
-# save model + label classes together
-joblib.dump({'model': model, 'classes': list(le.classes_)}, 'soil_model.pkl')
+# save model + label classes together (--compact: flat float32 arrays)
+payload = {'model': model, 'classes': list(le.classes_), 'encoder': encoder,
+           'drift_reference': build_reference(encoder, encoder.transform(X_train))}
+if tuning:
+    payload['tuning'] = tuning
+if compact:
+    compact_payload(payload, X_val=encoder.transform(X_test))
+joblib.dump(payload, 'soil_model.pkl')
 
 # save test rows to DB
 test_docs = []
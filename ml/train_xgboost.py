@@ -11,7 +11,6 @@ Usage:
 Output:
   ml/model.pkl  (replaces the existing model)
 """
-import numpy as np
 import pickle
 import os
 import sys
@@ -27,72 +26,22 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, classification_report
 
-np.random.seed(42)
+from crop_data import KAGGLE_FEATURES, generate_kaggle_frame
+from feature_encoder import CROP_ALIASES, crop_encoder
+from profiling import profile_training
+from tune import tuned_params
 
-def rnd(lo, hi, n):
-    return np.random.uniform(lo, hi, n)
+# --profile / ML_PROFILE=cprofile,tracemalloc,sample → model.pkl.profile/
+profile_training(os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.pkl"))
 
-def make_crop(name, N, P, K, temp, hum, ph, rain, n=200):
-    return {
-        'label':       [name] * n,
-        'N':           rnd(*N, n),
-        'P':           rnd(*P, n),
-        'K':           rnd(*K, n),
-        'temperature': rnd(*temp, n),
-        'humidity':    rnd(*hum, n),
-        'ph':          rnd(*ph, n),
-        'rainfall':    rnd(*rain, n),
-    }
-
-# ── Real Kaggle-derived physiological ranges per crop ──────────────────────────
-CROPS = [
-    make_crop("rice",        N=(60,99),   P=(35,55),   K=(35,55),   temp=(20,27), hum=(80,87), ph=(5.5,7.0), rain=(180,270)),
-    make_crop("maize",       N=(60,99),   P=(35,55),   K=(19,35),   temp=(18,25), hum=(55,75), ph=(5.5,7.5), rain=(55,125)),
-    make_crop("chickpea",    N=(35,60),   P=(55,75),   K=(70,90),   temp=(17,24), hum=(14,25), ph=(5.5,7.5), rain=(55,110)),
-    make_crop("kidneybeans", N=(10,35),   P=(55,80),   K=(15,35),   temp=(17,24), hum=(18,26), ph=(5.5,7.5), rain=(100,200)),
-    make_crop("pigeonpeas",  N=(15,40),   P=(55,80),   K=(15,40),   temp=(23,30), hum=(25,50), ph=(5.0,7.0), rain=(100,180)),
-    make_crop("mothbeans",   N=(15,40),   P=(35,60),   K=(15,35),   temp=(24,34), hum=(47,65), ph=(3.5,6.5), rain=(30,80)),
-    make_crop("mungbean",    N=(15,40),   P=(35,60),   K=(15,35),   temp=(24,34), hum=(80,92), ph=(6.0,7.5), rain=(30,70)),
-    make_crop("blackgram",   N=(35,60),   P=(55,80),   K=(15,35),   temp=(24,34), hum=(60,72), ph=(6.5,7.5), rain=(55,110)),
-    make_crop("lentil",      N=(15,40),   P=(55,80),   K=(15,35),   temp=(17,24), hum=(60,80), ph=(5.5,7.5), rain=(35,70)),
-    make_crop("pomegranate", N=(17,40),   P=(13,20),   K=(196,220), temp=(20,28), hum=(88,95), ph=(5.5,7.5), rain=(100,230)),
-    make_crop("banana",      N=(80,105),  P=(72,102),  K=(48,70),   temp=(25,30), hum=(75,90), ph=(5.5,7.0), rain=(90,150)),
-    make_crop("mango",       N=(14,22),   P=(14,22),   K=(29,42),   temp=(24,35), hum=(47,60), ph=(4.5,7.0), rain=(90,200)),
-    make_crop("grapes",      N=(17,23),   P=(120,135), K=(195,210), temp=(8,17),  hum=(80,92), ph=(5.5,7.0), rain=(60,105)),
-    make_crop("watermelon",  N=(97,112),  P=(16,22),   K=(48,55),   temp=(24,34), hum=(80,92), ph=(5.5,7.5), rain=(40,90)),
-    make_crop("muskmelon",   N=(96,112),  P=(17,22),   K=(48,55),   temp=(24,34), hum=(90,97), ph=(6.0,7.5), rain=(20,50)),
-    make_crop("apple",       N=(0,20),    P=(120,135), K=(195,210), temp=(20,25), hum=(90,97), ph=(5.5,7.0), rain=(100,200)),
-    make_crop("orange",      N=(0,20),    P=(4,12),    K=(8,15),    temp=(10,20), hum=(90,97), ph=(6.0,7.5), rain=(100,200)),
-    make_crop("papaya",      N=(48,58),   P=(58,68),   K=(48,58),   temp=(30,42), hum=(90,97), ph=(6.5,7.5), rain=(120,220)),
-    make_crop("coconut",     N=(0,20),    P=(0,20),    K=(28,42),   temp=(25,34), hum=(90,97), ph=(5.0,7.5), rain=(150,230)),
-    make_crop("cotton",      N=(95,118),  P=(35,55),   K=(35,55),   temp=(21,30), hum=(75,85), ph=(5.8,8.0), rain=(60,110)),
-    make_crop("jute",        N=(60,80),   P=(35,60),   K=(35,60),   temp=(24,37), hum=(70,90), ph=(6.0,7.5), rain=(150,250)),
-    make_crop("coffee",      N=(97,118),  P=(27,38),   K=(28,42),   temp=(23,30), hum=(55,70), ph=(6.0,7.0), rain=(150,270)),
-]
-
-# ── Assemble DataFrame ─────────────────────────────────────────────────────────
-import pandas as pd
-
-dfs = []
-for c in CROPS:
-    n = len(c['label'])
-    dfs.append(pd.DataFrame({
-        'N':           c['N'],
-        'P':           c['P'],
-        'K':           c['K'],
-        'temperature': c['temperature'],
-        'humidity':    c['humidity'],
-        'ph':          c['ph'],
-        'rainfall':    c['rainfall'],
-        'label':       c['label'],
-    }))
-
-df = pd.concat(dfs, ignore_index=True).sample(frac=1, random_state=42)
+# ── Kaggle-derived physiological ranges per crop (crop_data.KAGGLE_RANGES) ─────
+df = generate_kaggle_frame(seed=42)
 
 print(f"Dataset: {len(df)} rows, {df['label'].nunique()} crops")
 print(df['label'].value_counts().to_string())
 
-X = df[['N','P','K','temperature','humidity','ph','rainfall']].values
+encoder = crop_encoder(KAGGLE_FEATURES, [])
+X = encoder.transform(df.rename(columns=CROP_ALIASES))  # encoder reads request field names
 le = LabelEncoder()
 y  = le.fit_transform(df['label'].values)
 
@@ -100,12 +49,16 @@ X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_
 
 # ── Train XGBoost ──────────────────────────────────────────────────────────────
 print("\n🚀 Training XGBoost...")
+# defaults below unless `python ml/tune.py crop --family xgb --write` saved a better configuration
+params, tuning = tuned_params("crop", "xgb", {
+    "n_estimators":     300,
+    "max_depth":        6,
+    "learning_rate":    0.1,
+    "subsample":        0.8,
+    "colsample_bytree": 0.8,
+})
 model = xgb.XGBClassifier(
-    n_estimators     = 300,
-    max_depth        = 6,
-    learning_rate    = 0.1,
-    subsample        = 0.8,
-    colsample_bytree = 0.8,
+    **params,
     use_label_encoder= False,
     eval_metric      = 'mlogloss',
     random_state     = 42,
@@ -126,11 +79,14 @@ out_path = os.path.join(out_dir, "model.pkl")
 payload = {
     "model":       model,
     "label_encoder": le,
-    "features":    ['N','P','K','temperature','humidity','ph','rainfall'],
+    "features":    KAGGLE_FEATURES,
+    "encoder":     encoder,
     "model_type":  "xgboost",
     "accuracy":    round(acc * 100, 2),
     "crops":       list(le.classes_),
 }
+if tuning:
+    payload["tuning"] = tuning
 with open(out_path, "wb") as f:
     pickle.dump(payload, f)
 
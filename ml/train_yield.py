@@ -1,4 +1,5 @@
 import json
+import os
 from datetime import datetime
 
 import joblib
@@ -7,7 +8,17 @@ from pymongo import MongoClient
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder
+
+from drift import build_reference
+from feature_encoder import yield_encoder
+from model_compact import compact_option, compact_payload
+from profiling import profile_training
+from tune import tuned_params
+
+# --profile / ML_PROFILE=cprofile,tracemalloc,sample → yield_model.pkl.profile/ (next to the artifact in ml/)
+profile_training(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yield_model.pkl'))
+# --compact / ML_COMPACT=1 → flat float32 forests in the artifact (model_compact.py)
+compact = compact_option()
 
 # Connect to MongoDB
 client = MongoClient("mongodb://127.0.0.1:27017/")
@@ -37,55 +48,48 @@ for c in ['area', 'rainfall', 'temperature', 'fertilizer', 'yield_per_ha']:
 df = df.dropna(subset=['area', 'rainfall', 'temperature', 'fertilizer', 'crop', 'yield_per_ha'])
 
 FEATURES_NUM = ['area', 'rainfall', 'temperature', 'fertilizer']
-X_num = df[FEATURES_NUM]
-
-# encode crop with OneHotEncoder
-ohe = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-crop_ohe = ohe.fit_transform(df[['crop']])
-# handle case where categories_ may be a list of arrays
-cats = ohe.categories_[0] if hasattr(ohe, 'categories_') else []
-crop_cols = [f"crop_{c}" for c in cats]
-
-X = pd.concat([X_num.reset_index(drop=True), pd.DataFrame(crop_ohe, columns=crop_cols)], axis=1)
-Y = df['yield_per_ha']
+# one-hot crop via the shared FeatureEncoder (categorical codes, float32 matrix);
+# it is pickled with the model so predict_yield.py encodes requests identically
+X = df[FEATURES_NUM + ['crop']].reset_index(drop=True)
+Y = df['yield_per_ha'].reset_index(drop=True)
+encoder = yield_encoder().fit(X)
 
 # split
 X_train, X_test, y_train, y_test = train_test_split(X, Y, test_size=0.20, random_state=42)
 
-model = RandomForestRegressor(n_estimators=200, random_state=42)
-model.fit(X_train, y_train)
+params, tuning = tuned_params('yield', 'rf', {'n_estimators': 200})   # python ml/tune.py yield --write
+model = RandomForestRegressor(**params, random_state=42)
+model.fit(encoder.transform(X_train), y_train)
 
 # evaluate
-preds = model.predict(X_test)
+preds = model.predict(encoder.transform(X_test))
 # compute RMSE in a sklearn-version-compatible way
 mse = mean_squared_error(y_test, preds)
 rmse = float(mse ** 0.5)
 r2 = r2_score(y_test, preds)
 
-import os
-
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # save model + encoder metadata (write to ml/ so predict_yield finds it)
 model_path = os.path.join(BASE_DIR, 'yield_model.pkl')
-joblib.dump({'model': model, 'ohe_categories': list(ohe.categories_[0]), 'feature_columns': list(X.columns)}, model_path)
-
-# save test rows to DB (strip OHE columns; keep original inputs + actual)
+payload = {'model': model, 'ohe_categories': encoder.categories['crop'],
+           'feature_columns': encoder.feature_columns, 'encoder': encoder,
+           'drift_reference': build_reference(encoder, encoder.transform(X_train))}
+if tuning:
+    payload['tuning'] = tuning
+if compact:
+    compact_payload(payload, X_val=encoder.transform(X_test))
+joblib.dump(payload, model_path)
+
+# save test rows to DB (original inputs + actual)
 test_docs = []
 for i in range(len(X_test)):
-    # find matching original row by index in the test split (approx)
     row = X_test.iloc[i]
-    # reconstruct crop from OHE columns
-    crop_name = None
-    for c in crop_cols:
-        if c in row.index and row[c] == 1:
-            crop_name = c.replace('crop_', '')
-            break
     test_docs.append({
         'area': float(row['area']),
         'rainfall': float(row['rainfall']),
-        'temperature': float(row['temperature']) if 'temperature' in row.index else None,
-        'fertilizer': float(row['fertilizer']) if 'fertilizer' in row.index else None,
-        'crop': crop_name,
+        'temperature': float(row['temperature']),
+        'fertilizer': float(row['fertilizer']),
+        'crop': row['crop'],
         'actual_yield_per_ha': float(y_test.iloc[i]),
         'createdAt': datetime.utcnow()
     })
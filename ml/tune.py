@@ -0,0 +1,345 @@
+"""
+tune.py — Cross-validated hyperparameter search for the crop, soil, yield and
+rainfall models.
+
+Candidates are drawn from a search space (RandomForest or XGBoost) and scored
+with k-fold CV on the same training rows train_*.py uses (model_sweep.py's
+datasets; crop --family xgb uses train_xgboost.py's rows): stratified folds for classifiers, shuffled folds for yield, and
+forward-chaining time-series folds for rainfall (rows kept in time order).
+
+  * the training matrix is copied once into shared memory; pool workers map
+    it instead of each unpickling their own copy
+  * each (candidate, fold) fit is one pool task; inner n_jobs is
+    cpu_count // workers so the pool never oversubscribes the machine
+  * successive halving: every rung scores the surviving candidates on a
+    larger slice of the rows and keeps the best 1/eta, so hopeless
+    configurations are dropped after cheap fits; the last rung uses all rows
+  * the report carries the mean and std of the score across folds, and the
+    winner is refit on all training rows and scored on the held-out split
+
+--write saves the result next to the artifact, one file per family
+(<artifact>.<family>.tuning.json — train_model.py and train_xgboost.py both
+write model.pkl), and into the artifact's payload["tuning"] when the artifact
+is of that family; the next train_*.py run picks the tuned parameters up via
+tuned_params() and carries the metadata forward.
+
+Usage:
+  python ml/tune.py crop
+  python ml/tune.py rainfall --family rf --folds 4 --candidates 24
+  python ml/tune.py crop --family xgb --workers 2 --write
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import product
+from multiprocessing import shared_memory
+
+import numpy as np
+
+warnings.filterwarnings("ignore")
+
+from model_loader import MODEL_CANDIDATES, MODEL_KINDS
+
+CLASSIFIERS = ("crop", "soil")
+MIN_RUNG_ROWS = 200
+# model_sweep.load_dataset(dataset=...) for trainers that do not use the kind's default rows
+DATASETS = {("crop", "xgb"): "kaggle"}
+
+SEARCH_SPACES = {
+    "rf": {
+        "n_estimators":     [50, 100, 200, 400],
+        "max_depth":        [None, 8, 16, 24],
+        "min_samples_leaf": [1, 2, 4],
+        "max_features":     ["sqrt", 0.5, 1.0],
+    },
+    "xgb": {
+        "n_estimators":     [100, 200, 400],
+        "max_depth":        [3, 6, 9],
+        "learning_rate":    [0.05, 0.1, 0.2],
+        "subsample":        [0.7, 0.8, 1.0],
+        "colsample_bytree": [0.7, 0.8, 1.0],
+    },
+}
+
+
+def tuning_path(kind, family):
+    return os.path.abspath(MODEL_CANDIDATES[kind][0]) + f".{family}.tuning.json"
+
+
+def tuned_params(kind, family, defaults):
+    """Trainer hook: (defaults overridden by the tuned parameters, tuning metadata or None).
+
+    Reads the family's own tuning file; a legacy <artifact>.tuning.json only
+    applies when it was run for the same model family (and, for crop xgb, on
+    train_xgboost.py's rows).
+    """
+    legacy = os.path.abspath(MODEL_CANDIDATES[kind][0]) + ".tuning.json"
+    for path in (tuning_path(kind, family), legacy):
+        try:
+            with open(path, encoding="utf-8") as f:
+                tuning = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if tuning.get("family") == family and tuning.get("dataset") == DATASETS.get((kind, family)):
+            return {**defaults, **tuning["best"]["params"]}, tuning
+    return dict(defaults), None
+
+
+def artifact_family(model):
+    """"xgb" or "rf" for a loaded artifact's model object."""
+    return "xgb" if type(model).__module__.startswith("xgboost") else "rf"
+
+
+# ── Candidates ────────────────────────────────────────────────────────────────
+def sample_candidates(family, n, seed=42):
+    """The whole grid when it has <= n points, otherwise n distinct random points."""
+    space = SEARCH_SPACES[family]
+    keys = list(space)
+    grid = [dict(zip(keys, values)) for values in product(*space.values())]
+    if len(grid) <= n:
+        return grid
+    pick = np.random.default_rng(seed).choice(len(grid), size=n, replace=False)
+    return [grid[i] for i in sorted(pick)]
+
+
+def build_estimator(kind, family, params, n_jobs):
+    if family == "xgb":
+        import xgboost as xgb
+        cls = xgb.XGBClassifier if kind in CLASSIFIERS else xgb.XGBRegressor
+        return cls(**params, random_state=42, n_jobs=n_jobs)
+    from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+    cls = RandomForestClassifier if kind in CLASSIFIERS else RandomForestRegressor
+    return cls(**params, random_state=42, n_jobs=n_jobs)
+
+
+def fit_score(kind, family, params, n_jobs, X_tr, y_tr, X_va, y_va):
+    """Score of one fit: accuracy for classifiers, RMSE for regressors."""
+    model = build_estimator(kind, family, params, n_jobs)
+    if kind in CLASSIFIERS and family == "xgb":
+        # a fold can miss rare classes; xgboost wants labels 0..k-1
+        classes, y_tr = np.unique(y_tr, return_inverse=True)
+        model.fit(X_tr, y_tr)
+        pred = classes[np.asarray(model.predict(X_va), dtype=int)]
+    else:
+        model.fit(X_tr, y_tr)
+        pred = model.predict(X_va)
+    if kind in CLASSIFIERS:
+        return float(np.mean(pred == y_va))
+    return float(np.sqrt(np.mean((np.asarray(pred, dtype=np.float64) - y_va) ** 2)))
+
+
+# ── Shared memory ─────────────────────────────────────────────────────────────
+def _share(arr):
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+
+
+# ── Folds ─────────────────────────────────────────────────────────────────────
+def rung_rows(n_rows, kind, seed=42):
+    """Row order for growing rungs: a fixed shuffle, or time order for rainfall."""
+    if kind == "rainfall":
+        return np.arange(n_rows)
+    return np.random.default_rng(seed).permutation(n_rows)
+
+
+def fold_indices(kind, y, rows, n_folds, seed=42):
+    """[(train, validation)] positions into `rows` for one rung."""
+    from sklearn.model_selection import KFold, StratifiedKFold, TimeSeriesSplit
+    if kind == "rainfall":
+        splitter = TimeSeriesSplit(n_splits=n_folds)
+    elif kind in CLASSIFIERS and np.bincount(np.unique(y[rows], return_inverse=True)[1]).min() >= n_folds:
+        splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    else:
+        splitter = KFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    return [(rows[tr], rows[va]) for tr, va in splitter.split(rows, y[rows])]
+
+
+# ── Worker side ───────────────────────────────────────────────────────────────
+_w = {}
+
+
+def _init_worker(kind, family, x_spec, y_spec, order, n_folds, n_jobs):
+    warnings.filterwarnings("ignore")
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(n_jobs)       # BLAS/OpenMP pools inside each worker, same cap as n_jobs
+    _w["shm"] = [_attach(x_spec), _attach(y_spec)]
+    _w.update(kind=kind, family=family, X=_w["shm"][0][1], y=_w["shm"][1][1],
+              order=order, n_folds=n_folds, n_jobs=n_jobs, folds={})
+
+
+def _evaluate(task):
+    """One (candidate, rung, fold) fit on the shared matrix."""
+    cand_id, params, n_rows, fold = task
+    kind, X, y = _w["kind"], _w["X"], _w["y"]
+    rows = _w["order"][-n_rows:] if kind == "rainfall" else _w["order"][:n_rows]
+    if n_rows not in _w["folds"]:
+        _w["folds"][n_rows] = fold_indices(kind, y, rows, _w["n_folds"])
+    tr, va = _w["folds"][n_rows][fold]
+    t0 = time.perf_counter()
+    score = fit_score(kind, _w["family"], params, _w["n_jobs"], X[tr], y[tr], X[va], y[va])
+    return cand_id, n_rows, fold, score, time.perf_counter() - t0
+
+
+# ── Successive halving ────────────────────────────────────────────────────────
+def rung_schedule(n_candidates, n_rows, eta, n_folds):
+    """Row counts per rung, smallest first; the last rung is the full training set."""
+    n_rungs = max(1, math.ceil(math.log(max(n_candidates, 1), eta)) + 1)
+    floor = max(MIN_RUNG_ROWS, n_folds * 20)
+    sizes = [int(n_rows / eta ** (n_rungs - 1 - r)) for r in range(n_rungs)]
+    sizes = sorted({min(n_rows, max(floor, s)) for s in sizes})
+    return sizes
+
+
+def _better(kind):
+    # classifiers: higher accuracy wins; regressors: lower RMSE wins
+    return (lambda s: -s) if kind in CLASSIFIERS else (lambda s: s)
+
+
+def search(kind, family, data, candidates, n_folds, eta, workers):
+    X = np.ascontiguousarray(data["X_train"], dtype=np.float32)
+    y = np.asarray(data["y_train"])
+    if kind not in CLASSIFIERS:
+        y = y.astype(np.float64)
+    n_jobs = max(1, (os.cpu_count() or 1) // workers)
+    order = rung_rows(len(X), kind)
+    rungs = rung_schedule(len(candidates), len(X), eta, n_folds)
+    key = _better(kind)
+
+    x_shm, x_spec = _share(X)
+    y_shm, y_spec = _share(y)
+    survivors = list(range(len(candidates)))
+    history = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(kind, family, x_spec, y_spec, order, n_folds, n_jobs)) as pool:
+            for r, n_rows in enumerate(rungs):
+                tasks = [(c, candidates[c], n_rows, f) for c in survivors for f in range(n_folds)]
+                t0 = time.perf_counter()
+                scores = {c: [] for c in survivors}
+                fit_s = {c: 0.0 for c in survivors}
+                for cand_id, _, _, score, secs in pool.map(_evaluate, tasks):
+                    scores[cand_id].append(score)
+                    fit_s[cand_id] += secs
+                rows = [{"id": c, "params": candidates[c], "mean": float(np.mean(scores[c])),
+                         "std": float(np.std(scores[c])), "folds": [round(s, 4) for s in scores[c]],
+                         "fit_s": round(fit_s[c], 2)} for c in survivors]
+                rows.sort(key=lambda row: key(row["mean"]))
+                keep = len(rows) if r == len(rungs) - 1 else max(1, math.ceil(len(rows) / eta))
+                history.append({"rung": r, "rows": n_rows, "candidates": len(rows), "kept": keep,
+                                "seconds": round(time.perf_counter() - t0, 2),
+                                "results": [{**row, "mean": round(row["mean"], 4), "std": round(row["std"], 4)}
+                                            for row in rows]})
+                survivors = [row["id"] for row in rows[:keep]]
+    finally:
+        for shm in (x_shm, y_shm):
+            shm.close()
+            shm.unlink()
+    return history, n_jobs
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def _write(kind, tuning):
+    import joblib
+    path = tuning_path(kind, tuning["family"])
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(tuning, f, indent=2)
+    os.replace(path + ".tmp", path)
+    written = [path]
+    artifact = os.path.abspath(MODEL_CANDIDATES[kind][0])
+    if os.path.exists(artifact):
+        payload = joblib.load(artifact)
+        # model.pkl may hold the other family's model; its metadata stays as it is
+        if isinstance(payload, dict) and artifact_family(payload.get("model")) == tuning["family"]:
+            payload["tuning"] = tuning
+            # predict_server / model_fleet may load it at any moment: never expose a half-written file
+            joblib.dump(payload, artifact + ".tmp", compress=3)
+            os.replace(artifact + ".tmp", artifact)
+            written.append(artifact)
+    return written
+
+
+def run(args):
+    from model_sweep import load_dataset
+
+    family = args.family
+    if family == "xgb":
+        try:
+            import xgboost  # noqa: F401
+        except ImportError:
+            raise SystemExit("xgboost not installed — use --family rf")
+    dataset = DATASETS.get((args.kind, family))
+    data = load_dataset(args.kind, shuffle=args.kind != "rainfall", dataset=dataset)
+    candidates = sample_candidates(family, args.candidates, args.seed)
+
+    t0 = time.perf_counter()
+    history, n_jobs = search(args.kind, family, data, candidates, args.folds, args.eta, args.workers)
+    search_s = time.perf_counter() - t0
+    best = history[-1]["results"][0]
+
+    # refit the winner on every training row and score the untouched held-out split
+    holdout = fit_score(args.kind, family, best["params"], os.cpu_count() or 1,
+                        data["X_train"], np.asarray(data["y_train"]), data["X_test"], np.asarray(data["y_test"]))
+    metric = "accuracy" if args.kind in CLASSIFIERS else "rmse"
+    tuning = {
+        "kind":       args.kind,
+        "family":     family,
+        "dataset":    dataset,
+        "metric":     metric,
+        "cv":         "timeseries" if args.kind == "rainfall" else
+                      "stratified" if args.kind in CLASSIFIERS else "kfold",
+        "folds":      args.folds,
+        "eta":        args.eta,
+        "best":       {"params": best["params"], "cv_mean": best["mean"], "cv_std": best["std"],
+                       "holdout": round(holdout, 4)},
+        "tuned_at":   datetime.utcnow().isoformat(timespec="seconds") + "Z",
+    }
+    report = {
+        **tuning,
+        "data_source":   data["source"],
+        "train_rows":    int(len(data["X_train"])),
+        "candidates":    len(candidates),
+        "fits":          sum(h["candidates"] for h in history) * args.folds,
+        "workers":       args.workers,
+        "inner_n_jobs":  n_jobs,
+        "search_seconds": round(search_s, 2),
+        "rungs":         history,
+        "written":       _write(args.kind, tuning) if args.write else None,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Cross-validated hyperparameter search with successive halving.")
+    p.add_argument("kind", choices=MODEL_KINDS)
+    p.add_argument("--family", choices=sorted(SEARCH_SPACES), default="rf")
+    p.add_argument("--folds", type=int, default=5)
+    p.add_argument("--candidates", type=int, default=27, help="configurations sampled from the search space")
+    p.add_argument("--eta", type=int, default=3, help="keep the best 1/eta candidates per rung")
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--out", help="also write the JSON report to this file")
+    p.add_argument("--write", action="store_true",
+                   help="save the best configuration to <artifact>.<family>.tuning.json and the artifact metadata")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -0,0 +1,191 @@
+"""
+weather_rollup.py — Incrementally maintained hourly / daily weather rollups.
+
+Keeps one document per (granularity, city, bucket) in `weather_rollups` with
+count plus n / sum / min / max of temperature, humidity, rainfall and
+soilMoisture, so dashboardRoutes.js reads a handful of pre-aggregated
+documents instead of every raw WeatherData row.
+
+Only documents newer than the watermark in `weather_rollup_state` are read,
+city by city (plus one scan for rows without a city), so each query walks the
+existing {city: 1, createdAt: -1} index. New rows are grouped with pandas and
+merged with $inc / $min / $max upserts in one bulk_write; the watermark moves
+only after the write.
+
+  city     lower-cased, trimmed city name; "*" holds all cities together
+  hour     UTC hour buckets
+  day      local-calendar days (ROLLUP_TZ_OFFSET_MIN, default: this machine's
+           offset) labelled "YYYY-MM-DD", matching the dashboard's day labels
+
+Usage:
+  python ml/weather_rollup.py              # process new rows since the watermark
+  python ml/weather_rollup.py --rebuild    # drop rollups and recompute from scratch (archive included)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["temperature", "humidity", "rainfall", "soilMoisture"]
+ROLLUPS = "weather_rollups"
+STATE = "weather_rollup_state"
+STATE_ID = "weatherdatas"
+ALL_CITIES = "*"
+# rows newer than now - SETTLE are left for the next run so inserts landing in
+# the same millisecond as the watermark are never skipped
+SETTLE = timedelta(seconds=2)
+
+
+def _tz():
+    offset = os.environ.get("ROLLUP_TZ_OFFSET_MIN")
+    if offset is not None:
+        return timezone(timedelta(minutes=int(offset)))
+    return datetime.now().astimezone().tzinfo
+
+
+# ── Aggregation (pure; no Mongo) ──────────────────────────────────────────────
+def aggregate(df, tz=None):
+    """Group raw rows into rollup increments.
+
+    df needs createdAt (naive UTC, as pymongo returns it), city and the METRICS
+    columns. Returns a list of dicts: {granularity, city, bucket, date?, count,
+    <metric>: {n, sum, min, max}} — one per (granularity, city, bucket).
+    """
+    if df.empty:
+        return []
+    tz = tz or _tz()
+    df = df.copy()
+    for m in METRICS:
+        df[m] = pd.to_numeric(df[m], errors="coerce") if m in df.columns else np.nan
+    ts = pd.to_datetime(df["createdAt"], utc=True)
+    local = ts.dt.tz_convert(tz)
+    df["hour"] = ts.dt.floor("h").dt.tz_localize(None)
+    df["day"] = local.dt.strftime("%Y-%m-%d")
+    df["city"] = df["city"].fillna("").astype(str).str.strip().str.lower() if "city" in df.columns else ""
+
+    # rows without a city only count towards the "*" rollup
+    out = []
+    both = pd.concat([df[df["city"] != ""], df.assign(city=ALL_CITIES)], ignore_index=True)
+    for gran in ("hour", "day"):
+        g = both.groupby(["city", gran], sort=True)
+        agg = g[METRICS].agg(["count", "sum", "min", "max"])
+        agg.columns = [f"{m}_{s}" for m, s in agg.columns]
+        agg["rows"] = g.size()
+        for key, r in zip(agg.index, agg.to_dict("records")):
+            city, bucket = key
+            doc = {"granularity": gran, "city": city, "count": int(r["rows"])}
+            if gran == "hour":
+                doc["bucket"] = bucket.to_pydatetime()
+            else:
+                day = datetime.strptime(bucket, "%Y-%m-%d").replace(tzinfo=tz)
+                doc["bucket"] = day.astimezone(timezone.utc).replace(tzinfo=None)
+                doc["date"] = bucket
+            for m in METRICS:
+                n = int(r[f"{m}_count"])
+                doc[m] = {"n": n, "sum": float(r[f"{m}_sum"]),
+                          "min": float(r[f"{m}_min"]) if n else None,
+                          "max": float(r[f"{m}_max"]) if n else None}
+            out.append(doc)
+    return out
+
+
+def rollup_id(doc):
+    label = doc.get("date") or doc["bucket"].strftime("%Y-%m-%dT%H")
+    return f"{doc['granularity']}|{doc['city']}|{label}"
+
+
+def to_update(doc, now):
+    """$inc / $min / $max upsert that merges one increment into its rollup document."""
+    from pymongo import UpdateOne
+    inc, lo, hi = {"count": doc["count"]}, {}, {}
+    for m in METRICS:
+        st = doc[m]
+        inc[f"{m}.n"] = st["n"]
+        inc[f"{m}.sum"] = st["sum"]
+        if st["n"]:
+            lo[f"{m}.min"] = st["min"]
+            hi[f"{m}.max"] = st["max"]
+    update = {"$inc": inc,
+              "$set": {"updatedAt": now},
+              "$setOnInsert": {k: doc[k] for k in ("granularity", "city", "bucket", "date") if k in doc}}
+    if lo:
+        update["$min"] = lo
+        update["$max"] = hi
+    return UpdateOne({"_id": rollup_id(doc)}, update, upsert=True)
+
+
+# ── Incremental run ───────────────────────────────────────────────────────────
+def run(db, rebuild=False):
+    t0 = time.perf_counter()
+    weather, rollups, state = db["weatherdatas"], db[ROLLUPS], db[STATE]
+    if rebuild:
+        rollups.delete_many({})
+        state.delete_one({"_id": STATE_ID})
+    rollups.create_index([("granularity", 1), ("city", 1), ("bucket", 1)])
+
+    st = state.find_one({"_id": STATE_ID}) or {}
+    watermark = st.get("watermark")
+    upper = datetime.utcnow() - SETTLE
+    window = {"$lte": upper}
+    if watermark is not None:
+        window["$gt"] = watermark
+
+    # per-city range scans ride the {city, createdAt} index
+    projection = {"_id": 0, "city": 1, "createdAt": 1, **{m: 1 for m in METRICS}}
+    frames = []
+    if watermark is None:
+        # a rebuild starts with the rows history_archive.py moved out of MongoDB
+        from history_archive import Archive, read_history
+        archive = Archive()
+        archived = read_history(None, "weatherdatas", end=upper.replace(tzinfo=timezone.utc),
+                                columns=list(projection)[1:], archive=archive)
+        if len(archived):
+            frames.append(archived)
+        if archive.watermark("weatherdatas") is not None:
+            window["$gte"] = datetime.fromtimestamp(archive.watermark("weatherdatas") / 1000, timezone.utc)
+    rows = []
+    for city in weather.distinct("city"):
+        if city:
+            rows.extend(weather.find({"city": city, "createdAt": window}, projection))
+    # rows without a city (missing, null or "") still count towards the "*" rollup
+    rows.extend(weather.find({"city": {"$in": [None, ""]}, "createdAt": window}, projection))
+    frames.append(pd.DataFrame(rows))
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    increments = aggregate(df) if len(df) else []
+    now = datetime.utcnow()
+    if increments:
+        rollups.bulk_write([to_update(d, now) for d in increments], ordered=False)
+    state.update_one({"_id": STATE_ID},
+                     {"$set": {"watermark": upper, "updatedAt": now},
+                      "$inc": {"processed": len(df)}}, upsert=True)
+    return {
+        "status":          "ok",
+        "rebuild":         rebuild,
+        "previous_watermark": watermark.isoformat() if watermark else None,
+        "watermark":       upper.isoformat(),
+        "new_rows":        int(len(df)),
+        "rollups_touched": len(increments),
+        "seconds":         round(time.perf_counter() - t0, 3),
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Maintain hourly/daily weather rollups.")
+    p.add_argument("--rebuild", action="store_true", help="drop rollups and recompute everything")
+    args = p.parse_args(argv)
+
+    from pymongo import MongoClient
+    client = MongoClient("mongodb://127.0.0.1:27017/")
+    db = client['smart_irrigation']
+    print(json.dumps(run(db, rebuild=args.rebuild)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
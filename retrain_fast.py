@@ -2,12 +2,15 @@
 retrain_fast.py — Retrain crop model with small n_estimators=50 for fast load time.
 Saves to ml/model.pkl with joblib compression=3.
 """
-import random, os, joblib
+import random, os, sys, joblib
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml"))
+from feature_encoder import crop_encoder
+
 random.seed(42)
 
 def gen(crop, n, temp, hum, rain, ph, moist, N, P, K, soils, seasons, regions):
@@ -54,9 +57,9 @@ df = pd.DataFrame(rows)
 numeric_cols = ["temperature","humidity","rainfall","soil_ph","soilMoisture","nitrogen","phosphorus","potassium"]
 cat_cols     = ["soilType","region","season"]
 
-X_num = df[numeric_cols].astype(float)
-X_cat = pd.get_dummies(df[cat_cols].astype(str), prefix=cat_cols)
-X = pd.concat([X_num.reset_index(drop=True), X_cat.reset_index(drop=True)], axis=1)
+# same FeatureEncoder the predictors load from the artifact
+encoder = crop_encoder(numeric_cols, cat_cols).fit(df)
+X = encoder.transform(df)
 y = df["crop"]
 
 print(f"Feature matrix: {X.shape[0]} rows x {X.shape[1]} columns")
@@ -71,14 +74,13 @@ y_pred = model.predict(X_test)
 acc = accuracy_score(y_test, y_pred)
 print(f"Test accuracy: {acc:.4f}")
 
-cat_values = {}
-for c in cat_cols:
-    cat_values[c] = sorted(df[c].unique().tolist())
+cat_values = encoder.categorical_values
 
 payload = {
     "model":              model,
-    "feature_columns":    list(X.columns),
+    "feature_columns":    encoder.feature_columns,
     "categorical_values": cat_values,
+    "encoder":            encoder,
 }
 
 # Save to the ml/ folder with compression=3 (much smaller file, loads faster)